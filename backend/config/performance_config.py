@@ -2,6 +2,8 @@
 Performance Configuration for Production Bot
 Optimized settings for fast response times and stability
 """
+import os
+
 import httpx
 
 
@@ -26,6 +28,32 @@ class BotPerformanceConfig:
             max_connections=100,           # Allow many concurrent connections
         ),
         'retries': 2,              # Quick retries
+        # Per-upstream pool sizes for the shared client registry
+        # (services/http_clients.py). One pool per upstream keeps warm
+        # TLS connections to each API instead of a handshake per call.
+        'upstream_limits': {
+            'shipstation': httpx.Limits(
+                max_keepalive_connections=20,
+                max_connections=50,
+                keepalive_expiry=60.0,
+            ),
+            'oxapay': httpx.Limits(
+                max_keepalive_connections=5,
+                max_connections=20,
+                keepalive_expiry=60.0,
+            ),
+            'backend': httpx.Limits(
+                max_keepalive_connections=5,
+                max_connections=20,
+                keepalive_expiry=30.0,
+            ),
+            'default': httpx.Limits(
+                max_keepalive_connections=10,
+                max_connections=30,
+                keepalive_expiry=30.0,
+            ),
+        },
+        'http2': True,             # Used only when the h2 package is installed
     }
     
     # Database Connection Settings
@@ -43,6 +71,51 @@ class BotPerformanceConfig:
         'shipstation': 12.0,       # ShipStation API timeout
         'oxapay': 10.0,           # Oxapay API timeout
         'webhook_delivery': 8.0,   # Webhook delivery timeout
+        'backend': 30.0,           # Bot -> own REST API (refunds)
+        'default': 30.0,           # Label PDF downloads and other URLs
+    }
+    
+    # Circuit breakers for upstream APIs (utils/retry_utils.py), applied to
+    # every call made through the shared clients in services/http_clients.py
+    CIRCUIT_BREAKER_CONFIG = {
+        'upstreams': ('shipstation', 'oxapay'),  # Guarded clients
+        'defaults': {
+            'failure_threshold': 5,        # Consecutive failures -> OPEN
+            'timeout': 30,                 # Seconds OPEN before a probe
+            'window_seconds': 60,          # Error budget window
+            'min_calls': 10,               # Calls in window before budget applies
+            'failure_rate_threshold': 0.5, # Failure share in window -> OPEN
+            'half_open_max_calls': 1,      # Concurrent probes in HALF_OPEN
+        },
+        # Per-upstream / per-endpoint budgets ('<upstream>:<endpoint>')
+        'overrides': {
+            'shipstation:v2/labels': {'failure_rate_threshold': 0.3, 'timeout': 60},
+            'oxapay:v1/payment/invoice': {'failure_threshold': 3},
+        },
+    }
+    
+    # Adaptive timeouts / hedged reads (services/adaptive_requests.py)
+    ADAPTIVE_REQUEST_CONFIG = {
+        'window': 200,                 # Latency samples kept per endpoint
+        'min_samples': 20,             # Fixed timeout until this many samples
+        'timeout_multiplier': 3.0,     # Timeout = p95 * 3 (never above the fixed one)
+        'min_timeout': 2.0,
+        'hedge_budget_ratio': 0.05,    # Hedges: at most ~5% extra calls
+        'hedge_budget_max': 10.0,
+        'hedge_min_delay': 0.05,
+    }
+    
+    # Retry budgets for @retry_on_api_error (utils/retry_utils.py): every
+    # first attempt earns `ratio` tokens, every retry spends one, so retries
+    # stay under ~10% of calls per upstream and stop during an outage
+    RETRY_BUDGET_CONFIG = {
+        'defaults': {
+            'ratio': 0.1,              # Retries per first attempt (10%)
+            'max_tokens': 10.0,        # Burst of retries after a quiet period
+            'initial_tokens': 5.0,
+        },
+        'overrides': {},               # Per upstream: {'oxapay': {'ratio': 0.2}}
+        'max_retry_after': 30,         # Give up instead of sleeping longer (sec)
     }
     
     # Rate Limiting - Prevent Telegram bans
@@ -52,6 +125,92 @@ class BotPerformanceConfig:
         'bulk_messages_per_second': 1, # For broadcast operations
     }
     
+    # Label PDF blob store (services/label_store.py)
+    LABEL_STORE_CONFIG = {
+        'root_dir': os.environ.get(
+            'LABEL_STORE_DIR',
+            os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data', 'labels')
+        ),
+        'retention_days': int(os.environ.get('LABEL_RETENTION_DAYS', '90')),  # 0 = keep forever
+        'gc_interval_hours': 24,
+    }
+    
+    # Label purchase job queue (services/label_queue.py)
+    LABEL_QUEUE_CONFIG = {
+        'workers': int(os.environ.get('LABEL_QUEUE_WORKERS', '4')),  # Concurrent label purchases
+        'max_attempts': 3,                 # Attempts before dead letter
+        'lease_seconds': 120,              # Worker lease, renewed while running
+        'backoff_base_seconds': 5.0,       # Retry delay: 5s, 10s, 20s ...
+        'backoff_max_seconds': 300.0,
+        'poll_interval_seconds': 2.0,      # Idle poll (enqueue wakes workers at once)
+    }
+    
+    # Telegram update queue (services/update_queue.py): one lane (worker)
+    # per chat shard - updates of one chat stay ordered, chats run in parallel
+    UPDATE_QUEUE_CONFIG = {
+        'lanes': int(os.environ.get('UPDATE_QUEUE_LANES', '32')),
+        'lane_size': int(os.environ.get('UPDATE_QUEUE_LANE_SIZE', '100')),  # Full lane -> 503
+        'retry_after_seconds': 5,          # Retry-After sent with 503
+        'drain_timeout_seconds': 5.0,      # Drain on shutdown
+    }
+    
+    # Webhook update_id deduplication (services/update_dedup.py)
+    UPDATE_DEDUP_CONFIG = {
+        'ring_size': 10000,                # Last update_ids remembered in process
+        'ttl_seconds': 600,                # processed_updates TTL (Telegram retries within minutes)
+        # Several workers: also check the shared processed_updates collection
+        'shared': os.environ.get('TELEGRAM_STATE_SHARED', 'false').lower() == 'true',
+    }
+    
+    # Telegram user_data / conversation state (utils/mongodb_persistence.py)
+    PERSISTENCE_CONFIG = {
+        'collection': 'telegram_state',
+        'flush_interval_seconds': 1.0,     # Coalesce state changes into one write per second
+        # Several uvicorn workers / instances: reload before and flush after every update
+        'shared': os.environ.get('TELEGRAM_STATE_SHARED', 'false').lower() == 'true',
+        'max_batch': 500,                  # Documents per bulk_write
+    }
+    
+    # Outbound Telegram send scheduler (services/telegram_send_scheduler.py)
+    SEND_SCHEDULER_CONFIG = {
+        'global_rate': 25.0,               # Messages/sec for the whole bot (Telegram: ~30)
+        'global_burst': 5,
+        'chat_rate': 1.0,                  # Messages/sec per private chat
+        'chat_burst': 3,                   # Short bursts (edit + reply) pass without waiting
+        'group_rate': 20 / 60,             # Groups/channels: 20 messages/min
+        'group_burst': 3,
+        'max_retries': 2,                  # Re-sends after 429 RetryAfter
+        'max_chat_buckets': 10000,         # Idle full buckets are pruned above this
+    }
+    
+    # Order flow rendering (utils/order_card.py)
+    ORDER_CARD_CONFIG = {
+        'mode': os.environ.get('ORDER_RENDER_MODE', 'edit_in_place'),  # or 'send_new'
+        'max_tracked_orders': 10000,       # Open orders metered for Telegram calls
+    }
+    
+    # Broadcast jobs (services/broadcast_engine.py)
+    BROADCAST_CONFIG = {
+        'concurrency': 8,                  # Sends in flight; pacing is the send scheduler's
+        'batch_size': 50,                  # Recipients per progress checkpoint
+        'lease_seconds': 60,               # A crashed worker's broadcast resumes after this
+        'poll_interval_seconds': 5.0,
+    }
+    
+    # Broadcast audience segments
+    SEGMENT_CONFIG = {
+        'count_cache_ttl_seconds': 60,     # Admin preview counts
+        'max_cached_counts': 256,
+    }
+    
+    # Batch (multi-parcel) orders
+    BATCH_ORDER_CONFIG = {
+        'max_parcels': 20,                 # Parcels per batch
+        'max_parallel_quotes': 4,          # Concurrent ShipStation rate requests
+        'poll_interval_seconds': 2.0,      # ShipStation batch status poll
+        'poll_timeout_seconds': 120.0,     # Wait per attempt before the job retries
+    }
+    
     # Async Settings
     ASYNCIO_CONFIG = {
         'max_workers': 10,             # Thread pool size
@@ -86,6 +245,83 @@ class BotPerformanceConfig:
         """Get HTTP client configuration"""
         return cls.HTTP_CLIENT_CONFIG
     
+    @classmethod
+    def get_upstream_client_config(cls, upstream: str) -> dict:
+        """Get pool limits and timeout for one upstream API"""
+        limits = cls.HTTP_CLIENT_CONFIG['upstream_limits']
+        return {
+            'limits': limits.get(upstream, limits['default']),
+            'timeout': cls.EXTERNAL_API_TIMEOUTS.get(
+                upstream, cls.EXTERNAL_API_TIMEOUTS['default']
+            ),
+            'http2': cls.HTTP_CLIENT_CONFIG['http2'],
+        }
+    
+    @classmethod
+    def get_circuit_breaker_config(cls) -> dict:
+        """Get upstream circuit breaker thresholds and error budgets"""
+        return cls.CIRCUIT_BREAKER_CONFIG
+    
+    @classmethod
+    def get_adaptive_request_config(cls) -> dict:
+        """Get latency window, adaptive timeout and hedge budget settings"""
+        return cls.ADAPTIVE_REQUEST_CONFIG
+    
+    @classmethod
+    def get_retry_budget_config(cls) -> dict:
+        """Get per-upstream retry budget settings"""
+        return cls.RETRY_BUDGET_CONFIG
+    
+    @classmethod
+    def get_label_store_config(cls) -> dict:
+        """Get label PDF store directory and retention policy"""
+        return cls.LABEL_STORE_CONFIG
+    
+    @classmethod
+    def get_label_queue_config(cls) -> dict:
+        """Get label job queue concurrency, lease and retry policy"""
+        return cls.LABEL_QUEUE_CONFIG
+    
+    @classmethod
+    def get_update_queue_config(cls) -> dict:
+        """Get update queue lane count and per-lane depth"""
+        return cls.UPDATE_QUEUE_CONFIG
+    
+    @classmethod
+    def get_update_dedup_config(cls) -> dict:
+        """Get update_id ring size and shared dedup settings"""
+        return cls.UPDATE_DEDUP_CONFIG
+    
+    @classmethod
+    def get_persistence_config(cls) -> dict:
+        """Get MongoDB persistence flush interval and deployment mode"""
+        return cls.PERSISTENCE_CONFIG
+    
+    @classmethod
+    def get_send_scheduler_config(cls) -> dict:
+        """Get outbound Telegram token bucket rates"""
+        return cls.SEND_SCHEDULER_CONFIG
+    
+    @classmethod
+    def get_order_card_config(cls) -> dict:
+        """Get order flow rendering mode (edit-in-place card or send-new)"""
+        return cls.ORDER_CARD_CONFIG
+    
+    @classmethod
+    def get_broadcast_config(cls) -> dict:
+        """Get broadcast job concurrency, checkpoint and lease settings"""
+        return cls.BROADCAST_CONFIG
+    
+    @classmethod
+    def get_segment_config(cls) -> dict:
+        """Get audience segment count cache settings"""
+        return cls.SEGMENT_CONFIG
+    
+    @classmethod
+    def get_batch_order_config(cls) -> dict:
+        """Get batch order quoting and processing settings"""
+        return cls.BATCH_ORDER_CONFIG
+    
     @classmethod
     def get_mongodb_config(cls) -> dict:
         """Get MongoDB configuration"""
@@ -45,6 +45,7 @@ async def notify_admin_error(user_info: dict, error_type: str, error_details: st
     """Send error notification to admin"""
     from server import ADMIN_TELEGRAM_ID, bot_instance
     from handlers.common_handlers import safe_telegram_call
+    from services.telegram_send_scheduler import send_priority, SendPriority
     
     if not ADMIN_TELEGRAM_ID or not bot_instance:
         return
@@ -70,11 +71,12 @@ async def notify_admin_error(user_info: dict, error_type: str, error_details: st
         if order_id:
             message += f"\n🔖 <b>Order ID:</b> {order_id}"
         
-        await safe_telegram_call(bot_instance.send_message(
-            chat_id=ADMIN_TELEGRAM_ID,
-            text=message,
-            parse_mode='HTML'
-        ))
+        with send_priority(SendPriority.ADMIN):
+            await safe_telegram_call(bot_instance.send_message(
+                chat_id=ADMIN_TELEGRAM_ID,
+                text=message,
+                parse_mode='HTML'
+            ))
     except Exception as e:
         logger.error(f"Failed to send admin notification: {e}")
 
@@ -20,6 +20,9 @@ async def safe_telegram_call(coro, timeout=10, error_message="❌ Превыше
     Universal wrapper with timeout protection
     Fast responses + error handling
     
+    Rate limits and 429 RetryAfter are handled by the send scheduler
+    (services/telegram_send_scheduler.py) inside the bot call.
+    
     Usage:
         await safe_telegram_call(update.message.reply_text("Hello"), chat_id=update.effective_chat.id)
     """
@@ -29,10 +32,9 @@ async def safe_telegram_call(coro, timeout=10, error_message="❌ Превыше
         logger.error(f"Telegram API timeout after {timeout}s")
         return None
     except telegram.error.RetryAfter as e:
-        # Telegram rate limit hit - wait and retry
-        logger.warning(f"Telegram rate limit: waiting {e.retry_after}s")
-        await asyncio.sleep(e.retry_after)
-        return await asyncio.wait_for(coro, timeout=timeout)
+        # Still flood-limited after the scheduler's retries
+        logger.warning(f"Telegram rate limit: {e}")
+        return None
     except Exception as e:
         logger.error(f"Telegram API error: {e}")
         return None
@@ -48,8 +50,16 @@ async def mark_message_as_selected(update: Update, context: ContextTypes.DEFAULT
         context: Bot context
         prompt_text: EXPLICIT prompt text to mark (avoids race condition with context updates)
                      If None, falls back to context.user_data['last_bot_message_text']
+    
+    In edit-in-place mode (utils/order_card.py) the order card is not
+    marked: the next step redraws it.
     """
     try:
+        from utils.order_card import order_card
+        if order_card.owns(update, context):
+            await order_card.release(update, context)
+            return
+        
         # Handle callback query (button press)
         if update.callback_query:
             message = update.callback_query.message
@@ -400,15 +410,11 @@ async def check_stale_interaction(query, context: ContextTypes.DEFAULT_TYPE) ->
     
     logger.info(f"check_stale_interaction called - user_data keys: {list(context.user_data.keys())}")
     
-    # Check for rapid multiple clicks (debouncing)
-    from utils.telegram_utils import is_button_click_allowed
-    
-    user_id = query.from_user.id
-    button_data = query.data
-    
-    if not is_button_click_allowed(user_id, button_data):
-        await safe_telegram_call(query.answer("⚠️ Пожалуйста, подождите..."))
-        return True  # Block this interaction
+    # Rapid double clicks need no debouncing: updates of one chat are
+    # processed in order (services/update_queue.py) and the order
+    # ConversationHandler runs with block=True, so the second click sees the
+    # state left by the first one. update_queue.start() warns about
+    # block=False handlers, which would break this.
     
     # If user_data is completely empty, it's likely a stale button from a completed order
     if not context.user_data or len(context.user_data) == 0:
@@ -0,0 +1,286 @@
+"""
+Order Flow: Batch (Multi-Parcel) Order Handlers
+Adds more parcels to an order from the confirmation screen and buys all labels at once
+"""
+import asyncio
+import logging
+from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
+from telegram.ext import ContextTypes, ConversationHandler
+from handlers.common_handlers import safe_telegram_call, mark_message_as_selected, check_stale_interaction
+from utils.handler_decorators import with_user_session, safe_handler
+
+logger = logging.getLogger(__name__)
+
+SENDER_KEYS = (
+    'from_name', 'from_address', 'from_street', 'from_address2', 'from_street2',
+    'from_city', 'from_state', 'from_zip', 'from_phone'
+)
+RECIPIENT_KEYS = (
+    'to_name', 'to_address', 'to_street', 'to_address2', 'to_street2',
+    'to_city', 'to_state', 'to_zip', 'to_phone'
+)
+PACKAGE_KEYS = (
+    'parcel_weight', 'parcel_length', 'parcel_width', 'parcel_height',
+    'weight', 'length', 'width', 'height'
+)
+
+
+def _pick(data: dict, keys) -> dict:
+    return {key: data[key] for key in keys if data.get(key) not in (None, '')}
+
+
+def collect_batch_parcels(data: dict) -> list:
+    """Parcels added so far plus the one currently in user_data"""
+    return list(data.get('batch_parcels', [])) + [_pick(data, RECIPIENT_KEYS + PACKAGE_KEYS)]
+
+
+@safe_handler(fallback_state=ConversationHandler.END)
+@with_user_session(create_user=False, require_session=True)
+async def batch_add(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Ask whether the next parcel goes to the same or a new recipient"""
+    from server import CONFIRM_DATA
+    from services.batch_orders import batch_order_service
+    from utils.ui_utils import DataConfirmationUI
+
+    query = update.callback_query
+    if await check_stale_interaction(query, context):
+        return ConversationHandler.END
+    await safe_telegram_call(query.answer())
+
+    old_prompt_text = context.user_data.get('last_bot_message_text', '')
+    asyncio.create_task(mark_message_as_selected(update, context, prompt_text=old_prompt_text))
+
+    if len(collect_batch_parcels(context.user_data)) >= batch_order_service.max_parcels:
+        await safe_telegram_call(update.effective_message.reply_text(
+            f"⚠️ В пакете может быть не больше {batch_order_service.max_parcels} посылок.",
+            reply_markup=DataConfirmationUI.build_batch_confirmation_keyboard()
+        ))
+        return CONFIRM_DATA
+
+    await safe_telegram_call(update.effective_message.reply_text(
+        "➕ Кому отправляем следующую посылку?",
+        reply_markup=DataConfirmationUI.build_batch_add_keyboard()
+    ))
+    return CONFIRM_DATA
+
+
+@safe_handler(fallback_state=ConversationHandler.END)
+@with_user_session(create_user=False, require_session=True)
+async def batch_add_parcel(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """
+    Move the current parcel into the batch and start entering the next one
+
+    batch_same_recipient: keep recipient, ask parcel weight
+    batch_new_recipient: ask recipient from the first field
+    """
+    from server import TO_NAME, PARCEL_WEIGHT
+    from utils.ui_utils import get_cancel_keyboard, OrderStepMessages
+
+    query = update.callback_query
+    await safe_telegram_call(query.answer())
+
+    data = context.user_data
+    data['batch_parcels'] = collect_batch_parcels(data)
+    for key in PACKAGE_KEYS:
+        data.pop(key, None)
+
+    if query.data == 'batch_new_recipient':
+        for key in RECIPIENT_KEYS:
+            data.pop(key, None)
+        message_text, next_state = OrderStepMessages.TO_NAME, TO_NAME
+    else:
+        message_text, next_state = OrderStepMessages.PARCEL_WEIGHT, PARCEL_WEIGHT
+
+    logger.info(f"📦 Batch: parcel {len(data['batch_parcels'])} added, next via {query.data}")
+
+    data['last_bot_message_text'] = message_text
+    bot_msg = await safe_telegram_call(update.effective_message.reply_text(
+        f"📦 Посылка {len(data['batch_parcels']) + 1}\n\n{message_text}",
+        reply_markup=get_cancel_keyboard()
+    ))
+    if bot_msg:
+        data['last_bot_message_id'] = bot_msg.message_id
+    return next_state
+
+
+@safe_handler(fallback_state=ConversationHandler.END)
+@with_user_session(create_user=False, require_session=True)
+async def batch_checkout(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Quote all parcels concurrently and show services offered for every parcel"""
+    from server import CONFIRM_DATA, SELECT_CARRIER
+    from services.batch_orders import batch_order_service
+    from utils.ui_utils import DataConfirmationUI
+
+    query = update.callback_query
+    if await check_stale_interaction(query, context):
+        return ConversationHandler.END
+    await safe_telegram_call(query.answer())
+
+    old_prompt_text = context.user_data.get('last_bot_message_text', '')
+    asyncio.create_task(mark_message_as_selected(update, context, prompt_text=old_prompt_text))
+
+    data = context.user_data
+    parcels = collect_batch_parcels(data)
+    progress = await safe_telegram_call(update.effective_message.reply_text(
+        f"⏳ Получаем тарифы для {len(parcels)} посылок..."
+    ))
+
+    parcel_rates, options = await batch_order_service.quote(_pick(data, SENDER_KEYS), parcels)
+
+    if progress:
+        await safe_telegram_call(progress.delete())
+
+    if not options:
+        failed = [str(n) for n, rates in enumerate(parcel_rates, 1) if rates is None]
+        reason = (f"Не удалось получить тарифы для посылок: {', '.join(failed)}"
+                  if failed else "Нет службы доставки, доступной для всех посылок")
+        await safe_telegram_call(update.effective_message.reply_text(
+            f"❌ {reason}.\nПроверьте адреса или разделите заказ.",
+            reply_markup=DataConfirmationUI.build_batch_confirmation_keyboard()
+        ))
+        return CONFIRM_DATA
+
+    options = options[:8]
+    data['batch_options'] = options
+    # Batch key for this checkout: every tap on "pay" reuses it
+    from utils.order_utils import generate_order_id
+    data['batch_id'] = generate_order_id(telegram_id=update.effective_user.id, prefix="BATCH")
+
+    message = f"📦 *Тарифы для пакета ({len(parcels)} посылок)*\n\n"
+    keyboard = []
+    for i, option in enumerate(options):
+        message += f"{i + 1}. {option['carrier']} {option['service']}: *${option['total']:.2f}*\n"
+        keyboard.append([InlineKeyboardButton(
+            f"{option['carrier']} {option['service']} - ${option['total']:.2f}",
+            callback_data=f"batch_service_{i}"
+        )])
+    keyboard.append([InlineKeyboardButton("◀️ К данным заказа", callback_data='check_data')])
+    keyboard.append([InlineKeyboardButton("❌ Отмена", callback_data='cancel_order')])
+
+    bot_msg = await safe_telegram_call(update.effective_message.reply_text(
+        message, reply_markup=InlineKeyboardMarkup(keyboard), parse_mode='Markdown'
+    ))
+    if bot_msg:
+        data['last_bot_message_id'] = bot_msg.message_id
+        data['last_bot_message_text'] = message
+    return SELECT_CARRIER
+
+
+@safe_handler(fallback_state=ConversationHandler.END)
+@with_user_session(create_user=False, require_session=True)
+async def batch_select_service(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Show batch total and balance for the chosen service"""
+    from server import SELECT_CARRIER
+    from repositories import get_user_repo
+
+    query = update.callback_query
+    await safe_telegram_call(query.answer())
+
+    options = context.user_data.get('batch_options') or []
+    index = int(query.data.replace('batch_service_', ''))
+    if index >= len(options):
+        return SELECT_CARRIER
+
+    option = options[index]
+    context.user_data['batch_selected'] = index
+    balance = await get_user_repo().get_balance(update.effective_user.id)
+    parcels = len(option['rates'])
+
+    message = (f"📦 *Пакетный заказ*\n\n"
+               f"Посылок: {parcels}\n"
+               f"Служба: {option['carrier']} {option['service']}\n"
+               f"Итого: *${option['total']:.2f}*\n\n"
+               f"💰 Ваш баланс: ${balance:.2f}\n")
+
+    keyboard = []
+    if balance >= option['total']:
+        keyboard.append([InlineKeyboardButton(f"💳 Оплатить с баланса (${option['total']:.2f})", callback_data='batch_pay')])
+    else:
+        message += f"\n⚠️ Недостаточно средств: не хватает ${option['total'] - balance:.2f}. Пополните баланс в главном меню."
+    keyboard.append([InlineKeyboardButton("◀️ К данным заказа", callback_data='check_data')])
+    keyboard.append([InlineKeyboardButton("❌ Отмена", callback_data='cancel_order')])
+
+    await safe_telegram_call(update.effective_message.reply_text(
+        message, reply_markup=InlineKeyboardMarkup(keyboard), parse_mode='Markdown'
+    ))
+    return SELECT_CARRIER
+
+
+@safe_handler(fallback_state=ConversationHandler.END)
+@with_user_session(create_user=False, require_session=True)
+async def batch_pay(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Create the batch, debit its total and queue the purchase (unbought lines are refunded)"""
+    from server import SELECT_CARRIER
+    from repositories import get_user_repo
+    from services.batch_orders import batch_order_service
+    from services.label_queue import label_job_queue
+
+    query = update.callback_query
+    if await check_stale_interaction(query, context):
+        return ConversationHandler.END
+    await safe_telegram_call(query.answer())
+
+    data = context.user_data
+    options = data.get('batch_options') or []
+    index = data.get('batch_selected')
+    if index is None or index >= len(options):
+        return SELECT_CARRIER
+    option = options[index]
+
+    telegram_id = update.effective_user.id
+    balance = await get_user_repo().get_balance(telegram_id)
+    if balance < option['total']:
+        await safe_telegram_call(update.effective_message.reply_text(
+            f"❌ Недостаточно средств. Требуется: ${option['total']:.2f}, доступно: ${balance:.2f}"
+        ))
+        return SELECT_CARRIER
+
+    old_prompt_text = data.get('last_bot_message_text', '')
+    asyncio.create_task(mark_message_as_selected(update, context, prompt_text=old_prompt_text))
+
+    batch = await batch_order_service.create_batch(
+        telegram_id, _pick(data, SENDER_KEYS), collect_batch_parcels(data), option, data.get('batch_id')
+    )
+    if batch.get('charged') or batch['status'] != 'pending':
+        await safe_telegram_call(update.effective_message.reply_text("⏳ Этот пакет уже обрабатывается."))
+        return ConversationHandler.END
+
+    charged, error = await batch_order_service.charge(batch['batch_id'])
+    if not charged and error is None:
+        await safe_telegram_call(update.effective_message.reply_text("⏳ Этот пакет уже обрабатывается."))
+        return ConversationHandler.END
+    if not charged:
+        logger.warning(f"⚠️ Batch {batch['batch_id']} not charged: {error}")
+        await safe_telegram_call(update.effective_message.reply_text(
+            f"❌ Не удалось списать ${option['total']:.2f} с баланса. Пополните баланс и попробуйте снова."
+        ))
+        return SELECT_CARRIER
+
+    progress_msg = await safe_telegram_call(update.effective_message.reply_text(
+        f"⏳ Создаем {len(batch['parcels'])} этикеток... Общий PDF придет в этот чат."
+    ))
+    try:
+        await label_job_queue.enqueue(
+            batch['batch_id'],
+            telegram_id,
+            source='batch',
+            progress_message=progress_msg
+        )
+    except Exception:
+        # Nothing bought - mark_failed refunds the debit
+        await batch_order_service.mark_failed(batch['batch_id'])
+        raise
+
+    data.clear()
+    data['order_completed'] = True
+    return ConversationHandler.END
+
+
+__all__ = [
+    'collect_batch_parcels',
+    'batch_add',
+    'batch_add_parcel',
+    'batch_checkout',
+    'batch_select_service',
+    'batch_pay'
+]
@@ -10,6 +10,7 @@ from telegram.ext import ContextTypes, ConversationHandler
 logger = logging.getLogger(__name__)
 
 from utils.handler_decorators import with_user_session, safe_handler, with_services
+from utils.order_card import order_call_meter
 
 # Export public functions
 __all__ = ['cancel_order', 'confirm_cancel_order', 'return_to_order', 'check_order_data']
@@ -141,6 +142,7 @@ async def confirm_cancel_order(update: Update, context: ContextTypes.DEFAULT_TYP
     # Clear session via service
     await session_service.clear_session(user_id)
     context.user_data.clear()
+    order_call_meter.finish(user_id, completed=False)
     logger.info(f"🗑️ Session cleared after order cancellation for user {user_id}")
     
     keyboard = [[InlineKeyboardButton("🔙 Главное меню", callback_data='start')]]
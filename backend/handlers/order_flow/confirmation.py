@@ -10,6 +10,7 @@ from telegram.ext import ContextTypes, ConversationHandler
 logger = logging.getLogger(__name__)
 
 from utils.handler_decorators import with_user_session, safe_handler
+from utils.order_card import order_card
 from handlers.common_handlers import safe_telegram_call, mark_message_as_selected, check_stale_interaction
 from handlers.order_flow.cancellation import cancel_order, confirm_cancel_order, return_to_order
 
@@ -28,22 +29,23 @@ async def show_data_confirmation(update: Update, context: ContextTypes.DEFAULT_T
     message += "📤 " + DataConfirmationUI.format_address_section("ОТПРАВИТЕЛЬ", data, "from")
     message += "📥 " + DataConfirmationUI.format_address_section("ПОЛУЧАТЕЛЬ", data, "to")
     message += DataConfirmationUI.format_parcel_section(data)
-    message += "\n✅ *Подтвердите данные или отредактируйте*"
-    
-    # Build keyboard using UI utils
-    reply_markup = DataConfirmationUI.build_confirmation_keyboard()
     
-    # Use effective_message to handle both regular messages and callback queries
-    effective_msg = update.effective_message
+    # Batch order: previous parcels + the one just entered
+    if data.get('batch_parcels'):
+        from handlers.order_flow.batch import collect_batch_parcels
+        message += DataConfirmationUI.format_batch_section(collect_batch_parcels(data))
+        reply_markup = DataConfirmationUI.build_batch_confirmation_keyboard()
+    else:
+        # Build keyboard using UI utils
+        reply_markup = DataConfirmationUI.build_confirmation_keyboard()
     
-    # 🚀 PERFORMANCE: Send message in background - don't wait for Telegram response
-    async def send_confirmation():
-        bot_msg = await safe_telegram_call(effective_msg.reply_text(message, reply_markup=reply_markup, parse_mode='Markdown'))
-        if bot_msg:
-            context.user_data['last_bot_message_id'] = bot_msg.message_id
-            context.user_data['last_bot_message_text'] = message
+    message += "\n✅ *Подтвердите данные или отредактируйте*"
     
-    asyncio.create_task(send_confirmation())
+    # Send message (or redraw the order card); awaited so the card id is in
+    # user_data before the update finishes and is persisted
+    await order_card.render(
+        update, context, message, reply_markup=reply_markup, progress=False, parse_mode='Markdown'
+    )
     
     return CONFIRM_DATA
 
@@ -84,6 +84,13 @@ def setup_order_conversation_handler():
     )
     from handlers.order_flow.rates import fetch_shipping_rates
     from handlers.order_flow.carriers import select_carrier
+    from handlers.order_flow.batch import (
+        batch_add,
+        batch_add_parcel,
+        batch_checkout,
+        batch_select_service,
+        batch_pay
+    )
     from handlers.order_flow.cancellation import (
         cancel_order,
         confirm_cancel_order,
@@ -221,13 +228,18 @@ def setup_order_conversation_handler():
                 CallbackQueryHandler(return_to_order, pattern='^return_to_order$')
             ],
             CONFIRM_DATA: [
-                CallbackQueryHandler(handle_data_confirmation, pattern='^(confirm_data|save_template|edit_data|edit_addresses_error|edit_from_address|edit_to_address|return_to_order|confirm_cancel|cancel_order)$')
+                CallbackQueryHandler(handle_data_confirmation, pattern='^(confirm_data|save_template|edit_data|edit_addresses_error|edit_from_address|edit_to_address|return_to_order|confirm_cancel|cancel_order|back_to_confirmation)$'),
+                CallbackQueryHandler(batch_add, pattern='^batch_add$'),
+                CallbackQueryHandler(batch_add_parcel, pattern='^(batch_same_recipient|batch_new_recipient)$'),
+                CallbackQueryHandler(batch_checkout, pattern='^batch_checkout$')
             ],
             EDIT_MENU: [
                 CallbackQueryHandler(handle_data_confirmation, pattern='^(edit_from_address|edit_to_address|edit_parcel|back_to_confirmation|return_to_order|confirm_cancel)$')
             ],
             SELECT_CARRIER: [
-                CallbackQueryHandler(select_carrier, pattern='^(select_carrier_|refresh_rates|check_data|return_to_order|confirm_cancel|cancel_order)')
+                CallbackQueryHandler(select_carrier, pattern='^(select_carrier_|refresh_rates|check_data|return_to_order|confirm_cancel|cancel_order)'),
+                CallbackQueryHandler(batch_select_service, pattern='^batch_service_'),
+                CallbackQueryHandler(batch_pay, pattern='^batch_pay$')
             ],
             PAYMENT_METHOD: [
                 CallbackQueryHandler(return_to_order, pattern='^return_to_order$'),
@@ -273,9 +285,9 @@ def setup_order_conversation_handler():
         per_user=True,
         per_message=False,  # False is correct: we use MessageHandler (not only CallbackQueryHandler)
         allow_reentry=True,
-        block=False,  # CRITICAL: Process messages from same user sequentially to prevent race conditions
+        block=True,  # Lanes (services/update_queue.py) keep one user's updates ordered; the state is settled when the update finishes, so it can be persisted
         name="order_conversation",  # Name for logging/debugging + required for persistence
-        persistent=True  # ENABLED: Uses MongoDBPersistence for state management
+        persistent=True  # MongoDBPersistence (utils/mongodb_persistence.py)
     )
     
     logger.info("✅ Order conversation handler configured successfully")
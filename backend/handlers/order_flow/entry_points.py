@@ -71,6 +71,10 @@ async def new_order_start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     
     logger.info("✅ Cleared ALL user data for fresh order start")
     
+    # Telegram calls per order (utils/order_card.py)
+    from utils.order_card import order_card, order_call_meter
+    order_call_meter.start(telegram_id, order_card.mode)
+    
     # Create or update MongoDB session for ConversationHandler persistence
     from server import db
     from datetime import datetime, timezone
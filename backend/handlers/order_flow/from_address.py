@@ -12,6 +12,7 @@ logger = logging.getLogger(__name__)
 # Import shared utilities
 from handlers.common_handlers import safe_telegram_call, mark_message_as_selected
 from utils.handler_decorators import with_user_session, safe_handler, with_typing_action, with_services
+from services.zip_database import zip_db, zip_shortcut_hint
 
 # These will be imported from server when handlers are called
 # from server import (
@@ -204,6 +205,7 @@ async def order_from_address2(update: Update, context: ContextTypes.DEFAULT_TYPE
         message_text = TemplateEditMessages.FROM_CITY
     else:
         message_text = OrderStepMessages.FROM_CITY
+    message_text += zip_shortcut_hint()
     
     await ask_with_cancel_and_focus(
         update,
@@ -229,7 +231,10 @@ async def order_from_city(update: Update, context: ContextTypes.DEFAULT_TYPE, se
     """
     from server import sanitize_string, FROM_CITY, FROM_STATE, STATE_NAMES
     
-    
+    # 📮 ZIP entered instead of city: fill city + state locally, skip 2 steps
+    zip_info = zip_db.lookup(update.effective_message.text)
+    if zip_info:
+        return await _apply_from_zip_shortcut(update, context, session_service, zip_info)
     
     city = update.effective_message.text.strip()
     city = sanitize_string(city, max_length=50)
@@ -345,6 +350,14 @@ async def order_from_zip(update: Update, context: ContextTypes.DEFAULT_TYPE, ses
     
     zip_code = update.effective_message.text.strip()
     
+    # Reject impossible ZIP/state locally (no ShipStation call);
+    # a ZIP3 prefix mismatch is only a warning shown with the next prompt
+    is_valid, error_msg = zip_db.validate(context.user_data.get('from_state'), zip_code)
+    if not is_valid:
+        await safe_telegram_call(update.effective_message.reply_text(error_msg))
+        return FROM_ZIP
+    zip_warning = f"{error_msg}\n\n" if error_msg else ""
+    
     # Store
     user_id = update.effective_user.id
     context.user_data['from_zip'] = zip_code
@@ -359,6 +372,13 @@ async def order_from_zip(update: Update, context: ContextTypes.DEFAULT_TYPE, ses
     old_prompt_text = context.user_data.get('last_bot_message_text', '')
     asyncio.create_task(mark_message_as_selected(update, context, prompt_text=old_prompt_text))
     
+    return await _ask_from_phone(update, context, prefix=zip_warning)
+
+
+async def _ask_from_phone(update: Update, context: ContextTypes.DEFAULT_TYPE, prefix: str = ""):
+    """Show sender phone prompt (optional field with SKIP option)"""
+    from server import FROM_PHONE
+    
     # Show with SKIP option
     from utils.ui_utils import get_skip_and_cancel_keyboard, OrderStepMessages, CallbackData, TemplateEditMessages
     
@@ -373,7 +393,7 @@ async def order_from_zip(update: Update, context: ContextTypes.DEFAULT_TYPE, ses
     await ask_with_skip_cancel_and_focus(
         update,
         context,
-        message_text,
+        prefix + message_text,
         skip_callback=CallbackData.SKIP_FROM_PHONE,
         next_state=FROM_PHONE,
         safe_telegram_call_func=safe_telegram_call
@@ -382,6 +402,28 @@ async def order_from_zip(update: Update, context: ContextTypes.DEFAULT_TYPE, ses
     return FROM_PHONE
 
 
+async def _apply_from_zip_shortcut(update: Update, context: ContextTypes.DEFAULT_TYPE, session_service, zip_info):
+    """Store city/state/ZIP resolved from offline ZIP database and jump to phone"""
+    user_id = update.effective_user.id
+    context.user_data['from_city'] = zip_info.city
+    context.user_data['from_state'] = zip_info.state
+    context.user_data['from_zip'] = zip_info.zip_code
+    
+    if not context.user_data.get('editing_template_from'):
+        for field in ('from_city', 'from_state', 'from_zip'):
+            await session_service.save_order_field(user_id, field, context.user_data[field])
+    
+    logger.info(f"📮 FROM ZIP shortcut: {zip_info.zip_code} → {zip_info.city}, {zip_info.state}")
+    
+    old_prompt_text = context.user_data.get('last_bot_message_text', '')
+    asyncio.create_task(mark_message_as_selected(update, context, prompt_text=old_prompt_text))
+    
+    return await _ask_from_phone(
+        update, context,
+        prefix=f"✅ {zip_info.city}, {zip_info.state} {zip_info.zip_code}\n\n"
+    )
+
+
 @safe_handler(fallback_state=ConversationHandler.END)
 @with_typing_action()
 @with_user_session(create_user=False, require_session=True)
@@ -13,6 +13,8 @@ logger = logging.getLogger(__name__)
 from handlers.common_handlers import safe_telegram_call, mark_message_as_selected
 from utils.validators import validate_weight  # Keep only weight validation
 from utils.handler_decorators import with_user_session, safe_handler, with_typing_action, with_services
+from utils.order_card import order_card
+from services.rate_prefetch import rate_prefetcher
 from telegram.ext import ConversationHandler
 
 
@@ -49,6 +51,9 @@ async def order_parcel_weight(update: Update, context: ContextTypes.DEFAULT_TYPE
     # Update session via repository
     # Session service injected via decorator
     await session_service.save_order_field(user_id, 'parcel_weight', weight)
+    
+    # 🔮 Start quoting now - rates are usually ready by CONFIRM_DATA
+    rate_prefetcher.schedule(user_id, context.user_data)
     # REMOVED: ConversationHandler manages state via Persistence
         # await session_service.update_session_step(user_id, step="PARCEL_LENGTH")
     
@@ -68,19 +73,12 @@ async def order_parcel_weight(update: Update, context: ContextTypes.DEFAULT_TYPE
     
     message_text = OrderStepMessages.PARCEL_LENGTH
     
-    # Save state IMMEDIATELY (before background task)
+    # Save state IMMEDIATELY (kept if the Telegram call fails)
     context.user_data['last_bot_message_text'] = message_text
     
-    # 🚀 PERFORMANCE: Send message in background - don't wait for Telegram response
-    async def send_next_step():
-        bot_msg = await safe_telegram_call(update.effective_message.reply_text(
-            message_text,
-            reply_markup=reply_markup
-        ))
-        if bot_msg:
-            context.user_data['last_bot_message_id'] = bot_msg.message_id
-    
-    asyncio.create_task(send_next_step())
+    # Send message (or redraw the order card); awaited so the card id and
+    # prompt are in user_data before the update finishes and is persisted
+    await order_card.render(update, context, message_text, reply_markup=reply_markup)
     
     return PARCEL_LENGTH
 
@@ -110,6 +108,9 @@ async def order_parcel_length(update: Update, context: ContextTypes.DEFAULT_TYPE
     # Update session via repository
     # Session service injected via decorator
     await session_service.save_order_field(user_id, 'parcel_length', length)
+    
+    # 🔮 Start quoting now - rates are usually ready by CONFIRM_DATA
+    rate_prefetcher.schedule(user_id, context.user_data)
     # REMOVED: ConversationHandler manages state via Persistence
         # await session_service.update_session_step(user_id, step="PARCEL_WIDTH")
     
@@ -132,19 +133,12 @@ async def order_parcel_length(update: Update, context: ContextTypes.DEFAULT_TYPE
     
     message_text = OrderStepMessages.PARCEL_WIDTH
     
-    # Save state IMMEDIATELY (before background task)
+    # Save state IMMEDIATELY (kept if the Telegram call fails)
     context.user_data['last_bot_message_text'] = message_text
     
-    # 🚀 PERFORMANCE: Send message in background - don't wait for Telegram response
-    async def send_next_step():
-        bot_msg = await safe_telegram_call(update.effective_message.reply_text(
-            message_text,
-            reply_markup=reply_markup
-        ))
-        if bot_msg:
-            context.user_data['last_bot_message_id'] = bot_msg.message_id
-    
-    asyncio.create_task(send_next_step())
+    # Send message (or redraw the order card); awaited so the card id and
+    # prompt are in user_data before the update finishes and is persisted
+    await order_card.render(update, context, message_text, reply_markup=reply_markup)
     
     return PARCEL_WIDTH
 
@@ -174,6 +168,9 @@ async def order_parcel_width(update: Update, context: ContextTypes.DEFAULT_TYPE,
     # Update session via repository
     # Session service injected via decorator
     await session_service.save_order_field(user_id, 'parcel_width', width)
+    
+    # 🔮 Start quoting now - rates are usually ready by CONFIRM_DATA
+    rate_prefetcher.schedule(user_id, context.user_data)
     # REMOVED: ConversationHandler manages state via Persistence
         # await session_service.update_session_step(user_id, step="PARCEL_HEIGHT")
     
@@ -194,19 +191,12 @@ async def order_parcel_width(update: Update, context: ContextTypes.DEFAULT_TYPE,
     
     message_text = OrderStepMessages.PARCEL_HEIGHT
     
-    # Save state IMMEDIATELY (before background task)
+    # Save state IMMEDIATELY (kept if the Telegram call fails)
     context.user_data['last_bot_message_text'] = message_text
     
-    # 🚀 PERFORMANCE: Send message in background - don't wait for Telegram response
-    async def send_next_step():
-        bot_msg = await safe_telegram_call(update.effective_message.reply_text(
-            message_text,
-            reply_markup=reply_markup
-        ))
-        if bot_msg:
-            context.user_data['last_bot_message_id'] = bot_msg.message_id
-    
-    asyncio.create_task(send_next_step())
+    # Send message (or redraw the order card); awaited so the card id and
+    # prompt are in user_data before the update finishes and is persisted
+    await order_card.render(update, context, message_text, reply_markup=reply_markup)
     
     return PARCEL_HEIGHT
 
@@ -236,6 +226,9 @@ async def order_parcel_height(update: Update, context: ContextTypes.DEFAULT_TYPE
     # Update session via repository
     # Session service injected via decorator
     await session_service.save_order_field(user_id, 'parcel_height', height)
+    
+    # 🔮 Start quoting now - rates are usually ready by CONFIRM_DATA
+    rate_prefetcher.schedule(user_id, context.user_data)
     # REMOVED: ConversationHandler manages state via Persistence
         # await session_service.update_session_step(user_id, step="CALCULATING_RATES")
     
@@ -11,10 +11,104 @@ from telegram.ext import ContextTypes, ConversationHandler
 logger = logging.getLogger(__name__)
 
 from utils.handler_decorators import with_user_session, safe_handler
+from utils.order_card import order_call_meter
 from handlers.common_handlers import check_stale_interaction
 from server import safe_telegram_call, mark_message_as_selected
 
 
+async def complete_balance_label_job(job: dict):
+    """
+    Label job for a balance order succeeded: mark paid, notify
+    
+    Called by services.label_queue when the job reaches 'done'. The
+    balance was debited when the job was enqueued (payload 'reserved');
+    jobs enqueued before that are charged here.
+    """
+    from server import db, bot_instance
+    from services.service_factory import ServiceFactory
+    from repositories import get_user_repo
+    from utils.ui_utils import PaymentFlowUI
+    
+    telegram_id = job['telegram_id']
+    order_id = job['order_id']
+    amount = job['payload']['amount']
+    
+    if not job['payload'].get('reserved'):
+        payment_service = ServiceFactory(db).get_payment_service()
+        success, error = await payment_service.process_balance_payment(
+            telegram_id=telegram_id,
+            order_id=order_id,
+            amount=amount
+        )
+        
+        if not success:
+            # Label is bought already - admin has to settle the balance
+            logger.error(f"Failed to process payment: {error}")
+            from handlers.admin_handlers import notify_admin_error
+            user = await get_user_repo().find_by_telegram_id(telegram_id)
+            await notify_admin_error(
+                user_info=user or {'telegram_id': telegram_id},
+                error_type="Label Bought, Balance Not Charged",
+                error_details=f"${amount:.2f}: {error}",
+                order_id=order_id
+            )
+            if bot_instance:
+                await safe_telegram_call(bot_instance.send_message(
+                    chat_id=telegram_id,
+                    text=f"❌ Ошибка обработки платежа: {error}"
+                ))
+            return
+    
+    await db.orders.update_one(
+        {"order_id": order_id},
+        {"$set": {"payment_status": "paid"}}
+    )
+    logger.info(f"✅ Order {order_id} status updated to 'paid'")
+    
+    new_balance = await get_user_repo().get_balance(telegram_id)
+    
+    if bot_instance:
+        keyboard = [[InlineKeyboardButton("🔙 Главное меню", callback_data='start')]]
+        await safe_telegram_call(bot_instance.send_message(
+            chat_id=telegram_id,
+            text=PaymentFlowUI.payment_success_balance(amount, new_balance, order_id),
+            reply_markup=InlineKeyboardMarkup(keyboard)
+        ))
+
+
+async def fail_balance_label_job(job: dict):
+    """
+    Label job for a balance order was dead-lettered: refund the reserved amount
+    """
+    from server import db, bot_instance
+    from services.service_factory import ServiceFactory
+    
+    await db.orders.update_one(
+        {"order_id": job['order_id']},
+        {"$set": {"payment_status": "failed", "shipping_status": "failed"}}
+    )
+    
+    if job['payload'].get('reserved'):
+        # Refund once, even if dead-letter handling runs again
+        claimed = await db.label_jobs.update_one(
+            {"_id": job['_id'], "payload.refunded": {"$ne": True}},
+            {"$set": {"payload.refunded": True}}
+        )
+        if claimed.modified_count:
+            payment_service = ServiceFactory(db).get_payment_service()
+            await payment_service.refund_balance(job['telegram_id'], job['order_id'], job['payload']['amount'])
+    
+    if bot_instance:
+        keyboard = [[InlineKeyboardButton("🔙 Главное меню", callback_data='start')]]
+        await safe_telegram_call(bot_instance.send_message(
+            chat_id=job['telegram_id'],
+            text="""❌ Не удалось создать shipping label.
+Оплата возвращена на ваш баланс.
+Пожалуйста, свяжитесь с администратором.""",
+            reply_markup=InlineKeyboardMarkup(keyboard)
+        ))
+
+
 @safe_handler(fallback_state=ConversationHandler.END)
 @with_user_session(create_user=False, require_session=True)
 async def show_payment_methods(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -313,13 +407,9 @@ async def process_payment(update: Update, context: ContextTypes.DEFAULT_TYPE):
     try:
         if query.data == 'pay_from_balance':
             # Import required functions
-            from server import create_and_send_label, db
-            from services.service_factory import ServiceFactory
+            from server import db
             from utils.ui_utils import PaymentFlowUI
-            
-            # Get payment service
-            service_factory = ServiceFactory(db)
-            payment_service = service_factory.get_payment_service()
+            from services.service_factory import ServiceFactory
             
             if user.get('balance', 0) < amount:
                 await safe_telegram_call(update.effective_message.reply_text(PaymentFlowUI.insufficient_balance_error()))
@@ -347,7 +437,7 @@ async def process_payment(update: Update, context: ContextTypes.DEFAULT_TYPE):
                     ))
                     return ConversationHandler.END
             else:
-                # Find order in database (need _id for create_and_send_label)
+                # Find order in database (need order_id for the label job)
                 order = await db.orders.find_one({"order_id": order_id})
                 
                 if not order:
@@ -368,109 +458,49 @@ async def process_payment(update: Update, context: ContextTypes.DEFAULT_TYPE):
             
             logger.info(f"✅ Found pending order {order_id}, proceeding with payment")
             
-            # Show progress indicator while creating label
+            # Debit now with one conditional $inc (concurrent payments can't
+            # overdraw); the label job refunds it if the label can't be bought
+            payment_service = ServiceFactory(db).get_payment_service()
+            reserved, error = await payment_service.process_balance_payment(
+                telegram_id=telegram_id,
+                order_id=order_id,
+                amount=amount
+            )
+            if not reserved:
+                logger.warning(f"⚠️ Balance debit for order {order_id} failed: {error}")
+                await safe_telegram_call(update.effective_message.reply_text(PaymentFlowUI.insufficient_balance_error()))
+                return ConversationHandler.END
+            
+            # Label is bought in the background (label job queue); the
+            # progress message is updated by the worker
             progress_msg = await safe_telegram_call(update.effective_message.reply_text(
-                "⏳ Создаем shipping label... 0 сек",
-                parse_mode='Markdown'
+                "⏳ Создаем shipping label... Этикетка придет в этот чат через несколько секунд."
             ))
             
-            # Start progress updater in background
-            progress_task = None
-            if progress_msg:
-                async def update_progress():
-                    seconds = 0
-                    try:
-                        while True:
-                            await asyncio.sleep(0.3)
-                            seconds += 1
-                            await safe_telegram_call(progress_msg.edit_text(
-                                f"⏳ Создаем shipping label... {seconds} сек",
-                                parse_mode='Markdown'
-                            ))
-                    except asyncio.CancelledError:
-                        pass
-                    except Exception as e:
-                        logger.debug(f"Progress update error: {e}")
-                
-                progress_task = asyncio.create_task(update_progress())
-            
-            # Try to create shipping label (pass order_id string, not MongoDB _id)
-            label_created = await create_and_send_label(order['order_id'], telegram_id, query.message)
-            
-            # Stop progress indicator and delete message
-            if progress_task:
-                progress_task.cancel()
-                try:
-                    await progress_task
-                except asyncio.CancelledError:
-                    pass
+            from services.label_queue import label_job_queue
+            try:
+                job, created = await label_job_queue.enqueue(
+                    order['order_id'],
+                    telegram_id,
+                    source='balance',
+                    payload={'amount': amount, 'reserved': True},
+                    progress_message=progress_msg
+                )
+            except Exception:
+                await payment_service.refund_balance(telegram_id, order_id, amount)
+                raise
             
-            if progress_msg:
-                try:
-                    await safe_telegram_call(progress_msg.delete())
-                except Exception as e:
-                    logger.debug(f"Failed to delete progress message: {e}")
+            if not created:
+                # The existing job holds its own debit
+                await payment_service.refund_balance(telegram_id, order_id, amount)
+                logger.warning(f"⚠️ Order {order_id} already has a label job ({job.get('status')})")
+                if progress_msg:
+                    await safe_telegram_call(progress_msg.edit_text("⏳ Этот заказ уже обрабатывается."))
             
-            if label_created:
-                # Only deduct balance if label was created successfully using payment service
-                success, error = await payment_service.process_balance_payment(
-                    telegram_id=telegram_id,
-                    order_id=order['order_id'],
-                    amount=amount
-                )
-                
-                if not success:
-                    logger.error(f"Failed to process payment: {error}")
-                    # This shouldn't happen as we checked balance earlier
-                    await safe_telegram_call(update.effective_message.reply_text(f"❌ Ошибка обработки платежа: {error}"))
-                    return ConversationHandler.END
-                
-                # Update order status to "paid" (NEW LOGIC)
-                await db.orders.update_one(
-                    {"order_id": order_id},
-                    {"$set": {"payment_status": "paid"}}
-                )
-                logger.info(f"✅ Order {order_id} status updated to 'paid'")
-                
-                # Get new balance after payment
-                from repositories import get_user_repo
-                user_repo = get_user_repo()
-                new_balance = await user_repo.get_balance(telegram_id)
-                
-                from utils.ui_utils import PaymentFlowUI
-                keyboard = [[InlineKeyboardButton("🔙 Главное меню", callback_data='start')]]
-                reply_markup = InlineKeyboardMarkup(keyboard)
-                
-                await safe_telegram_call(update.effective_message.reply_text(
-                    PaymentFlowUI.payment_success_balance(amount, new_balance, order.get('order_id')),
-                    reply_markup=reply_markup
-                ))
-                
-                # Mark order as completed to prevent stale button interactions
-                context.user_data.clear()
-                context.user_data['order_completed'] = True
-            else:
-                # Label creation failed - don't charge user
-                from repositories import get_repositories
-                repos = get_repositories()
-                await repos.orders.update_one(
-                    {"order_id": order['order_id']},
-                    {"$set": {"payment_status": "failed", "shipping_status": "failed"}}
-                )
-                
-                keyboard = [[InlineKeyboardButton("🔙 Главное меню", callback_data='start')]]
-                reply_markup = InlineKeyboardMarkup(keyboard)
-                
-                await safe_telegram_call(update.effective_message.reply_text(
-            """❌ Не удалось создать shipping label.
-            Оплата не списана. Ваш баланс не изменился.
-            Пожалуйста, свяжитесь с администратором.""",
-            reply_markup=reply_markup
-        ))
-                
-                # Mark order as completed to prevent stale button interactions
-                context.user_data.clear()
-                context.user_data['order_completed'] = True
+            # Mark order as completed to prevent stale button interactions
+            context.user_data.clear()
+            context.user_data['order_completed'] = True
+            order_call_meter.finish(telegram_id, completed=True)
             
         elif query.data == 'pay_with_crypto':
             # Import required functions
@@ -526,6 +556,7 @@ async def process_payment(update: Update, context: ContextTypes.DEFAULT_TYPE):
 После успешной оплаты мы автоматически создадим shipping label.""",
                     reply_markup=reply_markup
                 ))
+                order_call_meter.finish(telegram_id, completed=True)
             else:
                 error_msg = invoice_result.get('error', 'Unknown error')
                 await safe_telegram_call(update.effective_message.reply_text(f"❌ Ошибка создания инвойса: {error_msg}"))
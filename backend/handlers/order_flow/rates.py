@@ -2,6 +2,7 @@
 Order Flow: Shipping Rates Handlers
 Handles fetching and displaying shipping rates
 """
+import copy
 import logging
 import os
 import time
@@ -10,7 +11,7 @@ from telegram import Update, ForceReply, InlineKeyboardButton, InlineKeyboardMar
 from telegram.ext import ContextTypes
 from handlers.common_handlers import safe_telegram_call
 from handlers.admin_handlers import notify_admin_error
-from services.api_services import get_shipstation_carrier_ids
+from services.carrier_catalog import carrier_catalog
 from services.shipping_service import display_shipping_rates
 from utils.session_utils import save_to_session
 
@@ -22,6 +23,87 @@ from server import CONFIRM_DATA
 # Get ShipStation API key from environment
 SHIPSTATION_API_KEY = os.environ.get('SHIPSTATION_API_KEY_TEST') or os.environ.get('SHIPSTATION_API_KEY_PROD')  # ⚠️ TEST MODE ENABLED
 
+async def fetch_and_prepare_rates(rate_request: dict, headers: dict):
+    """
+    Fetch rates from ShipStation and prepare them for display
+    
+    Applies carrier/service filters, balances per carrier and adds markup.
+    Runs once per in-flight quote key (see rate_quote_flight).
+    
+    Returns:
+        (success, rates_list, error_message) - rates_list is [] when
+        ShipStation answered but nothing survived the filters
+    """
+    from services.shipping_service import (
+        fetch_rates_from_shipstation,
+        apply_service_filter,
+        balance_and_deduplicate_rates
+    )
+    
+    success, all_rates, error_msg = await fetch_rates_from_shipstation(
+        rate_request=rate_request,
+        headers=headers,
+        api_url='https://api.shipstation.com/v2/rates',
+        timeout=30
+    )
+    if not success:
+        return False, None, error_msg
+    
+    # Log all rates received from API for debugging
+    logger.info(f"📦 Received {len(all_rates)} rates from ShipStation API")
+    for idx, rate in enumerate(all_rates[:10]):  # Log first 10
+        carrier = rate.get('carrier_friendly_name', rate.get('carrier', 'Unknown'))
+        service = rate.get('service_type', rate.get('service', 'Unknown'))
+        logger.info(f"   Rate {idx+1}: {carrier} - {service}")
+    
+    # First apply basic exclusion
+    excluded_carriers = ['globalpost']
+    all_rates = [
+        rate for rate in all_rates
+        if rate.get('carrier_code', '').lower() not in excluded_carriers
+    ]
+    
+    # Apply service filter using service
+    all_rates = apply_service_filter(all_rates)
+    
+    if not all_rates:
+        return True, [], None
+    
+    # Log carriers
+    carriers = set([r.get('carrier_friendly_name', 'Unknown') for r in all_rates])
+    logger.info(f"Got {len(all_rates)} rates from carriers: {carriers}")
+    
+    # Balance and deduplicate rates using service
+    rates = balance_and_deduplicate_rates(all_rates, max_per_carrier=5)[:15]
+    
+    # Add $10 markup to all rates (hidden from user - shown as part of shipping cost)
+    LABEL_MARKUP = 10.0
+    for rate in rates:
+        # Get original amount from shipping_amount dict or amount field
+        if 'shipping_amount' in rate and isinstance(rate['shipping_amount'], dict):
+            original_amount = rate['shipping_amount'].get('amount', 0.0)
+        elif 'amount' in rate:
+            original_amount = rate['amount']
+        else:
+            original_amount = 0.0
+        
+        # Store original amount for reference
+        rate['original_amount'] = original_amount
+        
+        # Add markup to displayed amount
+        if 'shipping_amount' in rate and isinstance(rate['shipping_amount'], dict):
+            rate['shipping_amount']['amount'] = original_amount + LABEL_MARKUP
+        elif 'amount' in rate:
+            rate['amount'] = original_amount + LABEL_MARKUP
+        else:
+            # Create shipping_amount structure if it doesn't exist
+            rate['shipping_amount'] = {'amount': original_amount + LABEL_MARKUP}
+            rate['amount'] = original_amount + LABEL_MARKUP
+    
+    logger.info(f"💰 Added ${LABEL_MARKUP} markup to {len(rates)} rates")
+    return True, rates, None
+
+
 async def fetch_shipping_rates(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Fetch shipping rates from ShipStation with caching"""
     logger.info("🚀 fetch_shipping_rates called")
@@ -36,8 +118,13 @@ async def fetch_shipping_rates(update: Update, context: ContextTypes.DEFAULT_TYP
     data = context.user_data
     logger.info(f"📋 User data keys: {list(data.keys())}")
     
+    # Rate cache / single-flight key; tell prefetcher which quote was used
+    from services.rate_prefetch import rate_prefetcher, quote_key_for
+    quote_key = quote_key_for(data)
+    rate_prefetcher.consume(update.effective_user.id, quote_key)
+    
     # Check cache first (before showing progress message)
-    cached_rates = shipstation_cache.get(
+    cached_rates = await shipstation_cache.get(
         from_zip=data['from_zip'],
         to_zip=data['to_zip'],
         weight=data['parcel_weight'],
@@ -113,13 +200,31 @@ async def fetch_shipping_rates(update: Update, context: ContextTypes.DEFAULT_TYP
             ))
             return CONFIRM_DATA
         
-        # Get carrier IDs
-        logger.info("📦 About to fetch carrier IDs from ShipStation...")
+        # Validate addresses (cached by normalized address, template addresses skip)
+        from services.api_services import validate_order_addresses
+        addresses_ok, address_error = await validate_order_addresses(data)
+        if not addresses_ok:
+            logger.warning(f"Address validation failed: {address_error}")
+            try:
+                await safe_telegram_call(progress_msg.delete())
+            except Exception:
+                pass
+            
+            from utils.ui_utils import get_edit_addresses_keyboard
+            reply_markup = get_edit_addresses_keyboard()
+            await safe_telegram_call(message.reply_text(
+                f"❌ Адрес не прошел проверку.\n\n{address_error}\n\nПожалуйста, исправьте адрес.",
+                reply_markup=reply_markup
+            ))
+            return CONFIRM_DATA
+        
+        # Get carrier IDs (served from in-memory carrier catalog)
+        logger.info("📦 Loading carrier IDs from carrier catalog...")
         headers = {
             'API-Key': SHIPSTATION_API_KEY,
             'Content-Type': 'application/json'
         }
-        carrier_ids = await get_shipstation_carrier_ids()
+        carrier_ids = await carrier_catalog.get_carrier_ids()
         logger.info(f"📦 Received carrier IDs: {len(carrier_ids) if carrier_ids else 0}")
         logger.info(f"📦 Carrier IDs dict: {carrier_ids}")
         if not carrier_ids:
@@ -163,24 +268,27 @@ async def fetch_shipping_rates(update: Update, context: ContextTypes.DEFAULT_TYP
         # Start progress update task
         progress_task = asyncio.create_task(update_progress())
         
-        # Fetch rates from ShipStation using service
-        from services.shipping_service import fetch_rates_from_shipstation
+        # Fetch rates from ShipStation; identical concurrent quotes
+        # (same route/weight/dimensions) share one upstream call
+        # (joins a still-running prefetch for the same quote)
+        from services.shipstation_cache import rate_quote_flight
         
         api_start_time = time.perf_counter()
-        success, all_rates, error_msg = await fetch_rates_from_shipstation(
-            rate_request=rate_request,
-            headers=headers,
-            api_url='https://api.shipstation.com/v2/rates',
-            timeout=30
+        success, prepared_rates, error_msg = await rate_quote_flight.do(
+            quote_key, fetch_and_prepare_rates, rate_request, headers
         )
         api_duration_ms = (time.perf_counter() - api_start_time) * 1000
         logger.info(f"⚡ ShipStation /rates API took {api_duration_ms:.2f}ms")
         
-        if not success and "timeout" in error_msg.lower():
-            # Handle timeout error
+        from utils.retry_utils import CircuitOpenError
+        circuit_open = not success and CircuitOpenError.is_circuit_message(error_msg)
+        
+        if not success and (circuit_open or "timeout" in error_msg.lower()):
+            # Handle timeout error / open circuit (fast-fail, retry later)
             logger.error(f"ShipStation rate request failed: {error_msg}")
             
             # Log error to session
+            from server import session_manager
             user_id = update.effective_user.id
             await session_manager.update_session_atomic(user_id, data={
                 'last_error': f'ShipStation API error: {error_msg}',
@@ -205,6 +313,7 @@ async def fetch_shipping_rates(update: Update, context: ContextTypes.DEFAULT_TYP
             reply_markup = get_retry_edit_cancel_keyboard()
             
             await safe_telegram_call(message.reply_text(
+                error_msg if circuit_open else
                 "❌ Превышено время ожидания ответа от сервиса доставки.\n\nПопробуйте еще раз или проверьте правильность адресов.",
                 reply_markup=reply_markup
             ))
@@ -253,28 +362,7 @@ async def fetch_shipping_rates(update: Update, context: ContextTypes.DEFAULT_TYP
         except asyncio.CancelledError:
             pass
         
-        # Log all rates received from API for debugging
-        logger.info(f"📦 Received {len(all_rates)} rates from ShipStation API")
-        for idx, rate in enumerate(all_rates[:10]):  # Log first 10
-            carrier = rate.get('carrier_friendly_name', rate.get('carrier', 'Unknown'))
-            service = rate.get('service_type', rate.get('service', 'Unknown'))
-            logger.info(f"   Rate {idx+1}: {carrier} - {service}")
-        
-        # Filter and format rates using service
-        
-        # First apply basic exclusion
-        excluded_carriers = ['globalpost']
-        filtered_rates = [
-            rate for rate in all_rates
-            if rate.get('carrier_code', '').lower() not in excluded_carriers
-        ]
-        all_rates = filtered_rates
-        
-        # Apply service filter using service
-        from services.shipping_service import apply_service_filter
-        all_rates = apply_service_filter(all_rates)
-        
-        if not all_rates or len(all_rates) == 0:
+        if not prepared_rates:
             # Delete progress message
             try:
                 await safe_telegram_call(progress_msg.delete())
@@ -290,39 +378,8 @@ async def fetch_shipping_rates(update: Update, context: ContextTypes.DEFAULT_TYP
         ))
             return CONFIRM_DATA  # Stay to handle callback
         
-        # Log carriers
-        carriers = set([r.get('carrier_friendly_name', 'Unknown') for r in all_rates])
-        logger.info(f"Got {len(all_rates)} rates from carriers: {carriers}")
-        
-        # Balance and deduplicate rates using service
-        from services.shipping_service import balance_and_deduplicate_rates
-        context.user_data['rates'] = balance_and_deduplicate_rates(all_rates, max_per_carrier=5)[:15]
-        
-        # Add $10 markup to all rates (hidden from user - shown as part of shipping cost)
-        LABEL_MARKUP = 10.0
-        for rate in context.user_data['rates']:
-            # Get original amount from shipping_amount dict or amount field
-            if 'shipping_amount' in rate and isinstance(rate['shipping_amount'], dict):
-                original_amount = rate['shipping_amount'].get('amount', 0.0)
-            elif 'amount' in rate:
-                original_amount = rate['amount']
-            else:
-                original_amount = 0.0
-            
-            # Store original amount for reference
-            rate['original_amount'] = original_amount
-            
-            # Add markup to displayed amount
-            if 'shipping_amount' in rate and isinstance(rate['shipping_amount'], dict):
-                rate['shipping_amount']['amount'] = original_amount + LABEL_MARKUP
-            elif 'amount' in rate:
-                rate['amount'] = original_amount + LABEL_MARKUP
-            else:
-                # Create shipping_amount structure if it doesn't exist
-                rate['shipping_amount'] = {'amount': original_amount + LABEL_MARKUP}
-                rate['amount'] = original_amount + LABEL_MARKUP
-        
-        logger.info(f"💰 Added ${LABEL_MARKUP} markup to {len(context.user_data['rates'])} rates")
+        # Coalesced callers share one result - give each user its own copy
+        context.user_data['rates'] = copy.deepcopy(prepared_rates)
         
         # Save to cache and session using service
         from services.shipping_service import save_rates_to_cache_and_session
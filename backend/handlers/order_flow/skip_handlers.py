@@ -13,6 +13,8 @@ logger = logging.getLogger(__name__)
 from handlers.common_handlers import safe_telegram_call, mark_message_as_selected
 from utils.ui_utils import get_cancel_keyboard, OrderStepMessages
 from utils.handler_decorators import with_user_session, safe_handler
+from utils.order_card import order_card
+from services.zip_database import zip_shortcut_hint
 from telegram.ext import ConversationHandler
 
 
@@ -74,16 +76,15 @@ async def handle_skip_field(
     # Save state IMMEDIATELY (before background task)
     context.user_data['last_bot_message_text'] = next_message
     
-    # Send message with ForceReply
-    bot_msg = await safe_telegram_call(update.effective_message.reply_text(
+    # Send message with ForceReply (or redraw the order card)
+    await order_card.render(
+        update, context,
         next_message,
         reply_markup=ForceReply(
             input_field_placeholder="⌨️ Жду ваш ответ...",
             selective=True
         )
-    ))
-    if bot_msg:
-        context.user_data['last_bot_message_id'] = bot_msg.message_id
+    )
     
     # Return next state constant
     return next_step_const
@@ -99,6 +100,7 @@ async def skip_from_address2(update: Update, context: ContextTypes.DEFAULT_TYPE)
     # Check if editing - use different message
     editing = context.user_data.get('editing_template_from') or context.user_data.get('editing_from_address')
     next_message = TemplateEditMessages.FROM_CITY if editing else OrderStepMessages.FROM_CITY
+    next_message += zip_shortcut_hint()
     
     return await handle_skip_field(
         update, context,
@@ -120,6 +122,7 @@ async def skip_to_address2(update: Update, context: ContextTypes.DEFAULT_TYPE):
     # Check if editing - use different message
     editing = context.user_data.get('editing_template_to') or context.user_data.get('editing_to_address')
     next_message = TemplateEditMessages.TO_CITY if editing else OrderStepMessages.TO_CITY
+    next_message += zip_shortcut_hint()
     
     return await handle_skip_field(
         update, context,
@@ -333,10 +336,12 @@ async def skip_parcel_dimensions(update: Update, context: ContextTypes.DEFAULT_T
     await safe_telegram_call(query.answer())
     
     # Edit message to remove buttons and show confirmation
-    await safe_telegram_call(query.message.edit_text(
-        "✅ Используются стандартные размеры: 10x10x10 дюймов",
-        reply_markup=None  # Remove keyboard
-    ))
+    # (an order card is redrawn by the confirmation screen instead)
+    if not order_card.owns(update, context):
+        await safe_telegram_call(query.message.edit_text(
+            "✅ Используются стандартные размеры: 10x10x10 дюймов",
+            reply_markup=None  # Remove keyboard
+        ))
     
     # Set standard dimensions
     user_id = update.effective_user.id
@@ -398,6 +403,10 @@ async def skip_parcel_dimensions(update: Update, context: ContextTypes.DEFAULT_T
         }
     )
     
+    # 🔮 Prefetch rates for the final dimensions while user reviews data
+    from services.rate_prefetch import rate_prefetcher
+    rate_prefetcher.schedule(user_id, context.user_data)
+    
     # Show data confirmation screen before fetching rates
     from handlers.order_flow.confirmation import show_data_confirmation
     return await show_data_confirmation(update, context)
@@ -412,10 +421,12 @@ async def skip_parcel_width_height(update: Update, context: ContextTypes.DEFAULT
     await safe_telegram_call(query.answer())
     
     # Edit message to remove buttons and show confirmation
-    await safe_telegram_call(query.message.edit_text(
-        "✅ Используются стандартные размеры для ширины и высоты: 10x10 дюймов",
-        reply_markup=None  # Remove keyboard
-    ))
+    # (an order card is redrawn by the confirmation screen instead)
+    if not order_card.owns(update, context):
+        await safe_telegram_call(query.message.edit_text(
+            "✅ Используются стандартные размеры для ширины и высоты: 10x10 дюймов",
+            reply_markup=None  # Remove keyboard
+        ))
     
     # Set standard width and height
     user_id = update.effective_user.id
@@ -453,6 +464,10 @@ async def skip_parcel_width_height(update: Update, context: ContextTypes.DEFAULT
         }
     )
     
+    # 🔮 Prefetch rates for the final dimensions while user reviews data
+    from services.rate_prefetch import rate_prefetcher
+    rate_prefetcher.schedule(user_id, context.user_data)
+    
     # Show data confirmation screen before fetching rates
     from handlers.order_flow.confirmation import show_data_confirmation
     return await show_data_confirmation(update, context)
@@ -467,10 +482,12 @@ async def skip_parcel_height(update: Update, context: ContextTypes.DEFAULT_TYPE)
     await safe_telegram_call(query.answer())
     
     # Edit message to remove buttons and show confirmation
-    await safe_telegram_call(query.message.edit_text(
-        "✅ Используется стандартная высота: 10 дюймов",
-        reply_markup=None  # Remove keyboard
-    ))
+    # (an order card is redrawn by the confirmation screen instead)
+    if not order_card.owns(update, context):
+        await safe_telegram_call(query.message.edit_text(
+            "✅ Используется стандартная высота: 10 дюймов",
+            reply_markup=None  # Remove keyboard
+        ))
     
     # Set standard height
     user_id = update.effective_user.id
@@ -504,6 +521,10 @@ async def skip_parcel_height(update: Update, context: ContextTypes.DEFAULT_TYPE)
         data={'parcel_height': 10.0}
     )
     
+    # 🔮 Prefetch rates for the final dimensions while user reviews data
+    from services.rate_prefetch import rate_prefetcher
+    rate_prefetcher.schedule(user_id, context.user_data)
+    
     # Show data confirmation screen before fetching rates
     from handlers.order_flow.confirmation import show_data_confirmation
     return await show_data_confirmation(update, context)
@@ -23,7 +23,7 @@ async def save_template_name(update: Update, context: ContextTypes.DEFAULT_TYPE)
         TEMPLATE_NAME,
         db, safe_telegram_call
     )
-    from utils.db_operations import insert_template, count_user_templates
+    from utils.db_operations import insert_template, count_user_templates, update_template
     from services import template_service
     
     # Remove cancel button from previous message if it exists
@@ -146,6 +146,11 @@ async def save_template_name(update: Update, context: ContextTypes.DEFAULT_TYPE)
     
     asyncio.create_task(send_success())
     
+    # Validate addresses once in background, store fingerprints on template
+    asyncio.create_task(template_service.prevalidate_template(
+        template_id, dict(context.user_data), update_template
+    ))
+    
     # Save template name for potential continuation
     context.user_data['saved_template_name'] = template_name
     
@@ -210,6 +215,11 @@ async def handle_template_update(update: Update, context: ContextTypes.DEFAULT_T
     )
     
     if result.modified_count > 0:
+        # Addresses changed - refresh pre-validated fingerprints in background
+        from services.template_service import prevalidate_template
+        from utils.db_operations import update_template
+        asyncio.create_task(prevalidate_template(template_id, dict(context.user_data), update_template))
+        
         template_name = context.user_data.get('pending_template_name', 'шаблон')
         keyboard = [
             [InlineKeyboardButton("📦 Продолжить создание заказа", callback_data='continue_order')],
@@ -12,6 +12,7 @@ logger = logging.getLogger(__name__)
 # Import shared utilities
 from handlers.common_handlers import safe_telegram_call, mark_message_as_selected
 from utils.handler_decorators import with_user_session, safe_handler, with_typing_action, with_services
+from services.zip_database import zip_db, zip_shortcut_hint
 from telegram.ext import ConversationHandler
 
 
@@ -169,6 +170,7 @@ async def order_to_address2(update: Update, context: ContextTypes.DEFAULT_TYPE,
         message_text = TemplateEditMessages.TO_CITY
     else:
         message_text = OrderStepMessages.TO_CITY
+    message_text += zip_shortcut_hint()
     
     await ask_with_cancel_and_focus(
         update,
@@ -190,7 +192,10 @@ async def order_to_city(update: Update, context: ContextTypes.DEFAULT_TYPE, sess
     """Step 11/13: Collect recipient city"""
     from server import sanitize_string, TO_CITY, TO_STATE, STATE_NAMES
     
-    
+    # 📮 ZIP entered instead of city: fill city + state locally, skip 2 steps
+    zip_info = zip_db.lookup(update.effective_message.text)
+    if zip_info:
+        return await _apply_to_zip_shortcut(update, context, session_service, zip_info)
     
     city = update.effective_message.text.strip()
     city = sanitize_string(city, max_length=50)
@@ -295,6 +300,14 @@ async def order_to_zip(update: Update, context: ContextTypes.DEFAULT_TYPE, sessi
     
     zip_code = update.effective_message.text.strip()
     
+    # Reject impossible ZIP/state locally (no ShipStation call);
+    # a ZIP3 prefix mismatch is only a warning shown with the next prompt
+    is_valid, error_msg = zip_db.validate(context.user_data.get('to_state'), zip_code)
+    if not is_valid:
+        await safe_telegram_call(update.effective_message.reply_text(error_msg))
+        return TO_ZIP
+    zip_warning = f"{error_msg}\n\n" if error_msg else ""
+    
     # Store
     user_id = update.effective_user.id
     context.user_data['to_zip'] = zip_code
@@ -314,6 +327,13 @@ async def order_to_zip(update: Update, context: ContextTypes.DEFAULT_TYPE, sessi
     
     asyncio.create_task(mark_message_as_selected(update, context, prompt_text=old_prompt_text))
     
+    return await _ask_to_phone(update, context, prefix=zip_warning)
+
+
+async def _ask_to_phone(update: Update, context: ContextTypes.DEFAULT_TYPE, prefix: str = ""):
+    """Show recipient phone prompt (optional field with SKIP option)"""
+    from server import TO_PHONE
+    
     from utils.ui_utils import get_skip_and_cancel_keyboard, OrderStepMessages, CallbackData, TemplateEditMessages
     
     # Use different messages for template editing vs order creation
@@ -328,7 +348,7 @@ async def order_to_zip(update: Update, context: ContextTypes.DEFAULT_TYPE, sessi
     await ask_with_skip_cancel_and_focus(
         update,
         context,
-        message_text,
+        prefix + message_text,
         skip_callback=CallbackData.SKIP_TO_PHONE,
         next_state=TO_PHONE,
         safe_telegram_call_func=safe_telegram_call
@@ -337,6 +357,28 @@ async def order_to_zip(update: Update, context: ContextTypes.DEFAULT_TYPE, sessi
     return TO_PHONE
 
 
+async def _apply_to_zip_shortcut(update: Update, context: ContextTypes.DEFAULT_TYPE, session_service, zip_info):
+    """Store city/state/ZIP resolved from offline ZIP database and jump to phone"""
+    user_id = update.effective_user.id
+    context.user_data['to_city'] = zip_info.city
+    context.user_data['to_state'] = zip_info.state
+    context.user_data['to_zip'] = zip_info.zip_code
+    
+    if not context.user_data.get('editing_template_to'):
+        for field in ('to_city', 'to_state', 'to_zip'):
+            await session_service.save_order_field(user_id, field, context.user_data[field])
+    
+    logger.info(f"📮 TO ZIP shortcut: {zip_info.zip_code} → {zip_info.city}, {zip_info.state}")
+    
+    old_prompt_text = context.user_data.get('last_bot_message_text', '')
+    asyncio.create_task(mark_message_as_selected(update, context, prompt_text=old_prompt_text))
+    
+    return await _ask_to_phone(
+        update, context,
+        prefix=f"✅ {zip_info.city}, {zip_info.state} {zip_info.zip_code}\n\n"
+    )
+
+
 @safe_handler(fallback_state=ConversationHandler.END)
 @with_typing_action()
 @with_user_session(create_user=False, require_session=True)
@@ -144,6 +144,10 @@ async def use_template(update: Update, context: ContextTypes.DEFAULT_TYPE):
     context.user_data['to_zip'] = template.get('to_zip')
     context.user_data['to_phone'] = template.get('to_phone')
     
+    # Pre-validated addresses skip validation (see prevalidate_template)
+    context.user_data['from_address_fingerprint'] = template.get('from_address_fingerprint')
+    context.user_data['to_address_fingerprint'] = template.get('to_address_fingerprint')
+    
     logger.info(f"✅ Template data loaded into context: from_name={context.user_data.get('from_name')}, to_name={context.user_data.get('to_name')}")
     
     # Remove buttons from template view message
@@ -440,6 +444,11 @@ async def save_order_as_template(telegram_id: int, template_name: str, order_dat
         await db.templates.insert_one(template)
         logger.info(f"✅ Template saved for user {telegram_id}: {template_name}")
         
+        # Validate addresses once in background, store fingerprints
+        from services.template_service import prevalidate_template
+        from utils.db_operations import update_template
+        asyncio.create_task(prevalidate_template(template['id'], dict(order_data), update_template))
+        
         return template['id']
         
     except Exception as e:
@@ -9,14 +9,14 @@ from datetime import datetime, timezone
 logger = logging.getLogger(__name__)
 
 
-async def handle_oxapay_webhook(request: Request, db, bot_instance, safe_telegram_call, find_user_by_telegram_id, find_pending_order, create_and_send_label):
+async def handle_oxapay_webhook(request: Request, db, bot_instance, safe_telegram_call, find_user_by_telegram_id, find_pending_order, enqueue_label):
     """
     Handle Oxapay payment webhooks
     
     Process payment notifications from Oxapay:
     - Update payment status in database
     - Handle top-up payments (add to user balance)
-    - Handle order payments (trigger label creation)
+    - Handle order payments (enqueue label purchase job)
     - Send notifications to users
     
     Args:
@@ -26,7 +26,7 @@ async def handle_oxapay_webhook(request: Request, db, bot_instance, safe_telegra
         safe_telegram_call: Safe Telegram API wrapper
         find_user_by_telegram_id: User lookup function
         find_pending_order: Pending order lookup function
-        create_and_send_label: Label creation function
+        enqueue_label: Label job enqueue function (label_job_queue.enqueue)
     
     Returns:
         dict: Status response for Oxapay
@@ -248,13 +248,13 @@ async def handle_oxapay_webhook(request: Request, db, bot_instance, safe_telegra
                         {"$set": {"payment_status": "paid"}}
                     )
                     
-                    # Auto-create shipping label
+                    # Auto-create shipping label (background job, webhook returns at once)
                     try:
                         order = await db.orders.find_one({"id": payment['order_id']}, {"_id": 0})
                         if order:
-                            await create_and_send_label(payment['order_id'], order['telegram_id'], None)
+                            await enqueue_label(payment['order_id'], order['telegram_id'], source='crypto')
                     except Exception as e:
-                        logger.error(f"Failed to create label: {e}")
+                        logger.error(f"Failed to enqueue label job: {e}")
         
         return {"status": "ok"}
     except Exception as e:
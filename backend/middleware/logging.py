@@ -7,6 +7,8 @@ from starlette.middleware.base import BaseHTTPMiddleware
 import logging
 import time
 
+from .security import is_webhook_lane
+
 logger = logging.getLogger(__name__)
 
 
@@ -37,6 +39,10 @@ class RequestLoggingMiddleware(BaseHTTPMiddleware):
         Returns:
             Response
         """
+        # Telegram webhook: не логируем каждый апдейт
+        if is_webhook_lane(request):
+            return await call_next(request)
+        
         # Начало обработки
         start_time = time.time()
         
@@ -1,6 +1,9 @@
 """
 Rate Limiter Middleware for Telegram Bot
 Prevents API rate limiting and potential bans
+
+Superseded: outbound Telegram requests are paced by the application's
+send scheduler (services/telegram_send_scheduler.py).
 """
 import asyncio
 import time
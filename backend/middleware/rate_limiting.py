@@ -9,6 +9,8 @@ import time
 from collections import defaultdict
 from typing import Dict, Tuple
 
+from .security import is_webhook_lane
+
 logger = logging.getLogger(__name__)
 
 
@@ -122,6 +124,10 @@ class RateLimitMiddleware(BaseHTTPMiddleware):
         Returns:
             Response
         """
+        # Telegram webhook (secret_token проверен) - без лимитов по IP
+        if is_webhook_lane(request):
+            return await call_next(request)
+        
         # Периодическая очистка
         self._cleanup_old_requests()
         
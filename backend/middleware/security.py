@@ -2,12 +2,14 @@
 Security Middleware
 Centralized security system for the application
 """
+import hmac
 import logging
 import time
 from typing import Optional, Dict
 from fastapi import Request, HTTPException, status
 from fastapi.responses import JSONResponse
 from starlette.middleware.base import BaseHTTPMiddleware
+from starlette.responses import Response
 from collections import defaultdict
 from datetime import datetime, timezone
 import re
@@ -253,6 +255,10 @@ class SecurityMiddleware(BaseHTTPMiddleware):
         """
         start_time = time.time()
         
+        # Authenticated Telegram webhook: no per-IP limits (TelegramWebhookLane)
+        if is_webhook_lane(request):
+            return await call_next(request)
+        
         # Get client IP
         client_ip = security_manager.get_client_ip(request)
         
@@ -313,6 +319,110 @@ class SecurityMiddleware(BaseHTTPMiddleware):
         return "default"
 
 
+# ============================================================
+# TELEGRAM WEBHOOK LANE
+# ============================================================
+
+# Scope key set for webhook requests that passed the secret_token check
+WEBHOOK_LANE_KEY = "telegram_webhook_lane"
+
+
+def is_webhook_lane(request: Request) -> bool:
+    """Request is an authenticated Telegram webhook call"""
+    return request.scope.get(WEBHOOK_LANE_KEY, False)
+
+
+class TelegramWebhookGuard:
+    """
+    Проверка X-Telegram-Bot-Api-Secret-Token
+    
+    All Telegram traffic comes from a few Telegram IPs, so per-IP limits
+    would throttle the bot's own webhook. Telegram sends the secret_token
+    given to set_webhook in every call; it is compared in constant time.
+    """
+    
+    def __init__(self):
+        self.accepted = 0
+        self.rejected = 0
+    
+    def verify(self, provided: bytes) -> bool:
+        """
+        Check the secret token header value
+        
+        Args:
+            provided: Header value (bytes, may be empty)
+        
+        Returns:
+            True if it matches the configured secret token
+        """
+        from utils.bot_config import get_webhook_secret_token
+        
+        expected = get_webhook_secret_token().encode()
+        if expected and hmac.compare_digest(provided, expected):
+            self.accepted += 1
+            return True
+        self.rejected += 1
+        return False
+    
+    def get_stats(self) -> Dict[str, int]:
+        """
+        Получить статистику проверки webhook
+        
+        Returns:
+            dict: принято / отклонено запросов
+        """
+        return {
+            'accepted': self.accepted,
+            'rejected': self.rejected,
+        }
+
+
+# Global webhook guard
+telegram_webhook_guard = TelegramWebhookGuard()
+
+
+class TelegramWebhookLane:
+    """
+    Dedicated lane for the Telegram webhook (pure ASGI, outermost middleware)
+    
+    - Webhook path + valid secret token: the request is marked with
+      WEBHOOK_LANE_KEY; rate limiting and request logging middlewares
+      pass it straight through
+    - Webhook path without it: 401 with an empty body, nothing else runs
+    - Any other path: untouched
+    """
+    
+    def __init__(self, app, path: Optional[str] = None):
+        """
+        Args:
+            app: ASGI application
+            path: Webhook path (по умолчанию WEBHOOK_PATH из bot_config)
+        """
+        self.app = app
+        if path is None:
+            from utils.bot_config import get_bot_config
+            path = get_bot_config().webhook_path
+        self.path = path if path.startswith('/') else f'/{path}'
+    
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] != self.path:
+            await self.app(scope, receive, send)
+            return
+        
+        provided = b""
+        for name, value in scope["headers"]:
+            if name == b"x-telegram-bot-api-secret-token":
+                provided = value
+                break
+        
+        if not telegram_webhook_guard.verify(provided):
+            await Response(status_code=status.HTTP_401_UNAUTHORIZED)(scope, receive, send)
+            return
+        
+        scope[WEBHOOK_LANE_KEY] = True
+        await self.app(scope, receive, send)
+
+
 # ============================================================
 # AUDIT LOGGING
 # ============================================================
@@ -404,8 +514,12 @@ __all__ = [
     'SecurityMiddleware',
     'SecurityManager',
     'RateLimiter',
+    'TelegramWebhookLane',
+    'TelegramWebhookGuard',
+    'is_webhook_lane',
     'AuditLogger',
     'security_manager',
     'rate_limiter',
+    'telegram_webhook_guard',
     'audit_logger'
 ]
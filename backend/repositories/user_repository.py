@@ -154,6 +154,67 @@ class UserRepository(BaseRepository):
         
         return result
     
+    async def deduct_balance_if_sufficient(self, telegram_id: int, amount: float) -> bool:
+        """
+        Списать с баланса, только если хватает средств (атомарно)
+        
+        Check and debit are one conditional $inc, so concurrent payments
+        cannot take the balance below zero.
+        
+        Args:
+            telegram_id: Telegram ID
+            amount: Сумма
+            
+        Returns:
+            True если списано, False если средств недостаточно
+        """
+        amount = abs(amount)
+        return await self.update_one(
+            {"telegram_id": telegram_id, "balance": {"$gte": amount}},
+            {"$inc": {"balance": -amount}}
+        )
+    
+    async def deduct_balance_for_charge(self, telegram_id: int, amount: float, charge_id: str) -> bool:
+        """
+        Списать с баланса и записать charge_id в pending_charges (атомарно)
+        
+        The debit and its marker are in one document update, so a caller
+        that crashed right after it can still find out whether it happened
+        (refund_pending_charge). The same charge_id is never debited twice.
+        
+        Args:
+            telegram_id: Telegram ID
+            amount: Сумма
+            charge_id: Ключ списания (batch_id)
+            
+        Returns:
+            True если списано
+        """
+        amount = abs(amount)
+        return await self.update_one(
+            {"telegram_id": telegram_id, "balance": {"$gte": amount}, "pending_charges": {"$ne": charge_id}},
+            {"$inc": {"balance": -amount}, "$addToSet": {"pending_charges": charge_id}}
+        )
+    
+    async def clear_pending_charge(self, telegram_id: int, charge_id: str) -> bool:
+        """Снять отметку списания после того, как оно учтено у заказа"""
+        return await self.update_one(
+            {"telegram_id": telegram_id},
+            {"$pull": {"pending_charges": charge_id}}
+        )
+    
+    async def refund_pending_charge(self, telegram_id: int, amount: float, charge_id: str) -> bool:
+        """
+        Вернуть списание, если оно еще отмечено в pending_charges (атомарно)
+        
+        Returns:
+            True если возвращено, False если такого списания нет
+        """
+        return await self.update_one(
+            {"telegram_id": telegram_id, "pending_charges": charge_id},
+            {"$inc": {"balance": abs(amount)}, "$pull": {"pending_charges": charge_id}}
+        )
+    
     async def get_balance(self, telegram_id: int) -> float:
         """
         Получить баланс пользователя
@@ -5,6 +5,7 @@ Handles user management endpoints
 from fastapi import APIRouter, Depends, HTTPException, Query, Request
 from pydantic import BaseModel
 from handlers.admin_handlers import verify_admin_key
+from utils.fast_json import FastJSONResponse
 import logging
 
 logger = logging.getLogger(__name__)
@@ -48,12 +49,12 @@ async def get_users(
             blocked_only=blocked_only
         )
         
-        return {
+        return FastJSONResponse({
             "users": users,
             "count": len(users),
             "limit": limit,
             "skip": skip
-        }
+        })
     
     except Exception as e:
         logger.error(f"Error getting users: {e}")
@@ -265,6 +265,7 @@ async def set_webhook_manually(
         # Установить новый
         await bot_instance.set_webhook(
             url=webhook_url,
+            secret_token=get_bot_config().get_webhook_secret_token(),
             allowed_updates=["message", "callback_query"]
         )
         
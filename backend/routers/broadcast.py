@@ -1,13 +1,18 @@
 """
 Broadcast Router
 Эндпоинты для рассылки сообщений
+
+Broadcasts run as background jobs (services/broadcast_engine.py); the
+admin panel polls GET /api/broadcast/{broadcast_id} for progress.
 """
 from fastapi import APIRouter, HTTPException, Request, Depends
 from handlers.admin_handlers import verify_admin_key
-from typing import Optional
-import asyncio
+from typing import Any, Dict, Optional
 import logging
 
+from services.broadcast_engine import broadcast_engine
+from services.segment_engine import segment_engine
+
 logger = logging.getLogger(__name__)
 
 router = APIRouter(prefix="/api/broadcast", tags=["broadcast"])
@@ -20,6 +25,11 @@ class BroadcastRequest(BaseModel):
     target: str = "all"
     image_url: Optional[str] = None
     file_id: Optional[str] = None
+    segment: Optional[Dict[str, Any]] = None   # custom audience, overrides target
+
+
+class SegmentPreviewRequest(BaseModel):
+    segment: Dict[str, Any]
 
 @router.post("", dependencies=[Depends(verify_admin_key)])
 async def broadcast_message(
@@ -28,17 +38,20 @@ async def broadcast_message(
 ):
     """
     Broadcast message to users - ADMIN ONLY
-    
+
+    Creates a broadcast job and returns at once; poll
+    GET /api/broadcast/{broadcast_id} for progress.
+
     Args:
-        broadcast: Broadcast request with message, target, image_url, file_id
+        broadcast: Broadcast request with message, target (or segment), image_url, file_id
     """
     message = broadcast.message
     target = broadcast.target
     image_url = broadcast.image_url
     file_id = broadcast.file_id
-    
+
     logger.info(f"📨 Broadcast request: image_url={image_url}, file_id={file_id}")
-    
+
     # Fix image_url if it's relative path
     if image_url and not image_url.startswith('http'):
         # Get base URL from request - force HTTPS for external access
@@ -46,154 +59,111 @@ async def broadcast_message(
         # Replace http:// with https:// for external URLs
         if base_url.startswith('http://') and 'emergentagent.com' in base_url:
             base_url = base_url.replace('http://', 'https://')
-        
+
         if image_url.startswith('/'):
             image_url = f"{base_url}{image_url}"
         else:
             image_url = f"{base_url}/{image_url}"
         logger.info(f"🔧 Fixed image_url to: {image_url}")
-    
-    from repositories import get_user_repo
-    
+
     # Get bot_instance from app.state
     bot_instance = getattr(request.app.state, 'bot_instance', None)
-    
+
     try:
         if not bot_instance:
             raise HTTPException(status_code=503, detail="Bot not initialized")
-        
+
         if not message:
             raise HTTPException(status_code=400, detail="Message is required")
-        
-        user_repo = get_user_repo()
-        
-        # Get target users
-        if target == "all":
-            users = await user_repo.find_many({}, limit=10000)
-        elif target == "active":
-            # Users with at least one order
-            from repositories import get_order_repo
-            order_repo = get_order_repo()
-            orders = await order_repo.find_many({}, limit=10000)
-            active_telegram_ids = list(set([o['telegram_id'] for o in orders]))
-            users = []
-            for tid in active_telegram_ids:
-                user = await user_repo.find_by_telegram_id(tid)
-                if user:
-                    users.append(user)
-        elif target == "premium":
-            # Users with balance > 0
-            users = await user_repo.find_many({}, limit=10000)
-            users = [u for u in users if u.get('balance', 0) > 0]
-        else:
-            raise HTTPException(status_code=400, detail="Invalid target. Use: all, active, or premium")
-        
-        if not users:
+
+        try:
+            job = await broadcast_engine.create(
+                message, target, image_url=image_url, file_id=file_id, segment=broadcast.segment
+            )
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+
+        if job is None:
             raise HTTPException(status_code=404, detail="No users found for target audience")
-        
-        # Start broadcasting
-        logger.info(f"📢 Starting broadcast to {len(users)} users. Target: {target}")
-        
-        success_count = 0
-        fail_count = 0
-        
-        for user in users:
-            try:
-                telegram_id = user['telegram_id']
-                username = user.get('username', 'unknown')
-                
-                # Check if user blocked the bot
-                if user.get('bot_blocked_by_user', False):
-                    logger.warning(f"❌ Пропуск пользователя {username} ({telegram_id}): заблокировал бота")
-                    fail_count += 1
-                    continue
-                
-                # Send with image (file_id or URL)
-                try:
-                    result = None
-                    send_error = None
-                    
-                    if file_id:
-                        # Use file_id (faster, no need to re-download)
-                        logger.info(f"📤 Отправка с file_id пользователю {username} ({telegram_id})")
-                        try:
-                            result = await bot_instance.send_photo(
-                                chat_id=telegram_id,
-                                photo=file_id,
-                                caption=message
-                            )
-                        except Exception as e:
-                            send_error = str(e)
-                            result = None
-                    elif image_url:
-                        # Use URL (will download image)
-                        logger.info(f"📤 Отправка с URL пользователю {username} ({telegram_id})")
-                        try:
-                            result = await bot_instance.send_photo(
-                                chat_id=telegram_id,
-                                photo=image_url,
-                                caption=message
-                            )
-                        except Exception as e:
-                            send_error = str(e)
-                            result = None
-                    else:
-                        # Text only message
-                        logger.info(f"📤 Отправка текста пользователю {username} ({telegram_id})")
-                        try:
-                            result = await bot_instance.send_message(
-                                chat_id=telegram_id,
-                                text=message
-                            )
-                        except Exception as e:
-                            send_error = str(e)
-                            result = None
-                    
-                    # Check if send was successful
-                    if result is not None:
-                        logger.info(f"✅ Успешно отправлено {username} ({telegram_id})")
-                        success_count += 1
-                    else:
-                        # Log specific error
-                        if send_error:
-                            logger.error(f"❌ Ошибка отправки {username} ({telegram_id}): {send_error}")
-                            
-                            # If chat not found or user blocked - mark in DB
-                            if "chat not found" in send_error.lower() or "bot was blocked" in send_error.lower() or "user is deactivated" in send_error.lower():
-                                logger.warning(f"⚠️ Пометка пользователя {username} ({telegram_id}) как заблокировавшего бота")
-                                await user_repo.update_one(
-                                    {"telegram_id": telegram_id},
-                                    {"$set": {"bot_blocked_by_user": True}}
-                                )
-                        else:
-                            logger.error(f"❌ Ошибка отправки {username} ({telegram_id}): unknown error")
-                        fail_count += 1
-                        
-                except Exception as telegram_err:
-                    logger.error(f"❌ Telegram API error для {username} ({telegram_id}): {telegram_err}")
-                    fail_count += 1
-                    continue
-                
-                # Rate limiting
-                await asyncio.sleep(0.05)  # 50ms delay between messages
-                
-            except Exception as e:
-                logger.error(f"❌ Общая ошибка для пользователя {telegram_id}: {e}")
-                fail_count += 1
-        
-        logger.info(f"✅ Broadcast complete. Success: {success_count}, Failed: {fail_count}")
-        
+
         return {
-            "status": "completed",
-            "target": target,
-            "total_users": len(users),
-            "success_count": success_count,
-            "fail_count": fail_count,
+            "success": True,
+            "status": job['status'],
+            "broadcast_id": job['_id'],
+            "target": job['target'],
+            "total_users": job['total'],
             "message": message[:100]  # First 100 chars
         }
-        
+
     except HTTPException:
         raise
     except Exception as e:
         logger.error(f"Error broadcasting message: {e}")
         raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.get("", dependencies=[Depends(verify_admin_key)])
+async def list_broadcasts(limit: int = 20):
+    """Recent broadcasts with progress - ADMIN ONLY"""
+    return {"success": True, "broadcasts": await broadcast_engine.list_recent(min(limit, 100))}
+
+
+@router.get("/segments", dependencies=[Depends(verify_admin_key)])
+async def list_segments():
+    """Recipient counts for the named segments (cached) - ADMIN ONLY"""
+    from server import db
+    return {"success": True, "segments": await segment_engine.preview(db)}
+
+
+@router.post("/segments/preview", dependencies=[Depends(verify_admin_key)])
+async def preview_segment(request: SegmentPreviewRequest):
+    """Recipient count for a custom segment definition - ADMIN ONLY"""
+    from server import db
+    try:
+        total = await segment_engine.count(db, request.segment)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"success": True, "segment": segment_engine.resolve(request.segment), "total_users": total}
+
+
+@router.get("/{broadcast_id}", dependencies=[Depends(verify_admin_key)])
+async def get_broadcast(broadcast_id: str):
+    """
+    Broadcast progress - ADMIN ONLY
+
+    Returns:
+        status, total, sent / failed / blocked and
+        progress {processed, percent, rate_per_sec, eta_seconds}
+    """
+    broadcast = await broadcast_engine.get(broadcast_id)
+    if broadcast is None:
+        raise HTTPException(status_code=404, detail="Broadcast not found")
+    return {"success": True, **broadcast}
+
+
+async def _control(broadcast_id: str, action: str):
+    changed = await getattr(broadcast_engine, action)(broadcast_id)
+    broadcast = await broadcast_engine.get(broadcast_id)
+    if broadcast is None:
+        raise HTTPException(status_code=404, detail="Broadcast not found")
+    if not changed:
+        raise HTTPException(status_code=409, detail=f"Cannot {action} a broadcast that is {broadcast['status']}")
+    return {"success": True, **broadcast}
+
+
+@router.post("/{broadcast_id}/pause", dependencies=[Depends(verify_admin_key)])
+async def pause_broadcast(broadcast_id: str):
+    """Pause a broadcast (stops after the current batch) - ADMIN ONLY"""
+    return await _control(broadcast_id, 'pause')
+
+
+@router.post("/{broadcast_id}/resume", dependencies=[Depends(verify_admin_key)])
+async def resume_broadcast(broadcast_id: str):
+    """Resume a paused broadcast - ADMIN ONLY"""
+    return await _control(broadcast_id, 'resume')
+
+
+@router.post("/{broadcast_id}/cancel", dependencies=[Depends(verify_admin_key)])
+async def cancel_broadcast(broadcast_id: str):
+    """Cancel a broadcast - ADMIN ONLY"""
+    return await _control(broadcast_id, 'cancel')
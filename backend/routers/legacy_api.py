@@ -5,6 +5,7 @@ Provides backward compatibility for old API endpoints used by frontend
 from fastapi import APIRouter, Header, HTTPException, Depends, Request
 from typing import Optional
 import logging
+from utils.fast_json import FastJSONResponse
 
 logger = logging.getLogger(__name__)
 
@@ -101,7 +102,7 @@ async def legacy_get_orders(api_key: str = Depends(verify_api_key)):
             enriched_order['username'] = 'no_username'
             enriched_orders.append(enriched_order)
     
-    return enriched_orders
+    return FastJSONResponse(enriched_orders)
 
 
 @router.get("/users")
@@ -109,7 +110,7 @@ async def legacy_get_users(api_key: str = Depends(verify_api_key)):
     """Legacy users endpoint - returns array directly"""
     from server import db
     users = await db.users.find({}, {"_id": 0}).limit(100).to_list(100)
-    return users
+    return FastJSONResponse(users)
 
 
 @router.get("/topups")
@@ -150,7 +151,7 @@ async def legacy_get_topups(api_key: str = Depends(verify_api_key)):
         
         enriched_topups.append(enriched_topup)
     
-    return enriched_topups
+    return FastJSONResponse(enriched_topups)
 
 
 @router.get("/users/leaderboard")
@@ -166,6 +166,123 @@ async def check_alerts(authenticated: bool = Depends(verify_admin_key)):
     }
 
 
+@router.get("/cache")
+async def get_cache_stats(authenticated: bool = Depends(verify_admin_key)):
+    """
+    Статистика кэшей тарифов (требует авторизацию)
+    
+    Включает:
+    - Кэш тарифов ShipStation (hits, misses, размер)
+    - Объединение одинаковых запросов тарифов (single-flight)
+    - Спекулятивная предзагрузка тарифов (hit rate, лишние запросы)
+    - Каталог перевозчиков
+    - Офлайн база ZIP кодов
+    - Кэш валидации адресов
+    - Локальное хранилище PDF этикеток
+    - Повторное использование Telegram file_id
+    - Реестр медиа рассылок (загрузка один раз)
+    """
+    from services.shipstation_cache import shipstation_cache, rate_quote_flight
+    from services.rate_prefetch import rate_prefetcher
+    from services.carrier_catalog import carrier_catalog
+    from services.zip_database import zip_db
+    from services.address_validation_cache import address_validation_cache
+    from services.label_store import label_store
+    from services.telegram_delivery import telegram_delivery
+    from services.media_registry import media_registry
+    
+    return {
+        "success": True,
+        "rate_cache": shipstation_cache.get_stats(),
+        "rate_coalescing": rate_quote_flight.get_stats(),
+        "rate_prefetch": rate_prefetcher.get_stats(),
+        "carrier_catalog": carrier_catalog.get_stats(),
+        "zip_database": zip_db.get_stats(),
+        "address_validation": address_validation_cache.get_stats(),
+        "label_store": label_store.get_stats(),
+        "telegram_delivery": telegram_delivery.get_stats(),
+        "media_registry": media_registry.get_stats(),
+        "message": "Статистика кэшей успешно получена"
+    }
+
+
+@router.get("/label-queue")
+async def get_label_queue_stats(authenticated: bool = Depends(verify_admin_key)):
+    """
+    Получить метрики очереди покупки этикеток
+    
+    Returns:
+        Глубина очереди по статусам, счетчики, латентность задач (p50/p95)
+    """
+    from services.label_queue import label_job_queue
+    from services.batch_orders import batch_order_service
+    
+    try:
+        depth = await label_job_queue.get_depth()
+    except Exception as e:
+        logger.error(f"Error reading label queue depth: {e}")
+        depth = {}
+    
+    return {
+        "success": True,
+        "depth": depth,
+        "stats": label_job_queue.get_stats(),
+        "batch_orders": batch_order_service.get_stats(),
+        "message": "Статистика очереди этикеток успешно получена"
+    }
+
+
+@router.get("/updates")
+async def get_update_queue_stats(authenticated: bool = Depends(verify_admin_key)):
+    """
+    Получить метрики очереди апдейтов Telegram (webhook)
+    
+    Returns:
+        Глубина очереди, отказы (503), ожидание и обработка (p50/p95),
+        дубликаты update_id, проверка secret_token, загрузки/записи
+        состояния (MongoDBPersistence)
+    """
+    from services.update_queue import update_queue
+    from services.update_dedup import update_dedup
+    from middleware.security import telegram_webhook_guard
+    from server import application
+    
+    persistence = getattr(application, 'persistence', None)
+    
+    return {
+        "success": True,
+        "stats": update_queue.get_stats(),
+        "dedup": update_dedup.get_stats(),
+        "webhook_auth": telegram_webhook_guard.get_stats(),
+        "persistence": persistence.get_stats() if hasattr(persistence, 'get_stats') else None,
+        "message": "Статистика очереди апдейтов успешно получена"
+    }
+
+
+@router.get("/upstreams")
+async def get_upstream_stats(authenticated: bool = Depends(verify_admin_key)):
+    """
+    Получить метрики upstream API (ShipStation, Oxapay, Telegram)
+    
+    Returns:
+        Латентность по endpoint (p50/p95), адаптивные таймауты, hedging,
+        retry budgets, планировщик отправки Telegram, вызовы Telegram на заказ
+    """
+    from services.adaptive_requests import request_policy
+    from services.telegram_send_scheduler import send_scheduler
+    from utils.retry_utils import retry_budgets
+    from utils.order_card import order_card, order_call_meter
+    
+    return {
+        "success": True,
+        "adaptive_requests": request_policy.get_stats(),
+        "retry_budgets": retry_budgets.get_stats(),
+        "telegram_sends": send_scheduler.get_stats(),
+        "order_card": {**order_card.get_stats(), "calls_per_order": order_call_meter.get_stats()},
+        "message": "Статистика upstream API успешно получена"
+    }
+
+
 @router.get("/slow-operations")
 async def get_slow_operations(
     limit: int = 20,
@@ -256,7 +256,7 @@ async def refund_order(order_id: str, refund_reason: Optional[str] = None):
     """Refund an order - void label and return money"""
     from repositories import get_repositories, get_user_repo
     from server import db, SHIPSTATION_API_KEY
-    import httpx
+    from services.http_clients import get_http_client
     
     try:
         repos = get_repositories()
@@ -280,11 +280,11 @@ async def refund_order(order_id: str, refund_reason: Optional[str] = None):
                     'Content-Type': 'application/json'
                 }
                 
-                async with httpx.AsyncClient(timeout=10.0) as client:
-                    void_response = await client.put(
-                        f'https://api.shipstation.com/v2/labels/{label["label_id"]}/void',
-                        headers=headers
-                    )
+                client = get_http_client('shipstation')
+                void_response = await client.put(
+                    f'https://api.shipstation.com/v2/labels/{label["label_id"]}/void',
+                    headers=headers
+                )
                 
                 void_success = void_response.status_code == 200
             except Exception as e:
@@ -2,7 +2,9 @@
 Shipping Router
 Эндпоинты для управления доставкой и метками
 """
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Request, Depends
+from fastapi.responses import FileResponse, Response, StreamingResponse
+from handlers.admin_handlers import verify_admin_key
 import logging
 
 logger = logging.getLogger(__name__)
@@ -55,7 +57,9 @@ async def create_shipping_label(order_id: str):
 async def track_shipment(tracking_number: str, carrier: str):
     """Get detailed tracking information with progress status"""
     from server import SHIPSTATION_API_KEY
-    import httpx
+    from services.http_clients import get_http_client
+    from services.adaptive_requests import request_policy
+    from config.performance_config import BotPerformanceConfig
     
     try:
         if not SHIPSTATION_API_KEY:
@@ -66,11 +70,14 @@ async def track_shipment(tracking_number: str, carrier: str):
             'Content-Type': 'application/json'
         }
         
-        async with httpx.AsyncClient(timeout=10.0) as client:
-            response = await client.get(
-                f'https://api.shipstation.com/v2/tracking?tracking_number={tracking_number}&carrier_code={carrier}',
-                headers=headers
-            )
+        client = get_http_client('shipstation')
+        response = await request_policy.request(
+            client, 'GET', 'https://api.shipstation.com/v2/tracking',
+            hedge=True,
+            default_timeout=BotPerformanceConfig.EXTERNAL_API_TIMEOUTS['shipstation'],
+            params={'tracking_number': tracking_number, 'carrier_code': carrier},
+            headers=headers
+        )
         
         if response.status_code == 200:
             tracking_data = response.json()
@@ -114,51 +121,139 @@ async def track_shipment(tracking_number: str, carrier: str):
 
 
 @router.get("/labels/{label_id}/download")
-async def download_label(label_id: str):
-    """Proxy endpoint to download label PDF from ShipStation"""
+async def download_label(label_id: str, request: Request):
+    """
+    Download label PDF
+    
+    Served from the local label store (ETag, Range); the PDF is fetched
+    from ShipStation only if it is not stored yet.
+    """
     from server import SHIPSTATION_API_KEY, db
-    from fastapi.responses import Response
-    import httpx
+    from services.label_store import label_store
     
     try:
-        if not SHIPSTATION_API_KEY:
-            raise HTTPException(status_code=500, detail="ShipStation API not configured")
+        label = await db.shipping_labels.find_one({"label_id": label_id}, {"_id": 0})
+        if not label:
+            raise HTTPException(status_code=404, detail="Label not found")
+        
+        blob = label_store.get_blob(label)
+        if blob is None:
+            label_url = label.get('label_url')
+            if not label_url:
+                raise HTTPException(status_code=404, detail="Label URL not available")
+            
+            if not SHIPSTATION_API_KEY:
+                raise HTTPException(status_code=500, detail="ShipStation API not configured")
+            
+            success, blob, error = await label_store.store_from_url(
+                label_url, headers={'API-Key': SHIPSTATION_API_KEY}, timeout=30.0
+            )
+            if not success:
+                logger.error(f"Failed to download label: {error}")
+                raise HTTPException(status_code=502, detail="Failed to download label from ShipStation")
+            
+            await label_store.attach_to_label(db, label_id, blob)
         
+        label_store.served += 1
+        return _label_file_response(blob, f"label_{label_id}.pdf", request)
+            
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error downloading label: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.post("/labels/{label_id}/resend", dependencies=[Depends(verify_admin_key)])
+async def resend_label_to_user(label_id: str, request: Request):
+    """
+    Re-send label PDF to the order owner in Telegram - ADMIN ONLY
+    
+    Sent by the stored Telegram file_id when possible (no re-upload).
+    """
+    from server import SHIPSTATION_API_KEY, db
+    from services.shipping_service import resend_label
+    from repositories import get_repositories
+    
+    try:
         label = await db.shipping_labels.find_one({"label_id": label_id}, {"_id": 0})
         if not label:
             raise HTTPException(status_code=404, detail="Label not found")
         
-        label_url = label.get('label_url')
-        if not label_url:
-            raise HTTPException(status_code=404, detail="Label URL not available")
+        order = await get_repositories().orders.find_by_id(label['order_id'])
+        if not order or not order.get('telegram_id'):
+            raise HTTPException(status_code=404, detail="Order not found")
         
-        headers = {'API-Key': SHIPSTATION_API_KEY}
+        bot_instance = getattr(request.app.state, 'bot_instance', None)
+        if not bot_instance:
+            raise HTTPException(status_code=503, detail="Bot not available")
         
-        async with httpx.AsyncClient(timeout=30.0) as client:
-            response = await client.get(label_url, headers=headers)
+        success, error = await resend_label(bot_instance, label, order['telegram_id'], SHIPSTATION_API_KEY)
+        if not success:
+            logger.error(f"Failed to re-send label {label_id}: {error}")
+            raise HTTPException(status_code=502, detail=error or "Failed to send label")
         
-        if response.status_code == 200:
-            return Response(
-                content=response.content,
-                media_type="application/pdf",
-                headers={"Content-Disposition": f"attachment; filename=label_{label_id}.pdf"}
-            )
-        else:
-            logger.error(f"Failed to download label: {response.status_code}")
-            raise HTTPException(status_code=502, detail="Failed to download label from ShipStation")
-            
+        logger.info(f"📨 Label {label_id} re-sent to user {order['telegram_id']}")
+        return {"status": "success", "label_id": label_id}
+    
     except HTTPException:
         raise
     except Exception as e:
-        logger.error(f"Error downloading label: {e}")
+        logger.error(f"Error re-sending label: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
 
+def _label_file_response(blob, filename: str, request: Request):
+    """FileResponse for stored label with strong ETag and single-range support"""
+    from services.label_store import parse_range
+    
+    etag = f'"{blob.sha256}"'
+    headers = {
+        'ETag': etag,
+        'Accept-Ranges': 'bytes',
+        'Cache-Control': 'private, max-age=86400',
+    }
+    
+    if etag in request.headers.get('if-none-match', ''):
+        return Response(status_code=304, headers=headers)
+    
+    range_header = request.headers.get('range')
+    if_range = request.headers.get('if-range')
+    if range_header and (not if_range or if_range == etag):
+        try:
+            byte_range = parse_range(range_header, blob.size)
+        except ValueError:
+            return Response(status_code=416, headers={'Content-Range': f'bytes */{blob.size}'})
+        
+        if byte_range:
+            start, end = byte_range
+            
+            def iter_range(chunk_size: int = 64 * 1024):
+                with open(blob.path, 'rb') as f:
+                    f.seek(start)
+                    remaining = end - start + 1
+                    while remaining > 0:
+                        chunk = f.read(min(chunk_size, remaining))
+                        if not chunk:
+                            break
+                        remaining -= len(chunk)
+                        yield chunk
+            
+            headers.update({
+                'Content-Range': f'bytes {start}-{end}/{blob.size}',
+                'Content-Length': str(end - start + 1),
+                'Content-Disposition': f'attachment; filename="{filename}"',
+            })
+            return StreamingResponse(iter_range(), status_code=206, media_type="application/pdf", headers=headers)
+    
+    return FileResponse(blob.path, media_type="application/pdf", filename=filename, headers=headers)
+
+
 @router.get("/carriers")
 async def get_carriers():
     """Get available carriers from ShipStation"""
     from server import SHIPSTATION_API_KEY
-    import httpx
+    from services.http_clients import get_http_client
     
     try:
         if not SHIPSTATION_API_KEY:
@@ -166,11 +261,11 @@ async def get_carriers():
         
         headers = {'API-Key': SHIPSTATION_API_KEY}
         
-        async with httpx.AsyncClient(timeout=10.0) as client:
-            response = await client.get(
-                'https://api.shipstation.com/carriers',
-                headers=headers
-            )
+        client = get_http_client('shipstation')
+        response = await client.get(
+            'https://api.shipstation.com/carriers',
+            headers=headers
+        )
         
         if response.status_code == 200:
             return response.json()
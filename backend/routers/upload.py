@@ -6,6 +6,7 @@ from fastapi import APIRouter, UploadFile, File, HTTPException, Request, Depends
 from handlers.admin_handlers import verify_admin_key
 import logging
 import os
+from typing import Optional
 from pathlib import Path
 import aiofiles
 import uuid
@@ -21,6 +22,27 @@ UPLOAD_DIR.mkdir(parents=True, exist_ok=True)
 MAX_FILE_SIZE = 10 * 1024 * 1024
 
 
+async def find_upload_path(file_id: str) -> Optional[Path]:
+    """Local copy of an uploaded broadcast image by its Telegram file_id"""
+    from server import db
+    
+    doc = await db.uploaded_images.find_one({"file_id": file_id}, {"_id": 0, "filename": 1})
+    if not doc:
+        return None
+    path = UPLOAD_DIR / doc['filename']
+    return path if path.exists() else None
+
+
+async def replace_upload_file_id(old_file_id: str, new_file_id: str) -> None:
+    """Point an uploaded image record at the file_id of a fresh upload"""
+    from server import db
+    
+    try:
+        await db.uploaded_images.update_one({"file_id": old_file_id}, {"$set": {"file_id": new_file_id}})
+    except Exception as e:
+        logger.warning(f"Could not update uploaded image file_id: {e}")
+
+
 @router.post("/upload-image", dependencies=[Depends(verify_admin_key)])
 async def upload_image(
     request: Request,
@@ -71,27 +93,14 @@ async def upload_image(
         file_id = None
         
         if bot_instance:
-            try:
-                # Send to admin chat to get file_id
-                import io
-                admin_telegram_id = os.getenv('ADMIN_TELEGRAM_ID')
-                
-                if admin_telegram_id:
-                    # Send photo to admin to get file_id
-                    message = await bot_instance.send_photo(
-                        chat_id=int(admin_telegram_id),
-                        photo=io.BytesIO(content),
-                        caption="📸 Файл загружен для рассылки (можно удалить)"
-                    )
-                    
-                    if message.photo:
-                        # Get largest photo size
-                        file_id = message.photo[-1].file_id
-                        logger.info(f"✅ Got Telegram file_id: {file_id}")
-                else:
-                    logger.warning("ADMIN_TELEGRAM_ID not set, cannot get file_id")
-            except Exception as e:
-                logger.warning(f"Could not upload to Telegram: {e}")
+            # Upload once: identical content already in Telegram reuses its file_id
+            from services.media_registry import media_registry
+            asset = await media_registry.register_bytes(bot_instance, content, filename=unique_filename)
+            if asset:
+                file_id = asset['file_id']
+                logger.info(f"✅ Got Telegram file_id: {file_id}")
+                if asset['filename'] != unique_filename:
+                    os.remove(file_path)   # duplicate of an image we already keep
         
         # Construct response
         response_data = {
@@ -3,7 +3,9 @@ Webhooks Router
 Эндпоинты для обработки вебхуков
 """
 from fastapi import APIRouter, Request, BackgroundTasks
+from fastapi.responses import JSONResponse
 import logging
+from utils import fast_json
 
 logger = logging.getLogger(__name__)
 
@@ -20,6 +22,7 @@ async def oxapay_webhook(request: Request):
         from repositories import get_user_repo
         # Import from server inside function to avoid circular import
         import server as srv
+        from services.label_queue import label_job_queue
         
         # Get bot_instance from app.state instead of server module
         bot_instance = getattr(request.app.state, 'bot_instance', None)
@@ -43,7 +46,7 @@ async def oxapay_webhook(request: Request):
             srv.safe_telegram_call, 
             user_repo.find_by_telegram_id,
             find_pending_order,
-            srv.create_and_send_label
+            label_job_queue.enqueue
         )
         logger.info(f"✅ [OXAPAY_WEBHOOK] Webhook processed: {result}")
         return result
@@ -55,13 +58,22 @@ async def oxapay_webhook(request: Request):
 
 @router.post("/telegram/webhook")
 async def telegram_webhook(request: Request):
-    """Handle Telegram webhook updates"""
+    """
+    Handle Telegram webhook updates
+    
+    The update is validated and queued (services/update_queue.py); the
+    response does not wait for the handlers. A full queue answers 503 with
+    Retry-After so Telegram redelivers the update later. A redelivered
+    update_id is acknowledged without dispatch (services/update_dedup.py).
+    """
     try:
         import server as srv
         from telegram import Update
+        from services.update_queue import update_queue
+        from services.update_dedup import update_dedup
         
-        # Get the update data from the request
-        update_data = await request.json()
+        # Get the update data from the request (orjson)
+        update_data = fast_json.loads(await request.body())
         
         # Check if application is initialized
         if not srv.application:
@@ -85,8 +97,15 @@ async def telegram_webhook(request: Request):
         update = Update.de_json(update_data, srv.application.bot)
         
         if update:
-            # Process update SYNCHRONOUSLY
-            await srv.application.process_update(update)
+            if await update_dedup.check_and_mark(update.update_id):
+                return {"ok": True}
+            if not update_queue.submit(update):
+                await update_dedup.forget(update.update_id)
+                return JSONResponse(
+                    status_code=503,
+                    content={"ok": False, "error": "Update queue is full"},
+                    headers={"Retry-After": str(update_queue.retry_after_seconds)}
+                )
             return {"ok": True}
         else:
             logger.error("⚠️ Update is None")
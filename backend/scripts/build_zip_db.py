@@ -0,0 +1,52 @@
+"""
+Build offline US ZIP database (data/us_zips.bin) for services/zip_database.py
+
+Input: GeoNames postal code dump (US.txt, tab-separated:
+country, postal_code, place_name, admin_name1, admin_code1, ...)
+or a CSV with zip,city,state columns.
+
+Usage:
+    python scripts/build_zip_db.py US.txt
+    python scripts/build_zip_db.py zips.csv data/us_zips.bin
+"""
+import csv
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.zip_database import build_zip_db, DEFAULT_PATH, ZipDatabase
+
+
+def read_rows(source_path):
+    with open(source_path, newline='', encoding='utf-8') as f:
+        if source_path.endswith('.csv'):
+            for row in csv.DictReader(f):
+                yield row['zip'], row['city'], row['state']
+        else:
+            for row in csv.reader(f, delimiter='\t'):
+                if len(row) >= 5 and row[0] == 'US':
+                    yield row[1], row[2], row[4]
+
+
+def main():
+    if len(sys.argv) < 2:
+        print(__doc__)
+        sys.exit(1)
+
+    source_path = sys.argv[1]
+    output_path = sys.argv[2] if len(sys.argv) > 2 else DEFAULT_PATH
+
+    print(f"Building ZIP database from {source_path}...")
+    count = build_zip_db(read_rows(source_path), output_path)
+    print(f"✅ Wrote {count} ZIP codes to {output_path} ({os.path.getsize(output_path) // 1024} KB)")
+
+    start = time.perf_counter()
+    db = ZipDatabase(output_path)
+    db.load()
+    print(f"✅ Load check: {(time.perf_counter() - start) * 1000:.2f}ms, 94102 → {db.lookup('94102')}")
+
+
+if __name__ == "__main__":
+    main()
@@ -61,9 +61,8 @@ if not os.environ.get('SHIPSTATION_API_KEY_PROD'):
     os.environ['SHIPSTATION_API_KEY_PROD'] = PRODUCTION_CONFIG.get('SHIPSTATION_API_KEY_PROD', '')
 
 from bot_protection import BotProtection
-from telegram_safety import TelegramSafetySystem, TelegramBestPractices
+from telegram_safety import TelegramBestPractices
 import logging
-import httpx
 
 # Configure logging for production
 logging.basicConfig(
@@ -173,7 +172,6 @@ from handlers.order_flow.template_save import (
 # Note: These are still defined in server.py for backward compatibility
 # TODO: Update all imports to use utils modules and remove duplicates
 from utils.telegram_utils import (
-    is_button_click_allowed as util_is_button_click_allowed,
     generate_random_phone as util_generate_random_phone,
     sanitize_string as util_sanitize_string,
     generate_thank_you_message as util_generate_thank_you_message
@@ -195,6 +193,7 @@ from utils.settings_cache import (
 # MongoDB connection with connection pooling for high load
 # Import performance config for optimized settings
 from config.performance_config import BotPerformanceConfig
+from utils.fast_json import FastJSONResponse
 
 mongo_url = os.environ['MONGO_URL']
 mongodb_config = BotPerformanceConfig.get_mongodb_config()
@@ -247,7 +246,7 @@ api_config_manager = init_api_config('production')
 # Legacy переменные для обратной совместимости
 # Получаются из APIConfigManager
 SHIPSTATION_API_KEY = os.environ.get('SHIPSTATION_API_KEY', '')
-SHIPSTATION_CARRIER_IDS = []  # Cache for carrier IDs
+SHIPSTATION_CARRIER_IDS = []  # Legacy; carriers now live in services.carrier_catalog
 
 # Admin API Key for protecting endpoints
 ADMIN_API_KEY = os.environ.get('ADMIN_API_KEY', '')
@@ -300,19 +299,12 @@ if TELEGRAM_BOT_TOKEN:
 # Cache moved to utils/cache.py
 
 
-# Button click debouncing - prevent multiple rapid clicks
-button_click_tracker = {}  # {user_id: {button_data: last_click_timestamp}}
-BUTTON_DEBOUNCE_SECONDS = 0.1  # Максимально быстрый: 100ms между нажатиями
-
 # Rate limiting для защиты от Telegram бана
-# Using optimized rate limiter from middleware
-
-# Note: Old simple RateLimiter replaced with advanced TelegramRateLimiter
-# from middleware.rate_limiter which has:
-# - Per-chat and global rate limiting
-# - Smart retry logic for "Too Many Requests" errors
-# - Semaphore-based concurrency control
-# - Safe message sending with automatic rate limiting
+# All outbound Telegram requests of application.bot go through
+# services/telegram_send_scheduler.py (PTB rate limiter):
+# - global and per-chat token buckets
+# - priorities: interactive > label delivery > admin notifications > broadcasts
+# - 429 RetryAfter pauses only the affected bucket
 
 # Helper function for session management
 # DEPRECATED: Use utils.session_utils.save_to_session instead
@@ -325,10 +317,6 @@ handle_critical_api_error = util_handle_critical_api_error
 # DEPRECATED: Use utils.session_utils.handle_step_error instead
 handle_step_error = util_handle_step_error
 
-# DEPRECATED: Use utils.telegram_utils.is_button_click_allowed instead
-# Keeping for backward compatibility
-is_button_click_allowed = util_is_button_click_allowed
-
 # Oxapay - Cryptocurrency Payment Gateway
 OXAPAY_API_KEY = os.environ.get('OXAPAY_API_KEY', '')
 OXAPAY_API_URL = 'https://api.oxapay.com'
@@ -346,7 +334,7 @@ clear_settings_cache = util_clear_settings_cache
 # DEPRECATED: Use utils.telegram_utils.generate_thank_you_message instead
 generate_thank_you_message = util_generate_thank_you_message
 
-app = FastAPI(title="Telegram Shipping Bot")
+app = FastAPI(title="Telegram Shipping Bot", default_response_class=FastJSONResponse)
 
 # ==================== STARTUP EVENT ====================
 @app.on_event("startup")
@@ -516,6 +504,9 @@ app.middleware("http")(error_handler_middleware)
 @app.middleware("http")
 async def log_requests(request: Request, call_next):
     """Log all requests for security monitoring"""
+    if is_webhook_lane(request):
+        return await call_next(request)
+    
     start_time = datetime.now(timezone.utc)
     
     # Log request
@@ -531,6 +522,11 @@ async def log_requests(request: Request, call_next):
     
     return response
 
+# Telegram webhook lane (добавлен последним = выполняется первым):
+# secret_token проверяется до rate limiting и логирования
+from middleware.security import TelegramWebhookLane, is_webhook_lane
+app.add_middleware(TelegramWebhookLane)
+
 # ==================== END SECURITY ====================
 
 
@@ -856,7 +852,19 @@ async def create_order_in_db(user, data, selected_rate, amount, discount_percent
     
     return order_dict
 
-async def create_and_send_label(order_id, telegram_id, message):
+async def create_and_send_label(order_id, telegram_id, message, notify_on_failure=True,
+                                external_shipment_id=None, shipment_id=None, purchased_label=None):
+    """
+    Buy ShipStation label for order and deliver it to the user
+    
+    notify_on_failure=False suppresses the admin alert and the user error
+    message (label job queue attempts that will be retried).
+    
+    external_shipment_id tags the shipment so a retry can find a label
+    bought by a timed-out attempt; shipment_id buys the label for a
+    shipment such an attempt already created; purchased_label is a label
+    it already bought (recorded and delivered, not bought again).
+    """
     try:
         # Get order using Repository Pattern
         from repositories import get_repositories
@@ -947,22 +955,39 @@ async def create_and_send_label(order_id, telegram_id, message):
             },
             'rate_id': selected_rate['rate_id']
         }
+        if external_shipment_id:
+            label_request['shipment']['external_shipment_id'] = external_shipment_id
         
-        logger.info(f"Purchasing label with rate_id: {selected_rate['rate_id']}")
-        
-        # Profile label creation API call (now truly async!)
-        api_start_time = time.perf_counter()
-        async with httpx.AsyncClient(timeout=30.0) as client:
-            response = await client.post(
-                'https://api.shipstation.com/v2/labels',
-                headers=headers,
-                json=label_request
-            )
-        api_duration_ms = (time.perf_counter() - api_start_time) * 1000
-        logger.info(f"⚡ ShipStation create label API took {api_duration_ms:.2f}ms")
+        if purchased_label is not None:
+            logger.info(f"♻️ Label for order {order_id} was bought by a previous attempt, not buying again")
+            response = None
+        else:
+            logger.info(f"Purchasing label with rate_id: {selected_rate['rate_id']}")
+            
+            # Profile label creation API call (now truly async!)
+            api_start_time = time.perf_counter()
+            from services.http_clients import get_http_client
+            client = get_http_client('shipstation')
+            if shipment_id:
+                # Shipment exists from a previous attempt - buy its label
+                response = await client.post(
+                    f'https://api.shipstation.com/v2/labels/shipment/{shipment_id}',
+                    headers=headers,
+                    json={'label_layout': label_request['label_layout'], 'label_format': label_request['label_format']},
+                    timeout=30.0
+                )
+            else:
+                response = await client.post(
+                    'https://api.shipstation.com/v2/labels',
+                    headers=headers,
+                    json=label_request,
+                    timeout=30.0
+                )
+            api_duration_ms = (time.perf_counter() - api_start_time) * 1000
+            logger.info(f"⚡ ShipStation create label API took {api_duration_ms:.2f}ms")
         
         # ShipStation API returns 200 or 201 for success
-        if response.status_code not in [200, 201]:
+        if response is not None and response.status_code not in [200, 201]:
             error_data = response.json() if response.text else {}
             error_msg = error_data.get('message', f'Status code: {response.status_code}')
             logger.error(f"Label creation failed: {error_msg}")
@@ -980,7 +1005,7 @@ async def create_and_send_label(order_id, telegram_id, message):
             from repositories import get_user_repo
             user_repo = get_user_repo()
             user = await user_repo.find_by_telegram_id(telegram_id)
-            if user:
+            if user and notify_on_failure:
                 error_details = f"ShipStation API Error:\n{response.text[:500]}"
                 await notify_admin_error(
                     user_info=user,
@@ -991,7 +1016,7 @@ async def create_and_send_label(order_id, telegram_id, message):
             
             raise Exception(error_msg)
         
-        label_response = response.json()
+        label_response = purchased_label if response is None else response.json()
         
         # Extract label data
         label_id = label_response.get('label_id', '')  # ShipStation label ID
@@ -1033,12 +1058,17 @@ async def create_and_send_label(order_id, telegram_id, message):
             "shipment_id": shipment_id
         })
         
+        # Stream label PDF to the local label store once (reused by admin
+        # downloads and re-sends), record its hash on the label
+        from services.label_store import label_store
+        pdf_stored, label_blob, pdf_error = await label_store.store_from_url(label_download_url, timeout=30)
+        if pdf_stored:
+            await label_store.attach_to_label(db, label_id, label_blob)
+        
         # Send label to user
         if bot_instance:
             try:
-                # Download label PDF using service
-                from services.shipping_service import download_label_pdf
-                success, pdf_bytes, error = await download_label_pdf(label_download_url, timeout=30)
+                success, error = pdf_stored, pdf_error
                 
                 if success:
                     # Generate AI thank you message
@@ -1053,11 +1083,13 @@ async def create_and_send_label(order_id, telegram_id, message):
                     success, error = await send_label_to_user(
                         bot_instance=bot_instance,
                         telegram_id=telegram_id,
-                        pdf_bytes=pdf_bytes,
+                        pdf_bytes=None,
                         order_id=order_id,
                         tracking_number=tracking_number,
                         carrier=order['selected_carrier'].upper(),
-                        safe_telegram_call_func=safe_telegram_call
+                        safe_telegram_call_func=safe_telegram_call,
+                        pdf_path=label_blob.path,
+                        label_id=label_id
                     )
                     
                     if success:
@@ -1160,11 +1192,13 @@ Label PDF: {label_download_url}
                     from telegram import Bot
                     admin_bot = Bot(TELEGRAM_BOT_TOKEN)
                 
-                await safe_telegram_call(admin_bot.send_message(
-                    chat_id=ADMIN_TELEGRAM_ID,
-                    text=admin_message,
-                    parse_mode='Markdown'
-                ))
+                from services.telegram_send_scheduler import send_priority, SendPriority
+                with send_priority(SendPriority.ADMIN):
+                    await safe_telegram_call(admin_bot.send_message(
+                        chat_id=ADMIN_TELEGRAM_ID,
+                        text=admin_message,
+                        parse_mode='Markdown'
+                    ))
                 logger.info(f"Label creation notification sent to admin {ADMIN_TELEGRAM_ID}")
             except Exception as e:
                 logger.error(f"Failed to send label notification to admin: {e}")
@@ -1176,6 +1210,12 @@ Label PDF: {label_download_url}
         return True  # Success
         
     except Exception as e:
+        from utils.retry_utils import CircuitOpenError
+        if isinstance(e, CircuitOpenError) and not notify_on_failure:
+            # ShipStation circuit is open - label queue defers the job
+            logger.warning(f"⏳ Label for order {order_id} deferred: {e}")
+            raise
+        
         logger.error(f"Error creating label: {e}", exc_info=True)
         
         # Log error to session for debugging
@@ -1186,6 +1226,10 @@ Label PDF: {label_download_url}
             'error_order_id': order_id
         })
         
+        if not notify_on_failure:
+            # Will be retried - only the final attempt notifies
+            return False
+        
         # Notify admin about error
         from repositories import get_user_repo
         user_repo = get_user_repo()
@@ -1321,6 +1365,53 @@ async def startup_event():
     init_service_factory(db)
     logger.info("✅ Service factory initialized")
     
+    # Shared pooled HTTP clients (ShipStation, Oxapay, ...)
+    from services.http_clients import http_clients
+    await http_clients.start()
+    
+    # Rate cache L2: shared MongoDB rate_quotes collection (TTL)
+    from services.shipstation_cache import shipstation_cache
+    await shipstation_cache.attach_db(db)
+    
+    # Address validation cache L2: shared address_validations collection (TTL)
+    from services.address_validation_cache import address_validation_cache
+    await address_validation_cache.attach_db(db)
+    
+    # Webhook update_id dedup L2: shared processed_updates collection (TTL)
+    from services.update_dedup import update_dedup
+    await update_dedup.attach_db(db)
+    
+    # Label PDF store: background retention GC
+    from services.label_store import label_store
+    await label_store.start(db)
+    
+    # Label purchase job queue: worker pool over label_jobs
+    from services.label_queue import label_job_queue
+    await label_job_queue.start(db)
+    
+    # Batch orders left in 'charging' by a crash: refund the debit, back to pending
+    from services.batch_orders import batch_order_service
+    await batch_order_service.recover_charges()
+    
+    # Broadcast jobs: resumable background sending
+    from services.broadcast_engine import broadcast_engine
+    await broadcast_engine.start(db)
+    
+    # Broadcast media: content hash → Telegram file_id (upload once)
+    from services.media_registry import media_registry
+    await media_registry.attach_db(db)
+    
+    # Offline ZIP database (memory-mapped ZIP → city/state)
+    from services.zip_database import zip_db
+    zip_db.load()
+    
+    # ShipStation carrier catalog: snapshot from MongoDB + background refresh
+    from services.carrier_catalog import carrier_catalog
+    try:
+        await carrier_catalog.start(db)
+    except Exception as e:
+        logger.error(f"Carrier catalog startup failed: {e}")
+    
     # V2: TTL index автоматически очищает сессии старше 15 минут
     # Периодическая очистка больше не нужна
     logger.info("✅ Session cleanup: TTL index (automatic, no manual cleanup needed)")
@@ -1357,7 +1448,7 @@ async def startup_event():
         logger.info("Using default API key from .env file")
     
     # Initialize Bot Protection System
-    global bot_protection, telegram_safety
+    global bot_protection
     bot_protection = BotProtection(
         owner_telegram_id=int(ADMIN_TELEGRAM_ID) if ADMIN_TELEGRAM_ID else 0,
         bot_name="WhiteLabelShippingBot"
@@ -1365,9 +1456,6 @@ async def startup_event():
     instance_info = bot_protection.get_instance_info()
     logger.info(f"🔒 Bot Protection System initialized: {instance_info}")
     
-    # Initialize Telegram Safety System
-    telegram_safety = TelegramSafetySystem()
-    logger.info("🛡️ Telegram Safety System initialized (Rate Limiting, Anti-Block)")
     logger.info(f"📋 Best Practices: {len(TelegramBestPractices.get_guidelines())} guidelines active")
     
     # Create MongoDB indexes for performance optimization (5000+ users)
@@ -1380,6 +1468,8 @@ async def startup_event():
         await db.orders.create_index("order_id", unique=True)
         await db.templates.create_index([("telegram_id", 1), ("created_at", -1)])
         await db.settings.create_index("key", unique=True)
+        await db.batch_orders.create_index("batch_id", unique=True)
+        await db.batch_orders.create_index([("telegram_id", 1), ("created_at", -1)])
         logger.info("✅ MongoDB indexes created successfully")
     except Exception as e:
         logger.warning(f"Index creation skipped (may already exist): {e}")
@@ -1399,11 +1489,10 @@ async def startup_event():
             # Get optimized settings from performance config
             app_settings = BotPerformanceConfig.get_optimized_application_settings()
             
-            # DictPersistence for webhook mode - stores conversation state between HTTP requests
-            # This is CRITICAL for webhook mode to work correctly!
-            from telegram.ext import DictPersistence
-            persistence = DictPersistence()
-            logger.info("✅ DictPersistence initialized for webhook mode")
+            # MongoDB persistence: user_data + conversation states survive restarts and
+            # can be shared by several workers (TELEGRAM_STATE_SHARED=true)
+            from utils.mongodb_persistence import MongoDBPersistence
+            persistence = MongoDBPersistence(db, **BotPerformanceConfig.get_persistence_config())
             
             # Optimize: Only receive needed update types (saves ~20-40ms)
             from telegram import Update
@@ -1414,21 +1503,25 @@ async def startup_event():
             ]
             logger.info(f"⚡ Optimized: Only accepting {len(allowed_update_types)} update types")
             
+            # Updates are sharded by chat onto ordered lanes (services/update_queue.py):
+            # one chat's updates run in order, different chats run in parallel
+            from services.update_queue import update_queue, LaneUpdateProcessor
+            from services.telegram_send_scheduler import send_scheduler
+            
             application = (
                 Application.builder()
                 .token(TELEGRAM_BOT_TOKEN)
-                .persistence(persistence)  # DictPersistence for webhook mode - preserves conversation state
-                .concurrent_updates(True)  # Allow concurrent updates for better performance in webhook mode
+                .persistence(persistence)  # MongoDB: lazy per-user load, coalesced versioned writes
+                .concurrent_updates(LaneUpdateProcessor(update_queue))  # Polling goes through the same lanes
                 .connect_timeout(app_settings['connect_timeout'])  # Fast connection
                 .read_timeout(app_settings['read_timeout'])   # Optimized read timeout
                 .write_timeout(app_settings['write_timeout'])  # Reliable message delivery
                 .pool_timeout(app_settings['pool_timeout'])    # Connection pool optimization
-                # Keep default rate limiter to prevent Telegram ban
+                .rate_limiter(send_scheduler)  # Global/per-chat token buckets + priorities
                 .build()
             )
             
-            logger.info("✅ Application built with DictPersistence for webhook mode")
-            logger.info("🔧 CRITICAL FIX: DictPersistence preserves conversation state between HTTP requests")
+            logger.info("✅ Application built with MongoDBPersistence")
             
             # CRITICAL: Update global bot_instance with the application's bot for notifications
             # Without this, notifications will NOT work!
@@ -1594,6 +1687,9 @@ async def startup_event():
             await application.initialize()
             await application.start()
             
+            # Webhook and polling updates are processed by the lane workers
+            await update_queue.start(application)
+            
             # Set bot commands for menu button
             commands = [
                 BotCommand("start", "🏠 Главное меню"),
@@ -1633,6 +1729,7 @@ async def startup_event():
                 # Установить новый webhook
                 await application.bot.set_webhook(
                     url=webhook_url,
+                    secret_token=bot_config.get_webhook_secret_token(),
                     allowed_updates=["message", "callback_query", "my_chat_member"],
                     drop_pending_updates=True  # Drop pending updates to avoid processing old messages
                 )
@@ -1674,4 +1771,28 @@ async def startup_event():
 @app.on_event("shutdown")
 async def shutdown_db_client():
     """Cleanup on shutdown"""
-    pass
+    from services.update_queue import update_queue
+    await update_queue.stop()
+    
+    # Write conversation state changes still buffered in memory
+    if application is not None and application.persistence:
+        try:
+            await application.update_persistence()
+            await application.persistence.flush()
+        except Exception as e:
+            logger.error(f"Failed to flush Telegram state: {e}")
+    
+    from services.carrier_catalog import carrier_catalog
+    await carrier_catalog.stop()
+    
+    from services.label_queue import label_job_queue
+    await label_job_queue.stop()
+    
+    from services.broadcast_engine import broadcast_engine
+    await broadcast_engine.stop()
+    
+    from services.label_store import label_store
+    await label_store.stop()
+    
+    from services.http_clients import http_clients
+    await http_clients.close()
@@ -4,7 +4,8 @@ from .api_services import (
     check_oxapay_payment,
     check_shipstation_balance,
     get_shipstation_carrier_ids,
-    validate_address_with_shipstation
+    validate_address_with_shipstation,
+    validate_order_addresses
 )
 from .order_service import OrderService
 from .user_service import UserService
@@ -18,6 +19,7 @@ __all__ = [
     'check_shipstation_balance',
     'get_shipstation_carrier_ids',
     'validate_address_with_shipstation',
+    'validate_order_addresses',
     # Domain Services
     'OrderService',
     'UserService',
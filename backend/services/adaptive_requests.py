@@ -0,0 +1,231 @@
+"""
+Adaptive Upstream Requests
+Таймауты по p95 и hedged-запросы для идемпотентных чтений
+
+Tracks a rolling latency window per upstream endpoint ('shipstation:v2/rates').
+Once enough samples exist:
+
+- timeout = p95 * timeout_multiplier, clamped to [min_timeout, default]
+  (the caller's fixed timeout stays the upper bound). Timed-out attempts
+  count as samples at the timeout, so the estimate grows back when the
+  upstream slows down; 5xx answers are recorded at their real latency.
+- hedged reads: if the primary request is still running after p95, a
+  duplicate is sent and whichever answers first wins; the other is
+  cancelled. Hedges are paid from a token bucket that earns
+  hedge_budget_ratio tokens per primary request, so hedging adds at most
+  ~5% extra calls and stops by itself when everything is slow (outage).
+
+Only idempotent reads may hedge: rates, carriers, address validation,
+tracking. Label purchase and payments never do.
+"""
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import Any, Dict, Optional
+
+import httpx
+
+from config.performance_config import BotPerformanceConfig
+from services.http_clients import endpoint_key
+
+logger = logging.getLogger(__name__)
+
+
+def _percentile(values, pct: float) -> Optional[float]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+class AdaptiveRequestPolicy:
+    """
+    Политика запросов к upstream: адаптивный таймаут + hedging
+
+    Usage:
+        response = await request_policy.request(
+            get_http_client('shipstation'), 'POST', '/v2/rates',
+            hedge=True, default_timeout=30.0, json=payload, headers=headers
+        )
+    """
+
+    def __init__(self,
+                 window: int = 200,
+                 min_samples: int = 20,
+                 timeout_multiplier: float = 3.0,
+                 min_timeout: float = 2.0,
+                 hedge_budget_ratio: float = 0.05,
+                 hedge_budget_max: float = 10.0,
+                 hedge_min_delay: float = 0.05):
+        """
+        Args:
+            window: Сколько последних замеров хранить на endpoint
+            min_samples: Замеров до включения адаптивного таймаута/hedging
+            timeout_multiplier: Таймаут = p95 * multiplier
+            min_timeout: Нижняя граница адаптивного таймаута (сек)
+            hedge_budget_ratio: Токенов за каждый основной запрос (0.05 = 5%)
+            hedge_budget_max: Емкость бакета hedge-токенов
+            hedge_min_delay: Минимальная задержка перед hedge (сек)
+        """
+        self.window = window
+        self.min_samples = min_samples
+        self.timeout_multiplier = timeout_multiplier
+        self.min_timeout = min_timeout
+        self.hedge_budget_ratio = hedge_budget_ratio
+        self.hedge_budget_max = hedge_budget_max
+        self.hedge_min_delay = hedge_min_delay
+        self._latencies: Dict[str, deque] = {}
+        self._hedge_tokens = 0.0
+        self.requests = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+        self.hedges_denied = 0
+
+    # ==================== LATENCY ====================
+
+    def record(self, key: str, seconds: float) -> None:
+        samples = self._latencies.get(key)
+        if samples is None:
+            samples = self._latencies[key] = deque(maxlen=self.window)
+        samples.append(seconds)
+
+    def p95(self, key: str) -> Optional[float]:
+        """Rolling p95 latency (seconds), None until min_samples"""
+        samples = self._latencies.get(key)
+        if not samples or len(samples) < self.min_samples:
+            return None
+        return _percentile(samples, 95)
+
+    def timeout_for(self, key: str, default: float) -> float:
+        """Adaptive timeout for endpoint, never above the caller's default"""
+        p95 = self.p95(key)
+        if p95 is None:
+            return default
+        return min(default, max(self.min_timeout, p95 * self.timeout_multiplier))
+
+    # ==================== HEDGE BUDGET ====================
+
+    def _earn_hedge_token(self) -> None:
+        self._hedge_tokens = min(self.hedge_budget_max, self._hedge_tokens + self.hedge_budget_ratio)
+
+    def _take_hedge_token(self) -> bool:
+        if self._hedge_tokens >= 1.0:
+            self._hedge_tokens -= 1.0
+            return True
+        self.hedges_denied += 1
+        return False
+
+    # ==================== REQUEST ====================
+
+    async def request(
+        self,
+        client: httpx.AsyncClient,
+        method: str,
+        url: str,
+        upstream: str = 'shipstation',
+        hedge: bool = False,
+        default_timeout: float = 30.0,
+        **kwargs
+    ) -> httpx.Response:
+        """
+        Send request with adaptive timeout (and hedging for idempotent reads)
+
+        Args:
+            client: Pooled client (get_http_client)
+            method: HTTP method
+            url: Absolute URL or path relative to the client base_url
+            upstream: Upstream name for the latency key
+            hedge: Allow a hedged duplicate (idempotent reads only)
+            default_timeout: Fixed timeout used until p95 is known (upper bound)
+            **kwargs: Passed to client.get/post (json, headers, params, ...)
+
+        Returns:
+            httpx.Response of the first request that completed
+
+        Raises:
+            httpx.HTTPError / CircuitOpenError: when every sent request failed
+        """
+        key = f"{upstream}:{endpoint_key(httpx.URL(url).path)}"
+        timeout = self.timeout_for(key, default_timeout)
+        kwargs['timeout'] = httpx.Timeout(timeout, connect=min(10.0, timeout))
+        self.requests += 1
+        self._earn_hedge_token()
+
+        send_method = getattr(client, method.lower())
+
+        async def send() -> httpx.Response:
+            start = time.perf_counter()
+            try:
+                response = await send_method(url, **kwargs)
+            except httpx.TimeoutException:
+                # Censored sample: the real latency is at least the timeout.
+                # Without it a slow upstream never raises p95 and stays timed out.
+                self.record(key, timeout)
+                raise
+            self.record(key, time.perf_counter() - start)
+            return response
+
+        primary = asyncio.create_task(send())
+        tasks = [primary]
+        try:
+            hedge_delay = self.p95(key) if hedge else None
+            if hedge_delay is None:
+                return await primary
+
+            done, _ = await asyncio.wait({primary}, timeout=max(self.hedge_min_delay, hedge_delay))
+            if done or not self._take_hedge_token():
+                return await primary
+
+            self.hedges += 1
+            logger.info(f"🪂 Hedging {key}: primary slower than p95 ({hedge_delay * 1000:.0f}ms)")
+            secondary = asyncio.create_task(send())
+            tasks.append(secondary)
+
+            pending = set(tasks)
+            error: Optional[BaseException] = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is secondary:
+                            self.hedge_wins += 1
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            # Loser of the race (or everything, if the caller was cancelled)
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        Получить статистику адаптивных запросов
+
+        Returns:
+            dict: p50/p95 и текущий таймаут по endpoint, счетчики hedging
+        """
+        endpoints = {}
+        for key, samples in self._latencies.items():
+            p95 = self.p95(key)
+            endpoints[key] = {
+                'samples': len(samples),
+                'p50_ms': round(_percentile(samples, 50) * 1000, 1),
+                'p95_ms': round(p95 * 1000, 1) if p95 is not None else None,
+                'adaptive_timeout_s': round(self.timeout_for(key, float('inf')), 2) if p95 is not None else None,
+            }
+        return {
+            'requests': self.requests,
+            'hedges': self.hedges,
+            'hedge_rate': f"{(self.hedges / self.requests * 100) if self.requests else 0:.1f}%",
+            'hedge_wins': self.hedge_wins,
+            'hedges_denied': self.hedges_denied,
+            'hedge_tokens': round(self._hedge_tokens, 2),
+            'endpoints': endpoints,
+        }
+
+
+# Глобальный инстанс (singleton)
+request_policy = AdaptiveRequestPolicy(**BotPerformanceConfig.get_adaptive_request_config())
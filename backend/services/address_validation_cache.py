@@ -0,0 +1,268 @@
+"""
+Address Validation Cache
+Кэш результатов /v2/addresses/validate по нормализованному адресу
+
+Addresses are keyed on a canonical form (upper case, single spaces, USPS
+street-suffix / directional / unit-designator abbreviations, ZIP5), so
+"215 Clayton Street, Apt. 4B" and "215 clayton st apt 4b" share one entry.
+Only definitive ShipStation answers are cached: valid results for a long
+TTL, invalid ones (negative caching) for a short one. Entries live in a
+bounded in-process L1 and in the shared MongoDB address_validations
+collection (TTL index), so every worker benefits.
+"""
+import hashlib
+import logging
+import re
+from collections import OrderedDict
+from datetime import datetime, timezone, timedelta
+from typing import Optional, Dict, Any, Tuple
+
+from services.zip_database import normalize_zip
+
+logger = logging.getLogger(__name__)
+
+# USPS Publication 28, C1 (most common street suffixes)
+STREET_SUFFIXES = {
+    'ALLEY': 'ALY', 'AVENUE': 'AVE', 'AV': 'AVE', 'BOULEVARD': 'BLVD', 'CENTER': 'CTR',
+    'CIRCLE': 'CIR', 'COURT': 'CT', 'COVE': 'CV', 'CREEK': 'CRK', 'CROSSING': 'XING',
+    'DRIVE': 'DR', 'EXPRESSWAY': 'EXPY', 'FREEWAY': 'FWY', 'GARDENS': 'GDNS', 'HEIGHTS': 'HTS',
+    'HIGHWAY': 'HWY', 'HOLLOW': 'HOLW', 'JUNCTION': 'JCT', 'LANE': 'LN', 'LOOP': 'LOOP',
+    'MOUNTAIN': 'MTN', 'PARKWAY': 'PKWY', 'PIKE': 'PIKE', 'PLACE': 'PL', 'PLAZA': 'PLZ',
+    'POINT': 'PT', 'RIDGE': 'RDG', 'ROAD': 'RD', 'ROUTE': 'RTE', 'SQUARE': 'SQ',
+    'STREET': 'ST', 'STR': 'ST', 'TERRACE': 'TER', 'TRAIL': 'TRL', 'TURNPIKE': 'TPKE',
+    'VALLEY': 'VLY', 'VIEW': 'VW', 'VILLAGE': 'VLG', 'WAY': 'WAY',
+}
+
+DIRECTIONALS = {
+    'NORTH': 'N', 'SOUTH': 'S', 'EAST': 'E', 'WEST': 'W',
+    'NORTHEAST': 'NE', 'NORTHWEST': 'NW', 'SOUTHEAST': 'SE', 'SOUTHWEST': 'SW',
+}
+
+# USPS Publication 28, C2 (secondary unit designators)
+UNIT_DESIGNATORS = {
+    'APARTMENT': 'APT', 'BUILDING': 'BLDG', 'DEPARTMENT': 'DEPT', 'FLOOR': 'FL',
+    'HANGAR': 'HNGR', 'LOT': 'LOT', 'OFFICE': 'OFC', 'PIER': 'PIER', 'ROOM': 'RM',
+    'SLIP': 'SLIP', 'SPACE': 'SPC', 'STOP': 'STOP', 'SUITE': 'STE', 'TRAILER': 'TRLR',
+    'UNIT': 'UNIT', 'NUMBER': '#', 'NO': '#',
+}
+
+_TOKEN_MAP = {**STREET_SUFFIXES, **DIRECTIONALS, **UNIT_DESIGNATORS}
+
+
+def _normalize_line(text: str) -> str:
+    text = (text or '').upper()
+    text = text.replace('#', ' # ')
+    text = re.sub(r"[.,;:'\"]", ' ', text)
+    tokens = [_TOKEN_MAP.get(token, token) for token in text.split()]
+    return ' '.join(tokens)
+
+
+def normalize_address(street1: str, street2: str, city: str, state: str, zip_code: str) -> str:
+    """
+    Canonical form of a US address
+
+    Street lines are merged so "Apt 4B" matches whether it was entered on
+    line 1 or line 2. Name and phone are not part of the address.
+    """
+    street = _normalize_line(f"{street1 or ''} {street2 or ''}")
+    city = ' '.join(re.sub(r"[.,']", ' ', (city or '').upper()).split())
+    state = (state or '').strip().upper()
+    zip5 = normalize_zip(zip_code) or (zip_code or '').strip()
+    return f"{street}|{city}|{state}|{zip5}"
+
+
+def address_fingerprint(street1: str, street2: str, city: str, state: str, zip_code: str) -> str:
+    """Stable fingerprint of the normalized address"""
+    canonical = normalize_address(street1, street2, city, state, zip_code)
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()[:32]
+
+
+def order_address_fingerprint(order_data: Dict[str, Any], prefix: str) -> Optional[str]:
+    """
+    Fingerprint of the 'from' or 'to' address in order data
+
+    Supports both from_street/from_street2 and from_address/from_address2 naming.
+    """
+    street1 = order_data.get(f'{prefix}_street') or order_data.get(f'{prefix}_address')
+    if not street1 or not order_data.get(f'{prefix}_zip'):
+        return None
+    street2 = order_data.get(f'{prefix}_street2') or order_data.get(f'{prefix}_address2') or ''
+    return address_fingerprint(
+        street1,
+        street2,
+        order_data.get(f'{prefix}_city'),
+        order_data.get(f'{prefix}_state'),
+        order_data.get(f'{prefix}_zip')
+    )
+
+
+# Keys of a corrected address that depend only on the address itself.
+# Name, phone and company belong to whoever asked first and are never cached.
+ADDRESS_FIELDS = (
+    'street1', 'street2', 'street3', 'city', 'state', 'postalCode', 'country', 'residential',
+    'address_line1', 'address_line2', 'address_line3', 'city_locality', 'state_province',
+    'postal_code', 'country_code', 'address_residential_indicator'
+)
+
+
+def address_fields(corrected: Any) -> Any:
+    """Corrected address without the caller's personal fields"""
+    if not isinstance(corrected, dict):
+        return corrected
+    return {key: value for key, value in corrected.items() if key in ADDRESS_FIELDS}
+
+
+class AddressValidationCache:
+    """
+    Кэш валидации адресов (L1 в памяти + L2 MongoDB)
+
+    Usage:
+        cached = await address_validation_cache.get(fingerprint)  # (is_valid, result) or None
+        await address_validation_cache.set(fingerprint, is_valid, result)
+    """
+
+    def __init__(self,
+                 ttl_hours: int = 24 * 30,
+                 negative_ttl_hours: int = 6,
+                 max_entries: int = 5000):
+        """
+        Args:
+            ttl_hours: Время жизни валидного результата
+            negative_ttl_hours: Время жизни невалидного результата (negative caching)
+            max_entries: Максимум записей в L1
+        """
+        self.ttl = timedelta(hours=ttl_hours)
+        self.negative_ttl = timedelta(hours=negative_ttl_hours)
+        self.max_entries = max_entries
+        self._cache: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._db = None
+        self.hits = 0
+        self.negative_hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.template_skips = 0
+        self.l2_errors = 0
+
+    async def attach_db(self, db) -> None:
+        """Подключить MongoDB как общий L2 и создать TTL индекс"""
+        self._db = db
+        try:
+            await db.address_validations.create_index("expires_at", expireAfterSeconds=0)
+            logger.info("✅ Address validation cache L2 attached (address_validations, TTL index)")
+        except Exception as e:
+            logger.warning(f"⚠️ address_validations TTL index creation skipped: {e}")
+
+    async def get(self, fingerprint: str) -> Optional[Tuple[bool, Any]]:
+        """
+        Получить закэшированный результат валидации
+
+        Returns:
+            (is_valid, corrected_address_or_error_message) or None
+        """
+        now = datetime.now(timezone.utc)
+        entry = self._cache.get(fingerprint)
+        if entry is not None and entry['expires_at'] <= now:
+            del self._cache[fingerprint]
+            entry = None
+
+        if entry is None and self._db is not None:
+            entry = await self._l2_get(fingerprint, now)
+            if entry is not None:
+                self._put(fingerprint, entry)
+
+        if entry is None:
+            self.misses += 1
+            return None
+
+        self._cache.move_to_end(fingerprint)
+        self.hits += 1
+        if not entry['is_valid']:
+            self.negative_hits += 1
+        logger.info(f"✅ Address validation cache HIT ({'valid' if entry['is_valid'] else 'invalid'})")
+        return entry['is_valid'], entry['result']
+
+    async def set(self, fingerprint: str, is_valid: bool, result: Any) -> None:
+        """Сохранить окончательный ответ ShipStation (valid или invalid)"""
+        now = datetime.now(timezone.utc)
+        entry = {
+            'is_valid': is_valid,
+            'result': result,
+            'validated_at': now,
+            'expires_at': now + (self.ttl if is_valid else self.negative_ttl)
+        }
+        self._put(fingerprint, entry)
+        self.stores += 1
+
+        if self._db is not None:
+            try:
+                await self._db.address_validations.replace_one(
+                    {'_id': fingerprint},
+                    {'_id': fingerprint, **entry},
+                    upsert=True
+                )
+            except Exception as e:
+                self.l2_errors += 1
+                logger.warning(f"⚠️ Address validation cache L2 write failed: {e}")
+
+    async def is_known_valid(self, fingerprint: Optional[str]) -> bool:
+        """True if address was validated as valid and the result has not expired"""
+        if not fingerprint:
+            return False
+        cached = await self.get(fingerprint)
+        return cached is not None and cached[0]
+
+    def _put(self, fingerprint: str, entry: Dict[str, Any]) -> None:
+        self._cache[fingerprint] = entry
+        self._cache.move_to_end(fingerprint)
+        while len(self._cache) > self.max_entries:
+            self._cache.popitem(last=False)
+
+    async def _l2_get(self, fingerprint: str, now: datetime) -> Optional[Dict[str, Any]]:
+        try:
+            doc = await self._db.address_validations.find_one({'_id': fingerprint})
+        except Exception as e:
+            self.l2_errors += 1
+            logger.warning(f"⚠️ Address validation cache L2 read failed: {e}")
+            return None
+        if not doc:
+            return None
+
+        expires_at = doc['expires_at']
+        if expires_at.tzinfo is None:
+            expires_at = expires_at.replace(tzinfo=timezone.utc)
+        # TTL монитор MongoDB работает раз в минуту - проверяем срок сами
+        if expires_at <= now:
+            return None
+
+        return {
+            'is_valid': doc['is_valid'],
+            'result': doc.get('result'),
+            'validated_at': doc.get('validated_at'),
+            'expires_at': expires_at
+        }
+
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        Получить статистику кэша валидации
+
+        Returns:
+            dict: hits (в т.ч. negative), misses, hit_rate, пропуски по шаблонам
+        """
+        total = self.hits + self.misses
+        hit_rate = (self.hits / total * 100) if total > 0 else 0
+
+        return {
+            'hits': self.hits,
+            'negative_hits': self.negative_hits,
+            'misses': self.misses,
+            'hit_rate': f"{hit_rate:.1f}%",
+            'stores': self.stores,
+            'template_skips': self.template_skips,
+            'cache_size': len(self._cache),
+            'l2_enabled': self._db is not None,
+            'l2_errors': self.l2_errors
+        }
+
+
+# Глобальный инстанс кэша (singleton)
+address_validation_cache = AddressValidationCache(ttl_hours=24 * 30, negative_ttl_hours=6, max_entries=5000)
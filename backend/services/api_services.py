@@ -5,9 +5,11 @@ Handles communication with ShipStation, Oxapay, and other external services
 import os
 import logging
 import time
-import httpx
 from fastapi import HTTPException
-from utils.retry_utils import retry_on_api_error
+from config.performance_config import BotPerformanceConfig
+from services.http_clients import get_http_client
+from services.adaptive_requests import request_policy
+from utils.retry_utils import retry_on_api_error, raise_for_retryable_status
 
 logger = logging.getLogger(__name__)
 
@@ -25,7 +27,18 @@ SHIPSTATION_API_KEY = _TEST_KEY or _PROD_KEY or _DEFAULT_KEY  # ⚠️ TEST MODE
 logger.info(f"🔑 ShipStation API Key loading: PROD={'SET' if _PROD_KEY else 'NOT SET'}, TEST={'SET' if _TEST_KEY else 'NOT SET'}, DEFAULT={'SET' if _DEFAULT_KEY else 'NOT SET'}, FINAL={'SET (len={})'.format(len(SHIPSTATION_API_KEY)) if SHIPSTATION_API_KEY else 'NOT SET'}")
 
 
-@retry_on_api_error(max_attempts=3, min_wait=2, max_wait=10)
+@retry_on_api_error(max_attempts=3, min_wait=2, max_wait=10, upstream='oxapay')
+async def _post_oxapay_invoice(payload: dict, headers: dict):
+    """POST /v1/payment/invoice; transient errors propagate to the retry"""
+    client = get_http_client('oxapay')
+    response = await client.post(
+        f"{OXAPAY_API_URL}/v1/payment/invoice",
+        json=payload,
+        headers=headers
+    )
+    return raise_for_retryable_status(response)
+
+
 async def create_oxapay_invoice(amount: float, order_id: str, description: str = "Shipping Label Payment"):
     """Create payment invoice via Oxapay"""
     if not OXAPAY_API_KEY:
@@ -57,12 +70,7 @@ async def create_oxapay_invoice(amount: float, order_id: str, description: str =
         
         # Profile Oxapay API call (now truly async!)
         api_start_time = time.perf_counter()
-        async with httpx.AsyncClient(timeout=30.0) as client:
-            response = await client.post(
-                f"{OXAPAY_API_URL}/v1/payment/invoice",
-                json=payload,
-                headers=headers
-            )
+        response = await _post_oxapay_invoice(payload, headers)
         api_duration_ms = (time.perf_counter() - api_start_time) * 1000
         logger.info(f"⚡ Oxapay create invoice API took {api_duration_ms:.2f}ms")
         
@@ -92,7 +100,18 @@ async def create_oxapay_invoice(amount: float, order_id: str, description: str =
         return {'success': False, 'error': str(e)}
 
 
-@retry_on_api_error(max_attempts=3, min_wait=1, max_wait=5)
+@retry_on_api_error(max_attempts=3, min_wait=1, max_wait=5, upstream='oxapay')
+async def _post_oxapay_payment_info(payload: dict, headers: dict):
+    """POST /v1/payment/info; transient errors propagate to the retry"""
+    client = get_http_client('oxapay')
+    response = await client.post(
+        f"{OXAPAY_API_URL}/v1/payment/info",
+        json=payload,
+        headers=headers
+    )
+    return raise_for_retryable_status(response)
+
+
 async def check_oxapay_payment(track_id: str):
     """Check payment status via Oxapay"""
     try:
@@ -106,12 +125,7 @@ async def check_oxapay_payment(track_id: str):
             "trackId": track_id
         }
         
-        async with httpx.AsyncClient(timeout=30.0) as client:
-            response = await client.post(
-                f"{OXAPAY_API_URL}/v1/payment/info",
-                json=payload,
-                headers=headers
-            )
+        response = await _post_oxapay_payment_info(payload, headers)
         
         if response.status_code == 200:
             data = response.json()
@@ -149,11 +163,11 @@ async def check_shipstation_balance():
             "Content-Type": "application/json"
         }
         
-        async with httpx.AsyncClient(timeout=10.0) as client:
-            response = await client.get(
-                'https://api.shipstation.com/v2/account',
-                headers=headers
-            )
+        client = get_http_client('shipstation')
+        response = await client.get(
+            'https://api.shipstation.com/v2/account',
+            headers=headers
+        )
         
         if response.status_code == 200:
             account_data = response.json()
@@ -169,11 +183,23 @@ async def check_shipstation_balance():
         return {"success": False, "error": str(e)}
 
 
-@retry_on_api_error(max_attempts=2, min_wait=1, max_wait=5)
-async def get_shipstation_carrier_ids():
+@retry_on_api_error(max_attempts=2, min_wait=1, max_wait=5, upstream='shipstation')
+async def _get_shipstation_carriers(headers: dict):
+    """GET /v2/carriers; transient errors propagate to the retry"""
+    client = get_http_client('shipstation')
+    response = await request_policy.request(
+        client, 'GET', 'https://api.shipstation.com/v2/carriers',
+        hedge=True,
+        default_timeout=30.0,  # Increased timeout to 30 sec
+        headers=headers
+    )
+    return raise_for_retryable_status(response)
+
+
+async def fetch_shipstation_carriers():
     """
-    Get carrier IDs from ShipStation
-    Returns dict mapping carrier names to IDs
+    Fetch full carrier list from ShipStation (GET /v2/carriers)
+    Returns list of raw carrier dicts, or None on failure
     """
     try:
         # Load API key inside function to ensure env vars are available
@@ -182,7 +208,7 @@ async def get_shipstation_carrier_ids():
         if not api_key:
             logger.warning("⚠️ ShipStation API key not configured")
             logger.warning("   Checked: SHIPSTATION_API_KEY_PROD, SHIPSTATION_API_KEY_TEST, SHIPSTATION_API_KEY")
-            return {}
+            return None
         
         logger.info(f"✅ ShipStation API key loaded (length: {len(api_key)})")
         
@@ -195,11 +221,7 @@ async def get_shipstation_carrier_ids():
         logger.info("   URL: https://api.shipstation.com/v2/carriers")
         logger.info(f"   API Key (first 10 chars): {api_key[:10]}...")
         
-        async with httpx.AsyncClient(timeout=30.0) as client:  # Increased timeout to 30 sec
-            response = await client.get(
-                'https://api.shipstation.com/v2/carriers',
-                headers=headers
-            )
+        response = await _get_shipstation_carriers(headers)
         
         logger.info(f"📡 ShipStation carriers response: status={response.status_code}")
         logger.info(f"📡 Response body (first 200 chars): {response.text[:200]}")
@@ -211,40 +233,96 @@ async def get_shipstation_carrier_ids():
                 
                 carriers_list = carriers_data.get('carriers', [])
                 logger.info(f"✅ Found {len(carriers_list)} carriers in response")
-                
-                carriers = {}
-                
-                for idx, carrier in enumerate(carriers_list):
-                    carrier_name = carrier.get('name') or carrier.get('friendly_name')
-                    carrier_id = carrier.get('carrier_id')
-                    
-                    if carrier_name and carrier_id:
-                        carriers[carrier_name] = carrier_id
-                        if idx < 3:  # Log first 3 carriers for debugging
-                            logger.info(f"   Carrier {idx+1}: {carrier_name} → {carrier_id}")
-                
-                logger.info(f"✅ Successfully loaded {len(carriers)} ShipStation carriers")
-                return carriers
+                return carriers_list
             except Exception as parse_error:
                 logger.error(f"❌ Error parsing carriers response: {parse_error}", exc_info=True)
                 logger.error(f"   Response text: {response.text[:500]}")
-                return {}
+                return None
         else:
             logger.error(f"❌ Failed to get carriers: status={response.status_code}")
             logger.error(f"   Response headers: {dict(response.headers)}")
             logger.error(f"   Response body: {response.text[:1000]}")
-            return {}
+            return None
             
     except Exception as e:
         logger.error(f"❌ Error getting ShipStation carriers: {e}", exc_info=True)
+        return None
+
+
+def build_carrier_ids_map(carriers_list) -> dict:
+    """
+    Map carrier names to carrier IDs
+    
+    Args:
+        carriers_list: Raw carriers from ShipStation
+    
+    Returns:
+        dict: {carrier_name: carrier_id}
+    """
+    carriers = {}
+    
+    for idx, carrier in enumerate(carriers_list or []):
+        carrier_name = carrier.get('name') or carrier.get('friendly_name')
+        carrier_id = carrier.get('carrier_id')
+        
+        if carrier_name and carrier_id:
+            carriers[carrier_name] = carrier_id
+            if idx < 3:  # Log first 3 carriers for debugging
+                logger.debug(f"   Carrier {idx+1}: {carrier_name} → {carrier_id}")
+    
+    return carriers
+
+
+async def get_shipstation_carrier_ids():
+    """
+    Get carrier IDs from ShipStation
+    Returns dict mapping carrier names to IDs
+    
+    Note: order flow reads carriers from services.carrier_catalog
+    (memory + MongoDB snapshot); this performs a live API call.
+    """
+    carriers_list = await fetch_shipstation_carriers()
+    if not carriers_list:
         return {}
+    
+    carriers = build_carrier_ids_map(carriers_list)
+    logger.info(f"✅ Successfully loaded {len(carriers)} ShipStation carriers")
+    return carriers
 
 
-async def validate_address_with_shipstation(name, street1, street2, city, state, zip_code):
+async def validate_address_with_shipstation(name, street1, street2, city, state, zip_code, phone=None):
     """
     Validate address with ShipStation API
     Returns (is_valid, corrected_address_or_error_message)
+    
+    Definitive answers are cached by normalized address (see
+    services/address_validation_cache.py); API errors are not cached.
+    Only address fields are cached, the caller's name/phone are merged back in.
     """
+    # Reject impossible ZIP/state combinations locally (offline ZIP database);
+    # a prefix-only mismatch is left to ShipStation
+    from services.zip_database import zip_db
+    zip_ok, zip_error = zip_db.validate(state, zip_code)
+    if not zip_ok:
+        return False, zip_error
+    
+    from services.address_validation_cache import address_validation_cache, address_fingerprint, address_fields
+    
+    def for_caller(corrected):
+        corrected = address_fields(corrected)
+        if not isinstance(corrected, dict):
+            return corrected
+        corrected['name'] = name
+        if phone:
+            corrected['phone'] = phone
+        return corrected
+    
+    fingerprint = address_fingerprint(street1, street2, city, state, zip_code)
+    cached = await address_validation_cache.get(fingerprint)
+    if cached is not None:
+        is_valid, result = cached
+        return (True, for_caller(result)) if is_valid else cached
+    
     try:
         # Load API key inside function to ensure env vars are available
         api_key = os.environ.get('SHIPSTATION_API_KEY_TEST') or os.environ.get('SHIPSTATION_API_KEY_PROD') or os.environ.get('SHIPSTATION_API_KEY', '')
@@ -268,12 +346,14 @@ async def validate_address_with_shipstation(name, street1, street2, city, state,
             "country": "US"
         }
         
-        async with httpx.AsyncClient(timeout=10.0) as client:
-            response = await client.post(
-                'https://api.shipstation.com/v2/addresses/validate',
-                json=payload,
-                headers=headers
-            )
+        client = get_http_client('shipstation')
+        response = await request_policy.request(
+            client, 'POST', 'https://api.shipstation.com/v2/addresses/validate',
+            hedge=True,
+            default_timeout=BotPerformanceConfig.EXTERNAL_API_TIMEOUTS['shipstation'],
+            json=payload,
+            headers=headers
+        )
         
         if response.status_code == 200:
             data = response.json()
@@ -283,11 +363,13 @@ async def validate_address_with_shipstation(name, street1, street2, city, state,
             
             if not is_valid:
                 error_msg = data.get('message', 'Address validation failed')
+                await address_validation_cache.set(fingerprint, False, error_msg)
                 return False, error_msg
             
             # Return corrected address if available
-            corrected = data.get('address')
-            return True, corrected
+            corrected = address_fields(data.get('address'))
+            await address_validation_cache.set(fingerprint, True, corrected)
+            return True, for_caller(corrected)
         else:
             # If validation API fails, don't block user
             logger.warning(f"Address validation failed: {response.status_code}")
@@ -297,3 +379,68 @@ async def validate_address_with_shipstation(name, street1, street2, city, state,
         logger.error(f"Address validation error: {e}")
         # Don't block user on API errors
         return True, None
+
+
+async def validate_order_addresses(order_data: dict):
+    """
+    Validate sender and recipient addresses of an order
+    
+    Addresses loaded from a template carry a pre-validated fingerprint
+    and are skipped as long as the user has not edited them.
+    
+    Returns:
+        (is_valid, error_message) - error names the failing side
+    """
+    import asyncio
+    from services.address_validation_cache import address_validation_cache, order_address_fingerprint
+    
+    async def validate_side(prefix):
+        fingerprint = order_address_fingerprint(order_data, prefix)
+        if fingerprint and fingerprint == order_data.get(f'{prefix}_address_fingerprint'):
+            address_validation_cache.template_skips += 1
+            return True, None
+        return await validate_address_with_shipstation(
+            order_data.get(f'{prefix}_name'),
+            order_data.get(f'{prefix}_street') or order_data.get(f'{prefix}_address'),
+            order_data.get(f'{prefix}_street2') or order_data.get(f'{prefix}_address2'),
+            order_data.get(f'{prefix}_city'),
+            order_data.get(f'{prefix}_state'),
+            order_data.get(f'{prefix}_zip')
+        )
+    
+    # Both sides in parallel - one round trip instead of two
+    results = await asyncio.gather(validate_side('from'), validate_side('to'))
+    for (is_valid, result), label in zip(results, ('Отправитель', 'Получатель')):
+        if not is_valid:
+            return False, f"{label}: {result}"
+    
+    return True, None
+
+
+async def prevalidate_template_addresses(order_data: dict) -> dict:
+    """
+    Validate template addresses and return their fingerprints
+    
+    Returns:
+        {'from_address_fingerprint': str|None, 'to_address_fingerprint': str|None}
+        - a fingerprint is only set for addresses ShipStation confirmed valid
+    """
+    from services.address_validation_cache import address_validation_cache, order_address_fingerprint
+    
+    fingerprints = {}
+    for prefix in ('from', 'to'):
+        fingerprint = order_address_fingerprint(order_data, prefix)
+        if fingerprint and not await address_validation_cache.is_known_valid(fingerprint):
+            await validate_address_with_shipstation(
+                order_data.get(f'{prefix}_name'),
+                order_data.get(f'{prefix}_street') or order_data.get(f'{prefix}_address'),
+                order_data.get(f'{prefix}_street2') or order_data.get(f'{prefix}_address2'),
+                order_data.get(f'{prefix}_city'),
+                order_data.get(f'{prefix}_state'),
+                order_data.get(f'{prefix}_zip')
+            )
+            if not await address_validation_cache.is_known_valid(fingerprint):
+                fingerprint = None
+        fingerprints[f'{prefix}_address_fingerprint'] = fingerprint
+    
+    return fingerprints
@@ -0,0 +1,652 @@
+"""
+Batch Orders
+Пакетные заказы: N посылок от одного отправителя за одну оплату
+
+One batch carries N parcels (one sender; many recipients and/or many
+parcels to the same recipient). Rates for all parcels are requested
+concurrently with bounded parallelism; a service offered for every parcel
+can be bought for the whole batch. The purchase uses the ShipStation
+batch API (POST /v2/batches with the quoted rate_ids, then process/labels),
+which also renders one merged PDF for all labels. The user gets that PDF
+as a single Telegram document and one balance debit for the labels that
+were actually bought.
+
+The batch id is generated at checkout and reused by every tap and retry.
+It is the batch_orders key and the ShipStation external_batch_id. The
+total is debited with one conditional update before the job is queued
+(charge); after the purchase the lines that were not bought are
+refunded, and the admin is alerted if that reconciliation fails.
+
+The purchase runs as a label job (services/label_queue.py, source='batch')
+and is resumable: the ShipStation batch id and each finished step are
+stored on the batch_orders document, so a retry continues where the
+previous attempt stopped instead of buying again. The batch is claimed
+(pending → creating) before POST /batches; a retry of a claimed batch
+without a ShipStation id looks it up by external_batch_id first.
+"""
+import asyncio
+import logging
+import os
+import time
+import uuid
+from datetime import datetime, timezone, timedelta
+from typing import Optional, Dict, Any, List, Tuple
+
+from pymongo import ReturnDocument
+
+from config.performance_config import BotPerformanceConfig
+from services.http_clients import get_http_client
+
+logger = logging.getLogger(__name__)
+
+SHIPSTATION_API = 'https://api.shipstation.com/v2'
+
+# Batch states in ShipStation after process/labels
+BATCH_DONE_STATUSES = ('completed', 'completed_with_errors')
+BATCH_FAILED_STATUSES = ('invalid', 'archived')
+
+
+def service_key(rate: Dict[str, Any]) -> str:
+    """Carrier + service identity of a rate, same across parcels"""
+    carrier = rate.get('carrier_code') or rate.get('carrier_id') or ''
+    return f"{carrier}:{rate.get('service_code', '')}"
+
+
+def _rate_amount(rate: Dict[str, Any]) -> float:
+    if isinstance(rate.get('shipping_amount'), dict):
+        return float(rate['shipping_amount'].get('amount', 0.0))
+    return float(rate.get('amount', 0.0))
+
+
+def common_service_options(parcel_rates: List[List[Dict[str, Any]]]) -> List[Dict[str, Any]]:
+    """
+    Services quoted for every parcel, with the batch total (cheapest first)
+
+    Args:
+        parcel_rates: Prepared rates (markup included) per parcel, same order as parcels
+
+    Returns:
+        [{'key', 'carrier', 'service', 'total', 'original_total', 'rates': [...]}]
+        where rates holds the per-parcel rate details needed for purchase
+    """
+    if not parcel_rates:
+        return []
+
+    per_parcel = [{service_key(rate): rate for rate in rates} for rates in parcel_rates]
+    common = set(per_parcel[0])
+    for rates in per_parcel[1:]:
+        common &= set(rates)
+
+    options = []
+    for key in common:
+        chosen = [rates[key] for rates in per_parcel]
+        first = chosen[0]
+        options.append({
+            'key': key,
+            'carrier': first.get('carrier_friendly_name') or first.get('carrier_code', ''),
+            'service': first.get('service_type') or first.get('service') or first.get('service_code', ''),
+            'total': round(sum(_rate_amount(rate) for rate in chosen), 2),
+            'original_total': round(sum(float(rate.get('original_amount', 0.0)) for rate in chosen), 2),
+            'rates': [{
+                'rate_id': rate.get('rate_id'),
+                'shipment_id': rate.get('shipment_id'),
+                'carrier_id': rate.get('carrier_id'),
+                'service_code': rate.get('service_code'),
+                'amount': _rate_amount(rate),
+                'original_amount': float(rate.get('original_amount', 0.0)),
+            } for rate in chosen]
+        })
+
+    options.sort(key=lambda option: option['total'])
+    return options
+
+
+class BatchOrderService:
+    """
+    Сервис пакетных заказов
+
+    Usage:
+        parcel_rates, options = await batch_order_service.quote(sender, parcels)
+        batch = await batch_order_service.create_batch(telegram_id, sender, parcels, options[0], batch_id)
+        charged, error = await batch_order_service.charge(batch['batch_id'])
+        await label_job_queue.enqueue(batch['batch_id'], telegram_id, source='batch')
+    """
+
+    def __init__(self,
+                 max_parcels: int = 20,
+                 max_parallel_quotes: int = 4,
+                 poll_interval_seconds: float = 2.0,
+                 poll_timeout_seconds: float = 120.0):
+        """
+        Args:
+            max_parcels: Максимум посылок в пакете
+            max_parallel_quotes: Параллельных запросов тарифов
+            poll_interval_seconds: Интервал опроса статуса пакета ShipStation
+            poll_timeout_seconds: Сколько ждать обработки пакета за одну попытку
+        """
+        self.max_parcels = max_parcels
+        self.max_parallel_quotes = max_parallel_quotes
+        self.poll_interval = poll_interval_seconds
+        self.poll_timeout = poll_timeout_seconds
+        self.quotes = 0
+        self.quote_failures = 0
+        self.batches_created = 0
+        self.batches_completed = 0
+        self.labels_bought = 0
+        self.parcels_failed = 0
+        self.refunds = 0
+        self.reconcile_failures = 0
+        self._last_quote_ms = None
+
+    # ==================== QUOTE ====================
+
+    async def quote(
+        self,
+        sender: Dict[str, Any],
+        parcels: List[Dict[str, Any]]
+    ) -> Tuple[List[Optional[List[Dict[str, Any]]]], List[Dict[str, Any]]]:
+        """
+        Fetch rates for all parcels concurrently
+
+        Rates are requested fresh (not from the rate cache): the purchase
+        needs rate_ids of shipments with these exact addresses.
+
+        Returns:
+            (rates per parcel - None where quoting failed, common service options)
+        """
+        from services.carrier_catalog import carrier_catalog
+        from services.shipping_service import build_shipstation_rates_request
+        from handlers.order_flow.rates import fetch_and_prepare_rates
+
+        carrier_ids = await carrier_catalog.get_carrier_ids()
+        headers = {
+            'API-Key': os.environ.get('SHIPSTATION_API_KEY_TEST') or os.environ.get('SHIPSTATION_API_KEY_PROD'),
+            'Content-Type': 'application/json'
+        }
+        semaphore = asyncio.Semaphore(self.max_parallel_quotes)
+
+        async def quote_parcel(parcel: Dict[str, Any]) -> Optional[List[Dict[str, Any]]]:
+            async with semaphore:
+                rate_request = build_shipstation_rates_request({**sender, **parcel}, list(carrier_ids.values()))
+                try:
+                    success, rates, error = await fetch_and_prepare_rates(rate_request, headers)
+                except Exception as e:
+                    success, rates, error = False, None, str(e)
+                self.quotes += 1
+                if not success or not rates:
+                    self.quote_failures += 1
+                    logger.warning(f"⚠️ Batch quote failed for {parcel.get('to_zip')}: {error}")
+                    return None
+                return rates
+
+        start = time.perf_counter()
+        parcel_rates = await asyncio.gather(*(quote_parcel(parcel) for parcel in parcels))
+        self._last_quote_ms = round((time.perf_counter() - start) * 1000, 1)
+        logger.info(f"📦 Batch quote: {len(parcels)} parcels in {self._last_quote_ms}ms")
+
+        if any(rates is None for rates in parcel_rates):
+            return list(parcel_rates), []
+        return list(parcel_rates), common_service_options(parcel_rates)
+
+    # ==================== CREATE ====================
+
+    async def create_batch(
+        self,
+        telegram_id: int,
+        sender: Dict[str, Any],
+        parcels: List[Dict[str, Any]],
+        option: Dict[str, Any],
+        batch_id: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """
+        Persist batch order with the chosen service (status 'pending')
+
+        Args:
+            batch_id: Key generated at checkout; a repeated call with the
+                same key returns the existing batch instead of a new one
+        """
+        from server import db
+        from utils.order_utils import generate_order_id
+
+        batch = {
+            'id': str(uuid.uuid4()),
+            'batch_id': batch_id or generate_order_id(telegram_id=telegram_id, prefix="BATCH"),
+            'telegram_id': telegram_id,
+            'sender': sender,
+            'parcels': [{**parcel, **rate} for parcel, rate in zip(parcels, option['rates'])],
+            'carrier': option['carrier'],
+            'service': option['service'],
+            'amount': option['total'],
+            'original_amount': option['original_total'],
+            'status': 'pending',
+            'charged': False,
+            'delivered': False,
+            'created_at': datetime.now(timezone.utc).isoformat()
+        }
+        existing = await db.batch_orders.find_one_and_update(
+            {'batch_id': batch['batch_id']},
+            {'$setOnInsert': dict(batch)},
+            upsert=True,
+            projection={'_id': 0},
+            return_document=ReturnDocument.BEFORE
+        )
+        if existing is not None:
+            return existing
+        self.batches_created += 1
+        logger.info(f"📦 Batch {batch['batch_id']} created: {len(parcels)} parcels, ${batch['amount']:.2f}")
+        return batch
+
+    async def charge(self, batch_id: str) -> Tuple[bool, Optional[str]]:
+        """
+        Debit the batch total once, before anything is bought
+
+        The batch is claimed (pending → charging) so a double tap charges
+        once; the debit itself is one conditional update on the balance that
+        also records batch_id in the user's pending_charges. If the process
+        dies before charged=True is written, recover_charges() finds the
+        marker and refunds it.
+
+        Returns:
+            (charged, error) - error is None when another call holds the batch
+        """
+        from server import db
+        from services.service_factory import ServiceFactory
+
+        batch = await db.batch_orders.find_one_and_update(
+            {'batch_id': batch_id, 'status': 'pending', 'charged': False},
+            {'$set': {'status': 'charging', 'charging_at': datetime.now(timezone.utc).isoformat()}},
+            projection={'_id': 0},
+            return_document=ReturnDocument.AFTER
+        )
+        if batch is None:
+            return False, None
+
+        payment_service = ServiceFactory(db).get_payment_service()
+        success, error = await payment_service.process_balance_charge(
+            telegram_id=batch['telegram_id'],
+            charge_id=batch_id,
+            amount=batch['amount']
+        )
+        if not success:
+            # Back to pending: the user may top up and pay again
+            await self._update(db, batch_id, status='pending')
+            return False, error
+
+        await self._update(db, batch_id, status='pending', charged=True, charged_amount=batch['amount'])
+        await payment_service.settle_charge(batch['telegram_id'], batch_id)
+        return True, None
+
+    async def recover_charges(self, older_than_seconds: float = 300) -> int:
+        """
+        Release batches left in 'charging' by a process that died
+
+        A debit that happened (marker still in pending_charges) is refunded,
+        and the batch goes back to pending so the user can pay again.
+
+        Returns:
+            int: Number of batches released
+        """
+        from server import db
+        from services.service_factory import ServiceFactory
+
+        cutoff = (datetime.now(timezone.utc) - timedelta(seconds=older_than_seconds)).isoformat()
+        payment_service = ServiceFactory(db).get_payment_service()
+        released = 0
+        async for batch in db.batch_orders.find(
+            {'status': 'charging', 'charging_at': {'$lt': cutoff}}, {'_id': 0}
+        ):
+            batch_id = batch['batch_id']
+            try:
+                if await payment_service.refund_unsettled_charge(batch['telegram_id'], batch_id, batch['amount']):
+                    self.refunds += 1
+                await db.batch_orders.update_one(
+                    {'batch_id': batch_id, 'status': 'charging', 'charged': False},
+                    {'$set': {'status': 'pending'}}
+                )
+                released += 1
+            except Exception as e:
+                logger.error(f"❌ Batch {batch_id} stuck in charging, recovery failed: {e}")
+        if released:
+            logger.warning(f"♻️ Released {released} batch(es) stuck in charging")
+        return released
+
+    # ==================== PURCHASE ====================
+
+    async def purchase(self, batch_id: str) -> bool:
+        """
+        Buy all labels of the batch, refund lines not bought, send merged PDF
+
+        Each step is recorded on the batch document; calling again after a
+        failure resumes from the first unfinished step.
+
+        Returns:
+            bool: True when the batch is completed
+        """
+        from server import db, SHIPSTATION_API_KEY
+
+        batch = await db.batch_orders.find_one({'batch_id': batch_id}, {'_id': 0})
+        if not batch:
+            logger.error(f"❌ Batch {batch_id} not found")
+            return False
+        if batch['status'] == 'completed':
+            return True
+
+        # Step 0: nothing is bought before the total is debited
+        if not batch.get('charged'):
+            charged, error = await self.charge(batch_id)
+            if not charged:
+                logger.error(f"❌ Batch {batch_id} not charged, not buying: {error}")
+                return False
+            batch.update(charged=True, charged_amount=batch['amount'])
+
+        headers = {'API-Key': SHIPSTATION_API_KEY, 'Content-Type': 'application/json'}
+        client = get_http_client('shipstation')
+
+        # Step 1: ShipStation batch from the quoted rates
+        ss_batch_id = batch.get('shipstation_batch_id')
+        if not ss_batch_id:
+            if batch['status'] == 'creating':
+                # A previous POST may have created it and timed out
+                ss_batch_id = await self._find_batch(client, headers, batch_id)
+            else:
+                claimed = await db.batch_orders.find_one_and_update(
+                    {'batch_id': batch_id, 'status': 'pending'},
+                    {'$set': {'status': 'creating'}},
+                    projection={'_id': 0}
+                )
+                if claimed is None:
+                    logger.warning(f"⚠️ Batch {batch_id} is not pending, not creating it again")
+                    return False
+
+        if not ss_batch_id:
+            response = await client.post(
+                f"{SHIPSTATION_API}/batches",
+                headers=headers,
+                json={
+                    'external_batch_id': batch_id,
+                    'batch_notes': f"Telegram user {batch['telegram_id']}",
+                    'rate_ids': [parcel['rate_id'] for parcel in batch['parcels']]
+                },
+                timeout=30.0
+            )
+            if response.status_code not in (200, 201):
+                logger.error(f"❌ ShipStation batch create failed: {response.status_code} {response.text[:300]}")
+                return False
+            ss_batch_id = response.json()['batch_id']
+
+        if not batch.get('shipstation_batch_id'):
+            await self._update(db, batch_id, shipstation_batch_id=ss_batch_id, status='created')
+            batch['status'] = 'created'
+
+        # Step 2: buy labels
+        if batch['status'] == 'created':
+            response = await client.post(
+                f"{SHIPSTATION_API}/batches/{ss_batch_id}/process/labels",
+                headers=headers,
+                json={'label_layout': 'letter', 'label_format': 'pdf'},
+                timeout=30.0
+            )
+            if response.status_code not in (200, 202, 204):
+                logger.error(f"❌ ShipStation batch process failed: {response.status_code} {response.text[:300]}")
+                return False
+            await self._update(db, batch_id, status='processing')
+
+        ss_batch = await self._wait_processed(client, headers, ss_batch_id)
+        if ss_batch is None:
+            return False
+
+        # Step 3: record bought labels
+        labels = await self._list_labels(client, headers, ss_batch_id)
+        bought = await self._save_labels(db, batch, labels)
+        if not bought:
+            logger.error(f"❌ Batch {batch_id}: no labels were bought")
+            await self._update(db, batch_id, status='failed')
+            return False
+
+        # Step 4: refund the lines that were not bought
+        if not batch.get('reconciled'):
+            cost = round(sum(parcel['amount'] for parcel in bought), 2)
+            await self._reconcile(db, batch, cost)
+
+        # Step 5: merged PDF to the user
+        if not batch.get('delivered'):
+            delivered = await self._deliver(db, batch, ss_batch, bought, headers)
+            if not delivered:
+                return False
+
+        await self._update(
+            db, batch_id,
+            status='completed',
+            labels_bought=len(bought),
+            completed_at=datetime.now(timezone.utc).isoformat()
+        )
+        self.batches_completed += 1
+        logger.info(f"✅ Batch {batch_id} completed: {len(bought)}/{len(batch['parcels'])} labels")
+        return True
+
+    async def _find_batch(self, client, headers: Dict[str, str], batch_id: str) -> Optional[str]:
+        """ShipStation batch created for external_batch_id (None if there is none)"""
+        response = await client.get(
+            f"{SHIPSTATION_API}/batches/external_batch_id/{batch_id}", headers=headers, timeout=30.0
+        )
+        if response.status_code == 404:
+            return None
+        if response.status_code != 200:
+            # Don't create blind - the batch may exist
+            raise RuntimeError(f"ShipStation batch lookup failed: HTTP {response.status_code}")
+        logger.info(f"♻️ Batch {batch_id} was created by a previous attempt, not creating again")
+        return response.json()['batch_id']
+
+    async def _reconcile(self, db, batch: Dict[str, Any], cost: float) -> None:
+        """Return charged_amount - cost to the balance (once); alert admin on failure"""
+        batch_id = batch['batch_id']
+        claimed = await db.batch_orders.find_one_and_update(
+            {'batch_id': batch_id, 'reconciled': {'$ne': True}},
+            {'$set': {'reconciled': True}},
+            projection={'_id': 0}
+        )
+        if claimed is None:
+            return
+
+        refund = round(batch.get('charged_amount', batch['amount']) - cost, 2)
+        error = None
+        if refund > 0:
+            from services.service_factory import ServiceFactory
+            payment_service = ServiceFactory(db).get_payment_service()
+            try:
+                refunded = await payment_service.refund_balance(batch['telegram_id'], batch_id, refund)
+            except Exception as e:
+                refunded, error = False, str(e)
+            if refunded:
+                self.refunds += 1
+            else:
+                error = error or "Refund failed"
+                self.reconcile_failures += 1
+                await self._alert_admin(batch, "Batch Refund Failed",
+                                        f"${refund:.2f} for {len(batch['parcels'])} parcels not refunded: {error}")
+
+        await self._update(db, batch_id, cost_amount=cost, refunded_amount=refund if not error else 0.0,
+                           charge_error=error)
+
+    @staticmethod
+    async def _alert_admin(batch: Dict[str, Any], error_type: str, details: str) -> None:
+        from handlers.admin_handlers import notify_admin_error
+        logger.error(f"❌ Batch {batch['batch_id']}: {error_type}: {details}")
+        await notify_admin_error(
+            user_info={'telegram_id': batch['telegram_id']},
+            error_type=error_type,
+            error_details=details,
+            order_id=batch['batch_id']
+        )
+
+    async def _wait_processed(self, client, headers: Dict[str, str], ss_batch_id: str) -> Optional[Dict[str, Any]]:
+        """Poll ShipStation until the batch is processed (None on timeout/failure)"""
+        deadline = time.monotonic() + self.poll_timeout
+        while True:
+            response = await client.get(f"{SHIPSTATION_API}/batches/{ss_batch_id}", headers=headers, timeout=30.0)
+            if response.status_code == 200:
+                ss_batch = response.json()
+                status = ss_batch.get('status')
+                if status in BATCH_DONE_STATUSES:
+                    return ss_batch
+                if status in BATCH_FAILED_STATUSES:
+                    logger.error(f"❌ ShipStation batch {ss_batch_id} is {status}")
+                    return None
+            if time.monotonic() >= deadline:
+                logger.warning(f"⏳ ShipStation batch {ss_batch_id} still processing")
+                return None
+            await asyncio.sleep(self.poll_interval)
+
+    async def _list_labels(self, client, headers: Dict[str, str], ss_batch_id: str) -> List[Dict[str, Any]]:
+        response = await client.get(
+            f"{SHIPSTATION_API}/labels",
+            headers=headers,
+            params={'batch_id': ss_batch_id, 'page_size': 500},
+            timeout=30.0
+        )
+        if response.status_code != 200:
+            logger.error(f"❌ ShipStation batch labels failed: {response.status_code}")
+            return []
+        return response.json().get('labels', [])
+
+    async def _save_labels(self, db, batch: Dict[str, Any], labels: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Match labels to parcels by shipment_id, upsert shipping_labels; returns bought parcels"""
+        by_shipment = {label.get('shipment_id'): label for label in labels if label.get('tracking_number')}
+        bought = []
+
+        for parcel in batch['parcels']:
+            label = by_shipment.get(parcel.get('shipment_id'))
+            if label is None or label.get('status') == 'voided':
+                continue
+
+            await db.shipping_labels.update_one(
+                {'label_id': label['label_id']},
+                {'$setOnInsert': {
+                    'id': str(uuid.uuid4()),
+                    'order_id': batch['batch_id'],
+                    'batch_id': batch['batch_id'],
+                    'label_id': label['label_id'],
+                    'shipment_id': label.get('shipment_id'),
+                    'tracking_number': label['tracking_number'],
+                    'label_url': (label.get('label_download') or {}).get('pdf', ''),
+                    'carrier': batch['carrier'],
+                    'service_level': batch['service'],
+                    'amount': str(parcel['amount']),
+                    'original_amount': parcel.get('original_amount'),
+                    'status': 'created',
+                    'created_at': datetime.now(timezone.utc).isoformat()
+                }},
+                upsert=True
+            )
+            bought.append({**parcel, 'tracking_number': label['tracking_number'], 'label_id': label['label_id']})
+
+        if not batch.get('labels_bought'):
+            self.labels_bought += len(bought)
+            self.parcels_failed += len(batch['parcels']) - len(bought)
+        return bought
+
+    async def _deliver(self, db, batch, ss_batch, bought, headers) -> bool:
+        from server import bot_instance
+        from services.label_store import label_store
+        from services.telegram_delivery import telegram_delivery
+
+        pdf_url = (ss_batch.get('label_download') or {}).get('pdf')
+        if not pdf_url:
+            logger.error(f"❌ ShipStation batch has no merged PDF: {batch['batch_id']}")
+            return False
+
+        success, blob, error = await label_store.store_from_url(pdf_url, headers={'API-Key': headers['API-Key']}, timeout=60)
+        if not success:
+            logger.error(f"❌ Merged batch PDF download failed: {error}")
+            return False
+
+        if not bot_instance:
+            logger.warning("⚠️ bot_instance not available, merged PDF stored but not sent")
+            return False
+
+        lines = [f"{n}. {parcel['tracking_number']} → {parcel.get('to_name', '')}, {parcel.get('to_city', '')} {parcel.get('to_state', '')}"
+                 for n, parcel in enumerate(bought, 1)]
+        caption = f"✅ Пакет этикеток ({len(bought)} из {len(batch['parcels'])})\n\nCarrier: {batch['carrier']}\n\n" + "\n".join(lines)
+
+        _, file_id = await telegram_delivery.send_document(
+            bot_instance,
+            batch['telegram_id'],
+            upload=lambda: open(blob.path, 'rb'),
+            filename=f"{batch['batch_id']}.pdf",
+            caption=caption[:1024]
+        )
+        await self._update(
+            db, batch['batch_id'],
+            delivered=True,
+            pdf_sha256=blob.sha256,
+            telegram_file_id=file_id
+        )
+        return True
+
+    async def mark_failed(self, batch_id: str) -> None:
+        """Batch job was dead-lettered: mark failed and tell the user"""
+        from server import db, bot_instance, safe_telegram_call
+        from telegram import InlineKeyboardButton, InlineKeyboardMarkup
+
+        await self._update(db, batch_id, status='failed')
+        batch = await db.batch_orders.find_one({'batch_id': batch_id}, {'_id': 0})
+        if not batch:
+            return
+
+        refunded = False
+        if batch.get('charged') and not batch.get('reconciled'):
+            if await db.shipping_labels.count_documents({'batch_id': batch_id}) == 0:
+                # Nothing was bought - the whole debit goes back
+                await self._reconcile(db, batch, 0.0)
+                batch = await db.batch_orders.find_one({'batch_id': batch_id}, {'_id': 0}) or batch
+                refunded = not batch.get('charge_error')
+            else:
+                await self._alert_admin(batch, "Batch Failed After Purchase",
+                                        "Labels were bought but the batch was not reconciled")
+
+        if not bot_instance:
+            return
+
+        if refunded:
+            text = f"""❌ Не удалось создать пакет этикеток {batch_id}.
+Оплата возвращена на ваш баланс.
+Пожалуйста, свяжитесь с администратором."""
+        elif batch.get('charged'):
+            text = f"❌ Не удалось отправить пакет этикеток {batch_id}.\nПожалуйста, свяжитесь с администратором."
+        else:
+            text = f"""❌ Не удалось создать пакет этикеток {batch_id}.
+Оплата не списана. Ваш баланс не изменился.
+Пожалуйста, свяжитесь с администратором."""
+        keyboard = [[InlineKeyboardButton("🔙 Главное меню", callback_data='start')]]
+        await safe_telegram_call(bot_instance.send_message(
+            chat_id=batch['telegram_id'],
+            text=text,
+            reply_markup=InlineKeyboardMarkup(keyboard)
+        ))
+
+    @staticmethod
+    async def _update(db, batch_id: str, **fields) -> None:
+        await db.batch_orders.update_one({'batch_id': batch_id}, {'$set': fields})
+
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        Получить статистику пакетных заказов
+
+        Returns:
+            dict: запросы тарифов, созданные/завершенные пакеты, купленные этикетки
+        """
+        return {
+            'quotes': self.quotes,
+            'quote_failures': self.quote_failures,
+            'last_quote_ms': self._last_quote_ms,
+            'batches_created': self.batches_created,
+            'batches_completed': self.batches_completed,
+            'labels_bought': self.labels_bought,
+            'parcels_failed': self.parcels_failed,
+            'refunds': self.refunds,
+            'reconcile_failures': self.reconcile_failures,
+        }
+
+
+# Глобальный инстанс (singleton)
+batch_order_service = BatchOrderService(**BotPerformanceConfig.get_batch_order_config())
@@ -0,0 +1,449 @@
+"""
+Broadcast Engine
+Рассылки как фоновые задачи (MongoDB broadcasts + broadcast_deliveries)
+
+POST /api/broadcast creates a job and returns at once; a worker sends it
+in the background. A broadcast survives request timeouts and restarts:
+
+- broadcasts: one document per broadcast - message, audience (target
+  name and its segment definition), status, counters and a cursor (last
+  telegram_id processed)
+- recipients are streamed by the segment engine (one aggregation sorted
+  by telegram_id, starting after the saved cursor) - no materialized list
+- broadcast_deliveries: one document per recipient, _id =
+  "<broadcast_id>:<telegram_id>", written before the send. A recipient is
+  never messaged twice: after a crash the unfinished batch is re-read and
+  recipients that already have a delivery are only counted
+- the worker holds a lease (lease_until) renewed at every checkpoint
+  (batch_size recipients); a broadcast whose worker died is picked up
+  again after the lease expires
+- pause / resume / cancel change the status; the worker stops at the
+  next checkpoint
+- media: an image URL is uploaded to Telegram once before the first
+  batch (services/media_registry.py); every recipient gets the file_id
+- pacing: sends go through the application bot with BROADCAST priority,
+  so the send scheduler keeps them within Telegram limits and behind
+  interactive replies
+- 403 (bot blocked / user deactivated) and "chat not found" set
+  bot_blocked_by_user on the user; audiences exclude those users
+
+Status: queued → running → done | paused → queued | cancelled
+"""
+import asyncio
+import logging
+import uuid
+from datetime import datetime, timezone, timedelta
+from typing import Any, Dict, List, Optional
+
+import telegram.error
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+from config.performance_config import BotPerformanceConfig
+from services.segment_engine import segment_engine
+from services.telegram_send_scheduler import send_priority, SendPriority
+
+logger = logging.getLogger(__name__)
+
+FINISHED_STATUSES = ('done', 'cancelled')
+OUTCOMES = ('sent', 'failed', 'blocked')
+
+
+def is_recipient_gone(error: Exception) -> bool:
+    """The user blocked the bot, was deactivated or the chat does not exist"""
+    if isinstance(error, telegram.error.Forbidden):
+        return True
+    return isinstance(error, telegram.error.BadRequest) and 'chat not found' in str(error).lower()
+
+
+class BroadcastEngine:
+    """
+    Фоновые рассылки с возобновлением после сбоя
+
+    Usage:
+        broadcast = await broadcast_engine.create(message, target='all')
+        progress = await broadcast_engine.get(broadcast['_id'])
+        await broadcast_engine.start(db)   # FastAPI startup
+    """
+
+    def __init__(self,
+                 concurrency: int = 8,
+                 batch_size: int = 50,
+                 lease_seconds: int = 60,
+                 poll_interval_seconds: float = 5.0):
+        """
+        Args:
+            concurrency: Одновременных отправок (темп задает send scheduler)
+            batch_size: Получателей между сохранениями прогресса
+            lease_seconds: Срок аренды рассылки воркером
+            poll_interval_seconds: Интервал опроса без уведомлений
+        """
+        self.concurrency = concurrency
+        self.batch_size = batch_size
+        self.lease = timedelta(seconds=lease_seconds)
+        self.poll_interval = poll_interval_seconds
+        self._db = None
+        self._task: Optional[asyncio.Task] = None
+        self._wakeup = asyncio.Event()
+        self._running = False
+        self.worker_id = uuid.uuid4().hex[:8]
+        self.started = 0
+        self.resumed = 0
+        self.completed = 0
+        self.outcomes = {outcome: 0 for outcome in OUTCOMES}
+
+    # ==================== LIFECYCLE ====================
+
+    async def start(self, db) -> None:
+        """Create indexes and start the worker (FastAPI startup)"""
+        self._db = db
+        try:
+            await db.broadcasts.create_index([("status", 1), ("created_at", 1)])
+            await db.broadcast_deliveries.create_index([("broadcast_id", 1), ("status", 1)])
+        except Exception as e:
+            logger.warning(f"⚠️ broadcasts index creation skipped: {e}")
+
+        self._running = True
+        self._task = asyncio.create_task(self._worker())
+        logger.info("✅ Broadcast engine started")
+
+    async def stop(self) -> None:
+        """Stop the worker; a running broadcast resumes after its lease expires"""
+        self._running = False
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    # ==================== API ====================
+
+    async def create(
+        self,
+        message: str,
+        target: str = 'all',
+        image_url: Optional[str] = None,
+        file_id: Optional[str] = None,
+        segment: Optional[Dict[str, Any]] = None
+    ) -> Optional[Dict[str, Any]]:
+        """
+        Create a broadcast job
+
+        Args:
+            target: Named segment (all, active, premium)
+            segment: Custom segment definition; overrides target
+
+        Returns:
+            The broadcast document, or None if the audience is empty
+
+        Raises:
+            ValueError: unknown target or invalid segment
+        """
+        if segment is not None:
+            target = 'custom'
+        definition = segment_engine.resolve(segment if segment is not None else target)
+        total = await segment_engine.count(self._db, definition, use_cache=False)
+        if not total:
+            return None
+
+        now = datetime.now(timezone.utc)
+        broadcast = {
+            '_id': uuid.uuid4().hex,
+            'message': message,
+            'target': target,
+            'segment': definition,
+            'image_url': image_url,
+            'file_id': file_id,
+            'status': 'queued',
+            'total': total,
+            **{outcome: 0 for outcome in OUTCOMES},
+            'cursor': None,
+            'worker_id': None,
+            'lease_until': None,
+            'last_error': None,
+            'created_at': now,
+            'started_at': None,
+            'finished_at': None,
+        }
+        await self._db.broadcasts.insert_one(broadcast)
+        self._wakeup.set()
+        logger.info(f"📢 Broadcast {broadcast['_id']} queued: {total} recipients (target={target})")
+        return broadcast
+
+    async def get(self, broadcast_id: str) -> Optional[Dict[str, Any]]:
+        """Broadcast with progress (percent, rate, ETA) for polling"""
+        broadcast = await self._db.broadcasts.find_one({'_id': broadcast_id})
+        return self.with_progress(broadcast) if broadcast else None
+
+    async def list_recent(self, limit: int = 20) -> List[Dict[str, Any]]:
+        cursor = self._db.broadcasts.find({}).sort('created_at', -1).limit(limit)
+        return [self.with_progress(b) async for b in cursor]
+
+    async def pause(self, broadcast_id: str) -> bool:
+        return await self._transition(broadcast_id, ('queued', 'running'), {'status': 'paused'})
+
+    async def resume(self, broadcast_id: str) -> bool:
+        resumed = await self._transition(broadcast_id, ('paused',), {'status': 'queued', 'lease_until': None})
+        if resumed:
+            self._wakeup.set()
+        return resumed
+
+    async def cancel(self, broadcast_id: str) -> bool:
+        return await self._transition(
+            broadcast_id, ('queued', 'running', 'paused'),
+            {'status': 'cancelled', 'finished_at': datetime.now(timezone.utc), 'lease_until': None}
+        )
+
+    async def _transition(self, broadcast_id: str, from_statuses, fields: Dict[str, Any]) -> bool:
+        result = await self._db.broadcasts.update_one(
+            {'_id': broadcast_id, 'status': {'$in': list(from_statuses)}},
+            {'$set': fields}
+        )
+        if result.modified_count:
+            logger.info(f"📢 Broadcast {broadcast_id} → {fields['status']}")
+        return bool(result.modified_count)
+
+    @staticmethod
+    def with_progress(broadcast: Dict[str, Any]) -> Dict[str, Any]:
+        processed = sum(broadcast.get(outcome, 0) for outcome in OUTCOMES)
+        total = broadcast.get('total') or 0
+        progress = {
+            'processed': processed,
+            'percent': round(processed / total * 100, 1) if total else 100.0,
+            'rate_per_sec': None,
+            'eta_seconds': None,
+        }
+        started = broadcast.get('started_at')
+        if started and broadcast.get('status') == 'running':
+            if started.tzinfo is None:
+                started = started.replace(tzinfo=timezone.utc)
+            elapsed = (datetime.now(timezone.utc) - started).total_seconds()
+            if elapsed > 0 and processed:
+                rate = processed / elapsed
+                progress['rate_per_sec'] = round(rate, 1)
+                progress['eta_seconds'] = int((total - processed) / rate)
+        result = {k: v for k, v in broadcast.items() if k not in ('_id', 'worker_id', 'lease_until')}
+        result['broadcast_id'] = broadcast['_id']
+        result['progress'] = progress
+        return result
+
+    # ==================== WORKER ====================
+
+    async def _worker(self) -> None:
+        while self._running:
+            try:
+                broadcast = await self._claim()
+                if broadcast is not None:
+                    await self._run(broadcast)
+                    continue
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                # The broadcast stays 'running' and is resumed when the lease expires
+                logger.error(f"❌ Broadcast worker error: {e}", exc_info=True)
+
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _claim(self) -> Optional[Dict[str, Any]]:
+        """Atomically lease the oldest queued broadcast (or one whose worker died)"""
+        now = datetime.now(timezone.utc)
+        broadcast = await self._db.broadcasts.find_one_and_update(
+            {'$or': [
+                {'status': 'queued'},
+                {'status': 'running', 'lease_until': {'$lt': now}},
+            ]},
+            {'$set': {'status': 'running', 'worker_id': self.worker_id, 'lease_until': now + self.lease}},
+            sort=[('created_at', 1)],
+            return_document=ReturnDocument.AFTER
+        )
+        if broadcast is None:
+            return None
+        if broadcast.get('started_at') is None:
+            self.started += 1
+            broadcast['started_at'] = now
+            await self._db.broadcasts.update_one({'_id': broadcast['_id']}, {'$set': {'started_at': now}})
+        else:
+            self.resumed += 1
+            logger.info(f"♻️ Broadcast {broadcast['_id']} resumed after telegram_id {broadcast.get('cursor')}")
+        return broadcast
+
+    async def _run(self, broadcast: Dict[str, Any]) -> None:
+        await self._prepare_media(broadcast)
+        recipients = segment_engine.stream(
+            self._db, broadcast.get('segment', broadcast['target']),
+            after=broadcast.get('cursor'), batch_size=self.batch_size
+        )
+        batch = []
+        async for telegram_id in recipients:
+            batch.append(telegram_id)
+            if len(batch) >= self.batch_size:
+                if not await self._deliver_batch(broadcast, batch):
+                    return
+                batch = []
+        if batch and not await self._deliver_batch(broadcast, batch):
+            return
+
+        finished = await self._db.broadcasts.find_one_and_update(
+            {'_id': broadcast['_id'], 'worker_id': self.worker_id, 'status': 'running'},
+            {'$set': {'status': 'done', 'finished_at': datetime.now(timezone.utc), 'lease_until': None}},
+            return_document=ReturnDocument.AFTER
+        )
+        if finished is not None:
+            self.completed += 1
+            logger.info(
+                f"✅ Broadcast {broadcast['_id']} done: sent {finished['sent']}, "
+                f"failed {finished['failed']}, blocked {finished['blocked']}"
+            )
+
+    async def _deliver_batch(self, broadcast: Dict[str, Any], batch: List[int]) -> bool:
+        """
+        Send to a batch and save progress
+
+        Returns:
+            bool: False if the broadcast was paused/cancelled or taken over
+        """
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def deliver(telegram_id: int) -> str:
+            async with semaphore:
+                return await self._deliver(broadcast, telegram_id)
+
+        outcomes = await asyncio.gather(*(deliver(telegram_id) for telegram_id in batch))
+        counts = {outcome: outcomes.count(outcome) for outcome in OUTCOMES if outcome in outcomes}
+        for outcome, count in counts.items():
+            self.outcomes[outcome] += count
+
+        update = {
+            '$max': {'cursor': batch[-1]},
+            '$set': {'lease_until': datetime.now(timezone.utc) + self.lease},
+        }
+        if counts:
+            update['$inc'] = counts
+        current = await self._db.broadcasts.find_one_and_update(
+            {'_id': broadcast['_id']}, update,
+            projection={'status': 1, 'worker_id': 1},
+            return_document=ReturnDocument.AFTER
+        )
+        if current is None or current['status'] != 'running' or current['worker_id'] != self.worker_id:
+            logger.info(f"⏸️ Broadcast {broadcast['_id']} stopped at telegram_id {batch[-1]}")
+            return False
+        return True
+
+    async def _deliver(self, broadcast: Dict[str, Any], telegram_id: int) -> str:
+        """Send to one recipient at most once; returns 'sent' | 'failed' | 'blocked'"""
+        delivery_id = f"{broadcast['_id']}:{telegram_id}"
+        try:
+            await self._db.broadcast_deliveries.insert_one({
+                '_id': delivery_id,
+                'broadcast_id': broadcast['_id'],
+                'telegram_id': telegram_id,
+                'status': 'pending',
+                'created_at': datetime.now(timezone.utc),
+            })
+        except DuplicateKeyError:
+            # Attempted before a crash: count it, never send twice
+            existing = await self._db.broadcast_deliveries.find_one({'_id': delivery_id}, {'status': 1})
+            status = existing.get('status') if existing else 'failed'
+            return status if status in OUTCOMES else 'failed'
+
+        error = None
+        try:
+            await self._send(broadcast, telegram_id)
+            status = 'sent'
+        except Exception as e:
+            error = str(e)
+            if is_recipient_gone(e):
+                status = 'blocked'
+                await self._db.users.update_one(
+                    {'telegram_id': telegram_id},
+                    {'$set': {'bot_blocked_by_user': True, 'bot_blocked_at': datetime.now(timezone.utc)}}
+                )
+                logger.warning(f"⚠️ Broadcast recipient {telegram_id} blocked the bot: {error}")
+            else:
+                status = 'failed'
+                logger.error(f"❌ Broadcast send to {telegram_id} failed: {error}")
+
+        await self._db.broadcast_deliveries.update_one(
+            {'_id': delivery_id},
+            {'$set': {'status': status, 'error': error, 'finished_at': datetime.now(timezone.utc)}}
+        )
+        return status
+
+    async def _prepare_media(self, broadcast: Dict[str, Any]) -> None:
+        """Upload an image URL to Telegram once; recipients then get the file_id"""
+        if broadcast.get('file_id') or not broadcast.get('image_url'):
+            return
+        from server import bot_instance
+        from services.media_registry import media_registry
+
+        asset = await media_registry.register_url(bot_instance, broadcast['image_url'])
+        if asset is None:
+            return   # fall back to sending the URL to every recipient
+        broadcast['file_id'] = asset['file_id']
+        await self._db.broadcasts.update_one({'_id': broadcast['_id']}, {'$set': {'file_id': asset['file_id']}})
+
+    async def _send(self, broadcast: Dict[str, Any], telegram_id: int) -> None:
+        from server import bot_instance
+        if not bot_instance:
+            raise RuntimeError("Bot not initialized")
+
+        message = broadcast['message']
+        with send_priority(SendPriority.BROADCAST):
+            if broadcast.get('file_id'):
+                await self._send_uploaded_photo(bot_instance, broadcast, telegram_id)
+            elif broadcast.get('image_url'):
+                await bot_instance.send_photo(chat_id=telegram_id, photo=broadcast['image_url'], caption=message)
+            else:
+                await bot_instance.send_message(chat_id=telegram_id, text=message)
+
+    async def _send_uploaded_photo(self, bot, broadcast: Dict[str, Any], telegram_id: int) -> None:
+        from services.telegram_delivery import telegram_delivery
+        from routers.upload import find_upload_path, replace_upload_file_id
+
+        file_id = broadcast['file_id']
+
+        async def load_image_source():
+            """Local copy (or URL) of the broadcast image, for re-upload"""
+            local_path = await find_upload_path(file_id)
+            if local_path is not None:
+                return open(local_path, 'rb')
+            if broadcast.get('image_url'):
+                return broadcast['image_url']
+            raise FileNotFoundError("Broadcast image is not available for re-upload")
+
+        _, sent_file_id = await telegram_delivery.send_photo(
+            bot, telegram_id, file_id=file_id, upload=load_image_source, caption=broadcast['message']
+        )
+        if sent_file_id and sent_file_id != file_id and broadcast['file_id'] == file_id:
+            # Telegram rejected the id - use the re-uploaded one for the rest (and after a resume)
+            broadcast['file_id'] = sent_file_id
+            await replace_upload_file_id(file_id, sent_file_id)
+            await self._db.broadcasts.update_one({'_id': broadcast['_id']}, {'$set': {'file_id': sent_file_id}})
+
+    # ==================== METRICS ====================
+
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        Получить статистику рассылок
+
+        Returns:
+            dict: запущено / возобновлено / завершено, исходы доставки
+        """
+        return {
+            'running': self._running,
+            'worker_id': self.worker_id,
+            'started': self.started,
+            'resumed': self.resumed,
+            'completed': self.completed,
+            **self.outcomes,
+        }
+
+
+# Глобальный инстанс (singleton)
+broadcast_engine = BroadcastEngine(**BotPerformanceConfig.get_broadcast_config())
@@ -0,0 +1,251 @@
+"""
+ShipStation Carrier Catalog
+Каталог перевозчиков в памяти с фоновым обновлением
+
+Carriers (ids, codes, services, packages) change maybe once a month, so
+they are loaded once at startup, refreshed in the background and served
+from memory. The last good snapshot is persisted to MongoDB so a cold
+worker can start quoting without a GET /v2/carriers round-trip.
+"""
+import asyncio
+import logging
+from datetime import datetime, timezone, timedelta
+from typing import Optional, Dict, Any, List
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_ID = 'shipstation'
+
+
+def _compact_carrier(carrier: Dict[str, Any]) -> Dict[str, Any]:
+    """Keep only the carrier fields the bot uses"""
+    return {
+        'carrier_id': carrier.get('carrier_id'),
+        'carrier_code': carrier.get('carrier_code'),
+        'name': carrier.get('name') or carrier.get('friendly_name'),
+        'friendly_name': carrier.get('friendly_name'),
+        'nickname': carrier.get('nickname'),
+        'services': [
+            {
+                'service_code': service.get('service_code'),
+                'name': service.get('name'),
+                'domestic': service.get('domestic'),
+                'international': service.get('international'),
+            }
+            for service in carrier.get('services') or []
+        ],
+        'packages': [
+            {
+                'package_code': package.get('package_code'),
+                'name': package.get('name'),
+            }
+            for package in carrier.get('packages') or []
+        ],
+    }
+
+
+class CarrierCatalog:
+    """
+    Каталог перевозчиков ShipStation
+    Обслуживает запросы из памяти, обновляется в фоне
+    """
+
+    def __init__(self, refresh_interval_minutes: int = 360):
+        """
+        Args:
+            refresh_interval_minutes: Интервал фонового обновления (по умолчанию 6 часов)
+        """
+        self.refresh_interval = timedelta(minutes=refresh_interval_minutes)
+        self._carriers: List[Dict[str, Any]] = []
+        self._by_id: Dict[str, Dict[str, Any]] = {}
+        self._by_code: Dict[str, List[Dict[str, Any]]] = {}
+        self.updated_at: Optional[datetime] = None
+        self.source: Optional[str] = None  # 'api' or 'snapshot'
+        self._db = None
+        self._refresh_task: Optional[asyncio.Task] = None
+        self._refresh_lock = asyncio.Lock()
+        self.refreshes = 0
+        self.refresh_failures = 0
+
+    # ==================== LOADING ====================
+
+    def _load(self, carriers: List[Dict[str, Any]], updated_at: datetime, source: str) -> None:
+        """Replace in-memory catalog and rebuild indexes"""
+        self._carriers = carriers
+        self._by_id = {c['carrier_id']: c for c in carriers if c.get('carrier_id')}
+        by_code: Dict[str, List[Dict[str, Any]]] = {}
+        for carrier in carriers:
+            code = (carrier.get('carrier_code') or '').lower()
+            if code:
+                by_code.setdefault(code, []).append(carrier)
+        self._by_code = by_code
+        self.updated_at = updated_at
+        self.source = source
+
+    async def load_snapshot(self) -> bool:
+        """Load last good snapshot from MongoDB"""
+        if self._db is None:
+            return False
+
+        try:
+            snapshot = await self._db.carrier_catalog.find_one({'_id': SNAPSHOT_ID})
+        except Exception as e:
+            logger.warning(f"⚠️ Could not load carrier snapshot: {e}")
+            return False
+
+        if not snapshot or not snapshot.get('carriers'):
+            return False
+
+        updated_at = snapshot.get('updated_at')
+        if isinstance(updated_at, str):
+            updated_at = datetime.fromisoformat(updated_at)
+        if updated_at and updated_at.tzinfo is None:
+            updated_at = updated_at.replace(tzinfo=timezone.utc)
+
+        self._load(snapshot['carriers'], updated_at or datetime.now(timezone.utc), 'snapshot')
+        logger.info(f"📦 Carrier catalog loaded from snapshot: {len(self._carriers)} carriers")
+        return True
+
+    async def _save_snapshot(self) -> None:
+        if self._db is None:
+            return
+
+        try:
+            await self._db.carrier_catalog.replace_one(
+                {'_id': SNAPSHOT_ID},
+                {
+                    '_id': SNAPSHOT_ID,
+                    'carriers': self._carriers,
+                    'updated_at': self.updated_at.isoformat(),
+                },
+                upsert=True
+            )
+        except Exception as e:
+            logger.warning(f"⚠️ Could not persist carrier snapshot: {e}")
+
+    async def refresh(self) -> bool:
+        """
+        Reload carriers from ShipStation
+
+        Keeps the current catalog if the API call fails.
+        Concurrent callers share one refresh.
+        """
+        if self._refresh_lock.locked():
+            async with self._refresh_lock:
+                return bool(self._carriers)
+
+        async with self._refresh_lock:
+            from services.api_services import fetch_shipstation_carriers
+
+            carriers_list = await fetch_shipstation_carriers()
+            if not carriers_list:
+                self.refresh_failures += 1
+                logger.warning("⚠️ Carrier catalog refresh failed, keeping previous catalog")
+                return False
+
+            carriers = [_compact_carrier(c) for c in carriers_list if c.get('carrier_id')]
+            self._load(carriers, datetime.now(timezone.utc), 'api')
+            self.refreshes += 1
+            await self._save_snapshot()
+            logger.info(f"✅ Carrier catalog refreshed: {len(carriers)} carriers")
+            return True
+
+    def is_stale(self) -> bool:
+        """True if catalog is empty or older than refresh interval"""
+        if not self._carriers or self.updated_at is None:
+            return True
+        return datetime.now(timezone.utc) - self.updated_at > self.refresh_interval
+
+    # ==================== LIFECYCLE ====================
+
+    async def start(self, db) -> None:
+        """
+        Load catalog at startup and schedule background refresh
+
+        Snapshot first (fast, no upstream call); the API is only hit
+        at startup if there is no snapshot or it is stale.
+        """
+        self._db = db
+        await self.load_snapshot()
+        if self.is_stale():
+            await self.refresh()
+
+        if self._refresh_task is None or self._refresh_task.done():
+            self._refresh_task = asyncio.create_task(self._refresh_loop())
+        logger.info(f"✅ Carrier catalog started (refresh every {self.refresh_interval})")
+
+    async def stop(self) -> None:
+        """Cancel background refresh (shutdown)"""
+        if self._refresh_task:
+            self._refresh_task.cancel()
+            try:
+                await self._refresh_task
+            except asyncio.CancelledError:
+                pass
+            self._refresh_task = None
+
+    async def _refresh_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.refresh_interval.total_seconds())
+            try:
+                await self.refresh()
+            except Exception as e:
+                self.refresh_failures += 1
+                logger.error(f"❌ Carrier catalog background refresh error: {e}")
+
+    # ==================== LOOKUPS ====================
+
+    async def get_carrier_ids(self) -> Dict[str, str]:
+        """
+        Get {carrier_name: carrier_id} mapping
+
+        Served from memory; only refreshes inline if the catalog
+        has never been loaded (e.g. startup refresh failed).
+        """
+        if not self._carriers:
+            await self.refresh()
+
+        return {
+            c['name']: c['carrier_id']
+            for c in self._carriers
+            if c.get('name') and c.get('carrier_id')
+        }
+
+    def get_carrier(self, carrier_id: str) -> Optional[Dict[str, Any]]:
+        """Get carrier by ShipStation carrier_id"""
+        return self._by_id.get(carrier_id)
+
+    def find_by_code(self, carrier_code: str) -> List[Dict[str, Any]]:
+        """Get carriers by carrier_code (e.g. 'ups', 'stamps_com')"""
+        return self._by_code.get((carrier_code or '').lower(), [])
+
+    def get_services(self, carrier_code: str) -> List[Dict[str, Any]]:
+        """Get all services offered under a carrier_code"""
+        services = []
+        for carrier in self.find_by_code(carrier_code):
+            services.extend(carrier.get('services', []))
+        return services
+
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        Получить статистику каталога
+
+        Returns:
+            dict: размер, источник, возраст, счетчики обновлений
+        """
+        age = None
+        if self.updated_at:
+            age = int((datetime.now(timezone.utc) - self.updated_at).total_seconds())
+
+        return {
+            'carriers': len(self._carriers),
+            'source': self.source,
+            'updated_at': self.updated_at.isoformat() if self.updated_at else None,
+            'age_seconds': age,
+            'refreshes': self.refreshes,
+            'refresh_failures': self.refresh_failures,
+        }
+
+
+# Глобальный инстанс каталога (singleton)
+carrier_catalog = CarrierCatalog(refresh_interval_minutes=360)
@@ -0,0 +1,215 @@
+"""
+Shared HTTP Client Registry
+One pooled httpx.AsyncClient per upstream API (ShipStation, Oxapay, ...)
+
+Clients are opened at FastAPI startup and closed on shutdown, so every
+rate quote and label purchase reuses a warm keep-alive connection instead
+of paying a fresh TCP+TLS handshake.
+
+Clients of guarded upstreams (CIRCUIT_BREAKER_CONFIG['upstreams']) send
+requests through CircuitBreakerTransport: while a circuit is open, calls
+fail immediately with CircuitOpenError instead of waiting for timeouts.
+"""
+import logging
+import re
+from typing import Dict, Any, Optional
+
+import httpx
+
+from config.performance_config import BotPerformanceConfig
+from utils.retry_utils import circuit_breakers
+
+logger = logging.getLogger(__name__)
+
+# Base URLs of known upstreams (None = absolute URLs only)
+UPSTREAM_BASE_URLS = {
+    'shipstation': 'https://api.shipstation.com',
+    'oxapay': 'https://api.oxapay.com',
+    'backend': None,
+    'default': None,
+}
+
+
+_VERSION_SEGMENT = re.compile(r'^v\d+$')
+
+
+def endpoint_key(path: str, depth: int = 3) -> str:
+    """
+    Endpoint identity for error budgets
+
+    Id-like segments collapse into ':id', so '/v2/labels/se-123/void'
+    and '/v2/labels/se-456/void' share the 'v2/labels/:id' budget.
+    """
+    segments = [segment for segment in path.split('/') if segment][:depth]
+    return '/'.join(
+        ':id' if any(ch.isdigit() for ch in segment) and not _VERSION_SEGMENT.match(segment) else segment
+        for segment in segments
+    ) or '/'
+
+
+def _is_upstream_failure(response: httpx.Response) -> bool:
+    """5xx and 429 spend the endpoint error budget; other 4xx are caller errors"""
+    return response.status_code >= 500 or response.status_code == 429
+
+
+class CircuitBreakerTransport(httpx.AsyncBaseTransport):
+    """
+    Transport wrapper that routes every request through circuit breakers
+
+    Transport errors trip both the upstream and the endpoint breaker;
+    5xx/429 responses only the endpoint breaker.
+    """
+
+    def __init__(self, upstream: str, transport: httpx.AsyncBaseTransport, registry=circuit_breakers):
+        self.upstream = upstream
+        self._transport = transport
+        self._registry = registry
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        host, route = self._registry.acquire(self.upstream, endpoint_key(request.url.path))
+        try:
+            response = await self._transport.handle_async_request(request)
+        except httpx.TransportError:
+            host.record_failure()
+            route.record_failure()
+            raise
+        except BaseException:
+            host.release()
+            route.release()
+            raise
+
+        host.record_success()
+        if _is_upstream_failure(response):
+            route.record_failure()
+        else:
+            route.record_success()
+        return response
+
+    async def aclose(self) -> None:
+        await self._transport.aclose()
+
+
+def _http2_available() -> bool:
+    """HTTP/2 in httpx needs the optional h2 package"""
+    try:
+        import h2  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+class HTTPClientRegistry:
+    """
+    Реестр HTTP клиентов: один пул соединений на каждый upstream
+
+    Usage:
+        client = http_clients.get('shipstation')
+        response = await client.get('/v2/carriers', headers=headers)
+    """
+
+    def __init__(self, config=BotPerformanceConfig):
+        self._config = config
+        self._clients: Dict[str, httpx.AsyncClient] = {}
+        self._requests: Dict[str, int] = {}
+        self.started = False
+
+    def _build_client(self, upstream: str) -> httpx.AsyncClient:
+        """Create pooled client for upstream using performance config"""
+        upstream_config = self._config.get_upstream_client_config(upstream)
+        http2 = upstream_config['http2'] and _http2_available()
+
+        kwargs: Dict[str, Any] = {
+            'timeout': httpx.Timeout(upstream_config['timeout'], connect=10.0),
+            'limits': upstream_config['limits'],
+            'http2': http2,
+            'event_hooks': {'request': [self._make_counter(upstream)]},
+        }
+        if upstream in self._config.get_circuit_breaker_config()['upstreams']:
+            # Pool settings belong to the transport once a transport is given
+            kwargs['transport'] = CircuitBreakerTransport(
+                upstream,
+                httpx.AsyncHTTPTransport(limits=kwargs.pop('limits'), http2=kwargs.pop('http2'))
+            )
+        base_url = UPSTREAM_BASE_URLS.get(upstream)
+        if base_url:
+            kwargs['base_url'] = base_url
+
+        logger.info(
+            f"🔌 HTTP client '{upstream}' opened "
+            f"(timeout={upstream_config['timeout']}s, http2={http2}, "
+            f"max_connections={upstream_config['limits'].max_connections}, "
+            f"circuit_breaker={'transport' in kwargs})"
+        )
+        return httpx.AsyncClient(**kwargs)
+
+    def _make_counter(self, upstream: str):
+        async def count_request(request: httpx.Request) -> None:
+            self._requests[upstream] = self._requests.get(upstream, 0) + 1
+        return count_request
+
+    async def start(self) -> None:
+        """Open clients for all known upstreams (FastAPI startup)"""
+        for upstream in UPSTREAM_BASE_URLS:
+            if upstream not in self._clients:
+                self._clients[upstream] = self._build_client(upstream)
+        self.started = True
+        logger.info(f"✅ HTTP client registry started: {list(self._clients)}")
+
+    def get(self, upstream: str = 'default') -> httpx.AsyncClient:
+        """
+        Get pooled client for upstream
+
+        Clients are created lazily if the registry was not started
+        (scripts, tests), so call sites never need to care.
+        """
+        client = self._clients.get(upstream)
+        if client is None or client.is_closed:
+            client = self._build_client(upstream)
+            self._clients[upstream] = client
+        return client
+
+    async def close(self) -> None:
+        """Close all clients (FastAPI shutdown)"""
+        for upstream, client in list(self._clients.items()):
+            try:
+                await client.aclose()
+            except Exception as e:
+                logger.warning(f"Error closing HTTP client '{upstream}': {e}")
+        self._clients.clear()
+        self.started = False
+        logger.info("🔌 HTTP client registry closed")
+
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        Получить статистику клиентов
+
+        Returns:
+            dict: открытые клиенты и число запросов по каждому upstream
+        """
+        return {
+            'started': self.started,
+            'clients': {
+                upstream: {
+                    'open': not client.is_closed,
+                    'requests': self._requests.get(upstream, 0),
+                }
+                for upstream, client in self._clients.items()
+            }
+        }
+
+
+# Глобальный реестр (singleton)
+http_clients = HTTPClientRegistry()
+
+
+def get_http_client(upstream: str = 'default') -> httpx.AsyncClient:
+    """Shortcut for http_clients.get(upstream)"""
+    return http_clients.get(upstream)
+
+
+def get_client_for_url(url: str, default: Optional[str] = 'default') -> httpx.AsyncClient:
+    """Pick the upstream client whose base URL matches an absolute URL"""
+    for upstream, base_url in UPSTREAM_BASE_URLS.items():
+        if base_url and url.startswith(base_url):
+            return http_clients.get(upstream)
+    return http_clients.get(default)
@@ -0,0 +1,554 @@
+"""
+Label Purchase Job Queue
+Фоновая очередь покупки этикеток (MongoDB label_jobs + пул воркеров)
+
+Payment handlers and the Oxapay webhook enqueue a job and return at once;
+the ShipStation purchase, PDF download, Telegram delivery and admin
+notification run in a worker. Jobs are durable:
+
+- one job per order: _id = order_id is the idempotency key, so a double
+  click or a repeated webhook does not buy a second label
+- before the first POST the job records the label's deterministic
+  external_shipment_id; a retry looks that shipment up in ShipStation and
+  delivers a label bought by a timed-out attempt instead of buying again
+- a worker holds a lease (lease_until) that it renews while running; a job
+  whose worker died is picked up again once the lease expires. If it died
+  on the last attempt, the saved label / ShipStation shipment is checked
+  first: a label bought before the crash is delivered, not refunded
+- failures are retried with exponential backoff; after max_attempts the
+  job is moved to status 'dead' (dead letter) for manual follow-up
+- while a ShipStation circuit breaker is open, jobs are deferred until it
+  lets calls through again, without spending an attempt
+
+Job status: queued → running → done | queued (retry) | dead
+"""
+import asyncio
+import logging
+import random
+import time
+import uuid
+from collections import deque
+from datetime import datetime, timezone, timedelta
+from typing import Optional, Dict, Any, Tuple
+
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+from config.performance_config import BotPerformanceConfig
+from services.telegram_send_scheduler import send_priority, SendPriority
+from utils.retry_utils import CircuitOpenError, circuit_breakers
+
+logger = logging.getLogger(__name__)
+
+JOB_STATUSES = ('queued', 'running', 'done', 'dead')
+
+
+def _percentile(values, pct: float) -> Optional[float]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return round(ordered[index], 1)
+
+
+class LabelJobQueue:
+    """
+    Очередь задач на покупку этикеток
+
+    Usage:
+        job, created = await label_job_queue.enqueue(order_id, telegram_id, source='balance')
+        await label_job_queue.start(db)   # FastAPI startup
+    """
+
+    def __init__(self,
+                 workers: int = 4,
+                 max_attempts: int = 3,
+                 lease_seconds: int = 120,
+                 backoff_base_seconds: float = 5.0,
+                 backoff_max_seconds: float = 300.0,
+                 poll_interval_seconds: float = 2.0):
+        """
+        Args:
+            workers: Число параллельных воркеров
+            max_attempts: Попыток до dead letter
+            lease_seconds: Срок аренды задачи воркером
+            backoff_base_seconds: Базовая задержка повтора
+            backoff_max_seconds: Максимальная задержка повтора
+            poll_interval_seconds: Интервал опроса очереди без уведомлений
+        """
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self.lease = timedelta(seconds=lease_seconds)
+        self.backoff_base = backoff_base_seconds
+        self.backoff_max = backoff_max_seconds
+        self.poll_interval = poll_interval_seconds
+        self._db = None
+        self._tasks = []
+        self._wakeup = asyncio.Event()
+        self._running = False
+        self.enqueued = 0
+        self.duplicates = 0
+        self.completed = 0
+        self.retried = 0
+        self.dead_lettered = 0
+        self.deferred = 0
+        self.lease_expired = 0
+        self._queue_latency_ms = deque(maxlen=500)   # enqueue → first start
+        self._total_latency_ms = deque(maxlen=500)   # enqueue → done
+        self._run_ms = deque(maxlen=500)             # one attempt
+
+    # ==================== LIFECYCLE ====================
+
+    async def start(self, db) -> None:
+        """Create indexes and start worker pool (FastAPI startup)"""
+        self._db = db
+        try:
+            await db.label_jobs.create_index([("status", 1), ("run_at", 1)])
+            await db.label_jobs.create_index([("status", 1), ("lease_until", 1)])
+        except Exception as e:
+            logger.warning(f"⚠️ label_jobs index creation skipped: {e}")
+
+        self._running = True
+        for n in range(self.workers):
+            worker_id = f"{uuid.uuid4().hex[:8]}-{n}"
+            self._tasks.append(asyncio.create_task(self._worker(worker_id)))
+        logger.info(f"✅ Label job queue started: {self.workers} workers")
+
+    async def stop(self) -> None:
+        """Stop workers; running jobs are picked up again after their lease expires"""
+        self._running = False
+        for task in self._tasks:
+            task.cancel()
+        for task in self._tasks:
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        self._tasks = []
+
+    # ==================== PRODUCER ====================
+
+    async def enqueue(
+        self,
+        order_id: str,
+        telegram_id: int,
+        source: str = 'api',
+        payload: Optional[Dict[str, Any]] = None,
+        progress_message=None
+    ) -> Tuple[Dict[str, Any], bool]:
+        """
+        Enqueue label purchase for order (idempotent by order_id)
+
+        Args:
+            order_id: Order ID (idempotency key)
+            telegram_id: Order owner
+            source: 'balance' | 'crypto' | 'api' - selects completion handling
+            payload: Extra data for completion (e.g. amount to charge)
+            progress_message: Telegram message updated with job progress
+
+        Returns:
+            (job, created) - created is False if the order already has a job
+        """
+        from server import db
+
+        now = datetime.now(timezone.utc)
+        job = {
+            '_id': order_id,
+            'order_id': order_id,
+            'telegram_id': telegram_id,
+            'source': source,
+            'payload': payload or {},
+            'status': 'queued',
+            'attempts': 0,
+            'max_attempts': self.max_attempts,
+            'run_at': now,
+            'lease_until': None,
+            'worker_id': None,
+            'last_error': None,
+            'created_at': now,
+        }
+        if progress_message is not None:
+            job['progress_chat_id'] = progress_message.chat_id
+            job['progress_message_id'] = progress_message.message_id
+
+        try:
+            await db.label_jobs.insert_one(job)
+        except DuplicateKeyError:
+            # A dead-lettered job may be started over (user pays again)
+            fields = {k: v for k, v in job.items() if k != '_id'}
+            revived = await db.label_jobs.find_one_and_update(
+                {'_id': order_id, 'status': 'dead'},
+                {'$set': fields},
+                return_document=ReturnDocument.AFTER
+            )
+            if revived is None:
+                self.duplicates += 1
+                existing = await db.label_jobs.find_one({'_id': order_id})
+                logger.info(f"🔁 Label job for order {order_id} already exists ({existing.get('status') if existing else '?'})")
+                return existing or job, False
+            job = revived
+
+        self.enqueued += 1
+        self._wakeup.set()
+        logger.info(f"📥 Label job enqueued: order {order_id} (source={source})")
+        return job, True
+
+    async def get_job(self, order_id: str) -> Optional[Dict[str, Any]]:
+        from server import db
+        return await db.label_jobs.find_one({'_id': order_id})
+
+    # ==================== WORKER ====================
+
+    async def _worker(self, worker_id: str) -> None:
+        while self._running:
+            try:
+                job = await self._claim(worker_id)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"❌ Label queue claim error: {e}")
+                job = None
+
+            if job is None:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            # Label delivery goes ahead of admin notifications and broadcasts
+            with send_priority(SendPriority.LABEL):
+                await self._run_job(job, worker_id)
+
+    async def _claim(self, worker_id: str) -> Optional[Dict[str, Any]]:
+        """Atomically lease the next due job (or one whose lease expired)"""
+        now = datetime.now(timezone.utc)
+        return await self._db.label_jobs.find_one_and_update(
+            {'$or': [
+                {'status': 'queued', 'run_at': {'$lte': now}},
+                {'status': 'running', 'lease_until': {'$lt': now}},
+            ]},
+            {
+                '$set': {
+                    'status': 'running',
+                    'worker_id': worker_id,
+                    'lease_until': now + self.lease,
+                    'started_at': now,
+                },
+                '$inc': {'attempts': 1},
+            },
+            sort=[('run_at', 1)],
+            return_document=ReturnDocument.AFTER
+        )
+
+    async def _run_job(self, job: Dict[str, Any], worker_id: str) -> None:
+        order_id = job['order_id']
+        attempt = job['attempts']
+        max_attempts = job.get('max_attempts', self.max_attempts)
+
+        if attempt == 1 and not job.get('deferrals'):
+            self._queue_latency_ms.append(self._ms_since(job['created_at']))
+
+        if attempt > max_attempts:
+            # Worker died mid-job on the last attempt - possibly after the
+            # label was bought, so look for it before failing (and refunding)
+            self.lease_expired += 1
+            try:
+                recovered = await self._recover_label(job)
+            except Exception as e:
+                # ShipStation can't tell us whether it was bought: ask again later
+                logger.error(f"❌ Label lookup for expired job {order_id} failed: {e}")
+                await self._schedule_retry(job, worker_id, f"Label lookup failed: {e}")
+                return
+            if recovered:
+                await self._complete(job, worker_id)
+            else:
+                await self._dead_letter(job, worker_id, "Lease expired on last attempt")
+            return
+
+        wait = self.circuit_wait(job)
+        if wait:
+            await self._defer(job, worker_id, wait)
+            return
+
+        heartbeat = asyncio.create_task(self._renew_lease(order_id, worker_id))
+        start = time.perf_counter()
+        error = None
+        try:
+            success = await self._execute(job, last_attempt=attempt >= max_attempts)
+        except CircuitOpenError as e:
+            # Circuit opened while this job was starting - nothing was bought
+            await self._defer(job, worker_id, e.retry_after)
+            return
+        except Exception as e:
+            success, error = False, str(e)
+            logger.error(f"❌ Label job {order_id} attempt {attempt} raised: {e}", exc_info=True)
+        finally:
+            heartbeat.cancel()
+        self._run_ms.append((time.perf_counter() - start) * 1000)
+
+        if success:
+            await self._complete(job, worker_id)
+        elif attempt >= max_attempts:
+            await self._dead_letter(job, worker_id, error or "Label creation failed")
+        else:
+            await self._schedule_retry(job, worker_id, error or "Label creation failed")
+
+    async def _execute(self, job: Dict[str, Any], last_attempt: bool) -> bool:
+        """Buy and deliver the label; True on success"""
+        if job.get('source') == 'batch':
+            # Batch purchase is resumable and idempotent by itself
+            from services.batch_orders import batch_order_service
+            return await batch_order_service.purchase(job['order_id'])
+
+        from server import create_and_send_label
+
+        # A previous attempt may have bought the label and failed afterwards
+        existing = await self._db.shipping_labels.find_one({'order_id': job['order_id']}, {'_id': 1})
+        if existing:
+            logger.info(f"♻️ Label for order {job['order_id']} already exists, not buying again")
+            return True
+
+        # ...or its POST timed out after ShipStation bought the label: the
+        # marker is saved before the POST, so a retry asks ShipStation first
+        shipment_id = purchased = None
+        external_shipment_id = job.get('external_shipment_id')
+        if external_shipment_id:
+            shipment_id, purchased = await self._find_purchased(external_shipment_id)
+        else:
+            from services.shipping_service import label_external_shipment_id
+            external_shipment_id = label_external_shipment_id(job['order_id'])
+            await self._db.label_jobs.update_one(
+                {'_id': job['_id']},
+                {'$set': {'external_shipment_id': external_shipment_id}}
+            )
+
+        return await create_and_send_label(
+            job['order_id'], job['telegram_id'], None, notify_on_failure=last_attempt,
+            external_shipment_id=external_shipment_id, shipment_id=shipment_id, purchased_label=purchased
+        )
+
+    async def _recover_label(self, job: Dict[str, Any]) -> bool:
+        """Deliver a label bought by a worker that died; False if none was bought"""
+        if job.get('source') == 'batch':
+            # mark_failed only refunds a batch without saved labels
+            return False
+
+        existing = await self._db.shipping_labels.find_one({'order_id': job['order_id']}, {'_id': 1})
+        if existing:
+            logger.info(f"♻️ Expired job {job['order_id']} already has a label")
+            return True
+
+        # No marker means the POST was never sent (it is saved before buying)
+        external_shipment_id = job.get('external_shipment_id')
+        if not external_shipment_id:
+            return False
+        shipment_id, purchased = await self._find_purchased(external_shipment_id)
+        if purchased is None:
+            return False
+
+        from server import create_and_send_label
+        logger.info(f"♻️ Expired job {job['order_id']}: delivering label bought before the worker died")
+        return await create_and_send_label(
+            job['order_id'], job['telegram_id'], None, notify_on_failure=True,
+            external_shipment_id=external_shipment_id, shipment_id=shipment_id, purchased_label=purchased
+        )
+
+    @staticmethod
+    async def _find_purchased(external_shipment_id: str):
+        """(shipment_id, label) from ShipStation for our external_shipment_id"""
+        from server import SHIPSTATION_API_KEY
+        from services.shipping_service import find_purchased_label
+        return await find_purchased_label(external_shipment_id, SHIPSTATION_API_KEY)
+
+    async def _renew_lease(self, order_id: str, worker_id: str) -> None:
+        interval = self.lease.total_seconds() / 3
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self._db.label_jobs.update_one(
+                    {'_id': order_id, 'worker_id': worker_id, 'status': 'running'},
+                    {'$set': {'lease_until': datetime.now(timezone.utc) + self.lease}}
+                )
+            except Exception as e:
+                logger.warning(f"⚠️ Label job lease renewal failed: {e}")
+
+    # ==================== TRANSITIONS ====================
+
+    def backoff_delay(self, attempt: int) -> float:
+        """Exponential backoff with jitter for retry after attempt N"""
+        delay = min(self.backoff_max, self.backoff_base * (2 ** (attempt - 1)))
+        return delay * random.uniform(0.5, 1.0)
+
+    @staticmethod
+    def circuit_wait(job: Dict[str, Any]) -> float:
+        """Seconds until ShipStation circuits for this job let calls through (0 = go)"""
+        endpoint = 'v2/batches' if job.get('source') == 'batch' else 'v2/labels'
+        return max(
+            circuit_breakers.upstream('shipstation').retry_after(),
+            circuit_breakers.endpoint('shipstation', endpoint).retry_after()
+        )
+
+    async def _defer(self, job: Dict[str, Any], worker_id: str, delay: float) -> None:
+        """Requeue without spending an attempt while ShipStation fast-fails"""
+        await self._db.label_jobs.update_one(
+            {'_id': job['_id'], 'worker_id': worker_id},
+            {
+                '$set': {
+                    'status': 'queued',
+                    'run_at': datetime.now(timezone.utc) + timedelta(seconds=delay),
+                    'lease_until': None,
+                    'worker_id': None,
+                    'last_error': 'ShipStation circuit open',
+                },
+                '$inc': {'attempts': -1, 'deferrals': 1},
+            }
+        )
+        self.deferred += 1
+        await self._show_progress(
+            job,
+            f"⏳ ShipStation временно недоступен. Этикетка будет создана автоматически "
+            f"(повтор через {int(delay)} сек)."
+        )
+        logger.warning(f"⏸️ Label job {job['order_id']} deferred {delay:.0f}s: ShipStation circuit open")
+
+    async def _complete(self, job: Dict[str, Any], worker_id: str) -> None:
+        now = datetime.now(timezone.utc)
+        await self._db.label_jobs.update_one(
+            {'_id': job['_id'], 'worker_id': worker_id},
+            {'$set': {'status': 'done', 'finished_at': now, 'lease_until': None, 'last_error': None}}
+        )
+        self.completed += 1
+        self._total_latency_ms.append(self._ms_since(job['created_at']))
+        await self._clear_progress(job)
+
+        if job.get('source') == 'balance':
+            from handlers.order_flow.payment import complete_balance_label_job
+            await complete_balance_label_job(job)
+
+        logger.info(f"✅ Label job done: order {job['order_id']} (attempt {job['attempts']})")
+
+    async def _schedule_retry(self, job: Dict[str, Any], worker_id: str, error: str) -> None:
+        delay = self.backoff_delay(job['attempts'])
+        await self._db.label_jobs.update_one(
+            {'_id': job['_id'], 'worker_id': worker_id},
+            {'$set': {
+                'status': 'queued',
+                'run_at': datetime.now(timezone.utc) + timedelta(seconds=delay),
+                'lease_until': None,
+                'worker_id': None,
+                'last_error': error,
+            }}
+        )
+        self.retried += 1
+        await self._show_progress(
+            job,
+            f"⏳ Создаем shipping label... ShipStation не ответил, повтор через {int(delay)} сек "
+            f"(попытка {job['attempts'] + 1}/{job.get('max_attempts', self.max_attempts)})"
+        )
+        logger.warning(f"🔁 Label job {job['order_id']} retry in {delay:.0f}s: {error}")
+
+    async def _dead_letter(self, job: Dict[str, Any], worker_id: str, error: str) -> None:
+        await self._db.label_jobs.update_one(
+            {'_id': job['_id'], 'worker_id': worker_id},
+            {'$set': {
+                'status': 'dead',
+                'finished_at': datetime.now(timezone.utc),
+                'lease_until': None,
+                'last_error': error,
+            }}
+        )
+        self.dead_lettered += 1
+        await self._clear_progress(job)
+
+        try:
+            if job.get('source') == 'balance':
+                from handlers.order_flow.payment import fail_balance_label_job
+                await fail_balance_label_job(job)
+            elif job.get('source') == 'batch':
+                from services.batch_orders import batch_order_service
+                await batch_order_service.mark_failed(job['order_id'])
+            else:
+                await self._db.orders.update_one(
+                    {'$or': [{'order_id': job['order_id']}, {'id': job['order_id']}]},
+                    {'$set': {'shipping_status': 'failed'}}
+                )
+        except Exception as e:
+            logger.error(f"❌ Label job dead-letter handling failed: {e}")
+
+        logger.error(f"☠️ Label job dead-lettered: order {job['order_id']} after {job['attempts']} attempts: {error}")
+
+    # ==================== PROGRESS ====================
+
+    async def _show_progress(self, job: Dict[str, Any], text: str) -> None:
+        if not job.get('progress_message_id'):
+            return
+        from server import bot_instance, safe_telegram_call
+        if bot_instance:
+            await safe_telegram_call(bot_instance.edit_message_text(
+                chat_id=job['progress_chat_id'],
+                message_id=job['progress_message_id'],
+                text=text
+            ))
+
+    async def _clear_progress(self, job: Dict[str, Any]) -> None:
+        if not job.get('progress_message_id'):
+            return
+        from server import bot_instance, safe_telegram_call
+        if bot_instance:
+            await safe_telegram_call(bot_instance.delete_message(
+                chat_id=job['progress_chat_id'],
+                message_id=job['progress_message_id']
+            ))
+
+    # ==================== METRICS ====================
+
+    @staticmethod
+    def _ms_since(created_at: datetime) -> float:
+        if created_at.tzinfo is None:
+            created_at = created_at.replace(tzinfo=timezone.utc)
+        return (datetime.now(timezone.utc) - created_at).total_seconds() * 1000
+
+    async def get_depth(self) -> Dict[str, int]:
+        """Number of jobs per status (queued = queue depth)"""
+        if self._db is None:
+            return {}
+        depth = {status: 0 for status in JOB_STATUSES}
+        async for row in self._db.label_jobs.aggregate([{'$group': {'_id': '$status', 'count': {'$sum': 1}}}]):
+            depth[row['_id']] = row['count']
+        return depth
+
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        Получить статистику очереди
+
+        Returns:
+            dict: счетчики задач и латентность (p50/p95, мс)
+        """
+        return {
+            'workers': len(self._tasks),
+            'enqueued': self.enqueued,
+            'duplicates': self.duplicates,
+            'completed': self.completed,
+            'retried': self.retried,
+            'dead_lettered': self.dead_lettered,
+            'deferred': self.deferred,
+            'lease_expired': self.lease_expired,
+            'queue_wait_ms': {
+                'p50': _percentile(self._queue_latency_ms, 50),
+                'p95': _percentile(self._queue_latency_ms, 95),
+            },
+            'attempt_ms': {
+                'p50': _percentile(self._run_ms, 50),
+                'p95': _percentile(self._run_ms, 95),
+            },
+            'end_to_end_ms': {
+                'p50': _percentile(self._total_latency_ms, 50),
+                'p95': _percentile(self._total_latency_ms, 95),
+            },
+        }
+
+
+# Глобальный инстанс (singleton)
+label_job_queue = LabelJobQueue(**BotPerformanceConfig.get_label_queue_config())
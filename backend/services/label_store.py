@@ -0,0 +1,290 @@
+"""
+Label PDF Blob Store
+Локальное content-addressed хранилище PDF этикеток
+
+Each label PDF is streamed to disk once, at purchase time, under
+<root>/<sha[:2]>/<sha>.pdf. Identical content is stored once. The hash,
+size and store time are kept on the shipping_labels document, so later
+downloads (admin panel, re-sends to the user) are served from disk with
+a strong ETag and Range support instead of going back to ShipStation.
+A retention policy drops blobs of labels older than N days.
+"""
+import asyncio
+import hashlib
+import logging
+import os
+import re
+import uuid
+from datetime import datetime, timezone, timedelta
+from typing import Optional, Dict, Any, Tuple, NamedTuple
+
+import httpx
+
+from config.performance_config import BotPerformanceConfig
+from services.http_clients import get_client_for_url
+
+logger = logging.getLogger(__name__)
+
+_RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+class LabelBlob(NamedTuple):
+    sha256: str
+    path: str
+    size: int
+
+
+def parse_range(range_header: Optional[str], size: int) -> Optional[Tuple[int, int]]:
+    """
+    Parse a single-range 'Range: bytes=...' header
+
+    Returns:
+        (start, end) inclusive, None for no/unsupported range
+
+    Raises:
+        ValueError: range not satisfiable
+    """
+    if not range_header:
+        return None
+    match = _RANGE_RE.match(range_header.strip())
+    if not match:
+        return None
+
+    start_str, end_str = match.groups()
+    if not start_str and not end_str:
+        return None
+    if not start_str:
+        # Suffix range: last N bytes
+        length = int(end_str)
+        if length == 0:
+            raise ValueError("Range not satisfiable")
+        return max(size - length, 0), size - 1
+
+    start = int(start_str)
+    end = int(end_str) if end_str else size - 1
+    if start >= size or end < start:
+        raise ValueError("Range not satisfiable")
+    return start, min(end, size - 1)
+
+
+class LabelStore:
+    """
+    Хранилище PDF этикеток на диске
+
+    Usage:
+        success, blob, error = await label_store.store_from_url(url)
+        await label_store.attach_to_label(db, label_id, blob)
+        path = label_store.path_for(label['pdf_sha256'])
+    """
+
+    def __init__(self, root_dir: str, retention_days: int = 90, gc_interval_hours: int = 24):
+        """
+        Args:
+            root_dir: Каталог хранилища
+            retention_days: Сколько дней хранить PDF (0 = бессрочно)
+            gc_interval_hours: Интервал фоновой очистки
+        """
+        self.root_dir = root_dir
+        self.retention_days = retention_days
+        self.gc_interval = timedelta(hours=gc_interval_hours)
+        self._gc_task: Optional[asyncio.Task] = None
+        self.stored = 0
+        self.deduplicated = 0
+        self.bytes_written = 0
+        self.download_failures = 0
+        self.served = 0
+        self.gc_runs = 0
+        self.gc_deleted = 0
+
+    # ==================== PATHS ====================
+
+    def path_for(self, sha256: str) -> str:
+        """Blob path for content hash"""
+        return os.path.join(self.root_dir, sha256[:2], f"{sha256}.pdf")
+
+    def exists(self, sha256: Optional[str]) -> bool:
+        return bool(sha256) and os.path.isfile(self.path_for(sha256))
+
+    def get_blob(self, label: Dict[str, Any]) -> Optional[LabelBlob]:
+        """Stored blob for a shipping_labels document, if still on disk"""
+        sha256 = label.get('pdf_sha256')
+        if not self.exists(sha256):
+            return None
+        path = self.path_for(sha256)
+        return LabelBlob(sha256, path, os.path.getsize(path))
+
+    # ==================== STORE ====================
+
+    async def store_from_url(
+        self,
+        label_url: str,
+        headers: Optional[Dict[str, str]] = None,
+        timeout: float = 30.0
+    ) -> Tuple[bool, Optional[LabelBlob], Optional[str]]:
+        """
+        Stream label PDF from URL to disk, hashing on the fly
+
+        Returns:
+            (success, blob, error_message)
+        """
+        tmp_dir = os.path.join(self.root_dir, 'tmp')
+        os.makedirs(tmp_dir, exist_ok=True)
+        tmp_path = os.path.join(tmp_dir, f"{uuid.uuid4().hex}.part")
+        digest = hashlib.sha256()
+        size = 0
+
+        try:
+            client = get_client_for_url(label_url)
+            async with client.stream('GET', label_url, headers=headers, timeout=timeout) as response:
+                if response.status_code != 200:
+                    self.download_failures += 1
+                    return False, None, f"Failed to download label: HTTP {response.status_code}"
+
+                with open(tmp_path, 'wb') as f:
+                    async for chunk in response.aiter_bytes():
+                        digest.update(chunk)
+                        f.write(chunk)
+                        size += len(chunk)
+        except httpx.TimeoutException:
+            self.download_failures += 1
+            self._remove(tmp_path)
+            return False, None, "Timeout downloading label"
+        except Exception as e:
+            self.download_failures += 1
+            self._remove(tmp_path)
+            return False, None, f"Error downloading label: {str(e)}"
+
+        if size == 0:
+            self.download_failures += 1
+            self._remove(tmp_path)
+            return False, None, "Empty label PDF"
+
+        sha256 = digest.hexdigest()
+        path = self.path_for(sha256)
+        if os.path.exists(path):
+            self._remove(tmp_path)
+            self.deduplicated += 1
+        else:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            os.replace(tmp_path, path)
+            self.stored += 1
+            self.bytes_written += size
+
+        logger.info(f"💾 Label PDF stored: {sha256[:12]} ({size} bytes)")
+        return True, LabelBlob(sha256, path, size), None
+
+    async def attach_to_label(self, db, label_id: str, blob: LabelBlob) -> None:
+        """Record blob metadata on the shipping_labels document"""
+        await db.shipping_labels.update_one(
+            {"label_id": label_id},
+            {"$set": {
+                "pdf_sha256": blob.sha256,
+                "pdf_size": blob.size,
+                "pdf_stored_at": datetime.now(timezone.utc).isoformat()
+            }}
+        )
+
+    def read_bytes(self, blob: LabelBlob) -> bytes:
+        with open(blob.path, 'rb') as f:
+            return f.read()
+
+    # ==================== GC ====================
+
+    async def gc(self, db) -> Dict[str, int]:
+        """
+        Delete blobs whose labels are all past the retention period
+
+        Also removes stale partial downloads. Labels keep their label_url,
+        so an expired PDF can still be re-fetched from ShipStation.
+        """
+        self.gc_runs += 1
+        result = {'deleted': 0, 'labels_expired': 0, 'tmp_removed': 0}
+
+        tmp_dir = os.path.join(self.root_dir, 'tmp')
+        if os.path.isdir(tmp_dir):
+            stale_before = datetime.now(timezone.utc).timestamp() - 3600
+            for name in os.listdir(tmp_dir):
+                tmp_path = os.path.join(tmp_dir, name)
+                if os.path.getmtime(tmp_path) < stale_before:
+                    self._remove(tmp_path)
+                    result['tmp_removed'] += 1
+
+        if self.retention_days <= 0:
+            return result
+
+        cutoff = (datetime.now(timezone.utc) - timedelta(days=self.retention_days)).isoformat()
+        expired_query = {"pdf_sha256": {"$exists": True}, "pdf_stored_at": {"$lt": cutoff}}
+        expired = await db.shipping_labels.find(expired_query, {"_id": 0, "pdf_sha256": 1}).to_list(None)
+
+        for sha256 in {label['pdf_sha256'] for label in expired}:
+            still_used = await db.shipping_labels.find_one(
+                {"pdf_sha256": sha256, "pdf_stored_at": {"$gte": cutoff}},
+                {"_id": 1}
+            )
+            if not still_used and self._remove(self.path_for(sha256)):
+                result['deleted'] += 1
+
+        if expired:
+            update = await db.shipping_labels.update_many(
+                expired_query,
+                {"$unset": {"pdf_sha256": "", "pdf_size": "", "pdf_stored_at": ""}}
+            )
+            result['labels_expired'] = update.modified_count
+
+        self.gc_deleted += result['deleted']
+        logger.info(f"🧹 Label store GC: {result}")
+        return result
+
+    async def start(self, db) -> None:
+        """Schedule background GC (FastAPI startup)"""
+        os.makedirs(self.root_dir, exist_ok=True)
+        if self._gc_task is None or self._gc_task.done():
+            self._gc_task = asyncio.create_task(self._gc_loop(db))
+        logger.info(f"✅ Label store started: {self.root_dir} (retention {self.retention_days} days)")
+
+    async def stop(self) -> None:
+        if self._gc_task:
+            self._gc_task.cancel()
+            try:
+                await self._gc_task
+            except asyncio.CancelledError:
+                pass
+            self._gc_task = None
+
+    async def _gc_loop(self, db) -> None:
+        while True:
+            await asyncio.sleep(self.gc_interval.total_seconds())
+            try:
+                await self.gc(db)
+            except Exception as e:
+                logger.error(f"❌ Label store GC error: {e}")
+
+    def _remove(self, path: str) -> bool:
+        try:
+            os.remove(path)
+            return True
+        except FileNotFoundError:
+            return False
+
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        Получить статистику хранилища
+
+        Returns:
+            dict: сохранено, дедуплицировано, отдано, результаты GC
+        """
+        return {
+            'root_dir': self.root_dir,
+            'retention_days': self.retention_days,
+            'stored': self.stored,
+            'deduplicated': self.deduplicated,
+            'bytes_written': self.bytes_written,
+            'download_failures': self.download_failures,
+            'served': self.served,
+            'gc_runs': self.gc_runs,
+            'gc_deleted': self.gc_deleted,
+        }
+
+
+# Глобальный инстанс (singleton)
+label_store = LabelStore(**BotPerformanceConfig.get_label_store_config())
@@ -0,0 +1,207 @@
+"""
+Media Registry
+Загрузка медиа рассылок в Telegram один раз (uploaded_images)
+
+Every broadcast image - uploaded in the admin panel or given as a URL - is
+uploaded to Telegram once (to the admin chat) and recorded in
+uploaded_images with its file_id, SHA-256 of the content, dimensions and
+local copy. Broadcasts then send the file_id to every recipient: no
+per-recipient URL fetch by Telegram, no repeated uploads.
+
+The content hash is the key: the same picture uploaded again, or served
+from another URL, resolves to the existing file_id without a new upload.
+The local copy lets telegram_delivery re-upload if Telegram ever rejects
+the id (routers.upload.find_upload_path).
+"""
+import hashlib
+import io
+import logging
+import mimetypes
+import os
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+import aiofiles
+
+logger = logging.getLogger(__name__)
+
+# Same limit as the admin upload endpoint
+MAX_MEDIA_SIZE = 10 * 1024 * 1024
+
+UPLOAD_CAPTION = "📸 Файл загружен для рассылки (можно удалить)"
+
+
+def content_hash(content: bytes) -> str:
+    return hashlib.sha256(content).hexdigest()
+
+
+class MediaRegistry:
+    """
+    Реестр медиа: content hash → Telegram file_id
+
+    Usage:
+        asset = await media_registry.register_url(bot, image_url)
+        if asset:
+            await bot.send_photo(chat_id, photo=asset['file_id'])
+    """
+
+    def __init__(self, max_size: int = MAX_MEDIA_SIZE):
+        """
+        Args:
+            max_size: Максимальный размер изображения (байт)
+        """
+        self.max_size = max_size
+        self.upload_dir: Optional[Path] = None   # None = routers.upload.UPLOAD_DIR
+        self._db = None
+        self.hits = 0
+        self.uploads = 0
+        self.failures = 0
+
+    async def attach_db(self, db) -> None:
+        """Подключить MongoDB (uploaded_images) и создать индекс по хэшу"""
+        self._db = db
+        try:
+            await db.uploaded_images.create_index(
+                "content_hash", unique=True,
+                partialFilterExpression={"content_hash": {"$exists": True}}
+            )
+        except Exception as e:
+            logger.warning(f"⚠️ uploaded_images content_hash index creation skipped: {e}")
+
+    def _get_db(self):
+        if self._db is None:
+            from server import db
+            self._db = db
+        return self._db
+
+    def _get_upload_dir(self) -> Path:
+        if self.upload_dir is None:
+            from routers.upload import UPLOAD_DIR
+            self.upload_dir = UPLOAD_DIR
+        return self.upload_dir
+
+    # ==================== REGISTRATION ====================
+
+    async def register_bytes(
+        self,
+        bot,
+        content: bytes,
+        filename: Optional[str] = None,
+        source_url: Optional[str] = None,
+        extension: str = '.jpg'
+    ) -> Optional[Dict[str, Any]]:
+        """
+        file_id for image content, uploading to Telegram only if the content is new
+
+        Args:
+            bot: Telegram bot instance
+            content: Image bytes
+            filename: Local copy already saved in the upload dir (else one is written)
+            source_url: URL the content came from
+            extension: Extension for a written local copy
+
+        Returns:
+            Registry record (file_id, content_hash, width, height, ...),
+            or None if the image could not be uploaded
+        """
+        db = self._get_db()
+        digest = content_hash(content)
+
+        existing = await db.uploaded_images.find_one(
+            {"content_hash": digest, "file_id": {"$ne": None}}, {"_id": 0}
+        )
+        if existing:
+            self.hits += 1
+            await db.uploaded_images.update_one(
+                {"content_hash": digest},
+                {"$set": {"last_used_at": datetime.now(timezone.utc).isoformat()}, "$inc": {"uses": 1}}
+            )
+            logger.info(f"♻️ Media {digest[:12]} already in Telegram, reusing file_id")
+            return existing
+
+        admin_telegram_id = os.getenv('ADMIN_TELEGRAM_ID')
+        if not admin_telegram_id:
+            logger.warning("ADMIN_TELEGRAM_ID not set, cannot get file_id")
+            return None
+
+        from services.telegram_delivery import telegram_delivery
+        try:
+            message, file_id = await telegram_delivery.send_photo(
+                bot, int(admin_telegram_id), upload=lambda: io.BytesIO(content), caption=UPLOAD_CAPTION
+            )
+        except Exception as e:
+            self.failures += 1
+            logger.warning(f"Could not upload media to Telegram: {e}")
+            return None
+        if not file_id:
+            self.failures += 1
+            return None
+
+        if filename is None:
+            filename = f"{digest[:32]}{extension}"
+            async with aiofiles.open(self._get_upload_dir() / filename, 'wb') as f:
+                await f.write(content)
+
+        largest = message.photo[-1]
+        now = datetime.now(timezone.utc).isoformat()
+        asset = {
+            "file_id": file_id,
+            "content_hash": digest,
+            "filename": filename,
+            "size": len(content),
+            "width": getattr(largest, 'width', None),
+            "height": getattr(largest, 'height', None),
+            "source_url": source_url,
+            "uploaded_at": now,
+            "last_used_at": now,
+        }
+        await db.uploaded_images.update_one(
+            {"content_hash": digest}, {"$set": asset, "$inc": {"uses": 1}}, upsert=True
+        )
+        self.uploads += 1
+        logger.info(f"✅ Media {digest[:12]} uploaded once: {asset['width']}x{asset['height']}, file_id cached")
+        return asset
+
+    async def register_url(self, bot, url: str) -> Optional[Dict[str, Any]]:
+        """Download an image URL and register it (see register_bytes)"""
+        try:
+            content, content_type = await self._download(url)
+        except Exception as e:
+            self.failures += 1
+            logger.warning(f"Could not download broadcast image {url}: {e}")
+            return None
+
+        extension = mimetypes.guess_extension(content_type or '') or Path(url.split('?')[0]).suffix or '.jpg'
+        return await self.register_bytes(bot, content, source_url=url, extension=extension)
+
+    async def _download(self, url: str):
+        from services.http_clients import get_http_client
+
+        async with get_http_client().stream('GET', url, follow_redirects=True) as response:
+            response.raise_for_status()
+            content = bytearray()
+            async for chunk in response.aiter_bytes():
+                content += chunk
+                if len(content) > self.max_size:
+                    raise ValueError(f"image larger than {self.max_size // (1024 * 1024)}MB")
+            return bytes(content), response.headers.get('content-type', '').split(';')[0]
+
+    # ==================== METRICS ====================
+
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        Получить статистику реестра медиа
+
+        Returns:
+            dict: повторные использования по хэшу, загрузки, ошибки
+        """
+        return {
+            'reused_by_hash': self.hits,
+            'uploads': self.uploads,
+            'failures': self.failures,
+        }
+
+
+# Глобальный инстанс (singleton)
+media_registry = MediaRegistry()
@@ -2,12 +2,15 @@
 Notification Service
 Централизованный сервис для всех уведомлений (Telegram, Email, SMS и т.д.)
 """
+from contextlib import nullcontext
 from typing import Optional, Dict, List
 from telegram import Bot
 from telegram.error import TelegramError
 import logging
 from datetime import datetime, timezone
 
+from services.telegram_send_scheduler import send_priority, SendPriority
+
 logger = logging.getLogger(__name__)
 
 
@@ -169,12 +172,14 @@ class NotificationService:
             return False
         
         try:
-            await self.bot.send_message(
-                chat_id=user_id,
-                text=message,
-                parse_mode=parse_mode,
-                disable_web_page_preview=disable_web_page_preview
-            )
+            priority = send_priority(SendPriority.ADMIN) if user_id == self.admin_id else nullcontext()
+            with priority:
+                await self.bot.send_message(
+                    chat_id=user_id,
+                    text=message,
+                    parse_mode=parse_mode,
+                    disable_web_page_preview=disable_web_page_preview
+                )
             
             self.sent_count += 1
             logger.info(f"✅ Notification sent to {user_id}")
@@ -534,7 +539,8 @@ class NotificationService:
         stats = {'sent': 0, 'failed': 0}
         
         for user_id in user_ids:
-            success = await self._send_telegram(user_id, message, parse_mode=parse_mode)
+            with send_priority(SendPriority.BROADCAST):
+                success = await self._send_telegram(user_id, message, parse_mode=parse_mode)
             
             if success:
                 stats['sent'] += 1
@@ -60,23 +60,74 @@ class PaymentService:
         Returns:
             (success, error_message)
         """
-        # Проверить достаточность баланса
-        sufficient, balance = await self.check_balance_sufficient(telegram_id, amount)
+        # Проверка и списание одним условным $inc
+        if await self.user_repo.deduct_balance_if_sufficient(telegram_id, amount):
+            return True, None
         
-        if not sufficient:
+        balance = await self.user_repo.get_balance(telegram_id)
+        if balance < amount:
             return False, f"Insufficient balance. Required: ${amount:.2f}, Available: ${balance:.2f}"
+        return False, "Failed to deduct balance"
+    
+    async def refund_balance(
+        self,
+        telegram_id: int,
+        order_id: str,
+        amount: float
+    ) -> bool:
+        """
+        Вернуть списанную сумму на баланс
         
-        # Списать с баланса
-        success = await self.user_repo.update_balance(
-            telegram_id,
-            amount,
-            operation="subtract"
-        )
+        Args:
+            telegram_id: Telegram ID пользователя
+            order_id: ID заказа (для лога)
+            amount: Сумма
+            
+        Returns:
+            True если успешно
+        """
+        success = await self.user_repo.update_balance(telegram_id, amount, operation="add")
+        if success:
+            logger.info(f"↩️ Refunded ${amount:.2f} to {telegram_id} for {order_id}")
+        else:
+            logger.error(f"❌ Refund of ${amount:.2f} to {telegram_id} for {order_id} failed")
+        return success
+    
+    async def process_balance_charge(
+        self,
+        telegram_id: int,
+        charge_id: str,
+        amount: float
+    ) -> Tuple[bool, Optional[str]]:
+        """
+        Списать с баланса с отметкой charge_id (см. settle_charge / refund_unsettled_charge)
         
-        if not success:
-            return False, "Failed to deduct balance"
+        Returns:
+            (success, error_message)
+        """
+        if await self.user_repo.deduct_balance_for_charge(telegram_id, amount, charge_id):
+            return True, None
         
-        return True, None
+        balance = await self.user_repo.get_balance(telegram_id)
+        if balance < amount:
+            return False, f"Insufficient balance. Required: ${amount:.2f}, Available: ${balance:.2f}"
+        return False, "Failed to deduct balance"
+    
+    async def settle_charge(self, telegram_id: int, charge_id: str) -> bool:
+        """Снять отметку списания, когда оно записано у заказа"""
+        return await self.user_repo.clear_pending_charge(telegram_id, charge_id)
+    
+    async def refund_unsettled_charge(self, telegram_id: int, charge_id: str, amount: float) -> bool:
+        """
+        Вернуть списание, которое не успели записать у заказа
+        
+        Returns:
+            True если возвращено, False если списания не было
+        """
+        refunded = await self.user_repo.refund_pending_charge(telegram_id, amount, charge_id)
+        if refunded:
+            logger.info(f"↩️ Refunded unsettled charge ${amount:.2f} to {telegram_id} for {charge_id}")
+        return refunded
     
     async def add_balance(
         self,
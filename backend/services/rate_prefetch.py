@@ -0,0 +1,222 @@
+"""
+Speculative Rate Prefetch
+Фоновый запрос тарифов во время ввода размеров посылки
+
+Both ZIPs and the weight are known at PARCEL_WEIGHT, several steps before
+the user confirms the order. Each parcel step schedules a background quote
+for the current best guess (missing dimensions default to 10", exactly what
+the "standard size" skip buttons would set). A newer guess cancels the stale
+one. Results are parked in the rate cache, and a quote still in flight at
+CONFIRM_DATA is joined through rate_quote_flight instead of being re-sent.
+"""
+import asyncio
+import logging
+import os
+from collections import OrderedDict
+from typing import Optional, Dict, Any
+
+from services.carrier_catalog import carrier_catalog
+from services.shipstation_cache import shipstation_cache, rate_quote_flight
+
+logger = logging.getLogger(__name__)
+
+
+def quote_key_for(order_data: Dict[str, Any]) -> str:
+    """Rate cache / single-flight key for the order as it stands now"""
+    return shipstation_cache._generate_cache_key(
+        order_data['from_zip'],
+        order_data['to_zip'],
+        order_data['parcel_weight'],
+        order_data.get('parcel_length', 10),
+        order_data.get('parcel_width', 10),
+        order_data.get('parcel_height', 10)
+    )
+
+
+class RatePrefetcher:
+    """
+    Движок спекулятивной предзагрузки тарифов
+
+    One prefetch per user: scheduling a different key cancels the previous
+    prefetch, scheduling the same key is a no-op.
+
+    Usage:
+        rate_prefetcher.schedule(user_id, context.user_data)   # parcel steps
+        rate_prefetcher.consume(user_id, quote_key)            # fetch_shipping_rates
+    """
+
+    def __init__(self, max_tracked_users: int = 10000):
+        """
+        Args:
+            max_tracked_users: Максимум пользователей с активной предзагрузкой
+        """
+        self.max_tracked_users = max_tracked_users
+        # user_id -> {'key', 'task', 'upstream': bool}
+        self._prefetches: "OrderedDict[int, Dict[str, Any]]" = OrderedDict()
+        self.scheduled = 0
+        self.cancelled = 0
+        self.upstream_calls = 0
+        self.already_cached = 0
+        self.failed = 0
+        self.hits = 0
+        self.misses = 0
+        self.wasted = 0
+
+    def schedule(self, user_id: int, order_data: Dict[str, Any]) -> Optional[asyncio.Task]:
+        """
+        Start (or refresh) background rate prefetch for user
+
+        Args:
+            user_id: Telegram user ID
+            order_data: context.user_data (snapshotted, not mutated)
+
+        Returns:
+            Prefetch task, or None if not enough data yet / same key running
+        """
+        if not all(order_data.get(f) for f in ('from_zip', 'to_zip', 'parcel_weight')):
+            return None
+
+        try:
+            key = quote_key_for(order_data)
+        except (TypeError, ValueError):
+            return None
+
+        current = self._prefetches.get(user_id)
+        if current is not None and current['key'] == key:
+            return None
+
+        self._discard(user_id)
+
+        entry = {'key': key, 'task': None, 'upstream': False}
+        entry['task'] = asyncio.create_task(self._run(entry, dict(order_data)))
+        self._prefetches[user_id] = entry
+        self.scheduled += 1
+
+        while len(self._prefetches) > self.max_tracked_users:
+            oldest_user_id = next(iter(self._prefetches))
+            self._discard(oldest_user_id)
+
+        logger.info(f"🔮 Rate prefetch scheduled for user {user_id} ({order_data['from_zip']} → {order_data['to_zip']}, {order_data['parcel_weight']} lb)")
+        return entry['task']
+
+    def consume(self, user_id: int, key: str) -> bool:
+        """
+        Record that the user confirmed the order with quote key
+
+        Returns:
+            bool: True if a prefetch for this exact key was made
+        """
+        entry = self._prefetches.pop(user_id, None)
+        if entry is not None and entry['key'] == key:
+            self.hits += 1
+            logger.info(f"🎯 Rate prefetch HIT for user {user_id}")
+            return True
+
+        self.misses += 1
+        if entry is not None:
+            self._retire(entry)
+        return False
+
+    def _discard(self, user_id: int) -> None:
+        entry = self._prefetches.pop(user_id, None)
+        if entry is not None:
+            self._retire(entry)
+
+    def _retire(self, entry: Dict[str, Any]) -> None:
+        """Cancel a stale prefetch; count its upstream call as wasted"""
+        task = entry['task']
+        if task is not None and not task.done():
+            task.cancel()
+            self.cancelled += 1
+        if entry['upstream']:
+            self.wasted += 1
+
+    async def _run(self, entry: Dict[str, Any], order_data: Dict[str, Any]) -> None:
+        from services.shipping_service import (
+            validate_order_data_for_rates,
+            build_shipstation_rates_request
+        )
+
+        is_valid, _ = await validate_order_data_for_rates(order_data)
+        if not is_valid:
+            return
+
+        try:
+            cached_rates = await shipstation_cache.get(
+                from_zip=order_data['from_zip'],
+                to_zip=order_data['to_zip'],
+                weight=order_data['parcel_weight'],
+                length=order_data.get('parcel_length', 10),
+                width=order_data.get('parcel_width', 10),
+                height=order_data.get('parcel_height', 10)
+            )
+            if cached_rates:
+                self.already_cached += 1
+                return
+
+            carrier_ids = await carrier_catalog.get_carrier_ids()
+            if not carrier_ids:
+                return
+
+            rate_request = build_shipstation_rates_request(order_data, list(carrier_ids.values()))
+            headers = {
+                'API-Key': os.environ.get('SHIPSTATION_API_KEY_TEST') or os.environ.get('SHIPSTATION_API_KEY_PROD'),
+                'Content-Type': 'application/json'
+            }
+
+            entry['upstream'] = True
+            self.upstream_calls += 1
+            success, rates, error_msg = await rate_quote_flight.do(
+                entry['key'], self._fetch, rate_request, headers
+            )
+
+            if not success or not rates:
+                self.failed += 1
+                logger.debug(f"Rate prefetch got no rates: {error_msg}")
+                return
+
+            await shipstation_cache.set(
+                from_zip=order_data['from_zip'],
+                to_zip=order_data['to_zip'],
+                weight=order_data['parcel_weight'],
+                length=order_data.get('parcel_length', 10),
+                width=order_data.get('parcel_width', 10),
+                height=order_data.get('parcel_height', 10),
+                rates=rates
+            )
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            self.failed += 1
+            logger.warning(f"⚠️ Rate prefetch failed: {e}")
+
+    async def _fetch(self, rate_request: dict, headers: dict):
+        from handlers.order_flow.rates import fetch_and_prepare_rates
+        return await fetch_and_prepare_rates(rate_request, headers)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        Получить статистику предзагрузки
+
+        Returns:
+            dict: hit rate, upstream calls, wasted upstream calls
+        """
+        consumed = self.hits + self.misses
+        hit_rate = (self.hits / consumed * 100) if consumed > 0 else 0
+
+        return {
+            'scheduled': self.scheduled,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': f"{hit_rate:.1f}%",
+            'upstream_calls': self.upstream_calls,
+            'already_cached': self.already_cached,
+            'wasted_upstream_calls': self.wasted,
+            'cancelled': self.cancelled,
+            'failed': self.failed,
+            'active': len(self._prefetches)
+        }
+
+
+# Глобальный инстанс (singleton)
+rate_prefetcher = RatePrefetcher(max_tracked_users=10000)
@@ -0,0 +1,256 @@
+"""
+Segment Engine
+Сегменты аудитории рассылок как агрегации MongoDB
+
+An audience is a small declarative definition that compiles into ONE
+aggregation pipeline over users - no per-user queries, no Python-side
+filtering:
+
+    {'min_orders': 1}                       # "active": has ordered
+    {'balance_above': 0}                    # "premium": positive balance
+    {'inactive_for_days': 30, 'max_orders': 0}
+
+Pipeline: $match on user fields (blocked status, balance, resume cursor) →
+$sort telegram_id → [$lookup orders grouped per user → $match on order
+count / last activity] → $project telegram_id. Matching ids are streamed
+with a cursor; counts for the admin preview are cached for a short TTL.
+The $lookup joins on localField/foreignField with a sub-pipeline, which
+needs MongoDB 5.0+.
+
+Last activity = latest of the user's updated_at and their last order's
+created_at. Both are stored as ISO-8601 UTC strings, so the cutoff is
+compared as a string too.
+"""
+import json
+import logging
+import time
+from datetime import datetime, timezone, timedelta
+from typing import Any, AsyncIterator, Dict, List, Optional, Union
+
+from config.performance_config import BotPerformanceConfig
+
+logger = logging.getLogger(__name__)
+
+# Named segments offered in the admin panel
+SEGMENTS: Dict[str, Dict[str, Any]] = {
+    'all': {},
+    'active': {'min_orders': 1},
+    'premium': {'balance_above': 0},
+}
+
+# Definition field → type
+SEGMENT_FIELDS = {
+    'min_orders': int,
+    'max_orders': int,
+    'balance_above': float,
+    'active_within_days': int,
+    'inactive_for_days': int,
+    'include_blocked': bool,
+}
+ORDER_FIELDS = ('min_orders', 'max_orders', 'active_within_days', 'inactive_for_days')
+
+
+class SegmentEngine:
+    """
+    Компилятор сегментов аудитории
+
+    Usage:
+        async for telegram_id in segment_engine.stream(db, 'active'):
+            ...
+        total = await segment_engine.count(db, {'min_orders': 3})
+    """
+
+    def __init__(self, count_cache_ttl_seconds: int = 60, max_cached_counts: int = 256):
+        """
+        Args:
+            count_cache_ttl_seconds: Время жизни кэша количества получателей
+            max_cached_counts: Максимум сегментов в кэше
+        """
+        self.count_cache_ttl = count_cache_ttl_seconds
+        self.max_cached_counts = max_cached_counts
+        self._counts: Dict[str, tuple] = {}   # key -> (expires_at, count)
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.streams = 0
+
+    # ==================== DEFINITIONS ====================
+
+    @staticmethod
+    def resolve(segment: Union[str, Dict[str, Any], None]) -> Dict[str, Any]:
+        """
+        Validate a segment name or definition
+
+        Returns:
+            Normalized definition (known fields only, coerced types)
+
+        Raises:
+            ValueError: unknown segment name, field or bad value
+        """
+        if segment is None:
+            segment = 'all'
+        if isinstance(segment, str):
+            if segment not in SEGMENTS:
+                raise ValueError(f"Unknown segment {segment!r}. Use: {', '.join(SEGMENTS)}")
+            segment = SEGMENTS[segment]
+
+        definition = {}
+        for field, value in segment.items():
+            if field not in SEGMENT_FIELDS:
+                raise ValueError(f"Unknown segment field {field!r}")
+            if value is None:
+                continue
+            kind = SEGMENT_FIELDS[field]
+            if kind is bool:
+                if not isinstance(value, bool):
+                    raise ValueError(f"{field} must be true or false")
+            else:
+                try:
+                    value = kind(value)
+                except (TypeError, ValueError):
+                    raise ValueError(f"{field} must be a number")
+                if value < 0:
+                    raise ValueError(f"{field} must not be negative")
+            definition[field] = value
+        return definition
+
+    def compile(self, segment: Union[str, Dict[str, Any], None],
+                after: Optional[int] = None, sort: bool = True) -> List[Dict[str, Any]]:
+        """
+        Aggregation pipeline over users that yields {'telegram_id': ...}
+
+        Args:
+            segment: Имя сегмента или определение
+            after: Only telegram_ids greater than this (resume cursor)
+            sort: Sort by telegram_id (needed for streaming, not for counts)
+        """
+        definition = self.resolve(segment)
+
+        match: Dict[str, Any] = {}
+        if not definition.get('include_blocked'):
+            match['bot_blocked_by_user'] = {'$ne': True}
+        if 'balance_above' in definition:
+            match['balance'] = {'$gt': definition['balance_above']}
+        if after is not None:
+            match['telegram_id'] = {'$gt': after}
+
+        pipeline: List[Dict[str, Any]] = [{'$match': match}]
+        if sort:
+            pipeline.append({'$sort': {'telegram_id': 1}})
+
+        if any(field in definition for field in ORDER_FIELDS):
+            pipeline += [
+                # localField/foreignField + pipeline (MongoDB 5.0+, docs/DEPLOYMENT.md
+                # requires 6.0): the join uses the orders.telegram_id index,
+                # a let/$expr match would scan orders once per user
+                {'$lookup': {
+                    'from': 'orders',
+                    'localField': 'telegram_id',
+                    'foreignField': 'telegram_id',
+                    'pipeline': [
+                        {'$group': {'_id': None, 'count': {'$sum': 1}, 'last_order_at': {'$max': '$created_at'}}},
+                    ],
+                    'as': 'order_stats',
+                }},
+                {'$addFields': {
+                    'orders_count': {'$ifNull': [{'$arrayElemAt': ['$order_stats.count', 0]}, 0]},
+                    'last_activity_at': {'$max': ['$updated_at', {'$arrayElemAt': ['$order_stats.last_order_at', 0]}]},
+                }},
+                {'$match': self._order_match(definition)},
+            ]
+
+        pipeline.append({'$project': {'_id': 0, 'telegram_id': 1}})
+        return pipeline
+
+    @staticmethod
+    def _order_match(definition: Dict[str, Any]) -> Dict[str, Any]:
+        match: Dict[str, Any] = {}
+        orders: Dict[str, int] = {}
+        if 'min_orders' in definition:
+            orders['$gte'] = definition['min_orders']
+        if 'max_orders' in definition:
+            orders['$lte'] = definition['max_orders']
+        if orders:
+            match['orders_count'] = orders
+
+        now = datetime.now(timezone.utc)
+        activity: Dict[str, str] = {}
+        if 'active_within_days' in definition:
+            activity['$gte'] = (now - timedelta(days=definition['active_within_days'])).isoformat()
+        if 'inactive_for_days' in definition:
+            cutoff = (now - timedelta(days=definition['inactive_for_days'])).isoformat()
+            if activity:
+                activity['$lt'] = cutoff
+            else:
+                # Never active counts as inactive
+                match['$or'] = [{'last_activity_at': {'$lt': cutoff}}, {'last_activity_at': None}]
+        if activity:
+            match['last_activity_at'] = activity
+        return match
+
+    # ==================== EVALUATION ====================
+
+    async def stream(self, db, segment: Union[str, Dict[str, Any], None],
+                     after: Optional[int] = None, batch_size: int = 500) -> AsyncIterator[int]:
+        """Matching telegram_ids in ascending order, one server-side pass"""
+        pipeline = self.compile(segment, after=after)
+        self.streams += 1
+        cursor = db.users.aggregate(pipeline, allowDiskUse=True, batchSize=batch_size)
+        async for user in cursor:
+            yield user['telegram_id']
+
+    async def count(self, db, segment: Union[str, Dict[str, Any], None], use_cache: bool = True) -> int:
+        """
+        Number of users in a segment
+
+        Args:
+            use_cache: Serve a cached count (admin preview); False for an exact count
+        """
+        definition = self.resolve(segment)
+        key = json.dumps(definition, sort_keys=True)
+        now = time.monotonic()
+
+        cached = self._counts.get(key)
+        if use_cache and cached and cached[0] > now:
+            self.cache_hits += 1
+            return cached[1]
+        self.cache_misses += 1
+
+        pipeline = self.compile(definition, sort=False) + [{'$count': 'total'}]
+        result = await db.users.aggregate(pipeline, allowDiskUse=True).to_list(1)
+        total = result[0]['total'] if result else 0
+
+        if len(self._counts) >= self.max_cached_counts:
+            self._counts = {k: v for k, v in self._counts.items() if v[0] > now}
+            if len(self._counts) >= self.max_cached_counts:
+                self._counts.pop(next(iter(self._counts)))
+        self._counts[key] = (now + self.count_cache_ttl, total)
+        return total
+
+    async def preview(self, db) -> Dict[str, int]:
+        """Cached recipient counts for every named segment"""
+        return {name: await self.count(db, name) for name in SEGMENTS}
+
+    def invalidate(self) -> None:
+        self._counts.clear()
+
+    # ==================== METRICS ====================
+
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        Получить статистику сегментов
+
+        Returns:
+            dict: попадания / промахи кэша количеств, запущенные выборки
+        """
+        total = self.cache_hits + self.cache_misses
+        return {
+            'cached_counts': len(self._counts),
+            'cache_hits': self.cache_hits,
+            'cache_misses': self.cache_misses,
+            'cache_hit_rate': f"{self.cache_hits / total * 100:.1f}%" if total else "0.0%",
+            'streams': self.streams,
+        }
+
+
+# Глобальный инстанс (singleton)
+segment_engine = SegmentEngine(**BotPerformanceConfig.get_segment_config())
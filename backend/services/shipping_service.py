@@ -5,9 +5,10 @@ Handles all shipping-related operations including rate calculations and label cr
 import logging
 import httpx
 from typing import Optional, Dict, List, Any, Tuple
+from services.http_clients import get_client_for_url
 from telegram import Update
 from telegram.ext import ContextTypes
-from utils.retry_utils import retry_on_api_error
+from utils.retry_utils import retry_on_api_error, raise_for_retryable_status, CircuitOpenError
 
 logger = logging.getLogger(__name__)
 
@@ -190,7 +191,8 @@ This module centralizes all shipping-related operations:
 2. Label Creation & Delivery:
    - build_shipstation_label_request() - Build label request
    - download_label_pdf() - Download PDF from URL
-   - send_label_to_user() - Send via Telegram
+   - send_label_to_user() - Send via Telegram (file_id reuse)
+   - resend_label() - Re-deliver an existing label
 
 3. Validation:
    - validate_shipping_address() - Address validation
@@ -439,7 +441,11 @@ def balance_and_deduplicate_rates(
                 'days': rate.get('delivery_days'),
                 'carrier_delivery_days': rate.get('carrier_delivery_days'),
                 'guaranteed_service': rate.get('guaranteed_service', False),
-                'rate_id': rate.get('rate_id')
+                'rate_id': rate.get('rate_id'),
+                # Needed to buy the quoted rate later (batch purchase matches
+                # labels back to parcels by shipment_id)
+                'shipment_id': rate.get('shipment_id'),
+                'carrier_id': rate.get('carrier_id')
             }
             balanced_rates.append(formatted_rate)
     
@@ -449,7 +455,24 @@ def balance_and_deduplicate_rates(
     return balanced_rates
 
 
-@retry_on_api_error(max_attempts=2, min_wait=1, max_wait=5)
+@retry_on_api_error(max_attempts=2, min_wait=1, max_wait=5, upstream='shipstation')
+async def _post_rate_request(rate_request, headers, api_url, timeout):
+    """POST /v2/rates; network errors, timeouts, 5xx and 429 propagate to the retry"""
+    # Timeout adapts to the rolling p95 of /v2/rates (fixed timeout is
+    # the upper bound); a slow quote is hedged with a duplicate request
+    from services.adaptive_requests import request_policy
+    
+    client = get_client_for_url(api_url, default='shipstation')
+    response = await request_policy.request(
+        client, 'POST', api_url,
+        hedge=True,
+        default_timeout=timeout,
+        json=rate_request,
+        headers=headers
+    )
+    return raise_for_retryable_status(response)
+
+
 async def fetch_rates_from_shipstation(
     rate_request: Dict[str, Any],
     headers: Dict[str, str],
@@ -469,15 +492,7 @@ async def fetch_rates_from_shipstation(
         (success, rates_list, error_message)
     """
     try:
-        # Create timeout config (connect, read, write, pool)
-        timeout_config = httpx.Timeout(timeout, connect=10.0)
-        
-        async with httpx.AsyncClient(timeout=timeout_config) as client:
-            response = await client.post(
-                api_url,
-                json=rate_request,
-                headers=headers
-            )
+        response = await _post_rate_request(rate_request, headers, api_url, timeout)
         
         if response.status_code == 200:
             data = response.json()
@@ -486,6 +501,12 @@ async def fetch_rates_from_shipstation(
             if not rates:
                 return False, None, "No rates returned from ShipStation"
             
+            # Rates belong to the shipment ShipStation created for the quote
+            shipment_id = data.get('shipment_id')
+            if shipment_id:
+                for rate in rates:
+                    rate.setdefault('shipment_id', shipment_id)
+            
             return True, rates, None
             
         else:
@@ -493,6 +514,13 @@ async def fetch_rates_from_shipstation(
             logger.error(error_msg)
             return False, None, error_msg
             
+    except CircuitOpenError as e:
+        return False, None, str(e)
+    except httpx.HTTPStatusError as e:
+        # 5xx / 429 that survived the retries
+        error_msg = f"ShipStation API error: {e.response.status_code} - {e.response.text}"
+        logger.error(error_msg)
+        return False, None, error_msg
     except httpx.TimeoutException:
         return False, None, "Request timeout - ShipStation API took too long to respond"
     except httpx.RequestError as e:
@@ -569,7 +597,7 @@ async def save_rates_to_cache_and_session(
     from datetime import datetime, timezone
     
     # Save to cache
-    shipstation_cache.set(
+    await shipstation_cache.set(
         from_zip=order_data['from_zip'],
         to_zip=order_data['to_zip'],
         weight=order_data.get('weight') or order_data.get('parcel_weight', 1.0),
@@ -651,6 +679,58 @@ def build_shipstation_label_request(
     }
 
 
+def label_external_shipment_id(order_id: str) -> str:
+    """Deterministic ShipStation external_shipment_id for an order's label"""
+    return f"label-{order_id}"
+
+
+async def find_purchased_label(
+    external_shipment_id: str,
+    shipstation_api_key: str
+) -> Tuple[Optional[str], Optional[Dict[str, Any]]]:
+    """
+    Look up a shipment created by an earlier purchase attempt
+
+    A label POST that timed out may still have bought the label; the
+    shipment is found by its external_shipment_id.
+
+    Returns:
+        (shipment_id, label) - (None, None) if ShipStation has no such
+        shipment, label is None if the shipment has no active label
+
+    Raises:
+        RuntimeError: ShipStation could not answer (do not buy blind)
+    """
+    from services.http_clients import get_http_client
+
+    client = get_http_client('shipstation')
+    headers = {'API-Key': shipstation_api_key}
+
+    response = await client.get(
+        f'https://api.shipstation.com/v2/shipments/external_shipment_id/{external_shipment_id}',
+        headers=headers,
+        timeout=30.0
+    )
+    if response.status_code == 404:
+        return None, None
+    if response.status_code != 200:
+        raise RuntimeError(f"Shipment lookup failed: HTTP {response.status_code}")
+    shipment_id = response.json().get('shipment_id')
+
+    response = await client.get(
+        'https://api.shipstation.com/v2/labels',
+        headers=headers,
+        params={'shipment_id': shipment_id},
+        timeout=30.0
+    )
+    if response.status_code != 200:
+        raise RuntimeError(f"Label lookup failed: HTTP {response.status_code}")
+    for label in response.json().get('labels', []):
+        if label.get('status') != 'voided' and label.get('tracking_number'):
+            return shipment_id, label
+    return shipment_id, None
+
+
 async def download_label_pdf(label_url: str, timeout: int = 30) -> Tuple[bool, Optional[bytes], Optional[str]]:
     """
     Download label PDF from URL
@@ -663,8 +743,8 @@ async def download_label_pdf(label_url: str, timeout: int = 30) -> Tuple[bool, O
         (success, pdf_bytes, error_message)
     """
     try:
-        async with httpx.AsyncClient(timeout=timeout) as client:
-            response = await client.get(label_url)
+        client = get_client_for_url(label_url)
+        response = await client.get(label_url, timeout=timeout)
         
         if response.status_code == 200:
             return True, response.content, None
@@ -682,51 +762,136 @@ async def download_label_pdf(label_url: str, timeout: int = 30) -> Tuple[bool, O
 async def send_label_to_user(
     bot_instance,
     telegram_id: int,
-    pdf_bytes: bytes,
+    pdf_bytes: Optional[bytes],
     order_id: str,
     tracking_number: str,
     carrier: str,
-    safe_telegram_call_func
+    safe_telegram_call_func,
+    pdf_path: Optional[str] = None,
+    file_id: Optional[str] = None,
+    label_id: Optional[str] = None
 ) -> Tuple[bool, Optional[str]]:
     """
     Send label PDF to user via Telegram
     
+    A known Telegram file_id is sent first; the PDF is uploaded only when
+    there is none or Telegram rejects it. The file_id of a fresh upload is
+    recorded on the shipping_labels document (when label_id is given).
+    
     Args:
         bot_instance: Telegram bot instance
         telegram_id: User's telegram ID
-        pdf_bytes: PDF file content
+        pdf_bytes: PDF file content (or None when pdf_path is given)
         order_id: Order ID
         tracking_number: Tracking number
         carrier: Carrier name
-        safe_telegram_call_func: Safe telegram call wrapper
+        safe_telegram_call_func: Safe telegram call wrapper (upload call)
+        pdf_path: Path to PDF in label store (read at upload time)
+        file_id: Telegram file_id from a previous delivery
+        label_id: ShipStation label ID to record the new file_id on
     
     Returns:
         (success, error_message)
     """
     import io
+    from services.telegram_delivery import telegram_delivery
+    
+    upload = None
+    if pdf_path:
+        upload = lambda: open(pdf_path, 'rb')
+    elif pdf_bytes:
+        upload = lambda: io.BytesIO(pdf_bytes)
     
     try:
-        # Create file-like object
-        pdf_file = io.BytesIO(pdf_bytes)
-        # Use only tracking number as filename
-        pdf_file.name = f"{tracking_number}.pdf"
-        
         # Caption message
         caption = f"""✅ Shipping Label
 
 Carrier: {carrier}
 Tracking: {tracking_number}"""
         
-        # Send document
-        await safe_telegram_call_func(
-            bot_instance.send_document(
-                chat_id=telegram_id,
-                document=pdf_file,
-                caption=caption
-            )
+        # Send document (tracking number as filename)
+        _, sent_file_id = await telegram_delivery.send_document(
+            bot_instance,
+            telegram_id,
+            file_id=file_id,
+            upload=upload,
+            call_wrapper=safe_telegram_call_func,
+            filename=f"{tracking_number}.pdf",
+            caption=caption
         )
         
+        if label_id and sent_file_id and sent_file_id != file_id:
+            await record_label_file_id(label_id, sent_file_id)
+        
         return True, None
         
     except Exception as e:
         return False, f"Error sending label: {str(e)}"
+
+
+async def record_label_file_id(label_id: str, file_id: str) -> None:
+    """Store Telegram file_id on the label for later re-sends"""
+    from server import db
+    
+    try:
+        await db.shipping_labels.update_one(
+            {"label_id": label_id},
+            {"$set": {"telegram_file_id": file_id}}
+        )
+    except Exception as e:
+        logger.warning(f"Could not record telegram_file_id for label {label_id}: {e}")
+
+
+async def resend_label(bot_instance, label: Dict[str, Any], telegram_id: int, shipstation_api_key: Optional[str] = None) -> Tuple[bool, Optional[str]]:
+    """
+    Re-deliver an existing label to the user
+    
+    Uses the recorded telegram_file_id; the PDF (local label store, or
+    ShipStation if the blob has expired) is only needed when there is no
+    file_id or Telegram no longer accepts it.
+    
+    Returns:
+        (success, error_message)
+    """
+    from handlers.common_handlers import safe_telegram_call
+    from services.label_store import label_store
+    
+    async def ensure_blob():
+        blob = label_store.get_blob(label)
+        if blob is None and label.get('label_url'):
+            headers = {'API-Key': shipstation_api_key} if shipstation_api_key else None
+            success, blob, error = await label_store.store_from_url(label['label_url'], headers=headers, timeout=30)
+            if not success:
+                logger.error(f"Failed to fetch label PDF for re-send: {error}")
+                return None
+            if label.get('label_id'):
+                from server import db
+                await label_store.attach_to_label(db, label['label_id'], blob)
+        return blob
+    
+    file_id = label.get('telegram_file_id')
+    blob = label_store.get_blob(label) if file_id else await ensure_blob()
+    if not file_id and blob is None:
+        return False, "Label PDF not available"
+    
+    send_kwargs = dict(
+        bot_instance=bot_instance,
+        telegram_id=telegram_id,
+        pdf_bytes=None,
+        order_id=label.get('order_id'),
+        tracking_number=label.get('tracking_number'),
+        carrier=(label.get('carrier') or '').upper(),
+        safe_telegram_call_func=safe_telegram_call,
+        label_id=label.get('label_id')
+    )
+    success, error = await send_label_to_user(
+        pdf_path=blob.path if blob else None, file_id=file_id, **send_kwargs
+    )
+    
+    if not success and file_id and blob is None:
+        # file_id rejected and nothing local to upload - fetch the PDF and upload
+        blob = await ensure_blob()
+        if blob is not None:
+            success, error = await send_label_to_user(pdf_path=blob.path, **send_kwargs)
+    
+    return success, error
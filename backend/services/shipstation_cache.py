@@ -1,31 +1,64 @@
 """
 ShipStation API Response Caching
 Кэширование результатов запросов тарифов для ускорения работы
+(L1 LRU в памяти + L2 MongoDB rate_quotes, общий для воркеров)
 """
 import hashlib
 import json
+from collections import OrderedDict
 from datetime import datetime, timezone, timedelta
 from typing import Optional, Dict, Any
 import logging
+from utils.single_flight import SingleFlight
 
 logger = logging.getLogger(__name__)
 
 
 class ShipStationCache:
     """
-    Кэш для результатов ShipStation API
+    Двухуровневый кэш для результатов ShipStation API
     Кэширует тарифы доставки на основе маршрута и веса посылки
+    
+    L1: in-process LRU (OrderedDict), ограничен по числу записей и байтам,
+        вытеснение O(1)
+    L2: MongoDB коллекция rate_quotes с TTL индексом, общая для всех
+        воркеров и переживает рестарты
     """
     
-    def __init__(self, cache_duration_minutes: int = 60):
+    def __init__(self,
+                 cache_duration_minutes: int = 60,
+                 max_entries: int = 2000,
+                 max_bytes: int = 32 * 1024 * 1024):
         """
         Args:
             cache_duration_minutes: Время жизни кэша в минутах (по умолчанию 60)
+            max_entries: Максимум записей в L1
+            max_bytes: Максимальный объем L1 в байтах (по сериализованным тарифам)
         """
-        self._cache: Dict[str, Dict[str, Any]] = {}
+        self._cache: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
         self.cache_duration = timedelta(minutes=cache_duration_minutes)
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._bytes = 0
+        self._db = None
         self.hits = 0
         self.misses = 0
+        self.l1_stats = {'hits': 0, 'misses': 0, 'evictions': 0, 'expirations': 0}
+        self.l2_stats = {'hits': 0, 'misses': 0, 'writes': 0, 'errors': 0}
+    
+    async def attach_db(self, db) -> None:
+        """
+        Подключить MongoDB как L2 и создать TTL индекс
+        
+        Args:
+            db: Motor database
+        """
+        self._db = db
+        try:
+            await db.rate_quotes.create_index("expires_at", expireAfterSeconds=0)
+            logger.info("✅ Rate cache L2 attached (rate_quotes, TTL index)")
+        except Exception as e:
+            logger.warning(f"⚠️ rate_quotes TTL index creation skipped: {e}")
     
     def _generate_cache_key(self, 
                            from_zip: str,
@@ -56,51 +89,88 @@ class ShipStationCache:
         key_string = json.dumps(key_data, sort_keys=True)
         return hashlib.md5(key_string.encode()).hexdigest()
     
-    def get(self, 
-            from_zip: str,
-            to_zip: str,
-            weight: float,
-            length: float = 10,
-            width: float = 10,
-            height: float = 10) -> Optional[list]:
+    # ==================== L1 (LRU) ====================
+    
+    def _l1_get(self, cache_key: str) -> Optional[Dict[str, Any]]:
+        entry = self._cache.get(cache_key)
+        if entry is None:
+            self.l1_stats['misses'] += 1
+            return None
+        
+        if datetime.now(timezone.utc) - entry['timestamp'] > self.cache_duration:
+            self._l1_remove(cache_key)
+            self.l1_stats['expirations'] += 1
+            self.l1_stats['misses'] += 1
+            return None
+        
+        self._cache.move_to_end(cache_key)
+        self.l1_stats['hits'] += 1
+        return entry
+    
+    def _l1_put(self, cache_key: str, entry: Dict[str, Any]) -> None:
+        if cache_key in self._cache:
+            self._l1_remove(cache_key)
+        
+        entry['size'] = len(json.dumps(entry['rates'], default=str))
+        self._cache[cache_key] = entry
+        self._bytes += entry['size']
+        
+        # Вытеснение самых старых записей (O(1) на запись)
+        while self._cache and (len(self._cache) > self.max_entries or self._bytes > self.max_bytes):
+            _, evicted = self._cache.popitem(last=False)
+            self._bytes -= evicted['size']
+            self.l1_stats['evictions'] += 1
+    
+    def _l1_remove(self, cache_key: str) -> bool:
+        entry = self._cache.pop(cache_key, None)
+        if entry is None:
+            return False
+        self._bytes -= entry['size']
+        return True
+    
+    # ==================== PUBLIC API ====================
+    
+    async def get(self, 
+                  from_zip: str,
+                  to_zip: str,
+                  weight: float,
+                  length: float = 10,
+                  width: float = 10,
+                  height: float = 10) -> Optional[list]:
         """
-        Получить закэшированные тарифы
+        Получить закэшированные тарифы (L1, затем L2)
         
         Returns:
             list: Список тарифов или None если кэш устарел/не найден
         """
         cache_key = self._generate_cache_key(from_zip, to_zip, weight, length, width, height)
         
-        if cache_key not in self._cache:
-            self.misses += 1
-            logger.debug(f"❌ Cache MISS for route {from_zip} → {to_zip}")
-            return None
-        
-        cache_entry = self._cache[cache_key]
-        cached_time = cache_entry['timestamp']
+        entry = self._l1_get(cache_key)
+        if entry is None and self._db is not None:
+            entry = await self._l2_get(cache_key)
+            if entry is not None:
+                # Промоушен в L1
+                self._l1_put(cache_key, entry)
         
-        # Проверяем, не устарел ли кэш
-        if datetime.now(timezone.utc) - cached_time > self.cache_duration:
-            # Кэш устарел - удаляем
-            del self._cache[cache_key]
+        if entry is None:
             self.misses += 1
-            logger.debug(f"⏰ Cache EXPIRED for route {from_zip} → {to_zip}")
+            logger.debug(f"❌ Cache MISS for route {from_zip} → {to_zip}")
             return None
         
         self.hits += 1
-        logger.info(f"✅ Cache HIT for route {from_zip} → {to_zip} (age: {(datetime.now(timezone.utc) - cached_time).seconds}s)")
-        return cache_entry['rates']
+        logger.info(f"✅ Cache HIT for route {from_zip} → {to_zip} (age: {(datetime.now(timezone.utc) - entry['timestamp']).seconds}s)")
+        return entry['rates']
     
-    def set(self,
-            from_zip: str,
-            to_zip: str,
-            weight: float,
-            rates: list,
-            length: float = 10,
-            width: float = 10,
-            height: float = 10) -> None:
+    async def set(self,
+                  from_zip: str,
+                  to_zip: str,
+                  weight: float,
+                  rates: list,
+                  length: float = 10,
+                  width: float = 10,
+                  height: float = 10) -> None:
         """
-        Сохранить тарифы в кэш
+        Сохранить тарифы в кэш (L1 и L2)
         
         Args:
             from_zip: ZIP код отправителя
@@ -111,24 +181,28 @@ class ShipStationCache:
         """
         cache_key = self._generate_cache_key(from_zip, to_zip, weight, length, width, height)
         
-        self._cache[cache_key] = {
+        entry = {
             'rates': rates,
             'timestamp': datetime.now(timezone.utc),
             'route': f"{from_zip} → {to_zip}",
             'weight': weight
         }
+        self._l1_put(cache_key, entry)
+        
+        if self._db is not None:
+            await self._l2_set(cache_key, entry)
         
         logger.info(f"💾 Cached {len(rates)} rates for route {from_zip} → {to_zip}")
     
-    def delete(self,
-               from_zip: str,
-               to_zip: str,
-               weight: float,
-               length: float = 10,
-               width: float = 10,
-               height: float = 10) -> bool:
+    async def delete(self,
+                     from_zip: str,
+                     to_zip: str,
+                     weight: float,
+                     length: float = 10,
+                     width: float = 10,
+                     height: float = 10) -> bool:
         """
-        Удалить конкретную запись из кэша
+        Удалить конкретную запись из кэша (L1 и L2)
         
         Args:
             from_zip: ZIP код отправителя
@@ -141,24 +215,85 @@ class ShipStationCache:
         """
         cache_key = self._generate_cache_key(from_zip, to_zip, weight, length, width, height)
         
-        if cache_key in self._cache:
-            del self._cache[cache_key]
+        deleted = self._l1_remove(cache_key)
+        if self._db is not None:
+            try:
+                result = await self._db.rate_quotes.delete_one({'_id': cache_key})
+                deleted = deleted or result.deleted_count > 0
+            except Exception as e:
+                self.l2_stats['errors'] += 1
+                logger.warning(f"⚠️ Rate cache L2 delete failed: {e}")
+        
+        if deleted:
             logger.info(f"🗑️ Deleted cache entry for route {from_zip} → {to_zip}")
             return True
         
         logger.debug(f"❌ Cache entry not found for route {from_zip} → {to_zip}")
         return False
     
+    # ==================== L2 (MongoDB) ====================
+    
+    async def _l2_get(self, cache_key: str) -> Optional[Dict[str, Any]]:
+        try:
+            doc = await self._db.rate_quotes.find_one({'_id': cache_key})
+        except Exception as e:
+            self.l2_stats['errors'] += 1
+            logger.warning(f"⚠️ Rate cache L2 read failed: {e}")
+            return None
+        
+        # TTL монитор MongoDB работает раз в минуту - проверяем срок сами
+        now = datetime.now(timezone.utc)
+        expires_at = doc.get('expires_at') if doc else None
+        if expires_at is not None and expires_at.tzinfo is None:
+            expires_at = expires_at.replace(tzinfo=timezone.utc)
+        if not doc or (expires_at is not None and expires_at <= now):
+            self.l2_stats['misses'] += 1
+            return None
+        
+        created_at = doc['created_at']
+        if created_at.tzinfo is None:
+            created_at = created_at.replace(tzinfo=timezone.utc)
+        
+        self.l2_stats['hits'] += 1
+        return {
+            'rates': doc['rates'],
+            'timestamp': created_at,
+            'route': doc.get('route'),
+            'weight': doc.get('weight')
+        }
+    
+    async def _l2_set(self, cache_key: str, entry: Dict[str, Any]) -> None:
+        try:
+            await self._db.rate_quotes.replace_one(
+                {'_id': cache_key},
+                {
+                    '_id': cache_key,
+                    'rates': entry['rates'],
+                    'route': entry['route'],
+                    'weight': entry['weight'],
+                    'created_at': entry['timestamp'],
+                    'expires_at': entry['timestamp'] + self.cache_duration
+                },
+                upsert=True
+            )
+            self.l2_stats['writes'] += 1
+        except Exception as e:
+            self.l2_stats['errors'] += 1
+            logger.warning(f"⚠️ Rate cache L2 write failed: {e}")
+    
+    # ==================== MAINTENANCE ====================
+    
     def clear(self) -> None:
-        """Очистить весь кэш"""
+        """Очистить L1 кэш (L2 истекает по TTL)"""
         self._cache.clear()
+        self._bytes = 0
         self.hits = 0
         self.misses = 0
         logger.info("🧹 Cache cleared")
     
     def cleanup_expired(self) -> int:
         """
-        Удалить устаревшие записи из кэша
+        Удалить устаревшие записи из L1
         
         Returns:
             int: Количество удаленных записей
@@ -170,7 +305,8 @@ class ShipStationCache:
         ]
         
         for key in expired_keys:
-            del self._cache[key]
+            self._l1_remove(key)
+        self.l1_stats['expirations'] += len(expired_keys)
         
         if expired_keys:
             logger.info(f"🧹 Removed {len(expired_keys)} expired cache entries")
@@ -182,7 +318,7 @@ class ShipStationCache:
         Получить статистику кэша
         
         Returns:
-            dict: Статистика (hits, misses, hit_rate, size)
+            dict: Статистика (hits, misses, hit_rate, size) и по уровням
         """
         total = self.hits + self.misses
         hit_rate = (self.hits / total * 100) if total > 0 else 0
@@ -191,10 +327,25 @@ class ShipStationCache:
             'hits': self.hits,
             'misses': self.misses,
             'hit_rate': f"{hit_rate:.1f}%",
-            'cache_size': len(self._cache)
+            'cache_size': len(self._cache),
+            'l1': {
+                **self.l1_stats,
+                'entries': len(self._cache),
+                'max_entries': self.max_entries,
+                'bytes': self._bytes,
+                'max_bytes': self.max_bytes
+            },
+            'l2': {
+                **self.l2_stats,
+                'enabled': self._db is not None
+            }
         }
 
 
 # Глобальный инстанс кэша (singleton)
 # Время жизни: 60 минут (тарифы не меняются часто)
-shipstation_cache = ShipStationCache(cache_duration_minutes=60)
+shipstation_cache = ShipStationCache(cache_duration_minutes=60, max_entries=2000, max_bytes=32 * 1024 * 1024)
+
+# Объединение одновременных одинаковых запросов тарифов
+# Ключ: ShipStationCache._generate_cache_key (маршрут + вес + размеры)
+rate_quote_flight = SingleFlight("rate_quotes")
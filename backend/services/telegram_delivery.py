@@ -0,0 +1,180 @@
+"""
+Telegram Media Delivery
+Отправка файлов по file_id с фолбэком на загрузку
+
+Telegram returns a file_id for every uploaded document/photo; sending that
+id again delivers the same file without re-uploading the bytes. Callers
+keep the id (shipping_labels.telegram_file_id, uploaded_images.file_id) and
+pass it here together with a lazy upload source. The id is tried first; the
+source is opened and uploaded only if Telegram rejects the id (expired,
+foreign bot, corrupted), and the fresh id is returned so the caller can
+store it.
+"""
+import asyncio
+import inspect
+import logging
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+import telegram.error
+
+logger = logging.getLogger(__name__)
+
+# BadRequest messages Telegram uses for an unusable file_id
+FILE_ID_ERROR_MARKERS = (
+    'wrong file identifier',
+    'wrong remote file identifier',
+    'file reference',
+    'wrong padding',
+    'invalid file id',
+    'file_id',
+    'wrong type of the web page content',
+    'failed to get http url content',
+)
+
+MEDIA_METHODS = {
+    'document': 'send_document',
+    'photo': 'send_photo',
+}
+
+
+def is_file_id_rejected(error: Exception) -> bool:
+    """True if Telegram refused the file_id itself (not the chat or the caption)"""
+    if not isinstance(error, telegram.error.BadRequest):
+        return False
+    message = str(error).lower()
+    return any(marker in message for marker in FILE_ID_ERROR_MARKERS)
+
+
+def extract_file_id(message, media: str) -> Optional[str]:
+    """file_id of the document / largest photo size in a sent message"""
+    if message is None:
+        return None
+    if media == 'photo':
+        photos = getattr(message, 'photo', None)
+        return photos[-1].file_id if photos else None
+    attachment = getattr(message, media, None)
+    return getattr(attachment, 'file_id', None)
+
+
+class TelegramDelivery:
+    """
+    Слой доставки медиа: сначала file_id, загрузка только при отказе
+
+    Usage:
+        message, file_id = await telegram_delivery.send_document(
+            bot, chat_id,
+            file_id=label.get('telegram_file_id'),
+            upload=lambda: open(path, 'rb'),
+            filename='label.pdf'
+        )
+    """
+
+    def __init__(self, timeout: float = 30.0):
+        """
+        Args:
+            timeout: Таймаут одного вызова Telegram API (секунды)
+        """
+        self.timeout = timeout
+        self.reused = 0
+        self.uploads = 0
+        self.rejected = 0
+        self.upload_failures = 0
+
+    async def send_media(
+        self,
+        bot,
+        media: str,
+        chat_id: int,
+        file_id: Optional[str] = None,
+        upload: Optional[Callable[[], Any]] = None,
+        call_wrapper: Optional[Callable[[Awaitable], Awaitable]] = None,
+        **kwargs
+    ) -> Tuple[Any, Optional[str]]:
+        """
+        Send document/photo by file_id, uploading from source if needed
+
+        Args:
+            bot: Telegram bot instance
+            media: 'document' or 'photo'
+            chat_id: Recipient chat
+            file_id: Known Telegram file_id (tried first)
+            upload: Zero-arg callable (sync or async) returning a file object,
+                bytes or URL; called only when an upload is needed
+            call_wrapper: Wrapper for the upload call (e.g. safe_telegram_call)
+            **kwargs: Passed to bot.send_* (caption, filename, ...)
+
+        Returns:
+            (message, file_id) - file_id is the one to store for next time
+
+        Raises:
+            telegram.error.TelegramError: file_id attempt failed for a
+                reason other than the id, or no upload source was given
+        """
+        send = getattr(bot, MEDIA_METHODS[media])
+
+        if file_id:
+            try:
+                message = await asyncio.wait_for(
+                    send(chat_id=chat_id, **{media: file_id}, **kwargs),
+                    timeout=self.timeout
+                )
+                self.reused += 1
+                return message, file_id
+            except telegram.error.BadRequest as e:
+                if upload is None or not is_file_id_rejected(e):
+                    raise
+                self.rejected += 1
+                logger.warning(f"♻️ Telegram rejected cached file_id ({e}), re-uploading {media}")
+
+        if upload is None:
+            raise ValueError(f"No file_id or upload source for {media}")
+
+        source = upload()
+        if inspect.isawaitable(source):
+            source = await source
+
+        try:
+            call = send(chat_id=chat_id, **{media: source}, **kwargs)
+            if call_wrapper is not None:
+                message = await call_wrapper(call)
+            else:
+                message = await asyncio.wait_for(call, timeout=self.timeout)
+        finally:
+            if hasattr(source, 'close'):
+                source.close()
+
+        new_file_id = extract_file_id(message, media)
+        if new_file_id:
+            self.uploads += 1
+            logger.info(f"📤 {media} uploaded to Telegram, file_id cached")
+        else:
+            self.upload_failures += 1
+        return message, new_file_id
+
+    async def send_document(self, bot, chat_id: int, **kwargs) -> Tuple[Any, Optional[str]]:
+        return await self.send_media(bot, 'document', chat_id, **kwargs)
+
+    async def send_photo(self, bot, chat_id: int, **kwargs) -> Tuple[Any, Optional[str]]:
+        return await self.send_media(bot, 'photo', chat_id, **kwargs)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        Получить статистику доставки
+
+        Returns:
+            dict: отправки по file_id, загрузки, отказы Telegram по file_id
+        """
+        total = self.reused + self.uploads
+        reuse_rate = (self.reused / total * 100) if total > 0 else 0
+
+        return {
+            'sent_by_file_id': self.reused,
+            'uploads': self.uploads,
+            'reuse_rate': f"{reuse_rate:.1f}%",
+            'file_id_rejected': self.rejected,
+            'upload_failures': self.upload_failures,
+        }
+
+
+# Глобальный инстанс (singleton)
+telegram_delivery = TelegramDelivery(timeout=30.0)
@@ -0,0 +1,413 @@
+"""
+Telegram Send Scheduler
+Единый планировщик исходящих запросов к Telegram (token buckets + приоритеты)
+
+Plugged into PTB as the application's rate limiter
+(Application.builder().rate_limiter(send_scheduler)), so every
+bot.send_* / edit_* / copy_* / forward_* call of the application's ExtBot
+goes through it - handlers, label delivery, admin notifications and
+broadcasts alike. Other endpoints (answerCallbackQuery, getFile,
+setWebhook, ...) are not throttled.
+
+- global token bucket: global_rate messages/sec for the whole bot
+  (Telegram allows ~30/s)
+- per-chat buckets: chat_rate/sec in private chats (Telegram: ~1/s, short
+  bursts are fine), group_rate in groups and channels (20/min)
+- priority classes, strict order: INTERACTIVE (replies to the user) >
+  LABEL (label delivery) > ADMIN (admin notifications) > BROADCAST.
+  A free global token always goes to the highest waiting class, so a
+  running broadcast never delays live users. A request whose chat bucket
+  is empty does not block requests for other chats.
+- 429 RetryAfter: only the affected bucket is paused (the chat's bucket,
+  or the global one for requests without chat_id) and the request is
+  re-sent up to max_retries times
+
+The priority comes from the calling context:
+
+    with send_priority(SendPriority.BROADCAST):
+        for user in users:
+            await bot.send_message(...)
+
+or per call: bot.send_message(..., rate_limit_args={'priority': SendPriority.ADMIN}).
+Without either, a request is INTERACTIVE.
+"""
+import asyncio
+import logging
+import time
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import timedelta
+from enum import IntEnum
+from typing import Any, Callable, Coroutine, Dict, Iterator, Optional
+
+from telegram.error import RetryAfter
+from telegram.ext import BaseRateLimiter
+
+from config.performance_config import BotPerformanceConfig
+from utils.order_card import order_call_meter
+
+logger = logging.getLogger(__name__)
+
+# Bot API methods that count against Telegram's message limits
+THROTTLED_ENDPOINT_PREFIXES = ('send', 'editMessage', 'copyMessage', 'forwardMessage')
+# send* methods that do not post a message ("typing..." status)
+UNTHROTTLED_SEND_ENDPOINTS = frozenset({'sendChatAction'})
+
+
+def is_throttled_endpoint(endpoint: str) -> bool:
+    """True if the Bot API method posts or edits a chat message"""
+    return endpoint.startswith(THROTTLED_ENDPOINT_PREFIXES) and endpoint not in UNTHROTTLED_SEND_ENDPOINTS
+
+
+class SendPriority(IntEnum):
+    """Классы приоритета (меньше = важнее)"""
+    INTERACTIVE = 0
+    LABEL = 1
+    ADMIN = 2
+    BROADCAST = 3
+
+
+_current_priority: ContextVar[SendPriority] = ContextVar(
+    'telegram_send_priority', default=SendPriority.INTERACTIVE
+)
+
+
+@contextmanager
+def send_priority(priority: SendPriority) -> Iterator[None]:
+    """Send every Telegram request made inside the block with this priority"""
+    token = _current_priority.set(priority)
+    try:
+        yield
+    finally:
+        _current_priority.reset(token)
+
+
+def _percentile(values, pct: float) -> Optional[float]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return round(ordered[index], 1)
+
+
+def _retry_after_seconds(error: RetryAfter) -> float:
+    # PTB keeps a timedelta; the public attribute is int or timedelta by version
+    value = getattr(error, '_retry_after', None)
+    if value is None:
+        value = error.retry_after
+    return value.total_seconds() if isinstance(value, timedelta) else float(value)
+
+
+def _is_group(chat_id: Any) -> bool:
+    # Negative ids are groups/channels; '@username' only works for channels
+    try:
+        return int(chat_id) < 0
+    except (TypeError, ValueError):
+        return True
+
+
+class TokenBucket:
+    """Token bucket with an optional pause (after 429 RetryAfter)"""
+
+    __slots__ = ('rate', 'capacity', 'tokens', 'updated', 'paused_until')
+
+    def __init__(self, rate: float, capacity: float, now: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = now
+        self.paused_until = 0.0
+
+    def _refill(self, now: float) -> None:
+        if now > self.updated:
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+
+    def ready_at(self, now: float) -> float:
+        """Monotonic time at which one token is available"""
+        if self.paused_until > now:
+            return self.paused_until
+        self._refill(now)
+        if self.tokens >= 1:
+            return now
+        return now + (1 - self.tokens) / self.rate
+
+    def take(self, now: float) -> None:
+        self._refill(now)
+        self.tokens -= 1
+
+    def pause(self, until: float) -> None:
+        """No sends before `until`, then one message and the normal rate"""
+        self.paused_until = max(self.paused_until, until)
+        self.tokens = 1
+        self.updated = self.paused_until
+
+    def is_idle(self, now: float) -> bool:
+        self._refill(now)
+        return self.tokens >= self.capacity and self.paused_until <= now
+
+
+class _Ticket:
+    __slots__ = ('priority', 'chat_id', 'future', 'enqueued')
+
+    def __init__(self, priority: SendPriority, chat_id: Any, future: asyncio.Future):
+        self.priority = priority
+        self.chat_id = chat_id
+        self.future = future
+        self.enqueued = time.monotonic()
+
+
+class TelegramSendScheduler(BaseRateLimiter[Dict[str, Any]]):
+    """
+    Rate limiter ExtBot: глобальный и per-chat token bucket, приоритеты
+
+    Usage:
+        Application.builder().token(TOKEN).rate_limiter(send_scheduler).build()
+    """
+
+    def __init__(self,
+                 global_rate: float = 25.0,
+                 global_burst: float = 5,
+                 chat_rate: float = 1.0,
+                 chat_burst: float = 3,
+                 group_rate: float = 20 / 60,
+                 group_burst: float = 3,
+                 max_retries: int = 2,
+                 max_chat_buckets: int = 10000):
+        """
+        Args:
+            global_rate: Сообщений в секунду на весь бот
+            global_burst: Емкость глобального bucket
+            chat_rate: Сообщений в секунду в личный чат
+            chat_burst: Емкость bucket личного чата
+            group_rate: Сообщений в секунду в группу/канал
+            group_burst: Емкость bucket группы
+            max_retries: Повторов после 429 RetryAfter
+            max_chat_buckets: Порог очистки неактивных bucket'ов чатов
+        """
+        self.global_rate = global_rate
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.group_rate = group_rate
+        self.group_burst = group_burst
+        self.max_retries = max_retries
+        self.max_chat_buckets = max_chat_buckets
+
+        self._global = TokenBucket(global_rate, global_burst, time.monotonic())
+        self._chats: Dict[Any, TokenBucket] = {}
+        self._queues: Dict[SendPriority, deque] = {p: deque() for p in SendPriority}
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+        self.sent = {p: 0 for p in SendPriority}
+        self._wait_ms = {p: deque(maxlen=1000) for p in SendPriority}
+        self.unthrottled = 0
+        self.chat_pauses = 0
+        self.global_pauses = 0
+        self.retries_exhausted = 0
+
+    # ==================== BaseRateLimiter ====================
+
+    async def initialize(self) -> None:
+        """Called by Bot.initialize()"""
+        self._ensure_dispatcher()
+
+    async def shutdown(self) -> None:
+        """Called by Bot.shutdown(): stop the dispatcher, let waiting requests through"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        for queue in self._queues.values():
+            while queue:
+                ticket = queue.popleft()
+                if not ticket.future.done():
+                    ticket.future.set_result(None)
+
+    async def process_request(
+        self,
+        callback: Callable[..., Coroutine[Any, Any, Any]],
+        args: Any,
+        kwargs: Dict[str, Any],
+        endpoint: str,
+        data: Dict[str, Any],
+        rate_limit_args: Optional[Dict[str, Any]],
+    ) -> Any:
+        if data:
+            order_call_meter.record(data.get('chat_id'))
+        if not is_throttled_endpoint(endpoint):
+            self.unthrottled += 1
+            return await callback(*args, **kwargs)
+
+        if isinstance(rate_limit_args, dict) and 'priority' in rate_limit_args:
+            priority = SendPriority(rate_limit_args['priority'])
+        else:
+            priority = _current_priority.get()
+        chat_id = data.get('chat_id')
+
+        for attempt in range(self.max_retries + 1):
+            await self._acquire(priority, chat_id)
+            try:
+                return await callback(*args, **kwargs)
+            except RetryAfter as e:
+                delay = _retry_after_seconds(e)
+                self._pause(chat_id, delay)
+                if attempt == self.max_retries:
+                    self.retries_exhausted += 1
+                    raise
+                logger.warning(
+                    f"⏳ Telegram 429 on {endpoint} (chat {chat_id}), "
+                    f"{'chat' if chat_id is not None else 'global'} bucket paused for {delay:.0f}s"
+                )
+
+    # ==================== Scheduling ====================
+
+    def _ensure_dispatcher(self) -> None:
+        loop = asyncio.get_running_loop()
+        if self._task is None or self._task.done() or self._loop is not loop:
+            self._loop = loop
+            self._wakeup = asyncio.Event()
+            self._task = loop.create_task(self._dispatch())
+
+    def _chat_bucket(self, chat_id: Any, now: float) -> TokenBucket:
+        bucket = self._chats.get(chat_id)
+        if bucket is None:
+            if len(self._chats) >= self.max_chat_buckets:
+                self._chats = {cid: b for cid, b in self._chats.items() if not b.is_idle(now)}
+            if _is_group(chat_id):
+                bucket = TokenBucket(self.group_rate, self.group_burst, now)
+            else:
+                bucket = TokenBucket(self.chat_rate, self.chat_burst, now)
+            self._chats[chat_id] = bucket
+        return bucket
+
+    def _ready_at(self, chat_id: Any, now: float) -> float:
+        ready = self._global.ready_at(now)
+        if chat_id is not None:
+            ready = max(ready, self._chat_bucket(chat_id, now).ready_at(now))
+        return ready
+
+    def _take(self, chat_id: Any, now: float) -> None:
+        self._global.take(now)
+        if chat_id is not None:
+            self._chat_bucket(chat_id, now).take(now)
+
+    def _pause(self, chat_id: Any, seconds: float) -> None:
+        until = time.monotonic() + seconds
+        if chat_id is not None:
+            self.chat_pauses += 1
+            self._chat_bucket(chat_id, until).pause(until)
+        else:
+            self.global_pauses += 1
+            self._global.pause(until)
+
+    async def _acquire(self, priority: SendPriority, chat_id: Any) -> None:
+        self._ensure_dispatcher()
+        now = time.monotonic()
+
+        # Fast path: nothing is waiting and both buckets have a token
+        if not any(self._queues.values()) and self._ready_at(chat_id, now) <= now:
+            self._take(chat_id, now)
+            self._record(priority, 0.0)
+            return
+
+        ticket = _Ticket(priority, chat_id, self._loop.create_future())
+        self._queues[priority].append(ticket)
+        self._wakeup.set()
+        await ticket.future
+        self._record(priority, (time.monotonic() - ticket.enqueued) * 1000)
+
+    def _record(self, priority: SendPriority, wait_ms: float) -> None:
+        self.sent[priority] += 1
+        self._wait_ms[priority].append(wait_ms)
+
+    def _grant_ready(self) -> Optional[float]:
+        """
+        Grant every ticket that can be sent now, highest priority first
+
+        Returns:
+            Seconds until the next ticket may become ready (None - nothing waits)
+        """
+        now = time.monotonic()
+        wait = None
+        for priority in SendPriority:
+            queue = self._queues[priority]
+            remaining = deque()
+            while queue:
+                ticket = queue.popleft()
+                if ticket.future.done():  # caller cancelled (timeout)
+                    continue
+                global_at = self._global.ready_at(now)
+                if global_at > now:
+                    # Out of global tokens: keep order, wait for the refill
+                    remaining.append(ticket)
+                    remaining.extend(queue)
+                    queue.clear()
+                    self._queues[priority] = remaining
+                    return global_at - now
+                ready = self._ready_at(ticket.chat_id, now)
+                if ready <= now:
+                    self._take(ticket.chat_id, now)
+                    ticket.future.set_result(None)
+                else:
+                    remaining.append(ticket)
+                    wait = ready - now if wait is None else min(wait, ready - now)
+            self._queues[priority] = remaining
+        return wait
+
+    async def _dispatch(self) -> None:
+        while True:
+            self._wakeup.clear()
+            try:
+                delay = self._grant_ready()
+            except Exception as e:
+                logger.error(f"❌ Send scheduler dispatch error: {e}", exc_info=True)
+                delay = 0.1
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=delay)
+            except asyncio.TimeoutError:
+                pass
+
+    # ==================== Metrics ====================
+
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        Получить статистику планировщика отправки
+
+        Returns:
+            dict: очередь и отправлено по классам, ожидание (p50/p95, мс),
+                  паузы после 429, число bucket'ов чатов
+        """
+        now = time.monotonic()
+        return {
+            'global_rate': self.global_rate,
+            'classes': {
+                priority.name.lower(): {
+                    'queued': len(self._queues[priority]),
+                    'sent': self.sent[priority],
+                    'wait_ms': {
+                        'p50': _percentile(self._wait_ms[priority], 50),
+                        'p95': _percentile(self._wait_ms[priority], 95),
+                    },
+                }
+                for priority in SendPriority
+            },
+            'unthrottled': self.unthrottled,
+            'retry_after': {
+                'chat_pauses': self.chat_pauses,
+                'global_pauses': self.global_pauses,
+                'retries_exhausted': self.retries_exhausted,
+            },
+            'global_paused': self._global.paused_until > now,
+            'paused_chats': sum(1 for b in self._chats.values() if b.paused_until > now),
+            'chat_buckets': len(self._chats),
+        }
+
+
+# Глобальный инстанс (singleton)
+send_scheduler = TelegramSendScheduler(**BotPerformanceConfig.get_send_scheduler_config())
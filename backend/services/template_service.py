@@ -196,6 +196,37 @@ async def delete_template(
         return False, None, str(e)
 
 
+async def prevalidate_template(
+    template_id: str,
+    order_data: Dict[str, Any],
+    update_template_func
+) -> Dict[str, Optional[str]]:
+    """
+    Store pre-validated address fingerprints on a template
+    
+    Orders started from the template skip address validation while
+    the addresses still match these fingerprints.
+    
+    Args:
+        template_id: Template ID
+        order_data: Order data the template was saved from
+        update_template_func: Function to update template
+    
+    Returns:
+        {'from_address_fingerprint': ..., 'to_address_fingerprint': ...}
+    """
+    from services.api_services import prevalidate_template_addresses
+    
+    try:
+        fingerprints = await prevalidate_template_addresses(order_data)
+        await update_template_func(template_id, fingerprints)
+        logger.info(f"✅ Template addresses pre-validated: id={template_id}, {fingerprints}")
+        return fingerprints
+    except Exception as e:
+        logger.warning(f"⚠️ Template pre-validation failed: {e}")
+        return {}
+
+
 # ============================================================
 # TEMPLATE USAGE
 # ============================================================
@@ -245,6 +276,10 @@ async def load_template_to_context(
         context.user_data['to_zip'] = template.get('to_zip', '')
         context.user_data['to_phone'] = template.get('to_phone', '')
         
+        # Pre-validated addresses skip validation (see prevalidate_template)
+        context.user_data['from_address_fingerprint'] = template.get('from_address_fingerprint')
+        context.user_data['to_address_fingerprint'] = template.get('to_address_fingerprint')
+        
         context.user_data['weight'] = template.get('weight', '')
         context.user_data['length'] = template.get('length', '10')
         context.user_data['width'] = template.get('width', '10')
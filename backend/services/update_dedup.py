@@ -0,0 +1,136 @@
+"""
+Telegram Update Deduplication
+Защита от повторной доставки одного update_id (webhook redelivery)
+
+Telegram redelivers an update when the webhook answers slowly or with an
+error. A redelivered callback must not run process_payment or
+create_and_send_label a second time, so the webhook checks update_id
+before the update reaches any handler.
+
+- L1: fixed-size ring of the last ring_size update_ids + a set for O(1)
+  membership; the oldest id is evicted when the ring is full
+- L2 (shared mode, several workers): insert into processed_updates with
+  _id = update_id; the unique _id rejects a second insert from any worker.
+  A TTL index removes entries after ttl_seconds. If MongoDB is
+  unavailable the check fails open (L1 only).
+"""
+import logging
+from collections import deque
+from datetime import datetime, timezone, timedelta
+from typing import Any, Dict
+
+from pymongo.errors import DuplicateKeyError
+
+from config.performance_config import BotPerformanceConfig
+
+logger = logging.getLogger(__name__)
+
+
+class UpdateDeduplicator:
+    """
+    Кольцевой буфер update_id + общий MongoDB индекс
+
+    Usage:
+        if await update_dedup.check_and_mark(update_id):
+            return {"ok": True}   # duplicate, already queued
+    """
+
+    def __init__(self, ring_size: int = 10000, ttl_seconds: int = 600, shared: bool = False):
+        """
+        Args:
+            ring_size: Сколько последних update_id помнить в процессе
+            ttl_seconds: Время жизни записи в processed_updates
+            shared: Проверять update_id в MongoDB (несколько воркеров)
+        """
+        self.ring_size = ring_size
+        self.ttl = timedelta(seconds=ttl_seconds)
+        self.shared = shared
+        self._ring = deque()
+        self._seen = set()
+        self._db = None
+        self.checked = 0
+        self.duplicates = 0
+        self.shared_duplicates = 0
+        self.shared_errors = 0
+
+    async def attach_db(self, db) -> None:
+        """Подключить MongoDB (processed_updates) и создать TTL индекс"""
+        self._db = db
+        try:
+            await db.processed_updates.create_index("expires_at", expireAfterSeconds=0)
+            logger.info("✅ Update dedup L2 attached (processed_updates, TTL index)")
+        except Exception as e:
+            logger.warning(f"⚠️ processed_updates TTL index creation skipped: {e}")
+
+    def _remember(self, update_id: int) -> None:
+        if len(self._ring) >= self.ring_size:
+            self._seen.discard(self._ring.popleft())
+        self._ring.append(update_id)
+        self._seen.add(update_id)
+
+    async def check_and_mark(self, update_id: int) -> bool:
+        """
+        Mark update_id as seen
+
+        Returns:
+            bool: True if the update was already seen (duplicate)
+        """
+        self.checked += 1
+        if update_id in self._seen:
+            self.duplicates += 1
+            logger.info(f"🔁 Duplicate update {update_id} skipped")
+            return True
+        self._remember(update_id)
+
+        if self.shared and self._db is not None:
+            try:
+                await self._db.processed_updates.insert_one({
+                    '_id': update_id,
+                    'expires_at': datetime.now(timezone.utc) + self.ttl,
+                })
+            except DuplicateKeyError:
+                self.duplicates += 1
+                self.shared_duplicates += 1
+                logger.info(f"🔁 Duplicate update {update_id} skipped (seen by another worker)")
+                return True
+            except Exception as e:
+                self.shared_errors += 1
+                logger.warning(f"⚠️ processed_updates check failed, using local ring only: {e}")
+        return False
+
+    async def forget(self, update_id: int) -> None:
+        """Unmark an update that was not accepted (503), so its redelivery is processed"""
+        if update_id in self._seen:
+            self._seen.discard(update_id)
+            # Drop it from the ring too: a stale copy would later evict the
+            # redelivered id from _seen. Usually it is the newest entry.
+            if self._ring[-1] == update_id:
+                self._ring.pop()
+            else:
+                self._ring.remove(update_id)
+        if self.shared and self._db is not None:
+            try:
+                await self._db.processed_updates.delete_one({'_id': update_id})
+            except Exception as e:
+                logger.warning(f"⚠️ processed_updates unmark failed for {update_id}: {e}")
+
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        Получить статистику дедупликации апдейтов
+
+        Returns:
+            dict: проверено, дубликаты (всего / найдено в MongoDB), размер кольца
+        """
+        return {
+            'shared': self.shared,
+            'ring_size': self.ring_size,
+            'ring_used': len(self._seen),
+            'checked': self.checked,
+            'duplicates': self.duplicates,
+            'shared_duplicates': self.shared_duplicates,
+            'shared_errors': self.shared_errors,
+        }
+
+
+# Глобальный инстанс (singleton)
+update_dedup = UpdateDeduplicator(**BotPerformanceConfig.get_update_dedup_config())
@@ -0,0 +1,338 @@
+"""
+Telegram Update Queue
+Быстрый ответ на webhook + упорядоченная обработка апдейтов по чатам
+
+The webhook validates the update, puts it into a bounded in-process queue
+and returns 200 at once, so a slow handler (label purchase, rate quotes)
+no longer holds Telegram's webhook connection open.
+
+The queue is sharded into lanes by chat_id (hash(chat_id) % lanes), one
+worker per lane:
+
+- updates of one chat are processed strictly in order, so two quick taps
+  never run handlers concurrently against the same user_data / session
+- different chats land on different lanes and run in parallel
+- bounded: each lane holds lane_size updates; when a lane is full,
+  submit() returns False and the webhook answers 503 + Retry-After -
+  Telegram redelivers the update later instead of the process growing
+  an unbounded number of tasks. One flooding chat only fills its lane.
+- supervised: a worker that dies is restarted; a handler error only
+  fails its own update
+- polling mode: LaneUpdateProcessor plugs the same lanes into PTB's
+  update fetcher (Application.builder().concurrent_updates(...))
+- lanes only serialize a chat if its handlers block: a handler (or
+  ConversationHandler) with block=False is scheduled as a task and the
+  next update of the chat starts before it finishes. There is no click
+  debounce any more, so start() warns about such handlers.
+- persistence hooks: if the application's persistence has
+  load_for_update / after_update (utils/mongodb_persistence.py), the lane
+  worker loads the user's state before the handlers and lets it persist
+  after them
+- on shutdown the queue stops accepting and drains for a few seconds;
+  undrained updates are lost (Telegram already got 200 for them)
+"""
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import Any, Awaitable, Dict, List, Optional
+
+from telegram.ext import BaseUpdateProcessor, ConversationHandler
+
+from config.performance_config import BotPerformanceConfig
+
+logger = logging.getLogger(__name__)
+
+
+def _percentile(values, pct: float) -> Optional[float]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return round(ordered[index], 1)
+
+
+def update_shard_key(update) -> int:
+    """chat_id of the update (user id / update_id when there is no chat)"""
+    chat = getattr(update, 'effective_chat', None)
+    if chat is not None:
+        return chat.id
+    user = getattr(update, 'effective_user', None)
+    if user is not None:
+        return user.id
+    return getattr(update, 'update_id', 0) or 0
+
+
+def non_blocking_handlers(application) -> List[str]:
+    """Names of registered handlers with block=False (incl. inside conversations)"""
+    found = []
+
+    def visit(handler, owner=''):
+        name = getattr(handler, 'name', None) or type(handler).__name__
+        # ConversationHandler.block is always True; its own block= setting is
+        # kept in _block and applies to the state handlers it runs
+        block = handler._block if isinstance(handler, ConversationHandler) else getattr(handler, 'block', True)
+        if block is False:
+            found.append(f"{owner}{name}")
+        for child in (
+            list(getattr(handler, 'entry_points', None) or [])
+            + [h for hs in (getattr(handler, 'states', None) or {}).values() for h in hs]
+            + list(getattr(handler, 'fallbacks', None) or [])
+        ):
+            visit(child, f"{owner}{name}/")
+
+    for handlers in (getattr(application, 'handlers', None) or {}).values():
+        for handler in handlers:
+            visit(handler)
+    return found
+
+
+class TelegramUpdateQueue:
+    """
+    Очередь апдейтов Telegram, шардированная по чатам (lane = воркер)
+
+    Usage:
+        await update_queue.start(application)      # after application.start()
+        if not update_queue.submit(update):
+            ...  # 503, Retry-After: update_queue.retry_after_seconds
+    """
+
+    def __init__(self,
+                 lanes: int = 32,
+                 lane_size: int = 100,
+                 retry_after_seconds: int = 5,
+                 drain_timeout_seconds: float = 5.0):
+        """
+        Args:
+            lanes: Число полос (воркеров); апдейты одного чата - в одной полосе
+            lane_size: Емкость одной полосы (при переполнении - 503)
+            retry_after_seconds: Retry-After для Telegram при переполнении
+            drain_timeout_seconds: Сколько ждать дообработки при остановке
+        """
+        self.lanes = lanes
+        self.lane_size = lane_size
+        self.retry_after_seconds = retry_after_seconds
+        self.drain_timeout = drain_timeout_seconds
+        self._lanes: List[asyncio.Queue] = []
+        self._application = None
+        self._load_state = None
+        self._save_state = None
+        self._tasks: Dict[int, asyncio.Task] = {}
+        self._running = False
+        self.accepted = 0
+        self.rejected = 0
+        self.processed = 0
+        self.failed = 0
+        self.worker_restarts = 0
+        self.max_depth = 0
+        self.max_lane_depth = 0
+        self._wait_ms = deque(maxlen=1000)      # submit → lane worker picks it up
+        self._process_ms = deque(maxlen=1000)   # handler duration
+
+    # ==================== LIFECYCLE ====================
+
+    @property
+    def running(self) -> bool:
+        return self._running
+
+    @property
+    def max_size(self) -> int:
+        return self.lanes * self.lane_size
+
+    async def start(self, application) -> None:
+        """Start one worker per lane for the PTB application"""
+        if self._running:
+            return
+        self._application = application
+        persistence = getattr(application, 'persistence', None)
+        self._load_state = getattr(persistence, 'load_for_update', None)
+        self._save_state = getattr(persistence, 'after_update', None)
+        non_blocking = non_blocking_handlers(application)
+        if non_blocking:
+            logger.warning(
+                f"⚠️ Handlers with block=False bypass lane ordering (double taps run concurrently): "
+                f"{', '.join(non_blocking)}"
+            )
+        self._lanes = [asyncio.Queue(maxsize=self.lane_size) for _ in range(self.lanes)]
+        self._running = True
+        for n in range(self.lanes):
+            self._spawn(n)
+        logger.info(f"✅ Telegram update queue started: {self.lanes} lanes x {self.lane_size} updates")
+
+    async def stop(self) -> None:
+        """Stop accepting updates, drain briefly, cancel workers"""
+        if not self._running:
+            return
+        self._running = False
+        if self.depth():
+            try:
+                await asyncio.wait_for(
+                    asyncio.gather(*(lane.join() for lane in self._lanes)),
+                    timeout=self.drain_timeout
+                )
+            except asyncio.TimeoutError:
+                logger.warning(f"⚠️ Update queue stopped with {self.depth()} undrained updates")
+        tasks = list(self._tasks.values())
+        self._tasks = {}
+        for task in tasks:
+            task.cancel()
+        for task in tasks:
+            try:
+                await task
+            except (asyncio.CancelledError, Exception):
+                pass
+
+    def _spawn(self, n: int) -> None:
+        task = asyncio.create_task(self._worker(n))
+        task.add_done_callback(lambda t, n=n: self._on_worker_exit(n, t))
+        self._tasks[n] = task
+
+    def _on_worker_exit(self, n: int, task: asyncio.Task) -> None:
+        """Supervisor: restart a lane worker that exited while the queue is running"""
+        if not self._running or task.cancelled() or self._tasks.get(n) is not task:
+            return
+        logger.error(f"❌ Update lane {n} worker exited: {task.exception()!r}, restarting")
+        self.worker_restarts += 1
+        self._spawn(n)
+
+    # ==================== PRODUCERS ====================
+
+    def lane_for(self, update) -> int:
+        return update_shard_key(update) % self.lanes
+
+    def _track_depth(self, lane: asyncio.Queue) -> None:
+        self.accepted += 1
+        self.max_lane_depth = max(self.max_lane_depth, lane.qsize())
+        self.max_depth = max(self.max_depth, self.depth())
+
+    def submit(self, update) -> bool:
+        """
+        Put update into its chat's lane without waiting (webhook)
+
+        Returns:
+            bool: False if the lane is full or the queue is not running (answer 503)
+        """
+        if not self._running:
+            return False
+        lane = self._lanes[self.lane_for(update)]
+        try:
+            lane.put_nowait((time.perf_counter(), update, None, None))
+        except asyncio.QueueFull:
+            self.rejected += 1
+            logger.warning(f"🚦 Update lane {self.lane_for(update)} full ({self.lane_size}), asking Telegram to retry")
+            return False
+        self._track_depth(lane)
+        return True
+
+    async def run_in_lane(self, update, coroutine: Awaitable) -> None:
+        """
+        Run a handler coroutine in the update's lane and wait for it (polling)
+
+        Waits for room instead of rejecting: polling has no redelivery.
+        """
+        if not self._running:
+            await coroutine
+            return
+        done = asyncio.get_running_loop().create_future()
+        lane = self._lanes[self.lane_for(update)]
+        await lane.put((time.perf_counter(), update, coroutine, done))
+        self._track_depth(lane)
+        await done
+
+    # ==================== WORKERS ====================
+
+    async def _worker(self, n: int) -> None:
+        lane = self._lanes[n]
+        while True:
+            enqueued_at, update, coroutine, done = await lane.get()
+            started = time.perf_counter()
+            self._wait_ms.append((started - enqueued_at) * 1000)
+            try:
+                await self._load(update)
+                await (coroutine if coroutine is not None else self._application.process_update(update))
+                self.processed += 1
+                if self._save_state is not None:
+                    await self._save_state(self._application, update)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.failed += 1
+                logger.error(f"❌ Update {getattr(update, 'update_id', '?')} failed in lane {n}: {e}", exc_info=True)
+            finally:
+                self._process_ms.append((time.perf_counter() - started) * 1000)
+                lane.task_done()
+                if done is not None and not done.done():
+                    done.set_result(None)
+
+    async def _load(self, update) -> None:
+        if self._load_state is None:
+            return
+        try:
+            await self._load_state(self._application, update)
+        except Exception as e:
+            logger.error(f"❌ Could not load state for update {getattr(update, 'update_id', '?')}: {e}")
+
+    # ==================== METRICS ====================
+
+    def depth(self) -> int:
+        return sum(lane.qsize() for lane in self._lanes)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        Получить статистику очереди апдейтов
+
+        Returns:
+            dict: глубина (всего и по полосам), счетчики,
+                  ожидание в очереди и обработка (p50/p95, мс)
+        """
+        lane_depths = [lane.qsize() for lane in self._lanes]
+        return {
+            'running': self._running,
+            'lanes': self.lanes,
+            'lane_size': self.lane_size,
+            'workers': sum(1 for task in self._tasks.values() if not task.done()),
+            'depth': sum(lane_depths),
+            'busiest_lane_depth': max(lane_depths, default=0),
+            'busy_lanes': sum(1 for depth in lane_depths if depth),
+            'max_depth': self.max_depth,
+            'max_lane_depth': self.max_lane_depth,
+            'accepted': self.accepted,
+            'rejected': self.rejected,
+            'processed': self.processed,
+            'failed': self.failed,
+            'worker_restarts': self.worker_restarts,
+            'queue_wait_ms': {
+                'p50': _percentile(self._wait_ms, 50),
+                'p95': _percentile(self._wait_ms, 95),
+            },
+            'process_ms': {
+                'p50': _percentile(self._process_ms, 50),
+                'p95': _percentile(self._process_ms, 95),
+            },
+        }
+
+
+class LaneUpdateProcessor(BaseUpdateProcessor):
+    """
+    PTB update processor for polling mode: runs each update in its chat's lane
+
+    Usage:
+        Application.builder().concurrent_updates(LaneUpdateProcessor(update_queue))
+    """
+
+    def __init__(self, queue: TelegramUpdateQueue):
+        super().__init__(max_concurrent_updates=queue.max_size)
+        self._queue = queue
+
+    async def do_process_update(self, update, coroutine) -> None:
+        await self._queue.run_in_lane(update, coroutine)
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        pass
+
+
+# Глобальный инстанс (singleton)
+update_queue = TelegramUpdateQueue(**BotPerformanceConfig.get_update_queue_config())
@@ -0,0 +1,305 @@
+"""
+Offline US ZIP Code Database
+ZIP → город/штат без обращения к внешним API
+
+Two layers:
+- ZIP5 → (city, state) from a memory-mapped binary file (data/us_zips.bin,
+  built by scripts/build_zip_db.py). The file holds a direct-indexed array
+  of 100000 uint32 slots, so a lookup is one offset read and loading is a
+  single mmap() call.
+- ZIP3 prefix → state table compiled into this module, used when the ZIP
+  is not in the data file (or the file is absent). Prefixes cross state
+  lines (83414 Alta WY, 42223 Fort Campbell KY/TN), so a prefix mismatch
+  is only a warning; only a ZIP found in the data file is rejected.
+
+File layout (little-endian):
+    header   '<8sIII'  magic, n_places, strings_len, reserved
+    index    100000 x uint32   place number + 1 (0 = unknown ZIP)
+    places   n_places x '<IB2s' city offset, city length, state
+    strings  UTF-8 city names
+"""
+import logging
+import mmap
+import os
+import re
+import struct
+import time
+from typing import Dict, Any, Iterable, NamedTuple, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b'USZIPDB1'
+HEADER = struct.Struct('<8sIII')
+SLOT = struct.Struct('<I')
+PLACE = struct.Struct('<IB2s')
+ZIP_SLOTS = 100000
+
+DEFAULT_PATH = os.environ.get(
+    'ZIP_DB_PATH',
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data', 'us_zips.bin')
+)
+
+_ZIP_RE = re.compile(r'^(\d{5})(?:-?\d{4})?$')
+
+# USPS ZIP3 prefix ranges → state(s); military (AA/AE/AP) and unassigned
+# prefixes are left out, so they are never rejected.
+ZIP3_STATE_RANGES = [
+    (5, 5, ('NY',)), (6, 7, ('PR',)), (8, 8, ('VI',)), (9, 9, ('PR',)),
+    (10, 27, ('MA',)), (28, 29, ('RI',)), (30, 38, ('NH',)), (39, 49, ('ME',)),
+    (50, 54, ('VT',)), (55, 55, ('MA',)), (56, 59, ('VT',)), (60, 69, ('CT',)),
+    (70, 89, ('NJ',)), (100, 149, ('NY',)), (150, 196, ('PA',)), (197, 199, ('DE',)),
+    (200, 200, ('DC',)), (201, 201, ('VA',)), (202, 205, ('DC',)), (206, 219, ('MD',)),
+    (220, 246, ('VA',)), (247, 268, ('WV',)), (270, 289, ('NC',)), (290, 299, ('SC',)),
+    (300, 319, ('GA',)), (320, 339, ('FL',)), (341, 349, ('FL',)), (350, 369, ('AL',)),
+    (370, 385, ('TN',)), (386, 397, ('MS',)), (398, 399, ('GA',)), (400, 427, ('KY',)),
+    (430, 459, ('OH',)), (460, 479, ('IN',)), (480, 499, ('MI',)), (500, 528, ('IA',)),
+    (530, 549, ('WI',)), (550, 567, ('MN',)), (569, 569, ('DC',)), (570, 577, ('SD',)),
+    (580, 588, ('ND',)), (590, 599, ('MT',)), (600, 629, ('IL',)), (630, 658, ('MO',)),
+    (660, 679, ('KS',)), (680, 693, ('NE',)), (700, 714, ('LA',)), (716, 729, ('AR',)),
+    (730, 732, ('OK',)), (733, 733, ('TX',)), (734, 749, ('OK',)), (750, 799, ('TX',)),
+    (800, 816, ('CO',)), (820, 831, ('WY',)), (832, 838, ('ID',)), (840, 847, ('UT',)),
+    (850, 865, ('AZ',)), (870, 884, ('NM',)), (885, 885, ('TX',)), (889, 898, ('NV',)),
+    (900, 961, ('CA',)), (967, 968, ('HI',)), (969, 969, ('GU', 'MP', 'AS')),
+    (970, 979, ('OR',)), (980, 994, ('WA',)), (995, 999, ('AK',)),
+]
+
+
+def _compile_zip3_table():
+    table = [None] * 1000
+    for start, end, states in ZIP3_STATE_RANGES:
+        for prefix in range(start, end + 1):
+            table[prefix] = states
+    return table
+
+
+_ZIP3_STATES = _compile_zip3_table()
+
+
+class ZipInfo(NamedTuple):
+    zip_code: str
+    city: str
+    state: str
+
+
+def normalize_zip(zip_code: str) -> Optional[str]:
+    """Return 5-digit ZIP for '12345', '12345-6789' or '123456789', else None"""
+    if not zip_code:
+        return None
+    match = _ZIP_RE.match(str(zip_code).strip())
+    return match.group(1) if match else None
+
+
+def _normalize_city(city: str) -> str:
+    city = re.sub(r'[^a-z ]', '', (city or '').lower())
+    city = re.sub(r'^(saint|st) ', 'st ', city)
+    city = re.sub(r'^(fort|ft) ', 'ft ', city)
+    return ' '.join(city.split())
+
+
+def build_zip_db(rows: Iterable[Tuple[str, str, str]], path: str) -> int:
+    """
+    Write binary ZIP database
+
+    Args:
+        rows: (zip, city, state) tuples; first row wins for a duplicate ZIP
+        path: Output file
+
+    Returns:
+        int: Number of ZIP codes written
+    """
+    index = [0] * ZIP_SLOTS
+    places: Dict[Tuple[str, str], int] = {}
+    place_records = []
+    strings = bytearray()
+    count = 0
+
+    for zip_code, city, state in rows:
+        zip5 = normalize_zip(zip_code)
+        state = (state or '').strip().upper()
+        city = (city or '').strip()
+        if not zip5 or len(state) != 2 or not city or index[int(zip5)]:
+            continue
+
+        place_key = (city, state)
+        if place_key not in places:
+            encoded = city.encode('utf-8')[:255]
+            place_records.append(PLACE.pack(len(strings), len(encoded), state.encode('ascii')))
+            strings.extend(encoded)
+            places[place_key] = len(place_records)
+        index[int(zip5)] = places[place_key]
+        count += 1
+
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, len(place_records), len(strings), 0))
+        f.write(struct.pack(f'<{ZIP_SLOTS}I', *index))
+        f.write(b''.join(place_records))
+        f.write(bytes(strings))
+    os.replace(tmp_path, path)
+    return count
+
+
+class ZipDatabase:
+    """
+    Офлайн база ZIP кодов США
+
+    Usage:
+        info = zip_db.lookup('94102')           # ZipInfo or None
+        ok, error = zip_db.validate('CA', '10001')
+    """
+
+    def __init__(self, path: str = DEFAULT_PATH):
+        self.path = path
+        self._mm: Optional[mmap.mmap] = None
+        self._n_places = 0
+        self._places_offset = 0
+        self._strings_offset = 0
+        self._load_attempted = False
+        self.load_ms = None
+        self.lookups = 0
+        self.found = 0
+        self.rejected = 0
+        self.warned = 0
+
+    def load(self) -> bool:
+        """Map data file into memory; False if it is missing or invalid"""
+        self._load_attempted = True
+        if self._mm is not None:
+            return True
+        if not os.path.exists(self.path):
+            logger.info(f"📮 ZIP database file not found ({self.path}), using ZIP3 → state table only")
+            return False
+
+        start = time.perf_counter()
+        try:
+            with open(self.path, 'rb') as f:
+                mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            magic, n_places, strings_len, _ = HEADER.unpack_from(mm, 0)
+            places_offset = HEADER.size + ZIP_SLOTS * SLOT.size
+            strings_offset = places_offset + n_places * PLACE.size
+            if magic != MAGIC or len(mm) < strings_offset + strings_len:
+                mm.close()
+                logger.warning(f"⚠️ ZIP database file is invalid: {self.path}")
+                return False
+        except (OSError, ValueError, struct.error) as e:
+            logger.warning(f"⚠️ Could not load ZIP database: {e}")
+            return False
+
+        self._mm = mm
+        self._n_places = n_places
+        self._places_offset = places_offset
+        self._strings_offset = strings_offset
+        self.load_ms = round((time.perf_counter() - start) * 1000, 2)
+        logger.info(f"✅ ZIP database loaded: {n_places} places in {self.load_ms}ms")
+        return True
+
+    def close(self) -> None:
+        if self._mm is not None:
+            self._mm.close()
+            self._mm = None
+        self._load_attempted = False
+
+    @property
+    def has_cities(self) -> bool:
+        """True if ZIP → city lookups are available"""
+        if not self._load_attempted:
+            self.load()
+        return self._mm is not None
+
+    def lookup(self, zip_code: str) -> Optional[ZipInfo]:
+        """
+        Resolve ZIP or ZIP+4 to city/state
+
+        Returns:
+            ZipInfo or None if unknown / data file not loaded
+        """
+        self.lookups += 1
+        zip5 = normalize_zip(zip_code)
+        if zip5 is None or not self.has_cities:
+            return None
+
+        (slot,) = SLOT.unpack_from(self._mm, HEADER.size + int(zip5) * SLOT.size)
+        if slot == 0 or slot > self._n_places:
+            return None
+
+        offset, length, state = PLACE.unpack_from(self._mm, self._places_offset + (slot - 1) * PLACE.size)
+        start = self._strings_offset + offset
+        city = self._mm[start:start + length].decode('utf-8')
+        self.found += 1
+        return ZipInfo(zip5, city, state.decode('ascii'))
+
+    def states_for_zip(self, zip_code: str) -> Optional[Tuple[str, ...]]:
+        """Possible states for ZIP (exact if in data file, else by ZIP3 prefix)"""
+        info = self.lookup(zip_code)
+        if info is not None:
+            return (info.state,)
+        zip5 = normalize_zip(zip_code)
+        if zip5 is None:
+            return None
+        return _ZIP3_STATES[int(zip5[:3])]
+
+    def validate(self, state: str, zip_code: str) -> Tuple[bool, Optional[str]]:
+        """
+        Check that ZIP exists in state
+
+        Only impossible combinations are rejected: a city that differs from
+        the primary USPS name is accepted (aliases like Hollywood/Los Angeles).
+        A mismatch by ZIP3 prefix alone (ZIP not in the data file) is
+        accepted with a warning, since some prefixes span two states.
+
+        Returns:
+            (is_valid, error_message) - error_message is a warning when is_valid
+        """
+        states = self.states_for_zip(zip_code)
+        state = (state or '').strip().upper()
+        if not states or not state or state in states:
+            return True, None
+
+        info = self.lookup(zip_code)
+        if info is None:
+            self.warned += 1
+            return True, (
+                f"⚠️ ZIP {normalize_zip(zip_code)} обычно не относится к штату {state}.\n"
+                f"Если это опечатка, исправьте адрес на шаге подтверждения."
+            )
+        self.rejected += 1
+        return False, (
+            f"❌ ZIP {info.zip_code} относится к {info.city}, {info.state}, а не к штату {state}.\n"
+            f"Проверьте штат или ZIP код."
+        )
+
+    def city_matches(self, zip_code: str, city: str) -> Optional[bool]:
+        """True/False if known, None if ZIP is not in the data file"""
+        info = self.lookup(zip_code)
+        if info is None:
+            return None
+        return _normalize_city(info.city) == _normalize_city(city)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        Получить статистику базы ZIP
+
+        Returns:
+            dict: загружена ли база, время загрузки, число запросов, отказов и предупреждений
+        """
+        return {
+            'path': self.path,
+            'cities_loaded': self._mm is not None,
+            'places': self._n_places,
+            'load_ms': self.load_ms,
+            'lookups': self.lookups,
+            'found': self.found,
+            'rejected': self.rejected,
+            'warned': self.warned,
+        }
+
+
+# Глобальный инстанс (singleton)
+zip_db = ZipDatabase(DEFAULT_PATH)
+
+
+def zip_shortcut_hint() -> str:
+    """Prompt suffix for the city step when ZIP autofill is available"""
+    if zip_db.has_cities:
+        return "\n\n💡 Или отправьте ZIP код — город и штат заполнятся автоматически"
+    return ""
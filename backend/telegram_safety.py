@@ -11,7 +11,11 @@ import logging
 logger = logging.getLogger(__name__)
 
 class TelegramSafetySystem:
-    """Система безопасности для предотвращения блокировки бота"""
+    """
+    Система безопасности для предотвращения блокировки бота
+    
+    Superseded for rate limiting by services/telegram_send_scheduler.py
+    """
     
     def __init__(self):
         # Rate limiting counters
@@ -83,7 +83,7 @@ class TestPaymentIntegration:
         
         # Mock environment variable and httpx
         with patch('services.api_services.OXAPAY_API_KEY', 'test_api_key'), \
-             patch('httpx.AsyncClient') as mock_client:
+             patch('services.api_services.get_http_client') as mock_client:
             
             mock_response = AsyncMock()
             mock_response.status_code = 200
@@ -91,7 +91,7 @@ class TestPaymentIntegration:
             
             mock_client_instance = AsyncMock()
             mock_client_instance.post = AsyncMock(return_value=mock_response)
-            mock_client.return_value.__aenter__.return_value = mock_client_instance
+            mock_client.return_value = mock_client_instance
             
             result = await create_oxapay_invoice(
                 amount=25.0,
@@ -247,15 +247,15 @@ class TestAPIIntegration:
         
         request = build_shipstation_rates_request(sample_order_data, carrier_ids)
         
-        # Mock httpx AsyncClient
-        with patch('httpx.AsyncClient') as mock_client:
+        # Mock pooled ShipStation client
+        with patch('services.shipping_service.get_client_for_url') as mock_client:
             mock_response = AsyncMock()
             mock_response.status_code = 200
             mock_response.json = AsyncMock(return_value=mock_shipstation_response)
             
             mock_client_instance = AsyncMock()
             mock_client_instance.post = AsyncMock(return_value=mock_response)
-            mock_client.return_value.__aenter__.return_value = mock_client_instance
+            mock_client.return_value = mock_client_instance
             
             headers = {"API-Key": "test_key"}
             api_url = "https://api.shipengine.com/v1/rates/estimate"
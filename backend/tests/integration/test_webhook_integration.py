@@ -134,14 +134,14 @@ class TestExternalAPIIntegration:
         assert "rate_options" in request_data
         
         # Mock API call
-        with patch('httpx.AsyncClient') as mock_client:
+        with patch('services.shipping_service.get_client_for_url') as mock_client:
             mock_response = AsyncMock()
             mock_response.status_code = 200
             mock_response.json = AsyncMock(return_value=mock_shipstation_response)
             
             mock_client_instance = AsyncMock()
             mock_client_instance.post = AsyncMock(return_value=mock_response)
-            mock_client.return_value.__aenter__.return_value = mock_client_instance
+            mock_client.return_value = mock_client_instance
             
             headers = {"API-Key": "test_key"}
             api_url = "https://api.shipengine.com/v1/rates/estimate"
@@ -167,7 +167,7 @@ class TestExternalAPIIntegration:
         
         # Mock API key and httpx
         with patch('services.api_services.OXAPAY_API_KEY', 'test_api_key'), \
-             patch('httpx.AsyncClient') as mock_client:
+             patch('services.api_services.get_http_client') as mock_client:
             
             mock_response = AsyncMock()
             mock_response.status_code = 200
@@ -175,7 +175,7 @@ class TestExternalAPIIntegration:
             
             mock_client_instance = AsyncMock()
             mock_client_instance.post = AsyncMock(return_value=mock_response)
-            mock_client.return_value.__aenter__.return_value = mock_client_instance
+            mock_client.return_value = mock_client_instance
             
             result = await create_oxapay_invoice(
                 amount=50.0,
@@ -194,11 +194,11 @@ class TestExternalAPIIntegration:
         from services.shipping_service import fetch_rates_from_shipstation
         import asyncio
         
-        with patch('httpx.AsyncClient') as mock_client:
+        with patch('services.shipping_service.get_client_for_url') as mock_client:
             # Simulate timeout
             mock_client_instance = AsyncMock()
             mock_client_instance.post = AsyncMock(side_effect=asyncio.TimeoutError())
-            mock_client.return_value.__aenter__.return_value = mock_client_instance
+            mock_client.return_value = mock_client_instance
             
             headers = {"API-Key": "test"}
             api_url = "https://api.shipengine.com/v1/rates/estimate"
@@ -227,7 +227,7 @@ class TestExternalAPIIntegration:
         carrier_ids = ["se-123456"]
         request_data = build_shipstation_rates_request(sample_order_data, carrier_ids)
         
-        with patch('httpx.AsyncClient') as mock_client:
+        with patch('services.shipping_service.get_client_for_url') as mock_client:
             # Simulate 500 error
             mock_response = AsyncMock()
             mock_response.status_code = 500
@@ -235,7 +235,7 @@ class TestExternalAPIIntegration:
             
             mock_client_instance = AsyncMock()
             mock_client_instance.post = AsyncMock(return_value=mock_response)
-            mock_client.return_value.__aenter__.return_value = mock_client_instance
+            mock_client.return_value = mock_client_instance
             
             headers = {"API-Key": "test"}
             api_url = "https://api.shipengine.com/v1/rates/estimate"
@@ -24,6 +24,8 @@ import httpx
 
 load_dotenv()
 
+from utils.bot_config import get_webhook_secret_token
+
 # Конфигурация теста
 NUM_USERS = 30
 WEBHOOK_URL = "http://localhost:8001/api/telegram/webhook"
@@ -161,7 +163,10 @@ class RealisticLoadTester:
             response = await self.http_client.post(
                 WEBHOOK_URL,
                 json=update,
-                headers={"Content-Type": "application/json"}
+                headers={
+                    "Content-Type": "application/json",
+                    "X-Telegram-Bot-Api-Secret-Token": get_webhook_secret_token(),
+                }
             )
             return response.status_code == 200
         except Exception as e:
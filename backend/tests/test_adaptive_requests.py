@@ -0,0 +1,109 @@
+"""
+Tests for adaptive timeouts and hedged reads (services/adaptive_requests.py)
+"""
+import asyncio
+import pytest
+from types import SimpleNamespace
+from services.adaptive_requests import AdaptiveRequestPolicy
+
+KEY = 'shipstation:v2/rates'
+
+
+class FakeClient:
+    """post() answers after the next delay from the list"""
+
+    def __init__(self, *delays):
+        self.delays = list(delays)
+        self.calls = []
+        self.cancelled = 0
+
+    async def post(self, url, **kwargs):
+        n = len(self.calls)
+        self.calls.append(kwargs)
+        try:
+            await asyncio.sleep(self.delays[n])
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            raise
+        return SimpleNamespace(status_code=200, call=n)
+
+
+def warmed_policy(latency=0.01, tokens=0.0, **kwargs):
+    policy = AdaptiveRequestPolicy(min_samples=5, hedge_min_delay=0.01, **kwargs)
+    for _ in range(5):
+        policy.record(KEY, latency)
+    policy._hedge_tokens = tokens
+    return policy
+
+
+def test_timeout_follows_p95_within_bounds():
+    policy = AdaptiveRequestPolicy(min_samples=5, timeout_multiplier=3.0, min_timeout=2.0)
+    assert policy.timeout_for(KEY, 30.0) == 30.0  # not enough samples
+
+    for _ in range(5):
+        policy.record(KEY, 1.5)
+    assert policy.timeout_for(KEY, 30.0) == 4.5
+    assert policy.timeout_for(KEY, 3.0) == 3.0    # fixed timeout is the cap
+
+    fast = AdaptiveRequestPolicy(min_samples=1)
+    fast.record(KEY, 0.1)
+    assert fast.timeout_for(KEY, 30.0) == 2.0     # min_timeout floor
+
+
+@pytest.mark.asyncio
+async def test_slow_primary_is_hedged_and_fast_duplicate_wins():
+    policy = warmed_policy(tokens=1.0)
+    client = FakeClient(1.0, 0.0)
+
+    response = await policy.request(client, 'POST', '/v2/rates', hedge=True, json={})
+    await asyncio.sleep(0)
+
+    assert response.call == 1
+    assert client.cancelled == 1
+    assert policy.hedges == 1 and policy.hedge_wins == 1
+    assert client.calls[0]['timeout'].read == 2.0
+
+
+@pytest.mark.asyncio
+async def test_hedge_budget_limits_extra_calls():
+    policy = warmed_policy(tokens=0.0)
+    client = FakeClient(0.05)
+
+    response = await policy.request(client, 'POST', '/v2/rates', hedge=True)
+
+    assert response.call == 0
+    assert len(client.calls) == 1
+    assert policy.hedges_denied == 1
+
+
+@pytest.mark.asyncio
+async def test_non_idempotent_calls_are_never_hedged():
+    policy = warmed_policy(tokens=5.0)
+    client = FakeClient(0.05)
+
+    await policy.request(client, 'POST', '/v2/rates', hedge=False)
+
+    assert len(client.calls) == 1
+    assert policy.get_stats()['hedges'] == 0
+
+
+@pytest.mark.asyncio
+async def test_timeouts_raise_the_estimate_so_it_can_recover():
+    import httpx
+    policy = AdaptiveRequestPolicy(min_samples=5, window=5, timeout_multiplier=3.0, min_timeout=2.0)
+    for _ in range(5):
+        policy.record(KEY, 0.5)
+    assert policy.timeout_for(KEY, 30.0) == 2.0
+
+    class TimingOutClient:
+        async def post(self, url, **kwargs):
+            raise httpx.ReadTimeout('timed out')
+
+    with pytest.raises(httpx.ReadTimeout):
+        await policy.request(TimingOutClient(), 'POST', '/v2/rates')
+    assert policy.timeout_for(KEY, 30.0) == 6.0   # sample recorded at the 2s timeout
+
+    for _ in range(3):
+        with pytest.raises(httpx.ReadTimeout):
+            await policy.request(TimingOutClient(), 'POST', '/v2/rates')
+    assert policy.timeout_for(KEY, 30.0) == 30.0  # back to the caller's fixed timeout
@@ -0,0 +1,172 @@
+"""
+Tests for address validation cache (services/address_validation_cache.py)
+"""
+import pytest
+from datetime import datetime, timezone, timedelta
+from unittest.mock import AsyncMock, Mock, patch
+from services.address_validation_cache import (
+    AddressValidationCache,
+    address_fingerprint,
+    normalize_address,
+    order_address_fingerprint
+)
+
+
+@pytest.fixture
+def cache():
+    fresh = AddressValidationCache()
+    with patch('services.address_validation_cache.address_validation_cache', fresh):
+        yield fresh
+
+
+@pytest.fixture
+def shipstation_client():
+    """Pooled ShipStation client returning a 'valid' answer"""
+    response = Mock(status_code=200)
+    response.json.return_value = {'status': 'valid', 'address': {
+        'name': 'JOHN', 'phone': '4155550100', 'street1': '215 CLAYTON ST'
+    }}
+    client = Mock()
+    client.post = AsyncMock(return_value=response)
+    with patch('services.api_services.get_http_client', return_value=client), \
+         patch.dict('os.environ', {'SHIPSTATION_API_KEY_TEST': 'test-key'}):
+        yield client
+
+
+def test_normalization_is_canonical():
+    a = normalize_address('215 Clayton Street', 'Apartment 4B', 'San Francisco', 'ca', '94117-1234')
+    b = normalize_address('215  clayton st.', 'apt 4b', 'san francisco', 'CA', '94117')
+    c = normalize_address('215 Clayton St Apt 4B', '', 'San Francisco', 'CA', '94117')
+    assert a == b == c
+    assert a == '215 CLAYTON ST APT 4B|SAN FRANCISCO|CA|94117'
+
+    assert normalize_address('100 North Main Avenue', 'Suite 5', 'Austin', 'TX', '73301') == \
+        normalize_address('100 N Main Ave', 'Ste 5', 'Austin', 'TX', '73301')
+
+
+def test_fingerprint_distinguishes_addresses():
+    assert address_fingerprint('1 Main St', '', 'Austin', 'TX', '73301') != \
+        address_fingerprint('2 Main St', '', 'Austin', 'TX', '73301')
+
+
+def test_order_address_fingerprint_supports_both_namings():
+    a = order_address_fingerprint({'from_street': '1 Main St', 'from_city': 'Austin',
+                                   'from_state': 'TX', 'from_zip': '73301'}, 'from')
+    b = order_address_fingerprint({'from_address': '1 main street', 'from_city': 'Austin',
+                                   'from_state': 'TX', 'from_zip': '73301'}, 'from')
+    assert a == b
+    assert order_address_fingerprint({}, 'to') is None
+
+
+@pytest.mark.asyncio
+async def test_positive_and_negative_ttl():
+    cache = AddressValidationCache(ttl_hours=24, negative_ttl_hours=1)
+    await cache.set('good', True, {'street1': '1 MAIN ST'})
+    await cache.set('bad', False, 'Address not found')
+
+    assert await cache.get('good') == (True, {'street1': '1 MAIN ST'})
+    assert await cache.get('bad') == (False, 'Address not found')
+    assert cache.get_stats()['negative_hits'] == 1
+
+    cache._cache['bad']['expires_at'] = datetime.now(timezone.utc) - timedelta(seconds=1)
+    assert await cache.get('bad') is None
+
+
+@pytest.mark.asyncio
+async def test_l2_shared_between_workers():
+    stored = {}
+    db = Mock()
+    db.address_validations.create_index = AsyncMock()
+    db.address_validations.replace_one = AsyncMock(
+        side_effect=lambda flt, doc, upsert: stored.__setitem__(flt['_id'], doc)
+    )
+    db.address_validations.find_one = AsyncMock(side_effect=lambda flt: stored.get(flt['_id']))
+
+    worker_a, worker_b = AddressValidationCache(), AddressValidationCache()
+    await worker_a.attach_db(db)
+    await worker_b.attach_db(db)
+
+    await worker_a.set('fp', True, None)
+    assert await worker_b.get('fp') == (True, None)
+
+
+@pytest.mark.asyncio
+async def test_validation_is_cached(cache, shipstation_client):
+    from services.api_services import validate_address_with_shipstation
+
+    first = await validate_address_with_shipstation('John', '215 Clayton Street', '', 'San Francisco', 'CA', '94117')
+    second = await validate_address_with_shipstation('Jane', '215 clayton st', None, 'san francisco', 'ca', '94117')
+
+    assert first[0] is second[0] is True
+    assert first[1]['street1'] == second[1]['street1'] == '215 CLAYTON ST'
+    assert shipstation_client.post.await_count == 1
+
+
+@pytest.mark.asyncio
+async def test_api_errors_are_not_cached(cache, shipstation_client):
+    from services.api_services import validate_address_with_shipstation
+    shipstation_client.post.return_value = Mock(status_code=503)
+
+    assert await validate_address_with_shipstation('J', '1 Main St', '', 'Austin', 'TX', '73301') == (True, None)
+    await validate_address_with_shipstation('J', '1 Main St', '', 'Austin', 'TX', '73301')
+
+    assert shipstation_client.post.await_count == 2
+    assert cache.get_stats()['stores'] == 0
+
+
+@pytest.mark.asyncio
+async def test_cached_result_does_not_leak_first_caller(cache, shipstation_client):
+    from services.api_services import validate_address_with_shipstation
+
+    await validate_address_with_shipstation('John', '215 Clayton St', '', 'San Francisco', 'CA', '94117',
+                                            phone='4155550100')
+    _, corrected = await validate_address_with_shipstation('Jane', '215 Clayton St', '', 'San Francisco', 'CA',
+                                                           '94117')
+
+    assert corrected == {'street1': '215 CLAYTON ST', 'name': 'Jane'}
+    assert cache._cache[next(iter(cache._cache))]['result'] == {'street1': '215 CLAYTON ST'}
+
+
+@pytest.mark.asyncio
+async def test_template_fingerprint_skips_validation(cache, shipstation_client):
+    from services.api_services import prevalidate_template_addresses, validate_order_addresses
+
+    order = {
+        'from_name': 'Warehouse', 'from_address': '215 Clayton St', 'from_city': 'San Francisco',
+        'from_state': 'CA', 'from_zip': '94117',
+        'to_name': 'Jane', 'to_address': '1 Main St', 'to_city': 'Austin',
+        'to_state': 'TX', 'to_zip': '73301'
+    }
+    fingerprints = await prevalidate_template_addresses(order)
+    assert fingerprints['from_address_fingerprint'] is not None
+    calls_after_template_save = shipstation_client.post.await_count
+
+    # New order from template: addresses untouched -> no ShipStation call
+    order.update(fingerprints)
+    assert await validate_order_addresses(order) == (True, None)
+    assert shipstation_client.post.await_count == calls_after_template_save
+    assert cache.get_stats()['template_skips'] == 2
+
+    # Edited recipient address no longer matches its fingerprint
+    order['to_address'] = '2 Main St'
+    await validate_order_addresses(order)
+    assert shipstation_client.post.await_count == calls_after_template_save + 1
+
+
+@pytest.mark.asyncio
+async def test_invalid_address_names_the_failing_side(cache, shipstation_client):
+    from services.api_services import validate_order_addresses
+
+    shipstation_client.post.return_value.json.return_value = {
+        'status': 'error', 'message': 'Street not found'
+    }
+    order = {
+        'from_name': 'Warehouse', 'from_address': '215 Clayton St', 'from_city': 'San Francisco',
+        'from_state': 'CA', 'from_zip': '94117',
+        'to_name': 'Jane', 'to_address': '1 Main St', 'to_city': 'Austin',
+        'to_state': 'TX', 'to_zip': '73301'
+    }
+    is_valid, error = await validate_order_addresses(order)
+
+    assert is_valid is False
+    assert error == 'Отправитель: Street not found'
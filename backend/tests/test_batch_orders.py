@@ -0,0 +1,308 @@
+"""
+Tests for batch (multi-parcel) orders (services/batch_orders.py)
+"""
+import asyncio
+import pytest
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, Mock, patch
+from services.batch_orders import BatchOrderService, common_service_options
+
+
+def rate(carrier, service, amount, shipment):
+    return {
+        'rate_id': f'{shipment}-{service}', 'shipment_id': shipment, 'carrier_code': carrier,
+        'service_code': service, 'shipping_amount': {'amount': amount + 10}, 'original_amount': amount
+    }
+
+
+def response(status_code, payload=None):
+    return SimpleNamespace(status_code=status_code, json=lambda: payload or {}, text='')
+
+
+def test_common_options_only_include_services_quoted_for_every_parcel():
+    parcel_rates = [
+        [rate('usps', 'priority', 8, 'se-1'), rate('ups', 'ground', 12, 'se-1')],
+        [rate('usps', 'priority', 9, 'se-2'), rate('fedex', 'home', 5, 'se-2')],
+    ]
+
+    options = common_service_options(parcel_rates)
+
+    assert [option['key'] for option in options] == ['usps:priority']
+    assert options[0]['total'] == 37.0
+    assert options[0]['original_total'] == 17.0
+    assert [r['rate_id'] for r in options[0]['rates']] == ['se-1-priority', 'se-2-priority']
+
+
+def test_common_options_sorted_cheapest_first():
+    parcel_rates = [[rate('usps', 'priority', 8, 'se-1'), rate('usps', 'ground', 4, 'se-1')]]
+    assert [o['key'] for o in common_service_options(parcel_rates)] == ['usps:ground', 'usps:priority']
+    assert common_service_options([]) == []
+
+
+@pytest.mark.asyncio
+async def test_quote_bounds_parallel_requests():
+    service = BatchOrderService(max_parallel_quotes=2)
+    in_flight = 0
+    peak = 0
+
+    async def fetch(rate_request, headers):
+        nonlocal in_flight, peak
+        in_flight += 1
+        peak = max(peak, in_flight)
+        await asyncio.sleep(0.01)
+        in_flight -= 1
+        zip_code = rate_request['shipment']['ship_to']['postal_code']
+        return True, [rate('usps', 'priority', 8, f'se-{zip_code}')], None
+
+    parcels = [{'to_name': 'A', 'to_city': 'X', 'to_state': 'CA', 'to_zip': str(90000 + i), 'parcel_weight': 1}
+               for i in range(5)]
+    sender = {'from_name': 'S', 'from_city': 'Y', 'from_state': 'NY', 'from_zip': '10001'}
+
+    with patch('services.carrier_catalog.carrier_catalog.get_carrier_ids', new=AsyncMock(return_value={'usps': 'c1'})), \
+         patch.dict('sys.modules', {'handlers.order_flow.rates': SimpleNamespace(fetch_and_prepare_rates=fetch)}):
+        parcel_rates, options = await service.quote(sender, parcels)
+
+    assert peak == 2
+    assert len(parcel_rates) == 5
+    assert options[0]['total'] == 90.0
+    assert service.get_stats()['quotes'] == 5
+
+
+
+@pytest.mark.asyncio
+async def test_quote_through_prepared_rates_keeps_shipment_ids():
+    """Real fetch_and_prepare_rates: balancing/markup must not drop what purchase needs"""
+    with patch.dict('os.environ', {'MONGO_URL': 'mongodb://localhost:1'}):
+        from handlers.order_flow.rates import fetch_and_prepare_rates  # noqa: F401 (imports server)
+
+    async def shipstation(rate_request, headers, api_url, timeout=30):
+        shipment = f"se-{rate_request['shipment']['ship_to']['postal_code']}"
+        return True, [{
+            'rate_id': f'{shipment}-ground', 'shipment_id': shipment, 'carrier_id': 'car-1',
+            'carrier_code': 'acme', 'carrier_friendly_name': 'Acme', 'service_code': 'acme_ground',
+            'service_type': 'Acme Ground', 'shipping_amount': {'amount': 8.0},
+        }], None
+
+    parcels = [{'to_name': 'A', 'to_city': 'X', 'to_state': 'CA', 'to_zip': str(90000 + i), 'parcel_weight': 1}
+               for i in range(2)]
+    sender = {'from_name': 'S', 'from_city': 'Y', 'from_state': 'NY', 'from_zip': '10001'}
+
+    with patch('services.carrier_catalog.carrier_catalog.get_carrier_ids', new=AsyncMock(return_value={'acme': 'car-1'})), \
+         patch('services.shipping_service.fetch_rates_from_shipstation', new=shipstation):
+        _, options = await BatchOrderService().quote(sender, parcels)
+
+    option, = options
+    assert [rate['shipment_id'] for rate in option['rates']] == ['se-90000', 'se-90001']
+    assert {rate['carrier_id'] for rate in option['rates']} == {'car-1'}
+    assert option['total'] == 36.0 and option['service'] == 'Acme Ground'
+
+
+def make_batch(**extra):
+    return {
+        'batch_id': 'BATCH-1', 'telegram_id': 42, 'carrier': 'USPS', 'service': 'Priority',
+        'status': 'pending', 'charged': False, 'delivered': False, 'amount': 37.0,
+        'parcels': [
+            {'rate_id': 'r1', 'shipment_id': 'se-1', 'amount': 18.0, 'to_name': 'A'},
+            {'rate_id': 'r2', 'shipment_id': 'se-2', 'amount': 19.0, 'to_name': 'B'},
+        ],
+        **extra
+    }
+
+
+def make_env(batch):
+    db = Mock()
+    db.batch_orders.find_one = AsyncMock(return_value=batch)
+    db.batch_orders.update_one = AsyncMock()
+    db.batch_orders.find_one_and_update = AsyncMock(return_value=batch)
+    db.shipping_labels.update_one = AsyncMock()
+    client = Mock()
+    client.post = AsyncMock(side_effect=[response(200, {'batch_id': 'ss-b1'}), response(204)])
+    labels = [
+        {'label_id': 'l1', 'shipment_id': 'se-1', 'tracking_number': 'T1', 'status': 'completed'},
+        {'label_id': 'l2', 'shipment_id': 'se-2', 'tracking_number': 'T2', 'status': 'completed'},
+    ]
+    client.get = AsyncMock(side_effect=[
+        response(200, {'status': 'completed', 'label_download': {'pdf': 'https://x/merged.pdf'}}),
+        response(200, {'labels': labels}),
+    ])
+    payment_service = Mock()
+    payment_service.process_balance_charge = AsyncMock(return_value=(True, None))
+    payment_service.refund_balance = AsyncMock(return_value=True)
+    payment_service.settle_charge = AsyncMock(return_value=True)
+    payment_service.refund_unsettled_charge = AsyncMock(return_value=True)
+    factory = Mock(return_value=Mock(get_payment_service=Mock(return_value=payment_service)))
+    return db, client, payment_service, factory
+
+
+@pytest.mark.asyncio
+async def test_purchase_buys_batch_and_debits_once():
+    service = BatchOrderService(poll_interval_seconds=0)
+    db, client, payment_service, factory = make_env(make_batch())
+    server = SimpleNamespace(db=db, SHIPSTATION_API_KEY='key')
+    service._deliver = AsyncMock(return_value=True)
+
+    with patch.dict('sys.modules', {'server': server}), \
+         patch('services.batch_orders.get_http_client', return_value=client), \
+         patch('services.service_factory.ServiceFactory', new=factory):
+        assert await service.purchase('BATCH-1') is True
+
+    create_body = client.post.await_args_list[0].kwargs['json']
+    assert create_body['rate_ids'] == ['r1', 'r2']
+    assert create_body['external_batch_id'] == 'BATCH-1'
+    assert db.shipping_labels.update_one.await_count == 2
+    # Debited before anything is bought, nothing to refund
+    payment_service.process_balance_charge.assert_awaited_once_with(
+        telegram_id=42, charge_id='BATCH-1', amount=37.0
+    )
+    payment_service.settle_charge.assert_awaited_once_with(42, 'BATCH-1')
+    claims = [c.args[0] for c in db.batch_orders.find_one_and_update.await_args_list]
+    assert claims[:2] == [{'batch_id': 'BATCH-1', 'status': 'pending', 'charged': False},
+                          {'batch_id': 'BATCH-1', 'status': 'pending'}]
+    payment_service.refund_balance.assert_not_awaited()
+    bought = service._deliver.await_args.args[3]
+    assert [parcel['tracking_number'] for parcel in bought] == ['T1', 'T2']
+    assert db.batch_orders.update_one.await_args.args[1]['$set']['status'] == 'completed'
+
+
+@pytest.mark.asyncio
+async def test_purchase_resumes_without_buying_or_charging_again():
+    service = BatchOrderService(poll_interval_seconds=0)
+    batch = make_batch(shipstation_batch_id='ss-b1', status='processing', charged=True)
+    db, client, payment_service, factory = make_env(batch)
+    service._deliver = AsyncMock(return_value=True)
+
+    with patch.dict('sys.modules', {'server': SimpleNamespace(db=db, SHIPSTATION_API_KEY='key')}), \
+         patch('services.batch_orders.get_http_client', return_value=client), \
+         patch('services.service_factory.ServiceFactory', new=factory):
+        assert await service.purchase('BATCH-1') is True
+
+    client.post.assert_not_awaited()
+    payment_service.process_balance_charge.assert_not_awaited()
+    service._deliver.assert_awaited_once()
+
+
+@pytest.mark.asyncio
+async def test_completed_batch_is_noop():
+    service = BatchOrderService()
+    db, client, _, _ = make_env(make_batch(status='completed'))
+
+    with patch.dict('sys.modules', {'server': SimpleNamespace(db=db, SHIPSTATION_API_KEY='key')}), \
+         patch('services.batch_orders.get_http_client', return_value=client):
+        assert await service.purchase('BATCH-1') is True
+
+    client.post.assert_not_awaited()
+    client.get.assert_not_awaited()
+
+
+@pytest.mark.asyncio
+async def test_unbought_lines_are_refunded():
+    service = BatchOrderService(poll_interval_seconds=0)
+    batch = make_batch(charged=True, charged_amount=37.0)
+    db, client, payment_service, factory = make_env(batch)
+    client.get.side_effect = [
+        response(200, {'status': 'completed_with_errors', 'label_download': {'pdf': 'https://x/merged.pdf'}}),
+        response(200, {'labels': [{'label_id': 'l1', 'shipment_id': 'se-1', 'tracking_number': 'T1'}]}),
+    ]
+    service._deliver = AsyncMock(return_value=True)
+
+    with patch.dict('sys.modules', {'server': SimpleNamespace(db=db, SHIPSTATION_API_KEY='key')}), \
+         patch('services.batch_orders.get_http_client', return_value=client), \
+         patch('services.service_factory.ServiceFactory', new=factory):
+        assert await service.purchase('BATCH-1') is True
+
+    payment_service.process_balance_charge.assert_not_awaited()
+    payment_service.refund_balance.assert_awaited_once_with(42, 'BATCH-1', 19.0)
+    assert service.get_stats()['refunds'] == 1
+
+
+@pytest.mark.asyncio
+async def test_failed_refund_alerts_admin():
+    service = BatchOrderService(poll_interval_seconds=0)
+    batch = make_batch(charged=True, charged_amount=37.0)
+    db, client, payment_service, factory = make_env(batch)
+    client.get.side_effect = [
+        response(200, {'status': 'completed_with_errors', 'label_download': {'pdf': 'https://x/merged.pdf'}}),
+        response(200, {'labels': [{'label_id': 'l1', 'shipment_id': 'se-1', 'tracking_number': 'T1'}]}),
+    ]
+    payment_service.refund_balance.return_value = False
+    service._deliver = AsyncMock(return_value=True)
+    alert = AsyncMock()
+
+    with patch.dict('sys.modules', {'server': SimpleNamespace(db=db, SHIPSTATION_API_KEY='key')}), \
+         patch('services.batch_orders.get_http_client', return_value=client), \
+         patch('services.service_factory.ServiceFactory', new=factory), \
+         patch('handlers.admin_handlers.notify_admin_error', alert):
+        assert await service.purchase('BATCH-1') is True
+
+    assert alert.await_args.kwargs['error_type'] == 'Batch Refund Failed'
+    assert alert.await_args.kwargs['order_id'] == 'BATCH-1'
+    recorded = [c.args[1]['$set'] for c in db.batch_orders.update_one.await_args_list]
+    assert any(fields.get('charge_error') == 'Refund failed' for fields in recorded)
+
+
+@pytest.mark.asyncio
+async def test_retry_after_create_timeout_reuses_shipstation_batch():
+    service = BatchOrderService(poll_interval_seconds=0)
+    db, client, payment_service, factory = make_env(make_batch(status='creating', charged=True, charged_amount=37.0))
+    client.get.side_effect = [response(200, {'batch_id': 'ss-b1'})] + list(client.get.side_effect)
+    client.post.side_effect = [response(204)]
+    service._deliver = AsyncMock(return_value=True)
+
+    with patch.dict('sys.modules', {'server': SimpleNamespace(db=db, SHIPSTATION_API_KEY='key')}), \
+         patch('services.batch_orders.get_http_client', return_value=client), \
+         patch('services.service_factory.ServiceFactory', new=factory):
+        assert await service.purchase('BATCH-1') is True
+
+    assert client.get.await_args_list[0].args[0].endswith('/batches/external_batch_id/BATCH-1')
+    assert [c.args[0] for c in client.post.await_args_list] == [
+        'https://api.shipstation.com/v2/batches/ss-b1/process/labels'
+    ]
+
+
+@pytest.mark.asyncio
+async def test_nothing_is_bought_without_a_debit():
+    service = BatchOrderService(poll_interval_seconds=0)
+    db, client, payment_service, factory = make_env(make_batch())
+    payment_service.process_balance_charge.return_value = (False, 'Insufficient balance')
+
+    with patch.dict('sys.modules', {'server': SimpleNamespace(db=db, SHIPSTATION_API_KEY='key')}), \
+         patch('services.batch_orders.get_http_client', return_value=client), \
+         patch('services.service_factory.ServiceFactory', new=factory):
+        assert await service.purchase('BATCH-1') is False
+
+    client.post.assert_not_awaited()
+    assert db.batch_orders.update_one.await_args.args[1] == {'$set': {'status': 'pending'}}
+    payment_service.settle_charge.assert_not_awaited()
+
+
+class AsyncIter:
+    def __init__(self, items):
+        self.items = list(items)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        if not self.items:
+            raise StopAsyncIteration
+        return self.items.pop(0)
+
+
+@pytest.mark.asyncio
+async def test_recover_charges_refunds_a_debit_left_in_charging():
+    service = BatchOrderService(poll_interval_seconds=0)
+    stuck = make_batch(status='charging', charging_at='2026-01-01T00:00:00+00:00')
+    db, client, payment_service, factory = make_env(stuck)
+    db.batch_orders.find = Mock(return_value=AsyncIter([stuck]))
+
+    with patch.dict('sys.modules', {'server': SimpleNamespace(db=db)}), \
+         patch('services.service_factory.ServiceFactory', new=factory):
+        assert await service.recover_charges(older_than_seconds=60) == 1
+
+    assert db.batch_orders.find.call_args.args[0]['status'] == 'charging'
+    payment_service.refund_unsettled_charge.assert_awaited_once_with(42, 'BATCH-1', 37.0)
+    assert db.batch_orders.update_one.await_args.args == (
+        {'batch_id': 'BATCH-1', 'status': 'charging', 'charged': False},
+        {'$set': {'status': 'pending'}},
+    )
+    assert service.refunds == 1
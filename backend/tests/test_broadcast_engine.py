@@ -0,0 +1,257 @@
+"""
+Tests for resumable broadcast jobs (services/broadcast_engine.py)
+"""
+import pytest
+from datetime import datetime, timezone, timedelta
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, patch
+
+import telegram.error
+from pymongo.errors import DuplicateKeyError
+
+from services.broadcast_engine import BroadcastEngine
+
+
+def matches(doc, query):
+    for key, cond in query.items():
+        if key == '$or':
+            if not any(matches(doc, sub) for sub in cond):
+                return False
+            continue
+        value = doc.get(key)
+        if isinstance(cond, dict):
+            for op, arg in cond.items():
+                if op == '$ne' and value == arg:
+                    return False
+                if op == '$in' and value not in arg:
+                    return False
+                if op == '$gt' and not (value is not None and value > arg):
+                    return False
+                if op == '$lt' and not (value is not None and value < arg):
+                    return False
+        elif value != cond:
+            return False
+    return True
+
+
+class FakeCursor:
+    def __init__(self, docs):
+        self.docs = docs
+
+    def sort(self, field, direction=1):
+        self.docs = sorted(self.docs, key=lambda d: d[field], reverse=direction < 0)
+        return self
+
+    def batch_size(self, n):
+        return self
+
+    def limit(self, n):
+        self.docs = self.docs[:n]
+        return self
+
+    def __aiter__(self):
+        async def iterate():
+            for doc in self.docs:
+                yield dict(doc)
+        return iterate()
+
+    async def to_list(self, length):
+        return self.docs[:length]
+
+
+class FakeCollection:
+    """Just enough of a Motor collection for the broadcast engine"""
+
+    def __init__(self, docs=()):
+        self.docs = {doc.get('_id', n): dict(doc) for n, doc in enumerate(docs)}
+
+    async def create_index(self, *args, **kwargs):
+        pass
+
+    async def insert_one(self, doc):
+        if doc['_id'] in self.docs:
+            raise DuplicateKeyError('E11000')
+        self.docs[doc['_id']] = dict(doc)
+
+    async def count_documents(self, query):
+        return sum(1 for doc in self.docs.values() if matches(doc, query))
+
+    async def distinct(self, field):
+        return list({doc[field] for doc in self.docs.values()})
+
+    def find(self, query, projection=None):
+        return FakeCursor([doc for doc in self.docs.values() if matches(doc, query)])
+
+    def aggregate(self, pipeline, **kwargs):
+        # $match / $sort / $project / $count - the stages of user-field segments
+        docs = list(self.docs.values())
+        for stage in pipeline:
+            (op, arg), = stage.items()
+            if op == '$match':
+                docs = [doc for doc in docs if matches(doc, arg)]
+            elif op == '$sort':
+                (field, direction), = arg.items()
+                docs = FakeCursor(docs).sort(field, direction).docs
+            elif op == '$project':
+                docs = [{field: doc[field] for field in arg if arg[field] and field in doc} for doc in docs]
+            elif op == '$count':
+                docs = [{arg: len(docs)}] if docs else []
+            else:
+                raise NotImplementedError(op)
+        return FakeCursor(docs)
+
+    async def find_one(self, query, projection=None):
+        return next((dict(doc) for doc in self.docs.values() if matches(doc, query)), None)
+
+    def _apply(self, doc, update):
+        doc.update(update.get('$set', {}))
+        for field, n in update.get('$inc', {}).items():
+            doc[field] = doc.get(field, 0) + n
+        for field, value in update.get('$max', {}).items():
+            if doc.get(field) is None or value > doc[field]:
+                doc[field] = value
+
+    async def update_one(self, query, update):
+        doc = next((doc for doc in self.docs.values() if matches(doc, query)), None)
+        if doc is not None:
+            self._apply(doc, update)
+        return SimpleNamespace(modified_count=int(doc is not None))
+
+    async def find_one_and_update(self, query, update, sort=None, projection=None, return_document=None):
+        candidates = [doc for doc in self.docs.values() if matches(doc, query)]
+        if sort:
+            candidates.sort(key=lambda d: d[sort[0][0]])
+        if not candidates:
+            return None
+        self._apply(candidates[0], update)
+        return dict(candidates[0])
+
+
+def make_engine(users, **kwargs):
+    db = SimpleNamespace(
+        users=FakeCollection(users),
+        orders=FakeCollection(),
+        broadcasts=FakeCollection(),
+        broadcast_deliveries=FakeCollection(),
+    )
+    engine = BroadcastEngine(**kwargs)
+    engine._db = db
+    return engine, db
+
+
+def make_users(*telegram_ids, **extra):
+    return [{'telegram_id': tid, 'balance': 0, **extra} for tid in telegram_ids]
+
+
+async def run_claimed(engine):
+    broadcast = await engine._claim()
+    await engine._run(broadcast)
+    return broadcast
+
+
+@pytest.mark.asyncio
+async def test_broadcast_sends_once_and_flags_blocked_users():
+    users = make_users(1, 2, 3, 4) + make_users(5, bot_blocked_by_user=True)
+    engine, db = make_engine(users, batch_size=2)
+    bot = SimpleNamespace(send_message=AsyncMock(side_effect=[
+        None, None, telegram.error.Forbidden('bot was blocked by the user'), None,
+    ]))
+
+    with patch.dict('sys.modules', {'server': SimpleNamespace(bot_instance=bot)}):
+        job = await engine.create('Hello', target='all')
+        await run_claimed(engine)
+
+    progress = await engine.get(job['_id'])
+    assert [c.kwargs['chat_id'] for c in bot.send_message.call_args_list] == [1, 2, 3, 4]
+    assert progress['status'] == 'done' and progress['total'] == 4
+    assert (progress['sent'], progress['failed'], progress['blocked']) == (3, 0, 1)
+    assert progress['progress']['percent'] == 100.0
+    assert db.users.docs[2]['bot_blocked_by_user'] is True
+    assert len(db.broadcast_deliveries.docs) == 4
+
+
+@pytest.mark.asyncio
+async def test_resume_after_crash_never_sends_twice():
+    engine, db = make_engine(make_users(1, 2, 3, 4), batch_size=10)
+    bot = SimpleNamespace(send_message=AsyncMock())
+
+    with patch.dict('sys.modules', {'server': SimpleNamespace(bot_instance=bot)}):
+        job = await engine.create('Hello')
+        # Previous worker died mid-batch: 1 delivered, 2 in flight, lease expired
+        db.broadcasts.docs[job['_id']].update(
+            status='running', worker_id='dead', started_at=datetime.now(timezone.utc),
+            lease_until=datetime.now(timezone.utc) - timedelta(seconds=1),
+        )
+        for tid, status in ((1, 'sent'), (2, 'pending')):
+            await db.broadcast_deliveries.insert_one(
+                {'_id': f"{job['_id']}:{tid}", 'broadcast_id': job['_id'], 'telegram_id': tid, 'status': status}
+            )
+        await run_claimed(engine)
+
+    progress = await engine.get(job['_id'])
+    assert [c.kwargs['chat_id'] for c in bot.send_message.call_args_list] == [3, 4]
+    assert (progress['sent'], progress['failed']) == (3, 1)   # in-flight one is not retried
+    assert progress['status'] == 'done'
+    assert engine.resumed == 1
+
+
+@pytest.mark.asyncio
+async def test_pause_stops_at_checkpoint_and_resume_continues_from_cursor():
+    engine, db = make_engine(make_users(1, 2, 3, 4, 5), batch_size=2, concurrency=1)
+    bot = SimpleNamespace(send_message=AsyncMock())
+
+    async def pause_on_first_send(**kwargs):
+        if bot.send_message.await_count == 1:
+            await engine.pause(job['_id'])
+
+    bot.send_message.side_effect = pause_on_first_send
+
+    with patch.dict('sys.modules', {'server': SimpleNamespace(bot_instance=bot)}):
+        job = await engine.create('Hello')
+        await run_claimed(engine)
+
+        paused = await engine.get(job['_id'])
+        assert paused['status'] == 'paused' and paused['cursor'] == 2 and paused['sent'] == 2
+        assert await engine._claim() is None          # paused jobs are not picked up
+        assert not await engine.resume('missing')
+
+        assert await engine.resume(job['_id'])
+        await run_claimed(engine)
+
+    done = await engine.get(job['_id'])
+    assert [c.kwargs['chat_id'] for c in bot.send_message.call_args_list] == [1, 2, 3, 4, 5]
+    assert done['status'] == 'done' and done['sent'] == 5
+
+
+@pytest.mark.asyncio
+async def test_audiences():
+    users = make_users(1, 2) + [{'telegram_id': 3, 'balance': 5.0}]
+    engine, db = make_engine(users)
+
+    assert (await engine.create('Hi', target='premium'))['total'] == 1
+    custom = await engine.create('Hi', segment={'balance_above': 10})
+    assert custom is None
+    custom = await engine.create('Hi', segment={'balance_above': '4.5'})
+    assert custom['target'] == 'custom' and custom['segment'] == {'balance_above': 4.5}
+    with pytest.raises(ValueError):
+        await engine.create('Hi', target='vip')
+
+    db.users.docs.clear()
+    assert await engine.create('Hi') is None
+
+
+@pytest.mark.asyncio
+async def test_image_url_is_uploaded_once_and_sent_by_file_id():
+    engine, db = make_engine(make_users(1, 2, 3))
+    bot = SimpleNamespace(send_photo=AsyncMock())
+    register_url = AsyncMock(return_value={'file_id': 'PHOTO1'})
+
+    with patch.dict('sys.modules', {'server': SimpleNamespace(bot_instance=bot)}), \
+            patch('services.media_registry.media_registry.register_url', register_url):
+        job = await engine.create('Sale', image_url='https://cdn.example.com/promo.jpg')
+        await run_claimed(engine)
+
+    register_url.assert_awaited_once_with(bot, 'https://cdn.example.com/promo.jpg')
+    assert [c.kwargs['photo'] for c in bot.send_photo.call_args_list] == ['PHOTO1'] * 3
+    assert db.broadcasts.docs[job['_id']]['file_id'] == 'PHOTO1'
+    assert (await engine.get(job['_id']))['sent'] == 3
@@ -0,0 +1,125 @@
+"""
+Tests for ShipStation carrier catalog (services/carrier_catalog.py)
+"""
+import pytest
+from datetime import datetime, timezone, timedelta
+from unittest.mock import AsyncMock, Mock, patch
+from services.carrier_catalog import CarrierCatalog
+
+
+@pytest.fixture
+def raw_carriers():
+    """Raw GET /v2/carriers payload"""
+    return [
+        {
+            'carrier_id': 'se-1',
+            'carrier_code': 'ups',
+            'friendly_name': 'UPS',
+            'services': [{'service_code': 'ups_ground', 'name': 'UPS Ground', 'domestic': True}],
+            'packages': [{'package_code': 'package', 'name': 'Package'}],
+            'balance': 12.5
+        },
+        {
+            'carrier_id': 'se-2',
+            'carrier_code': 'stamps_com',
+            'friendly_name': 'USPS',
+            'services': [{'service_code': 'usps_priority_mail', 'name': 'Priority Mail'}],
+            'packages': []
+        }
+    ]
+
+
+@pytest.fixture
+def catalog_db():
+    db = Mock()
+    db.carrier_catalog = Mock()
+    db.carrier_catalog.find_one = AsyncMock(return_value=None)
+    db.carrier_catalog.replace_one = AsyncMock()
+    return db
+
+
+@pytest.mark.asyncio
+async def test_refresh_loads_and_persists(raw_carriers, catalog_db):
+    """Refresh builds indexes and persists the snapshot"""
+    catalog = CarrierCatalog()
+    catalog._db = catalog_db
+    
+    with patch('services.api_services.fetch_shipstation_carriers', AsyncMock(return_value=raw_carriers)):
+        assert await catalog.refresh() is True
+    
+    assert await catalog.get_carrier_ids() == {'UPS': 'se-1', 'USPS': 'se-2'}
+    assert catalog.get_carrier('se-1')['carrier_code'] == 'ups'
+    assert catalog.get_services('UPS')[0]['service_code'] == 'ups_ground'
+    assert 'balance' not in catalog.get_carrier('se-1')
+    catalog_db.carrier_catalog.replace_one.assert_awaited_once()
+
+
+@pytest.mark.asyncio
+async def test_lookups_do_not_call_api_when_loaded(raw_carriers, catalog_db):
+    """Warm catalog serves lookups from memory"""
+    catalog = CarrierCatalog()
+    catalog._db = catalog_db
+    
+    fetch = AsyncMock(return_value=raw_carriers)
+    with patch('services.api_services.fetch_shipstation_carriers', fetch):
+        await catalog.refresh()
+        for _ in range(5):
+            await catalog.get_carrier_ids()
+    
+    assert fetch.await_count == 1
+
+
+@pytest.mark.asyncio
+async def test_failed_refresh_keeps_previous_catalog(raw_carriers, catalog_db):
+    """Upstream failure does not wipe the catalog"""
+    catalog = CarrierCatalog()
+    catalog._db = catalog_db
+    
+    with patch('services.api_services.fetch_shipstation_carriers', AsyncMock(return_value=raw_carriers)):
+        await catalog.refresh()
+    with patch('services.api_services.fetch_shipstation_carriers', AsyncMock(return_value=None)):
+        assert await catalog.refresh() is False
+    
+    assert len(await catalog.get_carrier_ids()) == 2
+    assert catalog.get_stats()['refresh_failures'] == 1
+
+
+@pytest.mark.asyncio
+async def test_start_uses_fresh_snapshot_without_api(raw_carriers, catalog_db):
+    """Cold worker starts from MongoDB snapshot"""
+    from services.carrier_catalog import _compact_carrier
+    
+    catalog_db.carrier_catalog.find_one = AsyncMock(return_value={
+        '_id': 'shipstation',
+        'carriers': [_compact_carrier(c) for c in raw_carriers],
+        'updated_at': datetime.now(timezone.utc).isoformat()
+    })
+    catalog = CarrierCatalog()
+    
+    fetch = AsyncMock(return_value=raw_carriers)
+    with patch('services.api_services.fetch_shipstation_carriers', fetch):
+        await catalog.start(catalog_db)
+        await catalog.stop()
+    
+    fetch.assert_not_awaited()
+    assert catalog.source == 'snapshot'
+    assert catalog.find_by_code('STAMPS_COM')[0]['carrier_id'] == 'se-2'
+
+
+@pytest.mark.asyncio
+async def test_start_refreshes_stale_snapshot(raw_carriers, catalog_db):
+    """Stale snapshot triggers an API refresh at startup"""
+    old = datetime.now(timezone.utc) - timedelta(days=2)
+    catalog_db.carrier_catalog.find_one = AsyncMock(return_value={
+        '_id': 'shipstation',
+        'carriers': [{'carrier_id': 'se-old', 'name': 'Old', 'carrier_code': 'old'}],
+        'updated_at': old.isoformat()
+    })
+    catalog = CarrierCatalog(refresh_interval_minutes=60)
+    
+    with patch('services.api_services.fetch_shipstation_carriers', AsyncMock(return_value=raw_carriers)):
+        await catalog.start(catalog_db)
+        await catalog.stop()
+    
+    assert catalog.source == 'api'
+    assert catalog.get_carrier('se-old') is None
@@ -0,0 +1,115 @@
+"""
+Tests for upstream circuit breakers (utils/retry_utils.py, services/http_clients.py)
+"""
+import pytest
+import httpx
+from utils.retry_utils import CircuitBreaker, CircuitBreakerRegistry, CircuitOpenError
+from services.http_clients import CircuitBreakerTransport, endpoint_key
+
+
+def make_registry(**defaults):
+    settings = {
+        'failure_threshold': 3, 'timeout': 30, 'window_seconds': 60,
+        'min_calls': 10, 'failure_rate_threshold': 0.5, 'half_open_max_calls': 1,
+        **defaults
+    }
+    return CircuitBreakerRegistry({'defaults': settings, 'overrides': {}})
+
+
+def make_client(registry, handler):
+    transport = CircuitBreakerTransport('shipstation', httpx.MockTransport(handler), registry=registry)
+    return httpx.AsyncClient(transport=transport, base_url='https://api.shipstation.com')
+
+
+def test_opens_after_consecutive_failures_and_probes_once():
+    breaker = CircuitBreaker(failure_threshold=2, timeout=30, name='ShipStation')
+    breaker.record_failure()
+    assert breaker.is_available()
+    breaker.record_failure()
+
+    assert breaker.state == 'OPEN'
+    with pytest.raises(CircuitOpenError) as exc:
+        breaker.check()
+    assert exc.value.retry_after == 30
+    assert 'ShipStation' in str(exc.value)
+
+    breaker.opened_at -= 31
+    assert breaker.is_available()       # probe
+    assert breaker.state == 'HALF_OPEN'
+    assert not breaker.is_available()   # second caller fast-fails
+    breaker.record_success()
+    assert breaker.state == 'CLOSED'
+
+
+def test_failed_probe_reopens():
+    breaker = CircuitBreaker(failure_threshold=1, timeout=30)
+    breaker.record_failure()
+    breaker.opened_at -= 31
+    assert breaker.is_available()
+    breaker.record_failure()
+    assert breaker.state == 'OPEN'
+    assert breaker.times_opened == 2
+
+
+def test_error_budget_opens_on_failure_rate():
+    breaker = CircuitBreaker(failure_threshold=100, min_calls=10, failure_rate_threshold=0.5)
+    for i in range(10):
+        breaker.record_failure() if i % 2 else breaker.record_success()
+    assert breaker.state == 'OPEN'
+    assert breaker.get_state()['window_failures'] == 5
+
+
+def test_endpoint_key_collapses_ids():
+    assert endpoint_key('/v2/labels/se-123/void') == 'v2/labels/:id'
+    assert endpoint_key('/v2/rates') == 'v2/rates'
+    assert endpoint_key('/v1/payment/invoice') == 'v1/payment/invoice'
+
+
+@pytest.mark.asyncio
+async def test_5xx_opens_endpoint_only():
+    calls = []
+
+    def handler(request):
+        calls.append(request.url.path)
+        status = 503 if request.url.path == '/v2/labels' else 200
+        return httpx.Response(status, json={})
+
+    registry = make_registry()
+    async with make_client(registry, handler) as client:
+        for _ in range(3):
+            await client.post('/v2/labels')
+        with pytest.raises(CircuitOpenError):
+            await client.post('/v2/labels')
+        assert (await client.post('/v2/rates')).status_code == 200
+
+    assert calls.count('/v2/labels') == 3
+    state = registry.get_state()['shipstation']
+    assert state['state'] == 'CLOSED'
+    assert state['endpoints']['v2/labels']['state'] == 'OPEN'
+    assert registry.open_circuits() == ['ShipStation:v2/labels']
+
+
+@pytest.mark.asyncio
+async def test_transport_errors_open_upstream():
+    def handler(request):
+        raise httpx.ConnectTimeout('timed out', request=request)
+
+    registry = make_registry()
+    async with make_client(registry, handler) as client:
+        for path in ('/v2/labels', '/v2/rates', '/v2/carriers'):
+            with pytest.raises(httpx.ConnectTimeout):
+                await client.get(path)
+        with pytest.raises(CircuitOpenError):
+            await client.get('/v2/addresses/validate')
+
+    assert registry.upstream('shipstation').state == 'OPEN'
+
+
+@pytest.mark.asyncio
+async def test_client_errors_do_not_spend_budget():
+    registry = make_registry()
+    async with make_client(registry, lambda request: httpx.Response(400, json={})) as client:
+        for _ in range(5):
+            await client.post('/v2/labels')
+
+    assert registry.endpoint('shipstation', 'v2/labels').state == 'CLOSED'
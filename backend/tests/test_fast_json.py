@@ -0,0 +1,146 @@
+"""
+Tests and micro-benchmark for the fast JSON layer (utils/fast_json.py)
+
+Run the benchmark with output:
+    pytest tests/test_fast_json.py -s -k benchmark
+"""
+import json
+import time
+from datetime import datetime, timezone
+from decimal import Decimal
+
+import pytest
+from bson import ObjectId
+from bson.decimal128 import Decimal128
+from fastapi.encoders import jsonable_encoder
+from telegram import Bot, Update
+
+from utils import fast_json
+from utils.fast_json import FastJSONResponse
+
+# Recorded webhook bodies (ids and names anonymised)
+RECORDED_UPDATES = [
+    {
+        "update_id": 815340120,
+        "message": {
+            "message_id": 5811, "date": 1731650042,
+            "from": {"id": 7066790254, "is_bot": False, "first_name": "Анна", "username": "anna_k", "language_code": "ru"},
+            "chat": {"id": 7066790254, "first_name": "Анна", "username": "anna_k", "type": "private"},
+            "text": "1209 Brickell Bay Dr, Apt 2704",
+        },
+    },
+    {
+        "update_id": 815340121,
+        "callback_query": {
+            "id": "3035167371786413522", "chat_instance": "-1558426512347211981", "data": "select_carrier_3",
+            "from": {"id": 7066790254, "is_bot": False, "first_name": "Анна", "username": "anna_k", "language_code": "ru"},
+            "message": {
+                "message_id": 5812, "date": 1731650047,
+                "from": {"id": 8035662211, "is_bot": True, "first_name": "Shipping Bot", "username": "ship_bot"},
+                "chat": {"id": 7066790254, "first_name": "Анна", "username": "anna_k", "type": "private"},
+                "text": "📦 Тарифы\n\n1. USPS Priority Mail: $9.80\n2. UPS Ground: $12.45\n3. FedEx Home: $11.20",
+                "reply_markup": {"inline_keyboard": [
+                    [{"text": f"Тариф {i}", "callback_data": f"select_carrier_{i}"}] for i in range(8)
+                ]},
+            },
+        },
+    },
+    {
+        "update_id": 815340122,
+        "my_chat_member": {
+            "chat": {"id": 6120954417, "first_name": "Mark", "type": "private"},
+            "from": {"id": 6120954417, "is_bot": False, "first_name": "Mark"},
+            "date": 1731650101,
+            "old_chat_member": {"user": {"id": 8035662211, "is_bot": True, "first_name": "Shipping Bot"}, "status": "member"},
+            "new_chat_member": {"user": {"id": 8035662211, "is_bot": True, "first_name": "Shipping Bot"}, "status": "kicked", "until_date": 0},
+        },
+    },
+]
+RECORDED_BODIES = [json.dumps(update, ensure_ascii=False).encode('utf-8') for update in RECORDED_UPDATES]
+
+
+def make_orders(n):
+    created = datetime(2025, 11, 15, 6, 30, 12, 345000, tzinfo=timezone.utc)
+    return [{
+        'order_id': f'ORD-{i:06d}', 'telegram_id': 7066790254 + i, 'amount': 12.45,
+        'payment_status': 'paid', 'shipping_status': 'label_created', 'created_at': created,
+        'address_from': {'name': 'Store', 'city': 'Miami', 'state': 'FL', 'zip': '33131'},
+        'address_to': {'name': 'Анна', 'city': 'Austin', 'state': 'TX', 'zip': '78701'},
+        'parcel': {'weight': 2.5, 'length': 10, 'width': 8, 'height': 4},
+    } for i in range(n)]
+
+
+def throughput(fn, payloads, rounds):
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for payload in payloads:
+            fn(payload)
+    return rounds * len(payloads) / (time.perf_counter() - start)
+
+
+def test_encodes_mongo_types_without_jsonable_encoder():
+    oid = ObjectId('65f1c2a9e4b0a1b2c3d4e5f6')
+    created = datetime(2025, 1, 2, 3, 4, 5, 600000, tzinfo=timezone.utc)
+    doc = {'_id': oid, 'created_at': created, 'amount': Decimal128('12.50'), 'qty': Decimal('3'),
+           'tags': {'vip'}, 7066790254: 'int key'}
+
+    decoded = json.loads(fast_json.dumps(doc))
+
+    assert decoded == {
+        '_id': '65f1c2a9e4b0a1b2c3d4e5f6', 'created_at': '2025-01-02T03:04:05.600000+00:00',
+        'amount': 12.5, 'qty': 3, 'tags': ['vip'], '7066790254': 'int key',
+    }
+
+
+def test_output_matches_default_encoder_for_api_payloads():
+    orders = make_orders(3)
+    assert json.loads(fast_json.dumps(orders)) == jsonable_encoder(orders)
+    assert FastJSONResponse({'ok': True}).body == b'{"ok":true}'
+
+
+def test_stdlib_fallback_encodes_the_same(monkeypatch):
+    doc = {'_id': ObjectId('65f1c2a9e4b0a1b2c3d4e5f6'), 'created_at': datetime(2025, 1, 2, tzinfo=timezone.utc)}
+    fast = fast_json.dumps(doc)
+    monkeypatch.setattr(fast_json, 'orjson', None)
+
+    assert json.loads(fast_json.dumps(doc)) == json.loads(fast)
+    assert fast_json.loads(RECORDED_BODIES[0]) == RECORDED_UPDATES[0]
+
+
+def test_benchmark_webhook_parsing():
+    pytest.importorskip('orjson')
+    bot = Bot('123456:TEST')
+
+    def before(body):
+        Update.de_json(json.loads(body), bot)
+
+    def after(body):
+        Update.de_json(fast_json.loads(body), bot)
+
+    rounds = 300
+    before(RECORDED_BODIES[0]), after(RECORDED_BODIES[0])   # warm up
+    parse_before = throughput(json.loads, RECORDED_BODIES, rounds * 5)
+    parse_after = throughput(fast_json.loads, RECORDED_BODIES, rounds * 5)
+    full_before = throughput(before, RECORDED_BODIES, rounds)
+    full_after = throughput(after, RECORDED_BODIES, rounds)
+
+    print(f"\nwebhook parse: stdlib {parse_before:,.0f}/s, orjson {parse_after:,.0f}/s "
+          f"(x{parse_after / parse_before:.1f}); with Update.de_json: "
+          f"{full_before:,.0f}/s -> {full_after:,.0f}/s")
+    assert parse_after > parse_before
+
+
+def test_benchmark_order_list_response():
+    pytest.importorskip('orjson')
+    pages = [make_orders(100)]
+
+    def before(orders):
+        json.dumps(jsonable_encoder(orders), ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+    rounds = 30
+    encode_before = throughput(before, pages, rounds)
+    encode_after = throughput(fast_json.dumps, pages, rounds)
+
+    print(f"\n/api/orders (100 orders): jsonable_encoder+json {encode_before:,.0f} pages/s, "
+          f"orjson direct {encode_after:,.0f} pages/s (x{encode_after / encode_before:.1f})")
+    assert encode_after > encode_before
@@ -0,0 +1,86 @@
+"""
+Tests for the shared HTTP client registry (services/http_clients.py)
+"""
+import pytest
+import httpx
+from services.http_clients import HTTPClientRegistry, UPSTREAM_BASE_URLS
+from config.performance_config import BotPerformanceConfig
+
+
+@pytest.mark.asyncio
+async def test_registry_start_opens_all_upstreams():
+    """start() opens one client per known upstream"""
+    registry = HTTPClientRegistry()
+    await registry.start()
+    
+    try:
+        stats = registry.get_stats()
+        assert stats['started'] is True
+        assert set(stats['clients']) == set(UPSTREAM_BASE_URLS)
+        assert all(c['open'] for c in stats['clients'].values())
+    finally:
+        await registry.close()
+    
+    assert registry.get_stats()['clients'] == {}
+
+
+@pytest.mark.asyncio
+async def test_registry_reuses_client():
+    """Same upstream returns the same pooled client"""
+    registry = HTTPClientRegistry()
+    
+    try:
+        first = registry.get('shipstation')
+        second = registry.get('shipstation')
+        assert first is second
+        assert registry.get('oxapay') is not first
+    finally:
+        await registry.close()
+
+
+@pytest.mark.asyncio
+async def test_registry_uses_upstream_config():
+    """Timeouts and base URL come from BotPerformanceConfig"""
+    registry = HTTPClientRegistry()
+    
+    try:
+        client = registry.get('shipstation')
+        expected = BotPerformanceConfig.EXTERNAL_API_TIMEOUTS['shipstation']
+        assert client.timeout.read == expected
+        assert str(client.base_url).startswith('https://api.shipstation.com')
+    finally:
+        await registry.close()
+
+
+@pytest.mark.asyncio
+async def test_registry_counts_requests():
+    """Requests are counted per upstream"""
+    def handler(request):
+        return httpx.Response(200, json={'ok': True})
+    
+    registry = HTTPClientRegistry()
+    registry._clients['default'] = httpx.AsyncClient(
+        transport=httpx.MockTransport(handler),
+        event_hooks={'request': [registry._make_counter('default')]}
+    )
+    
+    try:
+        client = registry.get('default')
+        await client.get('https://example.com/a')
+        await client.get('https://example.com/b')
+        assert registry.get_stats()['clients']['default']['requests'] == 2
+    finally:
+        await registry.close()
+
+
+@pytest.mark.asyncio
+async def test_registry_recreates_closed_client():
+    """A closed client is replaced transparently"""
+    registry = HTTPClientRegistry()
+    
+    try:
+        client = registry.get('oxapay')
+        await client.aclose()
+        assert registry.get('oxapay') is not client
+    finally:
+        await registry.close()
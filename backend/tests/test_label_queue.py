@@ -0,0 +1,218 @@
+"""
+Tests for label purchase job queue (services/label_queue.py)
+"""
+import pytest
+from datetime import datetime, timezone
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, Mock, patch
+from pymongo.errors import DuplicateKeyError
+from services.label_queue import LabelJobQueue
+
+
+def make_db():
+    db = Mock()
+    db.label_jobs.insert_one = AsyncMock()
+    db.label_jobs.find_one = AsyncMock(return_value=None)
+    db.label_jobs.find_one_and_update = AsyncMock(return_value=None)
+    db.label_jobs.update_one = AsyncMock()
+    db.shipping_labels.find_one = AsyncMock(return_value=None)
+    db.orders.update_one = AsyncMock()
+    return db
+
+
+def make_job(attempts=1, source='api', **extra):
+    return {
+        '_id': 'order-1', 'order_id': 'order-1', 'telegram_id': 42, 'source': source,
+        'payload': {}, 'status': 'running', 'attempts': attempts, 'max_attempts': 3,
+        'created_at': datetime.now(timezone.utc), **extra
+    }
+
+
+@pytest.fixture
+def queue():
+    q = LabelJobQueue(workers=1, max_attempts=3, lease_seconds=60, backoff_base_seconds=5, backoff_max_seconds=60)
+    q._db = make_db()
+    return q
+
+
+@pytest.mark.asyncio
+async def test_enqueue_is_idempotent_by_order_id(queue):
+    server = SimpleNamespace(db=queue._db)
+    with patch.dict('sys.modules', {'server': server}):
+        job, created = await queue.enqueue('order-1', 42, source='balance', payload={'amount': 12.5})
+        assert created is True
+        assert job['_id'] == 'order-1'
+        assert job['status'] == 'queued'
+        assert queue._wakeup.is_set()
+
+        queue._db.label_jobs.insert_one.side_effect = DuplicateKeyError('dup')
+        queue._db.label_jobs.find_one.return_value = {**job, 'status': 'running'}
+        job, created = await queue.enqueue('order-1', 42, source='balance')
+
+    assert created is False
+    assert job['status'] == 'running'
+    assert queue.get_stats()['duplicates'] == 1
+
+
+@pytest.mark.asyncio
+async def test_dead_job_can_be_enqueued_again(queue):
+    queue._db.label_jobs.insert_one.side_effect = DuplicateKeyError('dup')
+    queue._db.label_jobs.find_one_and_update.return_value = {'_id': 'order-1', 'status': 'queued'}
+    with patch.dict('sys.modules', {'server': SimpleNamespace(db=queue._db)}):
+        job, created = await queue.enqueue('order-1', 42)
+
+    assert created is True
+    revive_filter = queue._db.label_jobs.find_one_and_update.await_args.args[0]
+    assert revive_filter == {'_id': 'order-1', 'status': 'dead'}
+
+
+@pytest.mark.asyncio
+async def test_success_marks_job_done(queue):
+    queue._execute = AsyncMock(return_value=True)
+
+    await queue._run_job(make_job(attempts=1), 'w1')
+
+    update = queue._db.label_jobs.update_one.await_args.args[1]['$set']
+    assert update['status'] == 'done'
+    assert queue.completed == 1
+    assert queue._execute.await_args.kwargs['last_attempt'] is False
+
+
+@pytest.mark.asyncio
+async def test_failure_is_retried_with_backoff(queue):
+    queue._execute = AsyncMock(return_value=False)
+
+    await queue._run_job(make_job(attempts=1), 'w1')
+
+    update = queue._db.label_jobs.update_one.await_args.args[1]['$set']
+    assert update['status'] == 'queued'
+    delay = (update['run_at'] - datetime.now(timezone.utc)).total_seconds()
+    assert 1 <= delay <= 5
+    assert queue.retried == 1
+
+
+@pytest.mark.asyncio
+async def test_last_attempt_goes_to_dead_letter(queue):
+    queue._execute = AsyncMock(side_effect=RuntimeError("ShipStation down"))
+
+    await queue._run_job(make_job(attempts=3), 'w1')
+
+    update = queue._db.label_jobs.update_one.await_args.args[1]['$set']
+    assert update['status'] == 'dead'
+    assert update['last_error'] == "ShipStation down"
+    assert queue._execute.await_args.kwargs['last_attempt'] is True
+    queue._db.orders.update_one.assert_awaited_once()
+    assert queue.dead_lettered == 1
+
+
+@pytest.mark.asyncio
+async def test_expired_lease_past_max_attempts_is_dead_lettered(queue):
+    queue._execute = AsyncMock()
+
+    await queue._run_job(make_job(attempts=4), 'w1')
+
+    queue._execute.assert_not_awaited()
+    assert queue.lease_expired == 1
+    assert queue.dead_lettered == 1
+
+
+@pytest.mark.asyncio
+async def test_expired_lease_with_saved_label_completes_without_refund(queue):
+    queue._db.shipping_labels.find_one.return_value = {'_id': 'x'}
+    complete = AsyncMock()
+    fail = AsyncMock()
+    payment = SimpleNamespace(complete_balance_label_job=complete, fail_balance_label_job=fail)
+
+    with patch.dict('sys.modules', {'handlers.order_flow.payment': payment}):
+        await queue._run_job(make_job(attempts=4, source='balance'), 'w1')
+
+    assert queue._db.label_jobs.update_one.await_args.args[1]['$set']['status'] == 'done'
+    complete.assert_awaited_once()
+    fail.assert_not_awaited()
+
+
+@pytest.mark.asyncio
+async def test_expired_lease_delivers_label_bought_before_worker_died(queue):
+    label = {'label_id': 'se-l1', 'shipment_id': 'se-s1', 'tracking_number': 'T1'}
+    create = AsyncMock(return_value=True)
+    find = AsyncMock(return_value=('se-s1', label))
+    fail = AsyncMock()
+    server = SimpleNamespace(create_and_send_label=create, SHIPSTATION_API_KEY='key')
+    payment = SimpleNamespace(complete_balance_label_job=AsyncMock(), fail_balance_label_job=fail)
+
+    with patch.dict('sys.modules', {'server': server, 'handlers.order_flow.payment': payment}), \
+         patch('services.shipping_service.find_purchased_label', find):
+        await queue._run_job(make_job(attempts=4, source='balance', external_shipment_id='label-order-1'), 'w1')
+
+    assert create.await_args.kwargs['purchased_label'] is label
+    assert queue._db.label_jobs.update_one.await_args.args[1]['$set']['status'] == 'done'
+    fail.assert_not_awaited()
+
+
+@pytest.mark.asyncio
+async def test_expired_lease_retries_when_shipstation_lookup_fails(queue):
+    find = AsyncMock(side_effect=RuntimeError('ShipStation 503'))
+    with patch.dict('sys.modules', {'server': SimpleNamespace(SHIPSTATION_API_KEY='key')}), \
+         patch('services.shipping_service.find_purchased_label', find):
+        await queue._run_job(make_job(attempts=4, external_shipment_id='label-order-1'), 'w1')
+
+    assert queue._db.label_jobs.update_one.await_args.args[1]['$set']['status'] == 'queued'
+    assert queue.dead_lettered == 0
+
+
+@pytest.mark.asyncio
+async def test_existing_label_is_not_bought_again(queue):
+    queue._db.shipping_labels.find_one.return_value = {'_id': 'x'}
+    create = AsyncMock()
+    with patch.dict('sys.modules', {'server': SimpleNamespace(create_and_send_label=create)}):
+        assert await queue._execute(make_job(), last_attempt=False) is True
+    create.assert_not_awaited()
+
+
+@pytest.mark.asyncio
+async def test_first_attempt_records_external_shipment_id_before_buying(queue):
+    create = AsyncMock(return_value=True)
+    with patch.dict('sys.modules', {'server': SimpleNamespace(create_and_send_label=create)}):
+        assert await queue._execute(make_job(), last_attempt=False) is True
+
+    marker = queue._db.label_jobs.update_one.await_args.args[1]['$set']['external_shipment_id']
+    assert marker == 'label-order-1'
+    assert create.await_args.kwargs['external_shipment_id'] == marker
+    assert create.await_args.kwargs['purchased_label'] is None
+
+
+@pytest.mark.asyncio
+async def test_retry_delivers_label_bought_by_timed_out_attempt(queue):
+    label = {'label_id': 'se-l1', 'shipment_id': 'se-s1', 'tracking_number': 'T1'}
+    create = AsyncMock(return_value=True)
+    find = AsyncMock(return_value=('se-s1', label))
+    server = SimpleNamespace(create_and_send_label=create, SHIPSTATION_API_KEY='key')
+    with patch.dict('sys.modules', {'server': server}), \
+         patch('services.shipping_service.find_purchased_label', find):
+        job = make_job(attempts=2, external_shipment_id='label-order-1')
+        assert await queue._execute(job, last_attempt=False) is True
+
+    find.assert_awaited_once_with('label-order-1', 'key')
+    assert create.await_args.kwargs['purchased_label'] is label
+    queue._db.label_jobs.update_one.assert_not_awaited()
+
+
+def test_backoff_grows_and_is_capped(queue):
+    for attempt, cap in [(1, 5), (2, 10), (3, 20), (10, 60)]:
+        delay = queue.backoff_delay(attempt)
+        assert cap / 2 <= delay <= cap
+
+
+@pytest.mark.asyncio
+async def test_open_circuit_defers_without_spending_attempt(queue):
+    queue._execute = AsyncMock()
+
+    with patch.object(LabelJobQueue, 'circuit_wait', return_value=25.0):
+        await queue._run_job(make_job(attempts=3), 'w1')
+
+    queue._execute.assert_not_awaited()
+    update = queue._db.label_jobs.update_one.await_args.args[1]
+    assert update['$set']['status'] == 'queued'
+    assert update['$inc'] == {'attempts': -1, 'deferrals': 1}
+    assert queue.deferred == 1
+    assert queue.dead_lettered == 0
@@ -0,0 +1,143 @@
+"""
+Tests for label PDF blob store (services/label_store.py)
+"""
+import hashlib
+import os
+import pytest
+import httpx
+from datetime import datetime, timezone, timedelta
+from unittest.mock import AsyncMock, Mock, patch
+from fastapi import FastAPI, Request
+from fastapi.testclient import TestClient
+from services.label_store import LabelStore, LabelBlob, parse_range
+
+
+PDF = b'%PDF-1.4 ' + b'x' * 5000
+
+
+def make_client(status_code=200, content=PDF):
+    transport = httpx.MockTransport(lambda request: httpx.Response(status_code, content=content))
+    return httpx.AsyncClient(transport=transport)
+
+
+@pytest.fixture
+def store(tmp_path):
+    return LabelStore(str(tmp_path / 'labels'), retention_days=30)
+
+
+@pytest.mark.asyncio
+async def test_store_is_content_addressed(store):
+    with patch('services.label_store.get_client_for_url', return_value=make_client()):
+        success, blob, error = await store.store_from_url('https://api.shipstation.com/v2/downloads/1.pdf')
+
+    assert success is True
+    assert error is None
+    assert blob.sha256 == hashlib.sha256(PDF).hexdigest()
+    assert blob.size == len(PDF)
+    assert blob.path == store.path_for(blob.sha256)
+    with open(blob.path, 'rb') as f:
+        assert f.read() == PDF
+
+
+@pytest.mark.asyncio
+async def test_identical_pdf_stored_once(store):
+    with patch('services.label_store.get_client_for_url', return_value=make_client()):
+        await store.store_from_url('https://example.com/a.pdf')
+        await store.store_from_url('https://example.com/b.pdf')
+
+    stats = store.get_stats()
+    assert stats['stored'] == 1
+    assert stats['deduplicated'] == 1
+    assert os.listdir(os.path.join(store.root_dir, 'tmp')) == []
+
+
+@pytest.mark.asyncio
+async def test_failed_download(store):
+    with patch('services.label_store.get_client_for_url', return_value=make_client(status_code=404)):
+        success, blob, error = await store.store_from_url('https://example.com/missing.pdf')
+
+    assert success is False
+    assert blob is None
+    assert '404' in error
+    assert store.get_stats()['download_failures'] == 1
+
+
+def test_parse_range():
+    assert parse_range(None, 100) is None
+    assert parse_range('bytes=0-9', 100) == (0, 9)
+    assert parse_range('bytes=90-', 100) == (90, 99)
+    assert parse_range('bytes=-10', 100) == (90, 99)
+    assert parse_range('bytes=50-500', 100) == (50, 99)
+    assert parse_range('bytes=0-1,5-6', 100) is None  # multi-range -> full body
+    with pytest.raises(ValueError):
+        parse_range('bytes=100-', 100)
+
+
+@pytest.fixture
+def label_app(store, tmp_path):
+    """Minimal app serving a stored blob through the shipping router helper"""
+    from routers.shipping import _label_file_response
+
+    path = tmp_path / 'blob.pdf'
+    path.write_bytes(PDF)
+    blob = LabelBlob(hashlib.sha256(PDF).hexdigest(), str(path), len(PDF))
+
+    app = FastAPI()
+
+    @app.get("/label")
+    async def label(request: Request):
+        return _label_file_response(blob, "label_1.pdf", request)
+
+    return TestClient(app), blob
+
+
+def test_download_full_with_etag(label_app):
+    client, blob = label_app
+
+    response = client.get("/label")
+    assert response.status_code == 200
+    assert response.content == PDF
+    assert response.headers['etag'] == f'"{blob.sha256}"'
+    assert response.headers['accept-ranges'] == 'bytes'
+
+    cached = client.get("/label", headers={'If-None-Match': f'"{blob.sha256}"'})
+    assert cached.status_code == 304
+
+
+def test_download_range(label_app):
+    client, blob = label_app
+
+    response = client.get("/label", headers={'Range': 'bytes=0-99'})
+    assert response.status_code == 206
+    assert response.content == PDF[:100]
+    assert response.headers['content-range'] == f'bytes 0-99/{blob.size}'
+
+    stale = client.get("/label", headers={'Range': 'bytes=0-99', 'If-Range': '"other"'})
+    assert stale.status_code == 200
+
+    unsatisfiable = client.get("/label", headers={'Range': f'bytes={blob.size}-'})
+    assert unsatisfiable.status_code == 416
+
+
+@pytest.mark.asyncio
+async def test_gc_deletes_only_expired_blobs(store):
+    with patch('services.label_store.get_client_for_url', return_value=make_client()):
+        _, old_blob, _ = await store.store_from_url('https://example.com/old.pdf')
+    with patch('services.label_store.get_client_for_url', return_value=make_client(content=b'%PDF new')):
+        _, new_blob, _ = await store.store_from_url('https://example.com/new.pdf')
+
+    old_date = (datetime.now(timezone.utc) - timedelta(days=60)).isoformat()
+    db = Mock()
+    cursor = Mock()
+    cursor.to_list = AsyncMock(return_value=[{'pdf_sha256': old_blob.sha256}])
+    db.shipping_labels.find = Mock(return_value=cursor)
+    db.shipping_labels.find_one = AsyncMock(return_value=None)
+    db.shipping_labels.update_many = AsyncMock(return_value=Mock(modified_count=1))
+
+    result = await store.gc(db)
+
+    assert result['deleted'] == 1
+    assert result['labels_expired'] == 1
+    assert not os.path.exists(old_blob.path)
+    assert os.path.exists(new_blob.path)
+    assert db.shipping_labels.find.call_args[0][0]['pdf_stored_at']['$lt'] > old_date
@@ -0,0 +1,86 @@
+"""
+Tests for upload-once broadcast media (services/media_registry.py)
+"""
+import pytest
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, patch
+
+from services.media_registry import MediaRegistry, content_hash
+
+
+class FakeImages:
+    """uploaded_images: find_one / update_one(upsert) by content_hash"""
+
+    def __init__(self):
+        self.docs = {}
+
+    async def find_one(self, query, projection=None):
+        doc = self.docs.get(query['content_hash'])
+        return dict(doc) if doc and doc.get('file_id') else None
+
+    async def update_one(self, query, update, upsert=False):
+        doc = self.docs.get(query['content_hash'])
+        if doc is None:
+            if not upsert:
+                return
+            doc = self.docs[query['content_hash']] = {}
+        doc.update(update.get('$set', {}))
+        for field, n in update.get('$inc', {}).items():
+            doc[field] = doc.get(field, 0) + n
+
+
+def photo_message(file_id):
+    sizes = [SimpleNamespace(file_id='thumb', width=90, height=60),
+             SimpleNamespace(file_id=file_id, width=1280, height=853)]
+    return SimpleNamespace(photo=sizes)
+
+
+@pytest.fixture
+def registry(tmp_path, monkeypatch):
+    monkeypatch.setenv('ADMIN_TELEGRAM_ID', '777')
+    registry = MediaRegistry()
+    registry._db = SimpleNamespace(uploaded_images=FakeImages())
+    registry.upload_dir = tmp_path
+    return registry
+
+
+@pytest.mark.asyncio
+async def test_same_content_is_uploaded_once(registry, tmp_path):
+    bot = SimpleNamespace(send_photo=AsyncMock(return_value=photo_message('PHOTO1')))
+
+    first = await registry.register_bytes(bot, b'\x89PNG image', extension='.png')
+    again = await registry.register_bytes(bot, b'\x89PNG image')
+
+    bot.send_photo.assert_awaited_once()
+    assert bot.send_photo.await_args.kwargs['chat_id'] == 777
+    assert first['file_id'] == again['file_id'] == 'PHOTO1'
+    assert (first['width'], first['height']) == (1280, 853)
+    assert first['content_hash'] == content_hash(b'\x89PNG image')
+    assert (tmp_path / first['filename']).read_bytes() == b'\x89PNG image'
+    assert registry._db.uploaded_images.docs[first['content_hash']]['uses'] == 2
+    assert registry.get_stats() == {'reused_by_hash': 1, 'uploads': 1, 'failures': 0}
+
+
+@pytest.mark.asyncio
+async def test_url_with_known_content_skips_upload(registry):
+    bot = SimpleNamespace(send_photo=AsyncMock(return_value=photo_message('PHOTO1')))
+    await registry.register_bytes(bot, b'same picture', filename='admin-upload.jpg')
+
+    with patch.object(registry, '_download', AsyncMock(return_value=(b'same picture', 'image/jpeg'))):
+        asset = await registry.register_url(bot, 'https://cdn.example.com/promo.jpg')
+
+    assert asset['file_id'] == 'PHOTO1' and asset['filename'] == 'admin-upload.jpg'
+    bot.send_photo.assert_awaited_once()
+
+
+@pytest.mark.asyncio
+async def test_unavailable_image_is_not_registered(registry, monkeypatch):
+    bot = SimpleNamespace(send_photo=AsyncMock(return_value=photo_message('PHOTO1')))
+
+    with patch.object(registry, '_download', AsyncMock(side_effect=ValueError('image larger than 10MB'))):
+        assert await registry.register_url(bot, 'https://cdn.example.com/huge.jpg') is None
+
+    monkeypatch.delenv('ADMIN_TELEGRAM_ID')
+    assert await registry.register_bytes(bot, b'new picture') is None
+    bot.send_photo.assert_not_awaited()
+    assert registry.failures == 1
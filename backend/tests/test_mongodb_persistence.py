@@ -0,0 +1,175 @@
+"""
+Tests for the write-coalescing MongoDB persistence (utils/mongodb_persistence.py)
+"""
+import pytest
+from collections import defaultdict
+from types import MappingProxyType, SimpleNamespace
+from unittest.mock import AsyncMock
+from pymongo.errors import AutoReconnect
+from telegram.ext._utils.trackingdict import TrackingDict
+from utils.mongodb_persistence import MongoDBPersistence
+
+USER = 42
+KEY = (USER, USER)
+
+
+class FakeCollection:
+    """Just enough of a Motor collection for UpdateOne bulk writes"""
+
+    def __init__(self):
+        self.docs = {}
+        self.bulk_calls = 0
+        self.reads = 0
+
+    async def find_one(self, query):
+        self.reads += 1
+        doc = self.docs.get(query['_id'])
+        return dict(doc) if doc else None
+
+    def find(self, query, projection=None):
+        async def cursor():
+            for _id in query['_id']['$in']:
+                if _id in self.docs:
+                    yield dict(self.docs[_id])
+        return cursor()
+
+    async def bulk_write(self, ops, ordered=False):
+        self.bulk_calls += 1
+        modified = upserted = 0
+        for op in ops:
+            query, update = op._filter, op._doc
+            doc = self.docs.get(query['_id'])
+            version = query.get('version')
+            if isinstance(version, dict):
+                matches = doc is None or 'version' not in doc
+            else:
+                matches = doc is not None and doc.get('version') == version
+            if not matches:
+                continue
+            if doc is None:
+                doc = self.docs[query['_id']] = {'_id': query['_id']}
+                upserted += 1
+            else:
+                modified += 1
+            for path, value in update['$set'].items():
+                target = doc
+                *parents, leaf = path.split('.')
+                for part in parents:
+                    target = target.setdefault(part, {})
+                target[leaf] = value
+            for path in update.get('$unset', {}):
+                *parents, leaf = path.split('.')
+                target = doc
+                for part in parents:
+                    target = target.get(part, {})
+                target.pop(leaf, None)
+            doc['version'] = doc.get('version', 0) + update['$inc']['version']
+        return SimpleNamespace(modified_count=modified, upserted_count=upserted)
+
+
+def make_persistence(**kwargs):
+    collection = FakeCollection()
+    persistence = MongoDBPersistence({'telegram_state': collection}, flush_interval_seconds=60, **kwargs)
+    return persistence, collection
+
+
+def make_application(persistence):
+    user_data = defaultdict(dict)
+    return SimpleNamespace(
+        user_data=MappingProxyType(user_data),
+        _conversation_handler_conversations={'order_conversation': TrackingDict()},
+        persistence=persistence,
+        update_persistence=AsyncMock(),
+    )
+
+
+def make_update(user_id=USER):
+    return SimpleNamespace(effective_user=SimpleNamespace(id=user_id))
+
+
+@pytest.mark.asyncio
+async def test_state_changes_are_coalesced_into_one_write():
+    persistence, collection = make_persistence()
+
+    for state in (1, 2, 3, 4):
+        await persistence.update_conversation('order_conversation', KEY, state)
+    await persistence.update_user_data(USER, {'from_name': 'Ann'})
+    await persistence.flush()
+
+    assert collection.bulk_calls == 1
+    doc = collection.docs[USER]
+    assert doc['version'] == 1
+    assert doc['conversations']['order_conversation'][f'{USER}:{USER}'] == 4
+    assert doc['user_data'] == {'from_name': 'Ann'}
+    assert persistence.get_stats()['coalescing_ratio'] == 5.0
+
+    await persistence.update_conversation('order_conversation', KEY, None)
+    await persistence.flush()
+    assert collection.docs[USER]['conversations']['order_conversation'] == {}
+    assert collection.docs[USER]['version'] == 2
+
+
+@pytest.mark.asyncio
+async def test_state_is_loaded_lazily_per_user():
+    persistence, collection = make_persistence()
+    collection.docs[USER] = {
+        '_id': USER, 'version': 3, 'user_data': {'to_name': 'Bob'},
+        'conversations': {'order_conversation': {f'{USER}:{USER}': 7}},
+    }
+    application = make_application(persistence)
+
+    assert await persistence.get_conversations('order_conversation') == {}
+    await persistence.load_for_update(application, make_update())
+    await persistence.load_for_update(application, make_update())
+
+    assert collection.reads == 1
+    assert application.user_data[USER] == {'to_name': 'Bob'}
+    conversations = application._conversation_handler_conversations['order_conversation']
+    assert conversations[KEY] == 7
+    assert conversations.pop_accessed_keys() == set()   # loading is not a write
+
+
+@pytest.mark.asyncio
+async def test_stale_write_is_rejected_and_user_reloaded():
+    persistence, collection = make_persistence()
+    application = make_application(persistence)
+    collection.docs[USER] = {'_id': USER, 'version': 1, 'user_data': {'step': 'old'}}
+    await persistence.load_for_update(application, make_update())
+
+    collection.docs[USER].update(version=2, user_data={'step': 'other worker'})
+    await persistence.update_user_data(USER, {'step': 'stale'})
+    await persistence.flush()
+
+    assert collection.docs[USER]['user_data'] == {'step': 'other worker'}
+    assert persistence.conflicts == 1
+
+    await persistence.load_for_update(application, make_update())
+    assert application.user_data[USER] == {'step': 'other worker'}
+
+
+@pytest.mark.asyncio
+async def test_failed_flush_keeps_changes_dirty():
+    persistence, collection = make_persistence()
+    collection.bulk_write = AsyncMock(side_effect=AutoReconnect('down'))
+
+    await persistence.update_conversation('order_conversation', KEY, 5)
+    await persistence._write({USER: persistence._dirty.pop(USER)})
+
+    assert persistence.errors == 1
+    assert persistence._dirty[USER]['conversations'] == {f'order_conversation.{USER}:{USER}': 5}
+
+
+@pytest.mark.asyncio
+async def test_shared_mode_reloads_and_writes_through():
+    persistence, collection = make_persistence(shared=True)
+    application = make_application(persistence)
+
+    await persistence.load_for_update(application, make_update())
+    await persistence.update_user_data(USER, {'step': 1})
+    await persistence.after_update(application, make_update())
+    await persistence.load_for_update(application, make_update())
+
+    application.update_persistence.assert_awaited_once()
+    assert collection.docs[USER]['version'] == 1
+    assert collection.reads == 2
+    assert persistence.get_stats()['cache_hits'] == 0
@@ -0,0 +1,168 @@
+"""
+Tests for the edit-in-place order card (utils/order_card.py)
+"""
+import itertools
+import pytest
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, patch
+
+from telegram import ForceReply, InlineKeyboardButton, InlineKeyboardMarkup
+
+from handlers.common_handlers import mark_message_as_selected
+from utils.order_card import OrderCard, OrderCallMeter, CARD_ID_KEY
+
+SKIP = InlineKeyboardMarkup([[InlineKeyboardButton("⏭️ Пропустить", callback_data='skip')]])
+FORCE = ForceReply(selective=True)
+
+
+class FakeChat:
+    """Bot messages in one chat; every Telegram call is counted"""
+
+    def __init__(self):
+        self.ids = itertools.count(1)
+        self.calls = 0
+        self.bot = SimpleNamespace(
+            edit_message_text=AsyncMock(side_effect=self._count),
+            edit_message_reply_markup=AsyncMock(side_effect=self._count),
+        )
+
+    async def _count(self, *args, **kwargs):
+        self.calls += 1
+        return True
+
+    def message(self):
+        message = SimpleNamespace(message_id=next(self.ids), text='')
+
+        async def reply_text(text, **kwargs):
+            self.calls += 1
+            return self.message()
+
+        async def edit_text(text, **kwargs):
+            self.calls += 1
+            return message
+
+        message.reply_text = AsyncMock(side_effect=reply_text)
+        message.edit_text = AsyncMock(side_effect=edit_text)
+        message.edit_reply_markup = AsyncMock(side_effect=self._count)
+        return message
+
+    def text_update(self):
+        return SimpleNamespace(callback_query=None, effective_message=self.message(),
+                               effective_chat=SimpleNamespace(id=1))
+
+    def button_update(self):
+        pressed = self.last
+        return SimpleNamespace(callback_query=SimpleNamespace(message=pressed), effective_message=pressed,
+                               effective_chat=SimpleNamespace(id=1))
+
+
+async def run_step(card, chat, context, update, text, markup):
+    with patch('utils.order_card.order_card', card):
+        await mark_message_as_selected(update, context, prompt_text=context.user_data.get('last_bot_message_text'))
+    chat.last = await card.render(update, context, text, reply_markup=markup, safe_call=lambda coro: coro)
+
+
+# Order flow: (how the user answers, markup of the next prompt)
+ORDER_FLOW = [
+    ('text', FORCE), ('text', SKIP), ('button', FORCE), ('text', FORCE), ('text', FORCE), ('text', SKIP),
+    ('text', FORCE), ('text', SKIP), ('button', FORCE), ('text', FORCE), ('text', FORCE), ('text', SKIP),
+    ('button', FORCE), ('text', SKIP), ('button', None),
+]
+
+
+async def run_order(mode):
+    card, chat = OrderCard(mode=mode), FakeChat()
+    context = SimpleNamespace(user_data={}, bot=chat.bot)
+    chat.last = await card.render(chat.text_update(), context, 'Имя отправителя:', reply_markup=FORCE,
+                                  safe_call=lambda coro: coro)
+    for n, (answer, markup) in enumerate(ORDER_FLOW):
+        update = chat.text_update() if answer == 'text' else chat.button_update()
+        context.user_data[f'field_{n}'] = answer
+        await run_step(card, chat, context, update, f'Шаг {n}', markup)
+    return chat.calls, card
+
+
+@pytest.mark.asyncio
+async def test_edit_in_place_halves_telegram_calls_per_order():
+    send_new_calls, _ = await run_order('send_new')
+    card_calls, card = await run_order('edit_in_place')
+
+    assert send_new_calls == 1 + 2 * len(ORDER_FLOW)      # prompt + ✅ edit per step
+    assert card_calls <= send_new_calls * 0.6
+    assert card.get_stats()['card_edits'] == 4             # one per button press
+
+
+@pytest.mark.asyncio
+async def test_button_press_redraws_the_card():
+    card, chat = OrderCard(mode='edit_in_place'), FakeChat()
+    context = SimpleNamespace(user_data={'from_name': 'Ann'}, bot=chat.bot)
+    chat.last = await card.render(chat.text_update(), context, 'Адрес 2:', reply_markup=SKIP,
+                                  safe_call=lambda coro: coro)
+    card_id = context.user_data[CARD_ID_KEY]
+
+    update = chat.button_update()
+    await run_step(card, chat, context, update, 'Город:', FORCE)
+
+    edit = update.callback_query.message.edit_text
+    edit.assert_awaited_once()
+    assert edit.await_args.args[0].endswith('Город:') and '▰' in edit.await_args.args[0]
+    assert edit.await_args.kwargs['reply_markup'] is None          # ForceReply can't be edited in
+    update.effective_message.reply_text.assert_not_awaited()
+    assert context.user_data[CARD_ID_KEY] == card_id
+    assert context.user_data['last_bot_message_text'] == 'Город:'
+
+
+@pytest.mark.asyncio
+async def test_free_text_sends_new_card_and_strips_old_buttons():
+    card, chat = OrderCard(mode='edit_in_place'), FakeChat()
+    context = SimpleNamespace(user_data={}, bot=chat.bot)
+    chat.last = await card.render(chat.text_update(), context, 'Адрес 2:', reply_markup=SKIP,
+                                  safe_call=lambda coro: coro)
+    old_card = context.user_data[CARD_ID_KEY]
+
+    await run_step(card, chat, context, chat.text_update(), 'Город:', FORCE)
+
+    chat.bot.edit_message_reply_markup.assert_awaited_once_with(chat_id=1, message_id=old_card, reply_markup=None)
+    chat.bot.edit_message_text.assert_not_awaited()                 # no ✅ edit
+    assert context.user_data[CARD_ID_KEY] != old_card
+
+
+@pytest.mark.asyncio
+async def test_failed_edit_falls_back_to_new_message():
+    card, chat = OrderCard(mode='edit_in_place'), FakeChat()
+    context = SimpleNamespace(user_data={}, bot=chat.bot)
+    chat.last = await card.render(chat.text_update(), context, 'Адрес 2:', reply_markup=SKIP,
+                                  safe_call=lambda coro: coro)
+
+    async def safe_call(coro):
+        try:
+            return await coro
+        except Exception:
+            return None
+
+    update = chat.button_update()
+    update.callback_query.message.edit_text.side_effect = RuntimeError("Message can't be edited")
+    message = await card.render(update, context, 'Город:', reply_markup=FORCE, safe_call=safe_call)
+
+    assert message is not None and context.user_data[CARD_ID_KEY] == message.message_id
+    update.effective_message.reply_text.assert_awaited_once()
+    assert card.get_stats()['edit_fallbacks'] == 1
+
+
+def test_call_meter_per_mode():
+    meter = OrderCallMeter(max_tracked=2)
+
+    meter.start(1, 'edit_in_place')
+    for _ in range(9):
+        meter.record(1)
+    meter.record(99)                                         # not in an order
+    meter.finish(1)
+    meter.start(2, 'send_new')
+    meter.start(3, 'send_new')
+    meter.start(4, 'send_new')                               # evicts chat 2 as abandoned
+    meter.finish(3, completed=False)
+
+    stats = meter.get_stats()
+    assert stats['modes']['edit_in_place'] == {'completed': 1, 'abandoned': 0, 'calls_per_order': 9.0}
+    assert stats['modes']['send_new']['abandoned'] == 2
+    assert stats['open_orders'] == 1
@@ -427,5 +427,26 @@ async def test_full_topup_flow():
     assert invoice_data['amount'] == 50.00
 
 
+
+@pytest.mark.asyncio
+async def test_payment_service_debits_with_one_conditional_update():
+    """PaymentService never checks and debits in two steps"""
+    from services.payment_service import PaymentService
+    
+    user_repo = AsyncMock()
+    user_repo.deduct_balance_if_sufficient = AsyncMock(side_effect=[True, False])
+    user_repo.get_balance = AsyncMock(return_value=5.0)
+    service = PaymentService(payment_repo=AsyncMock(), user_repo=user_repo)
+    
+    assert await service.process_balance_payment(telegram_id=1, order_id='o1', amount=10.0) == (True, None)
+    success, error = await service.process_balance_payment(telegram_id=1, order_id='o2', amount=10.0)
+    
+    assert success is False and 'Insufficient' in error
+    user_repo.update_balance.assert_not_awaited()
+    
+    await service.refund_balance(1, 'o1', 10.0)
+    user_repo.update_balance.assert_awaited_once_with(1, 10.0, operation="add")
+
+
 if __name__ == '__main__':
     pytest.main([__file__, '-v'])
@@ -0,0 +1,134 @@
+"""
+Tests for speculative rate prefetch (services/rate_prefetch.py)
+"""
+import asyncio
+import pytest
+from unittest.mock import AsyncMock, patch
+from services.rate_prefetch import RatePrefetcher, quote_key_for
+from services.shipstation_cache import ShipStationCache
+from utils.single_flight import SingleFlight
+
+
+RATES = [{'carrier': 'UPS', 'amount': 22.5}]
+
+
+@pytest.fixture
+def order_data():
+    return {
+        'from_name': 'John', 'from_street': '1 Main St', 'from_city': 'New York',
+        'from_state': 'NY', 'from_zip': '10001',
+        'to_name': 'Jane', 'to_street': '2 Oak Ave', 'to_city': 'Los Angeles',
+        'to_state': 'CA', 'to_zip': '90001',
+        'parcel_weight': 3.0
+    }
+
+
+@pytest.fixture
+def prefetch_env():
+    """Isolated cache + single-flight + carrier catalog"""
+    cache = ShipStationCache()
+    flight = SingleFlight("test_rates")
+    with patch('services.rate_prefetch.shipstation_cache', cache), \
+         patch('services.rate_prefetch.rate_quote_flight', flight), \
+         patch('services.rate_prefetch.carrier_catalog.get_carrier_ids',
+               AsyncMock(return_value={'UPS': 'se-1'})):
+        yield cache
+
+
+@pytest.mark.asyncio
+async def test_prefetch_parks_rates_in_cache(prefetch_env, order_data):
+    prefetcher = RatePrefetcher()
+    fetch = AsyncMock(return_value=(True, RATES, None))
+
+    with patch.object(prefetcher, '_fetch', fetch):
+        task = prefetcher.schedule(1, order_data)
+        await task
+
+    assert await prefetch_env.get('10001', '90001', 3.0) == RATES
+    assert prefetcher.consume(1, quote_key_for(order_data)) is True
+
+    stats = prefetcher.get_stats()
+    assert stats['upstream_calls'] == 1
+    assert stats['hits'] == 1
+    assert stats['wasted_upstream_calls'] == 0
+
+
+@pytest.mark.asyncio
+async def test_incomplete_data_is_not_prefetched(prefetch_env, order_data):
+    prefetcher = RatePrefetcher()
+    del order_data['parcel_weight']
+
+    assert prefetcher.schedule(1, order_data) is None
+    assert prefetcher.get_stats()['scheduled'] == 0
+
+
+@pytest.mark.asyncio
+async def test_same_key_is_not_rescheduled(prefetch_env, order_data):
+    prefetcher = RatePrefetcher()
+    fetch = AsyncMock(return_value=(True, RATES, None))
+
+    with patch.object(prefetcher, '_fetch', fetch):
+        task = prefetcher.schedule(1, order_data)
+        assert prefetcher.schedule(1, dict(order_data)) is None
+        await task
+
+    assert fetch.await_count == 1
+
+
+@pytest.mark.asyncio
+async def test_dimension_change_cancels_stale_prefetch(prefetch_env, order_data):
+    prefetcher = RatePrefetcher()
+    release = asyncio.Event()
+
+    async def slow_fetch(rate_request, headers):
+        await release.wait()
+        return True, RATES, None
+
+    with patch.object(prefetcher, '_fetch', slow_fetch):
+        stale = prefetcher.schedule(1, order_data)
+        await asyncio.sleep(0)
+        await asyncio.sleep(0)
+
+        order_data['parcel_length'] = 12.0
+        fresh = prefetcher.schedule(1, order_data)
+        release.set()
+        await fresh
+        await asyncio.gather(stale, return_exceptions=True)
+
+    assert stale.cancelled()
+    assert prefetcher.consume(1, quote_key_for(order_data)) is True
+
+    stats = prefetcher.get_stats()
+    assert stats['cancelled'] == 1
+    assert stats['wasted_upstream_calls'] == 1
+    assert stats['upstream_calls'] == 2
+
+
+@pytest.mark.asyncio
+async def test_consume_with_other_key_is_miss(prefetch_env, order_data):
+    prefetcher = RatePrefetcher()
+    fetch = AsyncMock(return_value=(True, RATES, None))
+
+    with patch.object(prefetcher, '_fetch', fetch):
+        await prefetcher.schedule(1, order_data)
+
+    other = dict(order_data, parcel_weight=7.0)
+    assert prefetcher.consume(1, quote_key_for(other)) is False
+    assert prefetcher.consume(2, quote_key_for(order_data)) is False
+
+    stats = prefetcher.get_stats()
+    assert stats['misses'] == 2
+    assert stats['wasted_upstream_calls'] == 1
+
+
+@pytest.mark.asyncio
+async def test_cached_quote_skips_upstream(prefetch_env, order_data):
+    await prefetch_env.set('10001', '90001', 3.0, RATES)
+    prefetcher = RatePrefetcher()
+    fetch = AsyncMock()
+
+    with patch.object(prefetcher, '_fetch', fetch):
+        await prefetcher.schedule(1, order_data)
+
+    fetch.assert_not_awaited()
+    assert prefetcher.get_stats()['already_cached'] == 1
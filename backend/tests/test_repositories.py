@@ -82,6 +82,36 @@ class TestUserRepository:
         call_args = user_repo.collection.update_one.call_args
         assert call_args[0][1]['$inc']['balance'] == -30.0
     
+    @pytest.mark.asyncio
+    async def test_deduct_balance_if_sufficient(self, user_repo):
+        """Тест условного списания: проверка и списание одним запросом"""
+        user_repo.collection.update_one = AsyncMock(return_value=MagicMock(modified_count=1))
+        
+        assert await user_repo.deduct_balance_if_sufficient(12345, 30.0)
+        
+        call_args = user_repo.collection.update_one.call_args
+        assert call_args[0][0] == {"telegram_id": 12345, "balance": {"$gte": 30.0}}
+        assert call_args[0][1] == {"$inc": {"balance": -30.0}}
+        
+        # Недостаточно средств - фильтр не совпал
+        user_repo.collection.update_one = AsyncMock(return_value=MagicMock(modified_count=0))
+        assert not await user_repo.deduct_balance_if_sufficient(12345, 30.0)
+    
+    @pytest.mark.asyncio
+    async def test_charge_marker_travels_with_the_balance(self, user_repo):
+        """Тест списания с отметкой: возврат только пока отметка на месте"""
+        user_repo.collection.update_one = AsyncMock(return_value=MagicMock(modified_count=1))
+        
+        assert await user_repo.deduct_balance_for_charge(12345, 30.0, "BATCH-1")
+        filter_, update = user_repo.collection.update_one.call_args[0]
+        assert filter_ == {"telegram_id": 12345, "balance": {"$gte": 30.0}, "pending_charges": {"$ne": "BATCH-1"}}
+        assert update == {"$inc": {"balance": -30.0}, "$addToSet": {"pending_charges": "BATCH-1"}}
+        
+        assert await user_repo.refund_pending_charge(12345, 30.0, "BATCH-1")
+        filter_, update = user_repo.collection.update_one.call_args[0]
+        assert filter_ == {"telegram_id": 12345, "pending_charges": "BATCH-1"}
+        assert update == {"$inc": {"balance": 30.0}, "$pull": {"pending_charges": "BATCH-1"}}
+    
     @pytest.mark.asyncio
     async def test_is_admin(self, user_repo):
         """Тест проверки admin статуса"""
@@ -0,0 +1,148 @@
+"""
+Tests for retry budgets, full-jitter backoff and Retry-After (utils/retry_utils.py)
+"""
+import pytest
+import httpx
+from types import SimpleNamespace
+from unittest.mock import patch
+from utils.retry_utils import (
+    RetryBudget,
+    RetryBudgetRegistry,
+    retry_on_api_error,
+    retry_after_seconds,
+    wait_full_jitter_or_retry_after
+)
+
+
+def make_registry(**defaults):
+    settings = {'ratio': 0.1, 'max_tokens': 10.0, 'initial_tokens': 0.0, **defaults}
+    return RetryBudgetRegistry({'defaults': settings, 'overrides': {}, 'max_retry_after': 30})
+
+
+def status_error(status, headers=None):
+    request = httpx.Request('POST', 'https://api.oxapay.com/v1/payment/invoice')
+    response = httpx.Response(status, headers=headers or {}, request=request)
+    return httpx.HTTPStatusError(f'{status}', request=request, response=response)
+
+
+def failing_call(error, max_attempts=3):
+    calls = []
+
+    @retry_on_api_error(max_attempts=max_attempts, min_wait=0, max_wait=0, upstream='oxapay')
+    async def call():
+        calls.append(1)
+        raise error
+
+    return call, calls
+
+
+def test_budget_allows_retries_up_to_ratio():
+    budget = RetryBudget(ratio=0.1, max_tokens=10.0, initial_tokens=0.0)
+    for _ in range(20):
+        budget.record_attempt()
+
+    assert budget.try_acquire()
+    assert budget.try_acquire()
+    assert not budget.try_acquire()
+    assert budget.get_stats()['retries'] == 2
+    assert budget.get_stats()['denied'] == 1
+
+
+@pytest.mark.asyncio
+async def test_retries_stop_when_budget_is_exhausted():
+    budgets = make_registry(initial_tokens=1.0)
+    call, calls = failing_call(httpx.ConnectError('refused'))
+
+    with patch('utils.retry_utils.retry_budgets', budgets):
+        with pytest.raises(httpx.ConnectError):
+            await call()
+
+    assert len(calls) == 2   # first attempt + the only paid retry
+    stats = budgets.get_stats()['oxapay']
+    assert stats['attempts'] == 1 and stats['retries'] == 1 and stats['denied'] == 1
+
+
+@pytest.mark.asyncio
+async def test_client_errors_are_not_retried():
+    budgets = make_registry(initial_tokens=5.0)
+    call, calls = failing_call(status_error(400))
+
+    with patch('utils.retry_utils.retry_budgets', budgets):
+        with pytest.raises(httpx.HTTPStatusError):
+            await call()
+
+    assert len(calls) == 1
+    assert budgets.get_stats()['oxapay']['retries'] == 0
+
+
+@pytest.mark.asyncio
+async def test_too_long_retry_after_is_not_retried():
+    budgets = make_registry(initial_tokens=5.0)
+    call, calls = failing_call(status_error(429, {'Retry-After': '120'}))
+
+    with patch('utils.retry_utils.retry_budgets', budgets):
+        with pytest.raises(httpx.HTTPStatusError):
+            await call()
+
+    assert len(calls) == 1
+
+
+def test_retry_after_header_overrides_jitter():
+    assert retry_after_seconds(status_error(503, {'Retry-After': '7'})) == 7.0
+    assert retry_after_seconds(status_error(503, {'Retry-After': 'Wed, 21 Oct 2015 07:28:00 GMT'})) == 0.0
+    assert retry_after_seconds(status_error(503)) is None
+    assert retry_after_seconds(httpx.ConnectError('refused')) is None
+
+    wait = wait_full_jitter_or_retry_after(min_wait=1, max_wait=10)
+    outcome = SimpleNamespace(exception=lambda: status_error(503, {'Retry-After': '7'}))
+    assert wait(SimpleNamespace(outcome=outcome, attempt_number=1)) == 7.0
+
+
+def test_full_jitter_stays_under_exponential_cap():
+    wait = wait_full_jitter_or_retry_after(min_wait=1, max_wait=4)
+    outcome = SimpleNamespace(exception=lambda: httpx.ReadTimeout('slow'))
+
+    with patch('utils.retry_utils.random.uniform', side_effect=lambda low, high: high) as uniform:
+        assert wait(SimpleNamespace(outcome=outcome, attempt_number=2)) == 2
+        assert wait(SimpleNamespace(outcome=outcome, attempt_number=5)) == 4
+    assert uniform.call_args.args[0] == 0
+
+
+@pytest.mark.asyncio
+async def test_rate_fetch_retries_server_error_then_succeeds():
+    from unittest.mock import AsyncMock
+    from services.shipping_service import fetch_rates_from_shipstation
+
+    request = httpx.Request('POST', 'https://api.shipstation.com/v2/rates')
+    client = SimpleNamespace(post=AsyncMock(side_effect=[
+        httpx.Response(503, request=request),
+        httpx.Response(200, json={'rate_response': {'rates': [{'rate_id': 'r1'}]}}, request=request),
+    ]))
+    budgets = make_registry(initial_tokens=5.0)
+
+    with patch('utils.retry_utils.retry_budgets', budgets), \
+         patch('utils.retry_utils.random.uniform', return_value=0), \
+         patch('services.shipping_service.get_client_for_url', return_value=client):
+        success, rates, error = await fetch_rates_from_shipstation({}, {}, 'https://api.shipstation.com/v2/rates')
+
+    assert success is True and rates[0]['rate_id'] == 'r1' and error is None
+    assert client.post.await_count == 2
+    assert budgets.get_stats()['shipstation']['retries'] == 1
+
+
+@pytest.mark.asyncio
+async def test_rate_fetch_falls_back_after_retries():
+    from unittest.mock import AsyncMock
+    from services.shipping_service import fetch_rates_from_shipstation
+
+    request = httpx.Request('POST', 'https://api.shipstation.com/v2/rates')
+    client = SimpleNamespace(post=AsyncMock(return_value=httpx.Response(502, text='Bad Gateway', request=request)))
+
+    with patch('utils.retry_utils.retry_budgets', make_registry(initial_tokens=5.0)), \
+         patch('utils.retry_utils.random.uniform', return_value=0), \
+         patch('services.shipping_service.get_client_for_url', return_value=client):
+        success, rates, error = await fetch_rates_from_shipstation({}, {}, 'https://api.shipstation.com/v2/rates')
+
+    assert (success, rates) == (False, None)
+    assert '502' in error
+    assert client.post.await_count == 2   # max_attempts
@@ -0,0 +1,108 @@
+"""
+Tests for broadcast audience segments (services/segment_engine.py)
+"""
+import pytest
+from datetime import datetime, timezone, timedelta
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, MagicMock
+
+from services.segment_engine import SegmentEngine
+
+
+def stages(pipeline, op):
+    return [stage[op] for stage in pipeline if op in stage]
+
+
+class FakeAggregateCursor:
+    def __init__(self, docs):
+        self.docs = docs
+        self.to_list = AsyncMock(return_value=docs)
+
+    def __aiter__(self):
+        async def iterate():
+            for doc in self.docs:
+                yield doc
+        return iterate()
+
+
+def make_db(docs):
+    return SimpleNamespace(users=SimpleNamespace(aggregate=MagicMock(return_value=FakeAggregateCursor(docs))))
+
+
+def test_named_segments_compile_to_one_pipeline():
+    engine = SegmentEngine()
+
+    everyone = engine.compile('all')
+    assert stages(everyone, '$match') == [{'bot_blocked_by_user': {'$ne': True}}]
+    assert not stages(everyone, '$lookup')
+
+    premium = engine.compile('premium', after=42)
+    assert stages(premium, '$match')[0] == {
+        'bot_blocked_by_user': {'$ne': True}, 'balance': {'$gt': 0.0}, 'telegram_id': {'$gt': 42},
+    }
+
+    active = engine.compile('active')
+    lookup, = stages(active, '$lookup')
+    assert lookup['from'] == 'orders'
+    # Equality join on the indexed field, not let/$expr
+    assert (lookup['localField'], lookup['foreignField']) == ('telegram_id', 'telegram_id')
+    assert 'let' not in lookup
+    assert any('$group' in stage for stage in lookup['pipeline'])
+    assert stages(active, '$match')[-1] == {'orders_count': {'$gte': 1}}
+    # Cursor order is fixed before the join, the projection is last
+    assert active[1] == {'$sort': {'telegram_id': 1}}
+    assert active[-1] == {'$project': {'_id': 0, 'telegram_id': 1}}
+
+    assert stages(engine.compile({'include_blocked': True}), '$match') == [{}]
+
+
+def test_activity_cutoffs():
+    engine = SegmentEngine()
+    before = (datetime.now(timezone.utc) - timedelta(days=30)).isoformat()
+
+    dormant = stages(engine.compile({'inactive_for_days': 30, 'max_orders': 0}), '$match')[-1]
+    cutoff = dormant['$or'][0]['last_activity_at']['$lt']
+    assert before <= cutoff < datetime.now(timezone.utc).isoformat()
+    assert dormant['$or'][1] == {'last_activity_at': None}      # never active is inactive
+    assert dormant['orders_count'] == {'$lte': 0}
+
+    window = stages(engine.compile({'active_within_days': 30, 'inactive_for_days': 7}), '$match')[-1]
+    assert set(window['last_activity_at']) == {'$gte', '$lt'}
+
+
+def test_invalid_definitions():
+    engine = SegmentEngine()
+    for segment in ('vip', {'country': 'US'}, {'min_orders': -1}, {'min_orders': 'many'},
+                    {'include_blocked': 'yes'}):
+        with pytest.raises(ValueError):
+            engine.resolve(segment)
+    assert engine.resolve({'min_orders': '2', 'max_orders': None}) == {'min_orders': 2}
+
+
+@pytest.mark.asyncio
+async def test_counts_are_cached_for_preview():
+    engine = SegmentEngine(count_cache_ttl_seconds=60)
+    db = make_db([{'total': 7}])
+
+    assert await engine.count(db, 'active') == 7
+    assert await engine.count(db, {'min_orders': 1}) == 7   # same definition, same cache entry
+    assert db.users.aggregate.call_count == 1
+    pipeline = db.users.aggregate.call_args.args[0]
+    assert pipeline[-1] == {'$count': 'total'} and not stages(pipeline, '$sort')
+
+    assert await engine.count(db, 'active', use_cache=False) == 7
+    assert db.users.aggregate.call_count == 2
+    assert engine.get_stats()['cache_hits'] == 1
+
+    assert await engine.count(make_db([]), 'premium') == 0
+
+
+@pytest.mark.asyncio
+async def test_stream_yields_telegram_ids():
+    engine = SegmentEngine()
+    db = make_db([{'telegram_id': 5}, {'telegram_id': 9}])
+
+    assert [tid async for tid in engine.stream(db, 'all', after=3, batch_size=100)] == [5, 9]
+    kwargs = db.users.aggregate.call_args.kwargs
+    assert kwargs == {'allowDiskUse': True, 'batchSize': 100}
+    assert db.users.aggregate.call_args.args[0][0]['$match']['telegram_id'] == {'$gt': 3}
@@ -331,10 +331,10 @@ async def test_fetch_rates_from_shipstation_success():
         }
     })
     
-    with patch('httpx.AsyncClient') as mock_client:
+    with patch('services.shipping_service.get_client_for_url') as mock_client:
         mock_client_instance = AsyncMock()
         mock_client_instance.post = AsyncMock(return_value=mock_response)
-        mock_client.return_value.__aenter__.return_value = mock_client_instance
+        mock_client.return_value = mock_client_instance
         
         success, rates, error = await fetch_rates_from_shipstation(
             rate_request={},
@@ -358,10 +358,10 @@ async def test_fetch_rates_from_shipstation_api_error():
     mock_response.status_code = 400
     mock_response.text = 'Bad Request'
     
-    with patch('httpx.AsyncClient') as mock_client:
+    with patch('services.shipping_service.get_client_for_url') as mock_client:
         mock_client_instance = AsyncMock()
         mock_client_instance.post = AsyncMock(return_value=mock_response)
-        mock_client.return_value.__aenter__.return_value = mock_client_instance
+        mock_client.return_value = mock_client_instance
         
         success, rates, error = await fetch_rates_from_shipstation(
             rate_request={},
@@ -382,10 +382,10 @@ async def test_fetch_rates_from_shipstation_timeout():
     from unittest.mock import AsyncMock
     import httpx
     
-    with patch('httpx.AsyncClient') as mock_client:
+    with patch('services.shipping_service.get_client_for_url') as mock_client:
         mock_client_instance = AsyncMock()
         mock_client_instance.post = AsyncMock(side_effect=httpx.TimeoutException("timeout"))
-        mock_client.return_value.__aenter__.return_value = mock_client_instance
+        mock_client.return_value = mock_client_instance
         
         success, rates, error = await fetch_rates_from_shipstation(
             rate_request={},
@@ -410,10 +410,10 @@ async def test_fetch_rates_from_shipstation_no_rates():
         }
     })
     
-    with patch('httpx.AsyncClient') as mock_client:
+    with patch('services.shipping_service.get_client_for_url') as mock_client:
         mock_client_instance = AsyncMock()
         mock_client_instance.post = AsyncMock(return_value=mock_response)
-        mock_client.return_value.__aenter__.return_value = mock_client_instance
+        mock_client.return_value = mock_client_instance
         
         success, rates, error = await fetch_rates_from_shipstation(
             rate_request={},
@@ -428,6 +428,31 @@ async def test_fetch_rates_from_shipstation_no_rates():
     assert "no rates" in error.lower()
 
 
+@pytest.mark.asyncio
+async def test_find_purchased_label_by_external_shipment_id():
+    """Label bought by a timed-out attempt is found through its shipment"""
+    from services.shipping_service import find_purchased_label
+    
+    shipment = Mock(status_code=200, json=Mock(return_value={'shipment_id': 'se-1'}))
+    labels = Mock(status_code=200, json=Mock(return_value={'labels': [
+        {'label_id': 'l0', 'status': 'voided', 'tracking_number': 'T0'},
+        {'label_id': 'l1', 'status': 'completed', 'tracking_number': 'T1'},
+    ]}))
+    client = AsyncMock()
+    client.get = AsyncMock(side_effect=[shipment, labels])
+    
+    with patch('services.http_clients.get_http_client', return_value=client):
+        shipment_id, label = await find_purchased_label('label-order-1', 'key')
+    
+    assert shipment_id == 'se-1'
+    assert label['label_id'] == 'l1'
+    assert client.get.await_args_list[0].args[0].endswith('/external_shipment_id/label-order-1')
+    
+    client.get = AsyncMock(return_value=Mock(status_code=404))
+    with patch('services.http_clients.get_http_client', return_value=client):
+        assert await find_purchased_label('label-order-2', 'key') == (None, None)
+
+
 # ============================================================
 # INTEGRATION TESTS
 # ============================================================
@@ -465,10 +490,10 @@ async def test_full_rate_fetching_pipeline(sample_order_data, sample_carrier_ids
         }
     })
     
-    with patch('httpx.AsyncClient') as mock_client:
+    with patch('services.shipping_service.get_client_for_url') as mock_client:
         mock_client_instance = AsyncMock()
         mock_client_instance.post = AsyncMock(return_value=mock_response)
-        mock_client.return_value.__aenter__.return_value = mock_client_instance
+        mock_client.return_value = mock_client_instance
         
         success, rates, error = await fetch_rates_from_shipstation(
             request, {}, 'https://test', 30
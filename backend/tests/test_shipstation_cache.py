@@ -0,0 +1,147 @@
+"""
+Tests for two-tier ShipStation rate cache (services/shipstation_cache.py)
+"""
+import pytest
+from datetime import datetime, timezone, timedelta
+from unittest.mock import AsyncMock, Mock
+from services.shipstation_cache import ShipStationCache
+
+
+RATES = [{'carrier': 'UPS', 'amount': 12.5}, {'carrier': 'USPS', 'amount': 8.1}]
+
+
+@pytest.fixture
+def rate_db():
+    db = Mock()
+    db.rate_quotes = Mock()
+    db.rate_quotes.create_index = AsyncMock()
+    db.rate_quotes.find_one = AsyncMock(return_value=None)
+    db.rate_quotes.replace_one = AsyncMock()
+    db.rate_quotes.delete_one = AsyncMock(return_value=Mock(deleted_count=1))
+    return db
+
+
+@pytest.mark.asyncio
+async def test_l1_hit_and_miss():
+    cache = ShipStationCache()
+
+    assert await cache.get('10001', '90001', 2.0) is None
+    await cache.set('10001', '90001', 2.0, RATES)
+    assert await cache.get('10001', '90001', 2.0) == RATES
+
+    stats = cache.get_stats()
+    assert stats['hits'] == 1
+    assert stats['misses'] == 1
+    assert stats['l1']['entries'] == 1
+    assert stats['l2']['enabled'] is False
+
+
+@pytest.mark.asyncio
+async def test_l1_ttl_expiration():
+    cache = ShipStationCache(cache_duration_minutes=1)
+    await cache.set('10001', '90001', 2.0, RATES)
+
+    key = cache._generate_cache_key('10001', '90001', 2.0)
+    cache._cache[key]['timestamp'] -= timedelta(minutes=2)
+
+    assert await cache.get('10001', '90001', 2.0) is None
+    assert cache.get_stats()['l1']['expirations'] == 1
+    assert cache.get_stats()['l1']['bytes'] == 0
+
+
+@pytest.mark.asyncio
+async def test_l1_lru_eviction_by_entries():
+    cache = ShipStationCache(max_entries=2)
+    await cache.set('10001', '90001', 1.0, RATES)
+    await cache.set('10001', '90002', 1.0, RATES)
+
+    # Touch first entry so the second one becomes LRU
+    assert await cache.get('10001', '90001', 1.0) == RATES
+    await cache.set('10001', '90003', 1.0, RATES)
+
+    assert await cache.get('10001', '90002', 1.0) is None
+    assert await cache.get('10001', '90001', 1.0) == RATES
+    assert cache.get_stats()['l1']['evictions'] == 1
+
+
+@pytest.mark.asyncio
+async def test_l1_eviction_by_bytes():
+    cache = ShipStationCache(max_bytes=100)
+    await cache.set('10001', '90001', 1.0, RATES)
+    await cache.set('10001', '90002', 1.0, RATES)
+
+    stats = cache.get_stats()['l1']
+    assert stats['entries'] == 1
+    assert stats['bytes'] <= 100
+
+
+@pytest.mark.asyncio
+async def test_set_writes_through_to_l2(rate_db):
+    cache = ShipStationCache()
+    await cache.attach_db(rate_db)
+    rate_db.rate_quotes.create_index.assert_awaited_once_with("expires_at", expireAfterSeconds=0)
+
+    await cache.set('10001', '90001', 2.0, RATES)
+
+    rate_db.rate_quotes.replace_one.assert_awaited_once()
+    doc = rate_db.rate_quotes.replace_one.call_args[0][1]
+    assert doc['rates'] == RATES
+    assert doc['expires_at'] - doc['created_at'] == cache.cache_duration
+    assert cache.get_stats()['l2']['writes'] == 1
+
+
+@pytest.mark.asyncio
+async def test_l2_hit_promotes_to_l1(rate_db):
+    now = datetime.now(timezone.utc)
+    rate_db.rate_quotes.find_one = AsyncMock(return_value={
+        '_id': 'k', 'rates': RATES, 'route': '10001 → 90001', 'weight': 2.0,
+        'created_at': now, 'expires_at': now + timedelta(minutes=60)
+    })
+    cache = ShipStationCache()
+    await cache.attach_db(rate_db)
+
+    assert await cache.get('10001', '90001', 2.0) == RATES
+    assert await cache.get('10001', '90001', 2.0) == RATES
+
+    # Second read served from L1
+    assert rate_db.rate_quotes.find_one.await_count == 1
+    stats = cache.get_stats()
+    assert stats['l2']['hits'] == 1
+    assert stats['l1']['hits'] == 1
+
+
+@pytest.mark.asyncio
+async def test_l2_expired_doc_is_miss(rate_db):
+    past = datetime.now(timezone.utc) - timedelta(hours=2)
+    rate_db.rate_quotes.find_one = AsyncMock(return_value={
+        '_id': 'k', 'rates': RATES, 'created_at': past, 'expires_at': past + timedelta(minutes=60)
+    })
+    cache = ShipStationCache()
+    await cache.attach_db(rate_db)
+
+    assert await cache.get('10001', '90001', 2.0) is None
+    assert cache.get_stats()['l2']['misses'] == 1
+
+
+@pytest.mark.asyncio
+async def test_l2_errors_degrade_to_l1(rate_db):
+    rate_db.rate_quotes.find_one = AsyncMock(side_effect=Exception("mongo down"))
+    rate_db.rate_quotes.replace_one = AsyncMock(side_effect=Exception("mongo down"))
+    cache = ShipStationCache()
+    await cache.attach_db(rate_db)
+
+    assert await cache.get('10001', '90001', 2.0) is None
+    await cache.set('10001', '90001', 2.0, RATES)
+    assert await cache.get('10001', '90001', 2.0) == RATES
+    assert cache.get_stats()['l2']['errors'] == 2
+
+
+@pytest.mark.asyncio
+async def test_delete_removes_both_tiers(rate_db):
+    cache = ShipStationCache()
+    await cache.attach_db(rate_db)
+    await cache.set('10001', '90001', 2.0, RATES)
+
+    assert await cache.delete('10001', '90001', 2.0) is True
+    rate_db.rate_quotes.delete_one.assert_awaited_once()
+    assert cache.get_stats()['l1']['entries'] == 0
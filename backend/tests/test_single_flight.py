@@ -0,0 +1,94 @@
+"""
+Tests for single-flight request coalescing (utils/single_flight.py)
+"""
+import asyncio
+import pytest
+from utils.single_flight import SingleFlight
+
+
+@pytest.mark.asyncio
+async def test_concurrent_calls_share_one_upstream_call():
+    """Concurrent misses for the same key await one call"""
+    flight = SingleFlight("test")
+    calls = 0
+    release = asyncio.Event()
+    
+    async def fetch(value):
+        nonlocal calls
+        calls += 1
+        await release.wait()
+        return value
+    
+    waiters = [asyncio.create_task(flight.do("key", fetch, [1, 2])) for _ in range(5)]
+    await asyncio.sleep(0)
+    release.set()
+    results = await asyncio.gather(*waiters)
+    
+    assert calls == 1
+    assert all(r == [1, 2] for r in results)
+    stats = flight.get_stats()
+    assert stats['upstream_calls'] == 1
+    assert stats['coalesced'] == 4
+    assert stats['in_flight'] == 0
+
+
+@pytest.mark.asyncio
+async def test_different_keys_are_not_coalesced():
+    """Different keys run independently"""
+    flight = SingleFlight("test")
+    
+    async def fetch(value):
+        await asyncio.sleep(0)
+        return value
+    
+    results = await asyncio.gather(
+        flight.do("a", fetch, 1),
+        flight.do("b", fetch, 2)
+    )
+    
+    assert results == [1, 2]
+    assert flight.get_stats()['coalesced'] == 0
+
+
+@pytest.mark.asyncio
+async def test_exception_is_shared_and_key_released():
+    """All waiters see the error; next call starts a new flight"""
+    flight = SingleFlight("test")
+    release = asyncio.Event()
+    
+    async def failing():
+        await release.wait()
+        raise RuntimeError("upstream down")
+    
+    waiters = [asyncio.create_task(flight.do("key", failing)) for _ in range(3)]
+    await asyncio.sleep(0)
+    release.set()
+    results = await asyncio.gather(*waiters, return_exceptions=True)
+    
+    assert all(isinstance(r, RuntimeError) for r in results)
+    assert flight.get_stats()['errors'] == 1
+    
+    async def ok():
+        return "fresh"
+    
+    assert await flight.do("key", ok) == "fresh"
+
+
+@pytest.mark.asyncio
+async def test_cancelled_waiter_does_not_cancel_shared_call():
+    """A caller giving up leaves the flight running for others"""
+    flight = SingleFlight("test")
+    release = asyncio.Event()
+    
+    async def fetch():
+        await release.wait()
+        return "done"
+    
+    first = asyncio.create_task(flight.do("key", fetch))
+    second = asyncio.create_task(flight.do("key", fetch))
+    await asyncio.sleep(0)
+    first.cancel()
+    await asyncio.sleep(0)
+    release.set()
+    
+    assert await second == "done"
@@ -0,0 +1,137 @@
+"""
+Tests for Telegram file_id reuse (services/telegram_delivery.py)
+"""
+import io
+import pytest
+import telegram.error
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, Mock, patch
+from services.telegram_delivery import TelegramDelivery, is_file_id_rejected, extract_file_id
+
+
+def document_message(file_id):
+    return SimpleNamespace(document=SimpleNamespace(file_id=file_id), photo=None)
+
+
+@pytest.fixture
+def delivery():
+    return TelegramDelivery(timeout=5)
+
+
+@pytest.mark.asyncio
+async def test_known_file_id_is_sent_without_upload(delivery):
+    bot = Mock()
+    bot.send_document = AsyncMock(return_value=document_message('FILE1'))
+    upload = Mock()
+
+    message, file_id = await delivery.send_document(bot, 42, file_id='FILE1', upload=upload, caption='x')
+
+    assert file_id == 'FILE1'
+    upload.assert_not_called()
+    bot.send_document.assert_awaited_once_with(chat_id=42, document='FILE1', caption='x')
+    assert delivery.get_stats()['sent_by_file_id'] == 1
+
+
+@pytest.mark.asyncio
+async def test_upload_returns_new_file_id(delivery):
+    bot = Mock()
+    bot.send_document = AsyncMock(return_value=document_message('NEW'))
+    source = io.BytesIO(b'%PDF')
+
+    message, file_id = await delivery.send_document(bot, 42, upload=lambda: source, filename='t.pdf')
+
+    assert file_id == 'NEW'
+    assert bot.send_document.await_args.kwargs['document'] is source
+    assert source.closed
+    assert delivery.uploads == 1
+
+
+@pytest.mark.asyncio
+async def test_rejected_file_id_falls_back_to_upload(delivery):
+    bot = Mock()
+    bot.send_document = AsyncMock(side_effect=[
+        telegram.error.BadRequest("Wrong file identifier/http url specified"),
+        document_message('FRESH')
+    ])
+
+    message, file_id = await delivery.send_document(bot, 42, file_id='STALE', upload=lambda: b'%PDF')
+
+    assert file_id == 'FRESH'
+    assert bot.send_document.await_count == 2
+    assert bot.send_document.await_args.kwargs['document'] == b'%PDF'
+    assert delivery.rejected == 1
+
+
+@pytest.mark.asyncio
+async def test_other_bad_request_is_not_retried(delivery):
+    bot = Mock()
+    bot.send_document = AsyncMock(side_effect=telegram.error.BadRequest("Chat not found"))
+    upload = Mock()
+
+    with pytest.raises(telegram.error.BadRequest):
+        await delivery.send_document(bot, 42, file_id='FILE1', upload=upload)
+    upload.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_async_upload_source_and_photo_file_id(delivery):
+    bot = Mock()
+    bot.send_photo = AsyncMock(return_value=SimpleNamespace(photo=[
+        SimpleNamespace(file_id='small'), SimpleNamespace(file_id='large')
+    ]))
+
+    async def load():
+        return 'https://example.com/a.png'
+
+    message, file_id = await delivery.send_photo(bot, 7, upload=load)
+
+    assert file_id == 'large'
+    assert bot.send_photo.await_args.kwargs['photo'] == 'https://example.com/a.png'
+
+
+def test_helpers():
+    assert is_file_id_rejected(telegram.error.BadRequest("Wrong remote file identifier specified"))
+    assert not is_file_id_rejected(telegram.error.BadRequest("Message is too long"))
+    assert not is_file_id_rejected(ValueError("wrong file identifier"))
+    assert extract_file_id(None, 'document') is None
+    assert extract_file_id(document_message('D'), 'document') == 'D'
+
+
+@pytest.mark.asyncio
+async def test_send_label_records_file_id_on_first_upload(tmp_path):
+    from services.shipping_service import send_label_to_user
+
+    pdf = tmp_path / 'label.pdf'
+    pdf.write_bytes(b'%PDF')
+    bot = Mock()
+    bot.send_document = AsyncMock(return_value=document_message('LABELFILE'))
+
+    async def passthrough(coro):
+        return await coro
+
+    with patch('services.shipping_service.record_label_file_id', new=AsyncMock()) as record:
+        success, error = await send_label_to_user(
+            bot, 42, None, 'order1', '9400', 'USPS', passthrough,
+            pdf_path=str(pdf), label_id='se-1'
+        )
+
+    assert success is True
+    record.assert_awaited_once_with('se-1', 'LABELFILE')
+
+
+@pytest.mark.asyncio
+async def test_send_label_by_file_id_does_not_rewrite_label():
+    from services.shipping_service import send_label_to_user
+
+    bot = Mock()
+    bot.send_document = AsyncMock(return_value=document_message('LABELFILE'))
+
+    with patch('services.shipping_service.record_label_file_id', new=AsyncMock()) as record:
+        success, error = await send_label_to_user(
+            bot, 42, None, 'order1', '9400', 'USPS', AsyncMock(),
+            file_id='LABELFILE', label_id='se-1'
+        )
+
+    assert success is True
+    assert bot.send_document.await_args.kwargs['document'] == 'LABELFILE'
+    record.assert_not_awaited()
@@ -0,0 +1,124 @@
+"""
+Tests for the outbound Telegram send scheduler (services/telegram_send_scheduler.py)
+"""
+import asyncio
+import time
+from datetime import timedelta
+
+import pytest
+from telegram.error import RetryAfter
+
+from services.telegram_send_scheduler import SendPriority, TelegramSendScheduler, is_throttled_endpoint, send_priority
+
+
+def make_scheduler(**kwargs):
+    params = dict(global_rate=1000, global_burst=1000, chat_rate=1000, chat_burst=1000)
+    params.update(kwargs)
+    return TelegramSendScheduler(**params)
+
+
+async def send(scheduler, chat_id, log=None, endpoint='sendMessage', rate_limit_args=None, callback=None):
+    async def default_callback():
+        if log is not None:
+            log.append((chat_id, time.monotonic()))
+        return True
+
+    return await scheduler.process_request(
+        callback=callback or default_callback, args=(), kwargs={}, endpoint=endpoint,
+        data={'chat_id': chat_id}, rate_limit_args=rate_limit_args,
+    )
+
+
+@pytest.mark.asyncio
+async def test_interactive_reply_overtakes_waiting_broadcast():
+    scheduler = make_scheduler(global_rate=20, global_burst=1)
+    log = []
+
+    with send_priority(SendPriority.BROADCAST):
+        broadcast = [asyncio.create_task(send(scheduler, chat_id, log)) for chat_id in (1, 2, 3)]
+    await asyncio.sleep(0)   # first broadcast takes the only token, two wait
+    await send(scheduler, 99, log)
+    await asyncio.gather(*broadcast)
+    await scheduler.shutdown()
+
+    assert [chat_id for chat_id, _ in log] == [1, 99, 2, 3]
+    stats = scheduler.get_stats()['classes']
+    assert stats['broadcast']['sent'] == 3 and stats['interactive']['sent'] == 1
+
+
+@pytest.mark.asyncio
+async def test_per_chat_bucket_does_not_block_other_chats():
+    scheduler = make_scheduler(chat_rate=10, chat_burst=1)
+    log = []
+
+    await asyncio.gather(send(scheduler, 1, log), send(scheduler, 1, log), send(scheduler, 2, log))
+    await scheduler.shutdown()
+
+    times = {}
+    for chat_id, sent_at in log:
+        times.setdefault(chat_id, []).append(sent_at)
+    assert times[1][1] - times[1][0] >= 0.09            # 10/s in one chat
+    assert times[2][0] - times[1][0] < 0.05             # other chat is not delayed
+
+
+@pytest.mark.asyncio
+async def test_retry_after_pauses_only_the_chat_bucket():
+    scheduler = make_scheduler()
+    calls = []
+
+    async def flood_once():
+        calls.append(time.monotonic())
+        if len(calls) == 1:
+            raise RetryAfter(timedelta(milliseconds=200))
+        return 'sent'
+
+    start = time.monotonic()
+    flooded = asyncio.create_task(send(scheduler, 1, callback=flood_once))
+    await asyncio.sleep(0.01)
+    other_log = []
+    await send(scheduler, 2, other_log)
+    other_done = time.monotonic() - start
+
+    assert await flooded == 'sent'
+    await scheduler.shutdown()
+
+    assert other_done < 0.1                              # chat 2 was not paused
+    assert calls[1] - calls[0] >= 0.19                   # chat 1 waited Retry-After
+    assert scheduler.chat_pauses == 1 and scheduler.global_pauses == 0
+
+
+@pytest.mark.asyncio
+async def test_retry_after_is_raised_when_retries_exhausted():
+    scheduler = make_scheduler(max_retries=1)
+
+    async def always_flooded():
+        raise RetryAfter(timedelta(milliseconds=10))
+
+    with pytest.raises(RetryAfter):
+        await send(scheduler, 1, callback=always_flooded)
+    await scheduler.shutdown()
+
+    assert scheduler.retries_exhausted == 1
+
+
+@pytest.mark.asyncio
+async def test_priority_from_rate_limit_args_and_unthrottled_endpoints():
+    scheduler = make_scheduler(global_rate=1, global_burst=1)
+
+    await send(scheduler, 1, rate_limit_args={'priority': SendPriority.ADMIN})
+    start = time.monotonic()
+    for _ in range(5):   # global bucket is empty, but callback answers are not messages
+        await send(scheduler, 1, endpoint='answerCallbackQuery')
+    await scheduler.shutdown()
+
+    assert time.monotonic() - start < 0.1
+    assert scheduler.unthrottled == 5
+    assert scheduler.get_stats()['classes']['admin']['sent'] == 1
+
+
+def test_only_message_endpoints_are_throttled():
+    assert is_throttled_endpoint('sendMessage') and is_throttled_endpoint('sendDocument')
+    assert is_throttled_endpoint('editMessageText') and is_throttled_endpoint('copyMessage')
+    assert not is_throttled_endpoint('sendChatAction')       # typing indicator
+    assert not is_throttled_endpoint('editChatInviteLink')
+    assert not is_throttled_endpoint('answerCallbackQuery')
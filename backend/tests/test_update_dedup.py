@@ -0,0 +1,91 @@
+"""
+Tests for webhook update_id deduplication (services/update_dedup.py)
+"""
+import pytest
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, Mock, patch
+from pymongo.errors import DuplicateKeyError
+from services.update_dedup import UpdateDeduplicator
+from services.update_queue import TelegramUpdateQueue
+
+
+@pytest.mark.asyncio
+async def test_redelivered_update_is_duplicate():
+    dedup = UpdateDeduplicator(ring_size=10)
+
+    assert not await dedup.check_and_mark(100)
+    assert await dedup.check_and_mark(100)
+    assert not await dedup.check_and_mark(101)
+    assert dedup.get_stats()['duplicates'] == 1
+
+
+@pytest.mark.asyncio
+async def test_ring_evicts_oldest_id():
+    dedup = UpdateDeduplicator(ring_size=3)
+    for update_id in (1, 2, 3, 4):
+        await dedup.check_and_mark(update_id)
+
+    assert dedup.get_stats()['ring_used'] == 3
+    assert not await dedup.check_and_mark(1)   # evicted
+    assert await dedup.check_and_mark(4)
+
+
+@pytest.mark.asyncio
+async def test_shared_index_catches_other_workers():
+    db = Mock()
+    db.processed_updates.insert_one = AsyncMock(side_effect=[None, DuplicateKeyError('E11000')])
+    worker_a, worker_b = UpdateDeduplicator(shared=True), UpdateDeduplicator(shared=True)
+    worker_a._db = worker_b._db = db
+
+    assert not await worker_a.check_and_mark(7)
+    assert await worker_b.check_and_mark(7)
+    assert worker_b.get_stats()['shared_duplicates'] == 1
+
+
+@pytest.mark.asyncio
+async def test_shared_errors_fail_open():
+    db = Mock()
+    db.processed_updates.insert_one = AsyncMock(side_effect=Exception('mongo down'))
+    dedup = UpdateDeduplicator(shared=True)
+    dedup._db = db
+
+    assert not await dedup.check_and_mark(9)
+    assert dedup.shared_errors == 1
+
+
+@pytest.mark.asyncio
+async def test_webhook_acks_duplicate_without_dispatch_and_forgets_rejected():
+    from routers.webhooks import telegram_webhook
+
+    queue = TelegramUpdateQueue()
+    queue.submit = Mock(side_effect=[False, True])
+    dedup = UpdateDeduplicator()
+    srv = SimpleNamespace(application=SimpleNamespace(running=True, bot=Mock()))
+    request = SimpleNamespace(body=AsyncMock(return_value=b'{"update_id": 5}'))
+
+    with patch.dict('sys.modules', {'server': srv}), \
+         patch('services.update_queue.update_queue', queue), \
+         patch('services.update_dedup.update_dedup', dedup), \
+         patch('telegram.Update.de_json', return_value=SimpleNamespace(update_id=5)):
+        rejected = await telegram_webhook(request)      # queue full: 503, id forgotten
+        accepted = await telegram_webhook(request)      # Telegram's redelivery
+        duplicate = await telegram_webhook(request)     # redelivered again
+
+    assert rejected.status_code == 503
+    assert accepted == {"ok": True} and duplicate == {"ok": True}
+    assert queue.submit.call_count == 2
+    assert dedup.duplicates == 1
+
+
+@pytest.mark.asyncio
+async def test_forgotten_id_leaves_the_ring():
+    dedup = UpdateDeduplicator(ring_size=2)
+
+    assert await dedup.check_and_mark(1) is False
+    await dedup.forget(1)                         # 503: Telegram will redeliver
+    assert await dedup.check_and_mark(1) is False
+    assert await dedup.check_and_mark(2) is False
+
+    # No stale copy of 1 is evicted here, so the redelivered 1 is still known
+    assert await dedup.check_and_mark(1) is True
+    assert list(dedup._ring) == [1, 2]
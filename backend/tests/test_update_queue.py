@@ -0,0 +1,170 @@
+"""
+Tests for the fast-ack, chat-sharded update queue (services/update_queue.py)
+"""
+import asyncio
+import pytest
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, Mock, patch
+from services.update_queue import TelegramUpdateQueue, LaneUpdateProcessor, non_blocking_handlers
+
+
+def make_update(update_id, chat_id=1):
+    return SimpleNamespace(update_id=update_id, effective_chat=SimpleNamespace(id=chat_id))
+
+
+@pytest.mark.asyncio
+async def test_full_lane_rejects_instead_of_growing():
+    queue = TelegramUpdateQueue(lanes=1, lane_size=2)
+    gate = asyncio.Event()
+
+    async def slow(update):
+        await gate.wait()
+
+    await queue.start(SimpleNamespace(process_update=slow))
+    try:
+        assert queue.submit(make_update(1))
+        await asyncio.sleep(0)              # worker takes update 1 and blocks
+        assert queue.submit(make_update(2))
+        assert queue.submit(make_update(3))
+        assert not queue.submit(make_update(4))
+
+        stats = queue.get_stats()
+        assert stats['depth'] == 2 and stats['rejected'] == 1 and stats['accepted'] == 3
+        assert stats['busiest_lane_depth'] == 2
+    finally:
+        gate.set()
+        await queue.stop()
+
+    assert queue.processed == 3
+
+
+@pytest.mark.asyncio
+async def test_handler_error_fails_only_its_update():
+    queue = TelegramUpdateQueue(lanes=1)
+    seen = []
+
+    async def process(update):
+        seen.append(update.update_id)
+        if update.update_id == 1:
+            raise RuntimeError('handler bug')
+
+    await queue.start(SimpleNamespace(process_update=process))
+    queue.submit(make_update(1))
+    queue.submit(make_update(2))
+    await queue.stop()
+
+    assert seen == [1, 2]
+    assert queue.failed == 1 and queue.processed == 1
+    assert queue.get_stats()['queue_wait_ms']['p50'] is not None
+
+
+@pytest.mark.asyncio
+async def test_dead_worker_is_restarted():
+    queue = TelegramUpdateQueue(lanes=1)
+    worker = queue._worker
+    crashes = []
+
+    async def crash_once(n):
+        if not crashes:
+            crashes.append(n)
+            raise RuntimeError('worker died')
+        await worker(n)
+
+    queue._worker = crash_once
+    process = AsyncMock()
+    await queue.start(SimpleNamespace(process_update=process))
+    await asyncio.sleep(0.01)
+    queue.submit(make_update(1))
+    await queue.stop()
+
+    assert queue.worker_restarts == 1
+    process.assert_awaited_once()
+
+
+@pytest.mark.asyncio
+async def test_one_chat_is_ordered_while_chats_run_in_parallel():
+    queue = TelegramUpdateQueue(lanes=4)
+    running = {}
+    overlap = []
+    log = []
+
+    async def process(update):
+        chat = update.effective_chat.id
+        if running.get(chat):
+            overlap.append(chat)
+        running[chat] = True
+        await asyncio.sleep(0.02)
+        log.append((chat, update.update_id))
+        running[chat] = False
+
+    await queue.start(SimpleNamespace(process_update=process))
+    for update_id in range(1, 7):
+        assert queue.submit(make_update(update_id, chat_id=1 + update_id % 2))
+    started = asyncio.get_running_loop().time()
+    await queue.stop()
+    elapsed = asyncio.get_running_loop().time() - started
+
+    assert overlap == []
+    assert [u for chat, u in log if chat == 2] == [1, 3, 5]
+    assert [u for chat, u in log if chat == 1] == [2, 4, 6]
+    assert elapsed < 0.1                   # 2 chats x 3 updates x 20ms, chats overlapped
+    assert queue.lane_for(make_update(1, chat_id=-1001)) == queue.lane_for(make_update(2, chat_id=-1001))
+
+
+@pytest.mark.asyncio
+async def test_polling_processor_runs_updates_in_lanes():
+    queue = TelegramUpdateQueue(lanes=2)
+    await queue.start(SimpleNamespace(process_update=AsyncMock()))
+    processor = LaneUpdateProcessor(queue)
+    order = []
+
+    async def handler(n, delay):
+        await asyncio.sleep(delay)
+        order.append(n)
+
+    await asyncio.gather(
+        processor.process_update(make_update(1), handler(1, 0.02)),
+        processor.process_update(make_update(2), handler(2, 0)),
+    )
+    await queue.stop()
+
+    assert order == [1, 2]
+    assert queue.processed == 2
+
+
+@pytest.mark.asyncio
+async def test_webhook_answers_503_with_retry_after_when_full():
+    from routers.webhooks import telegram_webhook
+
+    queue = TelegramUpdateQueue(retry_after_seconds=7)   # not started: rejects
+    srv = SimpleNamespace(application=SimpleNamespace(running=True, bot=Mock()))
+    request = SimpleNamespace(body=AsyncMock(return_value=b'{"update_id": 1}'))
+
+    with patch.dict('sys.modules', {'server': srv}), \
+         patch('services.update_queue.update_queue', queue), \
+         patch('telegram.Update.de_json', return_value=make_update(1)):
+        response = await telegram_webhook(request)
+
+    assert response.status_code == 503
+    assert response.headers['Retry-After'] == '7'
+
+
+def test_non_blocking_handlers_are_reported():
+    from telegram.ext import CallbackQueryHandler, ConversationHandler
+
+    async def noop(update, context):
+        pass
+
+    ordered = ConversationHandler(
+        entry_points=[CallbackQueryHandler(noop)], states={0: [CallbackQueryHandler(noop)]},
+        fallbacks=[], name='order_conversation'
+    )
+    racy = ConversationHandler(
+        entry_points=[CallbackQueryHandler(noop)], states={0: [CallbackQueryHandler(noop, block=False)]},
+        fallbacks=[], name='refund', block=False
+    )
+
+    assert non_blocking_handlers(SimpleNamespace(handlers={0: [ordered]})) == []
+    assert non_blocking_handlers(SimpleNamespace(handlers={0: [ordered, racy]})) == [
+        'refund', 'refund/CallbackQueryHandler'
+    ]
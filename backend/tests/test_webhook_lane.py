@@ -0,0 +1,101 @@
+"""
+Tests for the secret-token webhook lane (middleware/security.py)
+"""
+import httpx
+import pytest
+from unittest.mock import patch
+from fastapi import FastAPI
+
+from middleware.error_handler_middleware import error_handler_middleware
+from middleware.logging import RequestLoggingMiddleware
+from middleware.rate_limiting import RateLimitMiddleware
+from middleware.security import TelegramWebhookLane, telegram_webhook_guard
+from utils.bot_config import BotConfig
+
+SECRET = 'lane-secret_1'
+TELEGRAM_IP = ('149.154.167.220', 443)
+
+
+def make_app():
+    app = FastAPI()
+    calls = []
+
+    @app.post('/api/telegram/webhook')
+    async def webhook():
+        calls.append(1)
+        return {'ok': True}
+
+    @app.get('/api/other')
+    async def other():
+        return {'ok': True}
+
+    # Same order as server.py
+    app.add_middleware(RequestLoggingMiddleware, log_body=False)
+    app.add_middleware(RateLimitMiddleware, requests_per_minute=3, requests_per_hour=1000)
+    app.middleware('http')(error_handler_middleware)
+    app.add_middleware(TelegramWebhookLane, path='/api/telegram/webhook')
+    return app, calls
+
+
+def make_client(app):
+    transport = httpx.ASGITransport(app=app, client=TELEGRAM_IP)
+    return httpx.AsyncClient(transport=transport, base_url='http://test')
+
+
+@pytest.mark.asyncio
+async def test_authenticated_webhook_skips_ip_rate_limit():
+    app, calls = make_app()
+    headers = {'X-Telegram-Bot-Api-Secret-Token': SECRET}
+
+    with patch('utils.bot_config.get_webhook_secret_token', return_value=SECRET):
+        async with make_client(app) as client:
+            webhook = [await client.post('/api/telegram/webhook', json={}, headers=headers) for _ in range(10)]
+            other = [await client.get('/api/other') for _ in range(4)]
+
+    assert [r.status_code for r in webhook] == [200] * 10
+    assert len(calls) == 10
+    assert [r.status_code for r in other] == [200, 200, 200, 429]
+    assert 'X-Process-Time' not in webhook[0].headers   # request logging skipped
+
+
+@pytest.mark.asyncio
+async def test_unauthenticated_webhook_rejected_before_handler():
+    app, calls = make_app()
+    rejected = telegram_webhook_guard.rejected
+
+    with patch('utils.bot_config.get_webhook_secret_token', return_value=SECRET):
+        async with make_client(app) as client:
+            missing = await client.post('/api/telegram/webhook', json={})
+            wrong = await client.post('/api/telegram/webhook', json={},
+                                      headers={'X-Telegram-Bot-Api-Secret-Token': SECRET + 'x'})
+
+    assert missing.status_code == wrong.status_code == 401
+    assert missing.content == b''
+    assert calls == []
+    assert telegram_webhook_guard.rejected == rejected + 2
+
+
+@pytest.mark.asyncio
+async def test_no_secret_configured_rejects_everything():
+    app, calls = make_app()
+
+    with patch('utils.bot_config.get_webhook_secret_token', return_value=''):
+        async with make_client(app) as client:
+            response = await client.post('/api/telegram/webhook', json={},
+                                         headers={'X-Telegram-Bot-Api-Secret-Token': ''})
+
+    assert response.status_code == 401
+    assert calls == []
+
+
+def test_secret_token_derived_from_bot_token(monkeypatch):
+    monkeypatch.setenv('BOT_ENVIRONMENT', 'test')
+    monkeypatch.setenv('TEST_BOT_TOKEN', '123456:ABC')
+    monkeypatch.delenv('TELEGRAM_WEBHOOK_SECRET', raising=False)
+
+    derived = BotConfig().get_webhook_secret_token()
+    assert derived == BotConfig().get_webhook_secret_token()   # same on every worker
+    assert len(derived) == 64 and derived.isalnum()
+
+    monkeypatch.setenv('TELEGRAM_WEBHOOK_SECRET', SECRET)
+    assert BotConfig().get_webhook_secret_token() == SECRET
@@ -0,0 +1,91 @@
+"""
+Tests for offline ZIP database (services/zip_database.py)
+"""
+import pytest
+from services.zip_database import ZipDatabase, build_zip_db, normalize_zip
+
+
+ROWS = [
+    ('94102', 'San Francisco', 'CA'),
+    ('10001', 'New York', 'NY'),
+    ('90028', 'Los Angeles', 'CA'),
+    ('90028', 'Hollywood', 'CA'),  # duplicate ZIP - first row wins
+    ('bad', 'Nowhere', 'XX'),
+]
+
+
+@pytest.fixture
+def zip_db(tmp_path):
+    path = str(tmp_path / 'us_zips.bin')
+    assert build_zip_db(ROWS, path) == 3
+    db = ZipDatabase(path)
+    assert db.load() is True
+    yield db
+    db.close()
+
+
+def test_normalize_zip():
+    assert normalize_zip('94102') == '94102'
+    assert normalize_zip(' 94102-1234 ') == '94102'
+    assert normalize_zip('941021234') == '94102'
+    assert normalize_zip('9410') is None
+    assert normalize_zip('San Francisco') is None
+
+
+def test_lookup(zip_db):
+    info = zip_db.lookup('94102')
+    assert info.city == 'San Francisco'
+    assert info.state == 'CA'
+
+    assert zip_db.lookup('90028-0001').city == 'Los Angeles'
+    assert zip_db.lookup('99999') is None
+    assert zip_db.lookup('New York') is None
+
+
+def test_validate_with_data_file(zip_db):
+    assert zip_db.validate('CA', '94102') == (True, None)
+
+    is_valid, error = zip_db.validate('NY', '94102')
+    assert is_valid is False
+    assert 'San Francisco' in error
+    assert zip_db.get_stats()['rejected'] == 1
+
+
+def test_city_matches(zip_db):
+    assert zip_db.city_matches('10001', 'new york') is True
+    assert zip_db.city_matches('90028', 'Hollywood') is False
+    assert zip_db.city_matches('99999', 'Anywhere') is None
+
+
+def test_missing_file_falls_back_to_zip3(tmp_path):
+    db = ZipDatabase(str(tmp_path / 'missing.bin'))
+
+    assert db.load() is False
+    assert db.has_cities is False
+    assert db.lookup('94102') is None
+
+    # State still checked by ZIP3 prefix, but a mismatch is only a warning
+    assert db.validate('CA', '94102') == (True, None)
+    assert db.validate('TX', '73301') == (True, None)
+    is_valid, warning = db.validate('NY', '94102')
+    assert is_valid is True and warning.startswith('⚠️')
+    assert db.get_stats()['warned'] == 1 and db.get_stats()['rejected'] == 0
+    # Unknown/military prefixes and non-ZIP input are never rejected
+    assert db.validate('AE', '09001') == (True, None)
+    assert db.validate('CA', 'abc') == (True, None)
+
+
+def test_prefix_spanning_states_is_not_rejected(zip_db):
+    # 83414 (Alta, WY) has an Idaho prefix; 42223 (Fort Campbell) is KY/TN
+    assert zip_db.validate('WY', '83414')[0] is True
+    assert zip_db.validate('TN', '42223')[0] is True
+    assert zip_db.get_stats()['rejected'] == 0
+
+
+def test_invalid_file_is_ignored(tmp_path):
+    path = tmp_path / 'broken.bin'
+    path.write_bytes(b'not a zip database')
+
+    db = ZipDatabase(str(path))
+    assert db.load() is False
+    assert db.lookup('94102') is None
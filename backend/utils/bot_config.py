@@ -3,6 +3,8 @@ Bot Configuration Manager
 Управление конфигурацией для test и production ботов
 """
 import os
+import hmac
+import hashlib
 import logging
 from typing import Dict, Literal
 
@@ -39,6 +41,7 @@ class BotConfig:
         # Webhook настройки
         self.webhook_base_url = os.environ.get('WEBHOOK_BASE_URL', '')
         self.webhook_path = os.environ.get('WEBHOOK_PATH', '/api/telegram/webhook')
+        self.webhook_secret = os.environ.get('TELEGRAM_WEBHOOK_SECRET', '')
         
         # Legacy поддержка (для обратной совместимости)
         os.environ.get('TELEGRAM_BOT_TOKEN', '')
@@ -125,6 +128,24 @@ class BotConfig:
         
         return f"{base}{path}"
     
+    def get_webhook_secret_token(self) -> str:
+        """
+        Получить secret_token для webhook (X-Telegram-Bot-Api-Secret-Token)
+        
+        TELEGRAM_WEBHOOK_SECRET if set, otherwise derived from the active bot
+        token, so every worker computes the same value without extra config.
+        
+        Returns:
+            Secret token (A-Z, a-z, 0-9, _ and -) или пустую строку
+        """
+        if self.webhook_secret:
+            return self.webhook_secret
+        
+        token = self.get_active_bot_token()
+        if not token:
+            return ''
+        return hmac.new(token.encode(), b'telegram-webhook', hashlib.sha256).hexdigest()
+    
     def is_production(self) -> bool:
         """Проверка что это production окружение"""
         return self.environment == 'production'
@@ -213,6 +234,11 @@ def get_bot_username() -> str:
     return bot_config.get_active_bot_username()
 
 
+def get_webhook_secret_token() -> str:
+    """Получить secret_token для webhook"""
+    return bot_config.get_webhook_secret_token()
+
+
 def is_webhook_mode() -> bool:
     """Проверка что используется webhook режим"""
     return bot_config.should_use_webhook()
@@ -298,6 +324,7 @@ PROD_BOT_USERNAME="bot_prod"
 # Webhook (для production)
 WEBHOOK_BASE_URL="https://example.com"
 WEBHOOK_PATH="/api/telegram/webhook"
+TELEGRAM_WEBHOOK_SECRET="..."  # опционально, по умолчанию из токена бота
 
 КОМБИНАЦИИ:
 ===========
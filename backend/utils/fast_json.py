@@ -0,0 +1,75 @@
+"""
+Fast JSON
+orjson для webhook и ответов API (fallback на stdlib json)
+
+- loads(): parse request bodies (Telegram updates) with orjson
+- dumps(): encode MongoDB documents directly - datetime/date/UUID natively
+  in orjson, ObjectId/Decimal128/Decimal/set via the default hook - instead
+  of FastAPI's jsonable_encoder walking every field in Python first
+- FastJSONResponse: default response class of the app; endpoints that
+  return large lists return it directly, so FastAPI skips jsonable_encoder
+
+Without orjson installed everything falls back to the stdlib json module
+with the same encoding rules.
+"""
+import json
+from decimal import Decimal
+from typing import Any, Union
+
+from bson import ObjectId
+from bson.decimal128 import Decimal128
+from starlette.responses import JSONResponse
+
+try:
+    import orjson
+except ImportError:  # optional: stdlib json fallback
+    orjson = None
+
+
+def _decimal(value: Decimal) -> Union[int, float]:
+    # Same rule as FastAPI's jsonable_encoder
+    return int(value) if value.as_tuple().exponent >= 0 else float(value)
+
+
+def _default(obj: Any) -> Any:
+    """Types orjson/json do not encode on their own"""
+    if isinstance(obj, ObjectId):
+        return str(obj)
+    if isinstance(obj, Decimal128):
+        return _decimal(obj.to_decimal())
+    if isinstance(obj, Decimal):
+        return _decimal(obj)
+    if isinstance(obj, (set, frozenset)):
+        return list(obj)
+    if hasattr(obj, 'isoformat'):  # datetime/date/time on the stdlib path
+        return obj.isoformat()
+    raise TypeError(f"Type is not JSON serializable: {type(obj).__name__}")
+
+
+def loads(data: Union[bytes, str]) -> Any:
+    """Parse JSON (orjson when available)"""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def dumps(obj: Any) -> bytes:
+    """Encode to compact UTF-8 JSON bytes (orjson when available)"""
+    if orjson is not None:
+        return orjson.dumps(obj, default=_default, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(
+        obj, default=_default, ensure_ascii=False, separators=(',', ':')
+    ).encode('utf-8')
+
+
+class FastJSONResponse(JSONResponse):
+    """
+    JSON response rendered with orjson
+
+    Usage:
+        app = FastAPI(default_response_class=FastJSONResponse)
+        return FastJSONResponse(orders)   # skip jsonable_encoder for big lists
+    """
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
@@ -76,10 +76,11 @@ def safe_handler(fallback_state=ConversationHandler.END, error_message="❌ Пр
                 # Send error notification to admin
                 try:
                     import os
-                    from telegram import Bot
+                    from services.telegram_send_scheduler import send_priority, SendPriority
                     admin_id = os.getenv('ADMIN_TELEGRAM_ID')
                     if admin_id:
-                        bot = Bot(os.getenv('TELEGRAM_BOT_TOKEN'))
+                        # Application bot: goes through the send scheduler
+                        bot = context.bot
                         error_text = f"""🚨 *Ошибка в боте*
 ━━━━━━━━━━━━━━━━━━━━
 
@@ -92,11 +93,12 @@ def safe_handler(fallback_state=ConversationHandler.END, error_message="❌ Пр
 
 🕐 *Time:* {datetime.now(timezone.utc).strftime('%d.%m.%Y %H:%M UTC')}"""
                         
-                        await bot.send_message(
-                            chat_id=admin_id,
-                            text=error_text,
-                            parse_mode='Markdown'
-                        )
+                        with send_priority(SendPriority.ADMIN):
+                            await bot.send_message(
+                                chat_id=admin_id,
+                                text=error_text,
+                                parse_mode='Markdown'
+                            )
                 except Exception as admin_error:
                     logger.error(f"Failed to send error notification to admin: {admin_error}")
                 
@@ -220,7 +222,10 @@ def with_typing_action():
             from telegram.constants import ChatAction
             
             # 🚀 PERFORMANCE: Send typing action in background - don't block handler
-            if update.effective_chat:
+            # (not while an order card is open: the card answers at once)
+            from utils.order_card import order_card, CARD_ID_KEY
+            card_open = order_card.edit_in_place and CARD_ID_KEY in (context.user_data or {})
+            if update.effective_chat and not card_open:
                 async def send_typing():
                     try:
                         await context.bot.send_chat_action(
@@ -1,111 +1,298 @@
 """
-MongoDB Persistence for ConversationHandler
-Replaces PicklePersistence with MongoDB storage
+MongoDB Persistence for python-telegram-bot
+user_data и состояния ConversationHandler в MongoDB (telegram_state)
+
+One document per user:
+    {_id: user_id, version, write_id, updated_at,
+     user_data: {...},
+     conversations: {handler_name: {"<chat_id>:<user_id>": state}}}
+
+- lazy: nothing is bulk-loaded at startup; a user's document is read
+  when their first update reaches a lane worker (services/update_queue.py
+  calls load_for_update before the handlers run)
+- write-coalescing: PTB's update_* calls only mark the user dirty; dirty
+  documents are written in one bulk_write per flush_interval, and on
+  shutdown (flush). Ten state transitions in a second cost one write.
+- versioned: a write only applies to the version this process last read
+  or wrote. A write based on stale state is rejected (conflict) instead
+  of overwriting newer state, and the user is reloaded on the next update.
+- shared mode (several uvicorn workers / instances): the document is
+  re-read before every update and flushed right after it, so any worker
+  can pick up any user's next update.
 """
+import asyncio
 import logging
-from typing import Dict, Optional
+import uuid
+from datetime import datetime, timezone
+from typing import Any, Dict, Optional
+
+import bson
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
 from telegram.ext import BasePersistence, PersistenceInput
 from telegram.ext._utils.types import ConversationDict
 
 logger = logging.getLogger(__name__)
 
 
+def _bson_safe(data: Dict[str, Any]) -> Dict[str, Any]:
+    """user_data without values MongoDB cannot store (objects, non-str keys)"""
+    try:
+        bson.encode({'v': data})
+        return data
+    except Exception:
+        pass
+    safe = {}
+    for key, value in data.items():
+        try:
+            bson.encode({str(key): value})
+            safe[str(key)] = value
+        except Exception:
+            logger.warning(f"⚠️ user_data['{key}'] is not BSON-serializable, not persisted")
+    return safe
+
+
+def _conversation_path(name: str, key: tuple) -> str:
+    return f"{name}.{':'.join(str(part) for part in key)}"
+
+
 class MongoDBPersistence(BasePersistence):
     """
-    Minimal MongoDB persistence for ConversationHandler states only
-    Does NOT persist user_data, chat_data, or bot_data (we use MongoDB sessions for that)
+    Persistence для user_data и ConversationHandler (webhook + polling)
+
+    Usage:
+        persistence = MongoDBPersistence(db, **BotPerformanceConfig.get_persistence_config())
+        Application.builder().persistence(persistence)
     """
-    
-    def __init__(self, db):
+
+    def __init__(self,
+                 db,
+                 collection: str = 'telegram_state',
+                 flush_interval_seconds: float = 1.0,
+                 shared: bool = False,
+                 max_batch: int = 500):
+        """
+        Args:
+            db: Motor database
+            collection: Коллекция с состоянием пользователей
+            flush_interval_seconds: Интервал записи накопленных изменений
+            shared: Несколько воркеров/инстансов обслуживают бота
+            max_batch: Максимум документов в одном bulk_write
+        """
         super().__init__(
             store_data=PersistenceInput(
-                user_data=False,  # We handle this via session_service
+                user_data=True,
                 chat_data=False,
                 bot_data=False,
                 callback_data=False
             ),
-            update_interval=0  # Immediate writes
+            update_interval=flush_interval_seconds
         )
         self.db = db
-        self._conversations: Dict[str, Dict[tuple, object]] = {}
-        self._last_saved: Dict[tuple, object] = {}  # Track last saved state for deduplication
-        logger.info("✅ MongoDBPersistence initialized (conversations only)")
-    
+        self._collection = db[collection]
+        self.flush_interval = flush_interval_seconds
+        self.shared = shared
+        self.max_batch = max_batch
+        self._instance = uuid.uuid4().hex[:8]
+        self._seq = 0
+        self._versions: Dict[int, int] = {}          # user_id -> version we last read/wrote
+        self._dirty: Dict[int, Dict[str, Any]] = {}  # user_id -> pending changes
+        self._flush_lock = asyncio.Lock()
+        self._flush_task: Optional[asyncio.Task] = None
+        self.loads = 0
+        self.cache_hits = 0
+        self.marked = 0
+        self.flushes = 0
+        self.docs_written = 0
+        self.conflicts = 0
+        self.errors = 0
+        logger.info(f"✅ MongoDBPersistence initialized ({collection}, shared={shared})")
+
+    # ==================== LOAD (lazy, per user) ====================
+
+    async def get_user_data(self) -> Dict:
+        return {}
+
     async def get_conversations(self, name: str) -> ConversationDict:
-        """Restore conversation states from MongoDB"""
+        return {}
+
+    async def load_for_update(self, application, update) -> None:
+        """Load the user's state before the update is dispatched"""
+        user = getattr(update, 'effective_user', None)
+        if user is None:
+            return
+        user_id = user.id
+        if user_id in self._dirty:
+            return  # local changes not flushed yet are the newest state
+        if user_id in self._versions and not self.shared:
+            self.cache_hits += 1
+            return
+
+        doc = await self._collection.find_one({'_id': user_id})
+        self.loads += 1
+        version = doc.get('version', 0) if doc else 0
+        if self._versions.get(user_id) == version:
+            return
+        self._versions[user_id] = version
+        if doc is not None:
+            self._apply(application, user_id, doc)
+
+    @staticmethod
+    def _apply(application, user_id: int, doc: Dict[str, Any]) -> None:
+        user_data = application.user_data[user_id]
+        user_data.clear()
+        user_data.update(doc.get('user_data') or {})
+
+        # The handlers' conversation dicts; PTB keeps them on the application
+        # for update_persistence. Loaded states are written without tracking
+        # so they are not flushed back.
+        stored = doc.get('conversations') or {}
+        for name, states in getattr(application, '_conversation_handler_conversations', {}).items():
+            keys = {
+                tuple(int(part) for part in key.split(':')): state
+                for key, state in (stored.get(name) or {}).items()
+            }
+            for key in [k for k in states.data if k[-1] == user_id and k not in keys]:
+                states.data.pop(key, None)
+            states.update_no_track(keys)
+
+    async def refresh_user_data(self, user_id: int, user_data: Dict) -> None:
+        pass  # loaded in load_for_update, before ConversationHandler reads its state
+
+    # ==================== WRITE (coalesced) ====================
+
+    def _mark(self, user_id: int) -> Dict[str, Any]:
+        self.marked += 1
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.create_task(self._flush_later())
+        return self._dirty.setdefault(user_id, {})
+
+    async def update_user_data(self, user_id: int, data: Dict) -> None:
+        self._mark(user_id)['user_data'] = data
+
+    async def drop_user_data(self, user_id: int) -> None:
+        self._mark(user_id)['user_data'] = {}
+
+    async def update_conversation(self, name: str, key: tuple, new_state: Optional[object]) -> None:
+        user_id = key[-1]
+        self._mark(user_id).setdefault('conversations', {})[_conversation_path(name, key)] = new_state
+
+    async def after_update(self, application, update) -> None:
+        """Shared mode: persist the user's state before another worker gets their next update"""
+        if self.shared:
+            await application.update_persistence()
+            await self.flush()
+
+    async def _flush_later(self) -> None:
+        await asyncio.sleep(self.flush_interval)
         try:
-            logger.info(f"🔍 get_conversations called for handler: {name}")
-            
-            # Load all active conversations for this handler
-            sessions = await self.db.user_sessions.find(
-                {"is_active": True},
-                {"user_id": 1, "session_data.conversation_state": 1}
-            ).to_list(1000)
-            
-            conversations = {}
-            for session in sessions:
-                user_id = session.get("user_id")
-                state = session.get("session_data", {}).get("conversation_state")
-                
-                if user_id and state is not None:
-                    # ConversationHandler uses (chat_id, user_id) as key
-                    key = (user_id, user_id)  # For private chats, chat_id == user_id
-                    conversations[key] = state
-                    logger.info(f"   📥 User {user_id}: state={state}")
-            
-            logger.info(f"✅ Loaded {len(conversations)} conversations from MongoDB for '{name}'")
-            return conversations
-            
+            await self.flush()
         except Exception as e:
-            logger.error(f"❌ Failed to load conversations: {e}")
-            return {}
-    
-    async def update_conversation(
-        self, name: str, key: tuple, new_state: Optional[object]
-    ) -> None:
-        """Save conversation state to MongoDB (with deduplication)"""
-        try:
-            chat_id, user_id = key
-            
-            logger.info(f"🔍 update_conversation called: handler={name}, user={user_id}, new_state={new_state}")
-            
-            if new_state is None:
-                # Conversation ended - clear state
-                await self.db.user_sessions.update_one(
-                    {"user_id": user_id, "is_active": True},
-                    {"$unset": {"session_data.conversation_state": ""}}
-                )
-                self._last_saved.pop(key, None)  # Clear cached state
-                logger.info(f"🗑️ CLEARED conversation for user {user_id} (handler={name})")
-            else:
-                # Save new state
-                result = await self.db.user_sessions.update_one(
-                    {"user_id": user_id, "is_active": True},
-                    {"$set": {"session_data.conversation_state": new_state}},
-                    upsert=False
-                )
-                
-                if result.matched_count == 0:
-                    logger.warning(f"⚠️ No active session found for user {user_id} - state NOT saved!")
+            logger.error(f"❌ Telegram state flush failed: {e}")
+
+    async def flush(self) -> None:
+        """Write all dirty users (interval, shared-mode write-through, shutdown)"""
+        async with self._flush_lock:
+            while self._dirty:
+                user_ids = list(self._dirty)[:self.max_batch]
+                batch = {user_id: self._dirty.pop(user_id) for user_id in user_ids}
+                await self._write(batch)
+
+    async def _write(self, batch: Dict[int, Dict[str, Any]]) -> None:
+        now = datetime.now(timezone.utc)
+        ops = []
+        write_ids = {}
+        for user_id, changes in batch.items():
+            self._seq += 1
+            write_ids[user_id] = f"{self._instance}:{self._seq}"
+            update: Dict[str, Any] = {
+                '$set': {'updated_at': now, 'write_id': write_ids[user_id]},
+                '$inc': {'version': 1},
+            }
+            if 'user_data' in changes:
+                update['$set']['user_data'] = _bson_safe(changes['user_data'])
+            unset = {}
+            for path, state in changes.get('conversations', {}).items():
+                if state is None:
+                    unset[f'conversations.{path}'] = ''
                 else:
-                    self._last_saved[key] = new_state  # Cache current state
-                    logger.info(f"✅ SAVED conversation: handler={name}, user={user_id}, state={new_state}")
-                
+                    update['$set'][f'conversations.{path}'] = state
+            if unset:
+                update['$unset'] = unset
+
+            version = self._versions.get(user_id, 0)
+            if version:
+                ops.append(UpdateOne({'_id': user_id, 'version': version}, update))
+            else:
+                ops.append(UpdateOne({'_id': user_id, 'version': {'$exists': False}}, update, upsert=True))
+
+        try:
+            result = await self._collection.bulk_write(ops, ordered=False)
+            applied = result.modified_count + result.upserted_count
+        except BulkWriteError as e:
+            # E11000 = upsert raced with a document created elsewhere: conflict
+            if any(err.get('code') != 11000 for err in e.details.get('writeErrors', [])):
+                logger.error(f"❌ Telegram state write errors: {e.details.get('writeErrors')}")
+            applied = -1
         except Exception as e:
-            logger.error(f"❌ Failed to save conversation: {e}", exc_info=True)
-    
-    # Required abstract methods (we don't use these):
-    async def get_user_data(self) -> Dict: return {}
+            # Nothing known to be written: keep the changes for the next flush
+            self.errors += 1
+            for user_id, changes in batch.items():
+                pending = self._dirty.setdefault(user_id, {})
+                merged = {**changes, **pending}
+                merged['conversations'] = {**changes.get('conversations', {}), **pending.get('conversations', {})}
+                self._dirty[user_id] = merged
+            logger.error(f"❌ Telegram state flush failed, {len(batch)} users kept dirty: {e}")
+            return
+
+        self.flushes += 1
+        if applied == len(ops):
+            written = set(batch)
+        else:
+            written = set()
+            async for doc in self._collection.find({'_id': {'$in': list(batch)}}, {'version': 1, 'write_id': 1}):
+                if doc.get('write_id') == write_ids[doc['_id']]:
+                    written.add(doc['_id'])
+                    self._versions[doc['_id']] = doc['version']
+
+        for user_id in batch:
+            if user_id not in written:
+                self.conflicts += 1
+                self._versions.pop(user_id, None)  # reload on the next update
+                logger.warning(f"⚠️ Telegram state of user {user_id} changed elsewhere, stale write rejected")
+            elif applied == len(ops):
+                self._versions[user_id] = self._versions.get(user_id, 0) + 1
+        self.docs_written += len(written)
+
+    # ==================== NOT STORED ====================
+
     async def get_chat_data(self) -> Dict: return {}
     async def get_bot_data(self) -> Dict: return {}
     async def get_callback_data(self) -> Optional[tuple]: return None
-    async def update_user_data(self, user_id: int, data: Dict) -> None: pass
     async def update_chat_data(self, chat_id: int, data: Dict) -> None: pass
     async def update_bot_data(self, data: Dict) -> None: pass
     async def update_callback_data(self, data: tuple) -> None: pass
     async def drop_chat_data(self, chat_id: int) -> None: pass
-    async def drop_user_data(self, user_id: int) -> None: pass
-    async def refresh_user_data(self, user_id: int, user_data: Dict) -> None: pass
     async def refresh_chat_data(self, chat_id: int, chat_data: Dict) -> None: pass
     async def refresh_bot_data(self, bot_data: Dict) -> None: pass
-    async def flush(self) -> None: pass
+
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        Получить статистику persistence
+
+        Returns:
+            dict: загрузки, коалесинг записей, конфликты версий
+        """
+        return {
+            'shared': self.shared,
+            'users_cached': len(self._versions),
+            'dirty': len(self._dirty),
+            'loads': self.loads,
+            'cache_hits': self.cache_hits,
+            'changes_marked': self.marked,
+            'flushes': self.flushes,
+            'docs_written': self.docs_written,
+            'coalescing_ratio': round(self.marked / self.docs_written, 2) if self.docs_written else None,
+            'conflicts': self.conflicts,
+            'errors': self.errors,
+        }
@@ -282,12 +282,21 @@ async def check_health(db) -> Dict[str, Any]:
         'status': 'configured' if OXAPAY_API_KEY else 'missing'
     }
     
-    # Проверка Circuit Breakers
-    from utils.retry_utils import SHIPSTATION_CIRCUIT, OXAPAY_CIRCUIT
+    # Проверка Circuit Breakers (upstream + каждый endpoint).
+    # Открытый circuit - деградация upstream, а не нашего сервиса:
+    # статус не меняется, список виден в upstreams_degraded
+    from utils.retry_utils import circuit_breakers
     
-    health['components']['circuit_breakers'] = {
-        'shipstation': SHIPSTATION_CIRCUIT.state,
-        'oxapay': OXAPAY_CIRCUIT.state
+    health['components']['circuit_breakers'] = circuit_breakers.get_state()
+    health['upstreams_degraded'] = circuit_breakers.open_circuits()
+    
+    # Очередь апдейтов webhook
+    from services.update_queue import update_queue
+    
+    health['components']['update_queue'] = {
+        'status': 'running' if update_queue.running else 'stopped',
+        'depth': update_queue.depth(),
+        'max_size': update_queue.max_size,
     }
     
     return health
@@ -340,13 +349,10 @@ class AlertManager:
                 )
         
         # Проверка Circuit Breakers
-        from utils.retry_utils import SHIPSTATION_CIRCUIT, OXAPAY_CIRCUIT
-        
-        if SHIPSTATION_CIRCUIT.state == "OPEN":
-            alerts.append("🔴 CIRCUIT BREAKER ОТКРЫТ: ShipStation API недоступен")
+        from utils.retry_utils import circuit_breakers
         
-        if OXAPAY_CIRCUIT.state == "OPEN":
-            alerts.append("🔴 CIRCUIT BREAKER ОТКРЫТ: Oxapay API недоступен")
+        for name in circuit_breakers.open_circuits():
+            alerts.append(f"🔴 CIRCUIT BREAKER ОТКРЫТ: {name} недоступен")
         
         # Отправка алертов
         if alerts and self.telegram_alerts_enabled and self.alert_chat_id and bot:
@@ -0,0 +1,253 @@
+"""
+Order Card
+Заказ в одном сообщении: шаги редактируют карточку вместо новых сообщений
+
+Rendering modes (ORDER_CARD_CONFIG['mode'], env ORDER_RENDER_MODE):
+
+- send_new: every step sends a new prompt and mark_message_as_selected
+  edits the previous one (✅ + buttons removed) - two calls per step
+- edit_in_place: the last prompt is the order card. A button press on the
+  card edits the card into the next step (one call, no ✅ edit). Free text
+  needs a fresh prompt below the user's message, so the next step is sent
+  as a new card; the previous card is only touched if it still has
+  buttons. The card shows a progress bar over the order fields.
+
+OrderCallMeter counts Telegram calls per chat between the start of an
+order and its completion (fed by the send scheduler), so the two modes
+can be compared in /api/monitoring/upstreams.
+"""
+import logging
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+from telegram import InlineKeyboardMarkup
+
+from config.performance_config import BotPerformanceConfig
+
+logger = logging.getLogger(__name__)
+
+MODES = ('edit_in_place', 'send_new')
+
+CARD_ID_KEY = 'order_card_message_id'
+CARD_BUTTONS_KEY = 'order_card_has_buttons'
+
+# Order flow steps, in order (optional ones are stored as None when skipped)
+ORDER_STEP_FIELDS = (
+    'from_name', 'from_address', 'from_address2', 'from_city', 'from_state', 'from_zip', 'from_phone',
+    'to_name', 'to_address', 'to_address2', 'to_city', 'to_state', 'to_zip', 'to_phone',
+    'parcel_weight', 'parcel_length', 'parcel_width', 'parcel_height',
+)
+
+
+def order_progress(user_data: Dict[str, Any], width: int = 10) -> str:
+    """Progress bar over the order fields entered so far"""
+    done = sum(1 for field in ORDER_STEP_FIELDS if field in user_data)
+    total = len(ORDER_STEP_FIELDS)
+    filled = round(done / total * width)
+    return f"{'▰' * filled}{'▱' * (width - filled)} {done}/{total}"
+
+
+def _has_buttons(reply_markup) -> bool:
+    return isinstance(reply_markup, InlineKeyboardMarkup) and bool(reply_markup.inline_keyboard)
+
+
+class OrderCallMeter:
+    """
+    Telegram calls per completed order, by rendering mode
+
+    Usage:
+        order_call_meter.start(chat_id, 'edit_in_place')   # order flow entry
+        order_call_meter.record(chat_id)                    # every API call
+        order_call_meter.finish(chat_id, completed=True)    # order placed
+    """
+
+    def __init__(self, max_tracked: int = 10000):
+        """
+        Args:
+            max_tracked: Максимум одновременно отслеживаемых заказов
+        """
+        self.max_tracked = max_tracked
+        self._open: 'OrderedDict[int, list]' = OrderedDict()   # chat_id -> [mode, calls]
+        self._modes = {mode: {'completed': 0, 'abandoned': 0, 'calls': 0} for mode in MODES}
+
+    def start(self, chat_id: int, mode: str) -> None:
+        if chat_id in self._open:
+            self._close(chat_id, completed=False)
+        elif len(self._open) >= self.max_tracked:
+            self._close(next(iter(self._open)), completed=False)
+        self._open[chat_id] = [mode, 0]
+
+    def record(self, chat_id: Optional[int]) -> None:
+        entry = self._open.get(chat_id)
+        if entry is not None:
+            entry[1] += 1
+
+    def finish(self, chat_id: int, completed: bool = True) -> None:
+        if chat_id in self._open:
+            self._close(chat_id, completed)
+
+    def _close(self, chat_id: int, completed: bool) -> None:
+        mode, calls = self._open.pop(chat_id)
+        stats = self._modes.setdefault(mode, {'completed': 0, 'abandoned': 0, 'calls': 0})
+        if completed:
+            stats['completed'] += 1
+            stats['calls'] += calls
+        else:
+            stats['abandoned'] += 1
+
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        Получить статистику вызовов Telegram на заказ
+
+        Returns:
+            dict: по режимам - завершенные / брошенные заказы, вызовов на заказ
+        """
+        return {
+            'open_orders': len(self._open),
+            'modes': {
+                mode: {
+                    'completed': stats['completed'],
+                    'abandoned': stats['abandoned'],
+                    'calls_per_order': round(stats['calls'] / stats['completed'], 1) if stats['completed'] else None,
+                }
+                for mode, stats in self._modes.items()
+            },
+        }
+
+
+class OrderCard:
+    """
+    Отрисовка шагов заказа (карточка или новые сообщения)
+
+    Usage:
+        await order_card.render(update, context, OrderStepMessages.FROM_CITY,
+                                reply_markup=ForceReply(selective=True))
+    """
+
+    def __init__(self, mode: str = 'edit_in_place'):
+        """
+        Args:
+            mode: 'edit_in_place' или 'send_new'
+        """
+        if mode not in MODES:
+            logger.warning(f"⚠️ Unknown order render mode {mode!r}, using send_new")
+            mode = 'send_new'
+        self.mode = mode
+        self.edits = 0
+        self.sends = 0
+        self.edit_fallbacks = 0
+
+    @property
+    def edit_in_place(self) -> bool:
+        return self.mode == 'edit_in_place'
+
+    def owns(self, update, context) -> bool:
+        """
+        The message being answered is the current order card
+
+        For a button press that is the message with the button; for text
+        input it is the last prompt.
+        """
+        if not self.edit_in_place or not context.user_data:
+            return False
+        card_id = context.user_data.get(CARD_ID_KEY)
+        if card_id is None:
+            return False
+        query = update.callback_query
+        if query is not None:
+            return query.message is not None and query.message.message_id == card_id
+        return context.user_data.get('last_bot_message_id') == card_id
+
+    async def release(self, update, context) -> None:
+        """
+        Card counterpart of mark_message_as_selected
+
+        A pressed card is edited by the next render, so nothing to do.
+        After free text the card stays in the history as is; only its
+        buttons are removed, and only if it has any.
+        """
+        if update.callback_query is not None or not context.user_data.pop(CARD_BUTTONS_KEY, False):
+            return
+        try:
+            await context.bot.edit_message_reply_markup(
+                chat_id=update.effective_chat.id,
+                message_id=context.user_data[CARD_ID_KEY],
+                reply_markup=None
+            )
+        except Exception:
+            # Message too old / already edited
+            pass
+
+    async def render(self, update, context, text: str, reply_markup=None,
+                     progress: bool = True, safe_call=None, **kwargs):
+        """
+        Show the next step of the order flow
+
+        Args:
+            text: Step prompt (stored as last_bot_message_text)
+            reply_markup: Inline keyboard or ForceReply; ForceReply is
+                dropped when the card is edited (Telegram only allows
+                inline keyboards on edits)
+            progress: Prefix the card with the order progress bar
+            safe_call: Wrapper for the Telegram call (default safe_telegram_call)
+            **kwargs: Passed to reply_text / edit_text (parse_mode, ...)
+
+        Returns:
+            The sent or edited message (None on failure)
+        """
+        if safe_call is None:
+            from handlers.common_handlers import safe_telegram_call as safe_call
+
+        user_data = context.user_data
+        message = None
+
+        if self.edit_in_place:
+            card_text = f"{order_progress(user_data)}\n\n{text}" if progress else text
+            if update.callback_query is not None and self.owns(update, context):
+                markup = reply_markup if isinstance(reply_markup, InlineKeyboardMarkup) else None
+                message = await safe_call(update.callback_query.message.edit_text(
+                    card_text, reply_markup=markup, **kwargs
+                ))
+                if message is not None:
+                    self.edits += 1
+                    reply_markup = markup
+                else:
+                    self.edit_fallbacks += 1
+        else:
+            card_text = text
+
+        if message is None:
+            message = await safe_call(update.effective_message.reply_text(
+                card_text, reply_markup=reply_markup, **kwargs
+            ))
+            if message is not None:
+                self.sends += 1
+
+        if message is not None and hasattr(message, 'message_id'):
+            user_data['last_bot_message_id'] = message.message_id
+            user_data['last_bot_message_text'] = text
+            if self.edit_in_place:
+                user_data[CARD_ID_KEY] = message.message_id
+                user_data[CARD_BUTTONS_KEY] = _has_buttons(reply_markup)
+        return message
+
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        Получить статистику карточки заказа
+
+        Returns:
+            dict: режим, правки карточки, новые сообщения, откаты на отправку
+        """
+        return {
+            'mode': self.mode,
+            'card_edits': self.edits,
+            'new_messages': self.sends,
+            'edit_fallbacks': self.edit_fallbacks,
+        }
+
+
+_config = BotPerformanceConfig.get_order_card_config()
+
+# Глобальные инстансы (singleton)
+order_card = OrderCard(mode=_config['mode'])
+order_call_meter = OrderCallMeter(max_tracked=_config['max_tracked_orders'])
@@ -3,6 +3,12 @@ Retry Utilities
 Centralized retry logic for handling transient errors
 """
 import logging
+import math
+import random
+from collections import deque
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import Optional
 from tenacity import (
     retry,
     stop_after_attempt,
@@ -11,6 +17,8 @@ from tenacity import (
     before_sleep_log,
     after_log
 )
+from tenacity.retry import retry_base
+from tenacity.wait import wait_base
 import httpx
 from pymongo.errors import (
     ConnectionFailure,
@@ -18,6 +26,8 @@ from pymongo.errors import (
     ServerSelectionTimeoutError
 )
 
+from config.performance_config import BotPerformanceConfig
+
 logger = logging.getLogger(__name__)
 
 
@@ -25,30 +35,36 @@ logger = logging.getLogger(__name__)
 # RETRY DECORATORS FOR DIFFERENT SCENARIOS
 # ============================================================
 
-def retry_on_api_error(max_attempts=3, min_wait=1, max_wait=10):
+def retry_on_api_error(max_attempts=3, min_wait=1, max_wait=10, upstream='default'):
     """
     Retry decorator for external API calls
     
     Handles:
     - httpx network errors
     - Timeouts
-    - 5xx server errors
+    - 5xx / 429 server errors (other 4xx are not retried)
+    
+    Retries are paid from the upstream's retry budget (see RetryBudget),
+    wait with full-jitter exponential backoff and honour Retry-After.
+    The last error is re-raised once retries stop.
+    
+    The decorated function must let transient errors propagate: call
+    raise_for_retryable_status(response) and keep the fallback
+    (try/except -> error result) in an undecorated outer wrapper.
     
     Usage:
-        @retry_on_api_error(max_attempts=3)
+        @retry_on_api_error(max_attempts=3, upstream='shipstation')
         async def call_external_api():
             ...
     """
     return retry(
-        retry=retry_if_exception_type((
-            httpx.RequestError,
-            httpx.TimeoutException,
-            httpx.HTTPStatusError
-        )),
+        retry=retry_api_error_within_budget(upstream, max_attempts),
         stop=stop_after_attempt(max_attempts),
-        wait=wait_exponential(multiplier=1, min=min_wait, max=max_wait),
+        wait=wait_full_jitter_or_retry_after(min_wait, max_wait),
+        before=_record_first_attempt(upstream),
         before_sleep=before_sleep_log(logger, logging.WARNING),
-        after=after_log(logger, logging.INFO)
+        after=after_log(logger, logging.INFO),
+        reraise=True
     )
 
 
@@ -206,6 +222,30 @@ class ErrorHandler:
 # CIRCUIT BREAKER (ADVANCED)
 # ============================================================
 
+class CircuitOpenError(Exception):
+    """
+    Raised instead of calling an upstream whose circuit is open
+
+    Not an httpx error on purpose: tenacity retry decorators do not retry
+    it, so the caller fails fast. str() is a user-facing message.
+    """
+
+    MARKER = "временно недоступен"
+    
+    def __init__(self, name: str, retry_after: float):
+        self.name = name
+        self.retry_after = max(1, math.ceil(retry_after))
+        super().__init__(
+            f"⏳ Сервис {name.split(':')[0]} {self.MARKER}. "
+            f"Попробуйте через {self.retry_after} сек."
+        )
+    
+    @classmethod
+    def is_circuit_message(cls, message: str) -> bool:
+        """True for error strings produced from CircuitOpenError"""
+        return bool(message) and cls.MARKER in message
+
+
 class CircuitBreaker:
     """
     Circuit breaker pattern for external services
@@ -215,45 +255,94 @@ class CircuitBreaker:
     States:
     - CLOSED: Normal operation
     - OPEN: Rejecting calls (fast-fail)
-    - HALF_OPEN: Testing if service recovered
+    - HALF_OPEN: Testing if service recovered (limited probe calls)
+    
+    Opens on failure_threshold consecutive failures, or when the failure
+    rate over the last window_seconds exceeds failure_rate_threshold
+    (error budget) with at least min_calls calls in the window.
     """
     
-    def __init__(self, failure_threshold=5, timeout=60, name="service"):
+    def __init__(self, failure_threshold=5, timeout=60, name="service",
+                 window_seconds=60, min_calls=10, failure_rate_threshold=0.5,
+                 half_open_max_calls=1):
         self.failure_threshold = failure_threshold
         self.timeout = timeout  # Seconds before trying again
         self.name = name
+        self.window_seconds = window_seconds
+        self.min_calls = min_calls
+        self.failure_rate_threshold = failure_rate_threshold
+        self.half_open_max_calls = half_open_max_calls
         
         self.failure_count = 0
         self.last_failure_time = None
         self.state = "CLOSED"  # CLOSED, OPEN, HALF_OPEN
+        self.opened_at = None
+        self.times_opened = 0
+        self.rejected = 0
+        self._probes = 0
+        self._window = deque()  # (monotonic time, ok)
     
-    def is_available(self):
-        """Check if circuit allows calls"""
+    def _now(self):
         import time
-        
+        return time.monotonic()
+    
+    def retry_after(self) -> float:
+        """Seconds until an OPEN circuit lets a probe call through"""
+        if self.state != "OPEN":
+            return 0.0
+        return max(0.0, self.timeout - (self._now() - self.opened_at))
+    
+    def is_available(self):
+        """Check if circuit allows calls (reserves a probe slot in HALF_OPEN)"""
         if self.state == "CLOSED":
             return True
         
         if self.state == "OPEN":
             # Check if timeout expired
-            if time.time() - self.last_failure_time > self.timeout:
-                logger.info(f"🟡 Circuit HALF_OPEN for {self.name} (testing)")
-                self.state = "HALF_OPEN"
-                return True
-            
-            logger.warning(f"🔴 Circuit OPEN for {self.name} (fast-fail)")
-            return False
+            if self.retry_after() > 0:
+                self.rejected += 1
+                logger.debug(f"🔴 Circuit OPEN for {self.name} (fast-fail)")
+                return False
+            logger.info(f"🟡 Circuit HALF_OPEN for {self.name} (testing)")
+            self.state = "HALF_OPEN"
+            self._probes = 0
         
-        if self.state == "HALF_OPEN":
+        if self._probes < self.half_open_max_calls:
+            self._probes += 1
             return True
         
+        self.rejected += 1
         return False
     
+    def check(self):
+        """is_available() that raises CircuitOpenError"""
+        if not self.is_available():
+            raise CircuitOpenError(self.name, self.retry_after() or self.timeout)
+    
+    def release(self):
+        """Give back a probe slot without an outcome (call cancelled)"""
+        if self.state == "HALF_OPEN" and self._probes > 0:
+            self._probes -= 1
+    
+    def _record(self, ok: bool):
+        now = self._now()
+        self._window.append((now, ok))
+        while self._window and now - self._window[0][0] > self.window_seconds:
+            self._window.popleft()
+    
+    def _window_stats(self):
+        calls = len(self._window)
+        failures = sum(1 for _, ok in self._window if not ok)
+        return calls, failures
+    
     def record_success(self):
         """Record successful call"""
+        self._record(True)
         if self.state == "HALF_OPEN":
             logger.info(f"✅ Circuit CLOSED for {self.name} (recovered)")
             self.state = "CLOSED"
+            self._window.clear()
+            self._probes = 0
         
         self.failure_count = 0
     
@@ -261,21 +350,308 @@ class CircuitBreaker:
         """Record failed call"""
         import time
         
+        self._record(False)
         self.failure_count += 1
         self.last_failure_time = time.time()
         
-        if self.failure_count >= self.failure_threshold:
-            logger.error(f"🔴 Circuit OPEN for {self.name} (too many failures: {self.failure_count})")
-            self.state = "OPEN"
+        if self.state == "HALF_OPEN":
+            logger.error(f"🔴 Circuit OPEN again for {self.name} (probe failed)")
+            self._open()
+            return
+        
+        calls, failures = self._window_stats()
+        over_budget = calls >= self.min_calls and failures / calls >= self.failure_rate_threshold
+        if self.state == "CLOSED" and (self.failure_count >= self.failure_threshold or over_budget):
+            logger.error(
+                f"🔴 Circuit OPEN for {self.name} (too many failures: {self.failure_count} in a row, "
+                f"{failures}/{calls} in {self.window_seconds}s)"
+            )
+            self._open()
+    
+    def _open(self):
+        self.state = "OPEN"
+        self.opened_at = self._now()
+        self.times_opened += 1
+        self._probes = 0
+    
+    def get_state(self) -> dict:
+        """Breaker state for monitoring"""
+        calls, failures = self._window_stats()
+        return {
+            'state': self.state,
+            'consecutive_failures': self.failure_count,
+            'window_calls': calls,
+            'window_failures': failures,
+            'failure_rate': round(failures / calls, 3) if calls else 0.0,
+            'retry_after': round(self.retry_after(), 1),
+            'times_opened': self.times_opened,
+            'rejected': self.rejected,
+        }
+
+
+class CircuitBreakerRegistry:
+    """
+    Circuit breakers per upstream and per upstream endpoint
+    
+    The upstream breaker ('shipstation') trips on transport failures
+    (timeouts, refused connections) from any endpoint - the host is down.
+    Endpoint breakers ('shipstation:v2/labels') also count 5xx/429 answers,
+    each with its own error budget, so a failing label endpoint does not
+    block rate quotes.
+    """
+    
+    def __init__(self, config: dict):
+        self._config = config
+        self._upstreams = {}
+        self._endpoints = {}
+    
+    def _settings(self, key: str) -> dict:
+        settings = dict(self._config['defaults'])
+        settings.update(self._config.get('overrides', {}).get(key, {}))
+        return settings
+    
+    def upstream(self, upstream: str) -> CircuitBreaker:
+        breaker = self._upstreams.get(upstream)
+        if breaker is None:
+            breaker = CircuitBreaker(name=UPSTREAM_NAMES.get(upstream, upstream), **self._settings(upstream))
+            self._upstreams[upstream] = breaker
+        return breaker
+    
+    def endpoint(self, upstream: str, endpoint: str) -> CircuitBreaker:
+        key = f"{upstream}:{endpoint}"
+        breaker = self._endpoints.get(key)
+        if breaker is None:
+            name = f"{UPSTREAM_NAMES.get(upstream, upstream)}:{endpoint}"
+            breaker = CircuitBreaker(name=name, **self._settings(key))
+            self._endpoints[key] = breaker
+        return breaker
+    
+    def acquire(self, upstream: str, endpoint: str):
+        """
+        Check both breakers before a call
+        
+        Returns:
+            (upstream_breaker, endpoint_breaker)
+        
+        Raises:
+            CircuitOpenError: upstream or endpoint circuit is open
+        """
+        host = self.upstream(upstream)
+        route = self.endpoint(upstream, endpoint)
+        host.check()
+        try:
+            route.check()
+        except CircuitOpenError:
+            host.release()
+            raise
+        return host, route
+    
+    def open_circuits(self) -> list:
+        """Names of circuits that currently fast-fail"""
+        breakers = list(self._upstreams.values()) + list(self._endpoints.values())
+        return [b.name for b in breakers if b.state != "CLOSED"]
+    
+    def get_state(self) -> dict:
+        """
+        Состояние всех circuit breakers для /api/monitoring/health
+        
+        Returns:
+            dict: upstream -> состояние + состояние каждого endpoint
+        """
+        state = {}
+        for upstream, breaker in self._upstreams.items():
+            state[upstream] = {
+                **breaker.get_state(),
+                'endpoints': {
+                    key.split(':', 1)[1]: endpoint_breaker.get_state()
+                    for key, endpoint_breaker in self._endpoints.items()
+                    if key.split(':', 1)[0] == upstream
+                }
+            }
+        return state
 
 
 # ============================================================
 # GLOBAL CIRCUIT BREAKERS
 # ============================================================
 
-# Create circuit breakers for external services
-SHIPSTATION_CIRCUIT = CircuitBreaker(failure_threshold=5, timeout=60, name="ShipStation")
-OXAPAY_CIRCUIT = CircuitBreaker(failure_threshold=5, timeout=60, name="Oxapay")
+UPSTREAM_NAMES = {
+    'shipstation': 'ShipStation',
+    'oxapay': 'Oxapay',
+}
+
+circuit_breakers = CircuitBreakerRegistry(BotPerformanceConfig.get_circuit_breaker_config())
+
+# Upstream-level breakers for external services
+SHIPSTATION_CIRCUIT = circuit_breakers.upstream('shipstation')
+OXAPAY_CIRCUIT = circuit_breakers.upstream('oxapay')
+
+
+# ============================================================
+# RETRY BUDGETS
+# ============================================================
+
+class RetryBudget:
+    """
+    Token-bucket retry budget for one upstream
+    
+    Every first attempt deposits `ratio` tokens (capped at max_tokens),
+    every retry withdraws one. While the upstream is healthy a few
+    retries are always available; during an outage the bucket drains
+    and calls fail fast instead of multiplying load by max_attempts.
+    """
+    
+    def __init__(self, ratio=0.1, max_tokens=10.0, initial_tokens=5.0, name="default"):
+        self.ratio = ratio
+        self.max_tokens = max_tokens
+        self.name = name
+        self.tokens = min(initial_tokens, max_tokens)
+        self.attempts = 0
+        self.retries = 0
+        self.denied = 0
+    
+    def record_attempt(self):
+        """First attempt of a call earns retry tokens"""
+        self.attempts += 1
+        self.tokens = min(self.max_tokens, self.tokens + self.ratio)
+    
+    def try_acquire(self) -> bool:
+        """Spend a token for one retry, False if the budget is exhausted"""
+        if self.tokens >= 1.0:
+            self.tokens -= 1.0
+            self.retries += 1
+            return True
+        self.denied += 1
+        return False
+    
+    def get_stats(self) -> dict:
+        return {
+            'attempts': self.attempts,
+            'retries': self.retries,
+            'denied': self.denied,
+            'retry_ratio': f"{(self.retries / self.attempts * 100) if self.attempts else 0:.1f}%",
+            'tokens': round(self.tokens, 2),
+        }
+
+
+class RetryBudgetRegistry:
+    """Retry budgets per upstream ('shipstation', 'oxapay', ...)"""
+    
+    def __init__(self, config: dict):
+        self._config = config
+        self.max_retry_after = config.get('max_retry_after', 30)
+        self._budgets = {}
+    
+    def budget(self, upstream: str) -> RetryBudget:
+        budget = self._budgets.get(upstream)
+        if budget is None:
+            settings = dict(self._config['defaults'])
+            settings.update(self._config.get('overrides', {}).get(upstream, {}))
+            budget = RetryBudget(name=upstream, **settings)
+            self._budgets[upstream] = budget
+        return budget
+    
+    def get_stats(self) -> dict:
+        """
+        Получить статистику retry budgets
+        
+        Returns:
+            dict: upstream -> попытки, ретраи, отказы, токены
+        """
+        return {upstream: budget.get_stats() for upstream, budget in self._budgets.items()}
+
+
+def is_retryable_api_error(exc: BaseException) -> bool:
+    """Network errors, timeouts, 5xx and 429 are worth retrying"""
+    if isinstance(exc, httpx.HTTPStatusError):
+        status = exc.response.status_code
+        return status >= 500 or status == 429
+    return isinstance(exc, httpx.RequestError)
+
+
+def raise_for_retryable_status(response):
+    """
+    Raise httpx.HTTPStatusError for 5xx/429 so @retry_on_api_error retries it
+    
+    Other statuses are returned unchanged for the caller to handle.
+    """
+    if response.status_code >= 500 or response.status_code == 429:
+        try:
+            request = response.request
+        except RuntimeError:
+            request = None
+        raise httpx.HTTPStatusError(
+            f"Server error {response.status_code}", request=request, response=response
+        )
+    return response
+
+
+def retry_after_seconds(exc: BaseException) -> Optional[float]:
+    """Retry-After of a failed response (delta-seconds or HTTP-date), None if absent"""
+    response = getattr(exc, 'response', None) if isinstance(exc, httpx.HTTPStatusError) else None
+    value = response.headers.get('Retry-After') if response is not None else None
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        when = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if when.tzinfo is None:
+        when = when.replace(tzinfo=timezone.utc)
+    return max(0.0, (when - datetime.now(timezone.utc)).total_seconds())
+
+
+class retry_api_error_within_budget(retry_base):
+    """Tenacity retry condition: retryable error, attempts left and a budget token"""
+    
+    def __init__(self, upstream: str, max_attempts: int):
+        self.upstream = upstream
+        self.max_attempts = max_attempts
+    
+    def __call__(self, retry_state) -> bool:
+        outcome = retry_state.outcome
+        if not outcome.failed or not is_retryable_api_error(outcome.exception()):
+            return False
+        if retry_state.attempt_number >= self.max_attempts:
+            return False
+        
+        retry_after = retry_after_seconds(outcome.exception())
+        if retry_after is not None and retry_after > retry_budgets.max_retry_after:
+            logger.warning(f"⏳ {self.upstream}: Retry-After {retry_after:.0f}s is too long, not retrying")
+            return False
+        
+        if not retry_budgets.budget(self.upstream).try_acquire():
+            logger.warning(f"🪫 {self.upstream}: retry budget exhausted, failing fast")
+            return False
+        return True
+
+
+class wait_full_jitter_or_retry_after(wait_base):
+    """Wait Retry-After if the server sent it, else uniform(0, min(max, min * 2^n))"""
+    
+    def __init__(self, min_wait: float, max_wait: float):
+        self.min_wait = min_wait
+        self.max_wait = max_wait
+    
+    def __call__(self, retry_state) -> float:
+        retry_after = retry_after_seconds(retry_state.outcome.exception())
+        if retry_after is not None:
+            return retry_after
+        cap = min(self.max_wait, self.min_wait * 2 ** (retry_state.attempt_number - 1))
+        return random.uniform(0, cap)
+
+
+def _record_first_attempt(upstream: str):
+    def before(retry_state):
+        if retry_state.attempt_number == 1:
+            retry_budgets.budget(upstream).record_attempt()
+    return before
+
+
+retry_budgets = RetryBudgetRegistry(BotPerformanceConfig.get_retry_budget_config())
 
 
 # ============================================================
@@ -287,11 +663,16 @@ Example 1: Decorator for API calls
 -----------------------------------
 from utils.retry_utils import retry_on_api_error
 
-@retry_on_api_error(max_attempts=3)
-async def fetch_rates_from_shipstation(data):
-    async with httpx.AsyncClient() as client:
-        response = await client.post(url, json=data)
-    return response.json()
+@retry_on_api_error(max_attempts=3, upstream='shipstation')
+async def _post_rates(data):
+    response = await get_http_client('shipstation').post(url, json=data)
+    return raise_for_retryable_status(response)
+
+async def fetch_rates(data):
+    try:
+        return (await _post_rates(data)).json()
+    except Exception:
+        return None  # fallback once retries are exhausted
 
 
 Example 2: Manual retry
@@ -316,15 +697,14 @@ async with ErrorHandler("process_payment", fallback_value=False):
 
 Example 4: Circuit breaker
 ---------------------------
-from utils.retry_utils import SHIPSTATION_CIRCUIT
+Calls through get_http_client('shipstation') / get_http_client('oxapay')
+are guarded automatically (services/http_clients.py). An open circuit
+raises CircuitOpenError before any network I/O:
 
-if not SHIPSTATION_CIRCUIT.is_available():
-    return {"error": "ShipStation temporarily unavailable"}
+from utils.retry_utils import CircuitOpenError
 
 try:
-    result = await call_shipstation_api()
-    SHIPSTATION_CIRCUIT.record_success()
-except Exception as e:
-    SHIPSTATION_CIRCUIT.record_failure()
-    raise
+    response = await get_http_client('shipstation').post('/v2/rates', ...)
+except CircuitOpenError as e:
+    return False, None, str(e)  # "⏳ Сервис ShipStation временно недоступен..."
 """
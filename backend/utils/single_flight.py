@@ -0,0 +1,85 @@
+"""
+Single-flight request coalescing
+Concurrent calls with the same key share one in-flight upstream call
+"""
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict
+
+logger = logging.getLogger(__name__)
+
+
+class SingleFlight:
+    """
+    Объединение одинаковых параллельных запросов
+
+    The first caller for a key (the leader) starts the call as a task;
+    callers arriving while it runs await the same task and get the same
+    result or exception. The task is shielded, so a caller that gives up
+    does not cancel the call for everyone else.
+
+    Usage:
+        flight = SingleFlight("rates")
+        result = await flight.do(cache_key, fetch_rates, request)
+    """
+
+    def __init__(self, name: str = "single_flight"):
+        self.name = name
+        self._inflight: Dict[str, asyncio.Task] = {}
+        self.calls = 0
+        self.leaders = 0
+        self.coalesced = 0
+        self.errors = 0
+
+    async def do(self, key: str, fn: Callable[..., Awaitable[Any]], *args, **kwargs) -> Any:
+        """
+        Run fn(*args, **kwargs) once per key among concurrent callers
+
+        Args:
+            key: Coalescing key (e.g. ShipStationCache cache key)
+            fn: Async function performing the upstream call
+
+        Returns:
+            Result of the shared call
+        """
+        self.calls += 1
+        task = self._inflight.get(key)
+
+        if task is not None:
+            self.coalesced += 1
+            logger.info(f"🔗 {self.name}: joined in-flight call for {key[:12]} (coalesced={self.coalesced})")
+        else:
+            self.leaders += 1
+            task = asyncio.ensure_future(fn(*args, **kwargs))
+            self._inflight[key] = task
+            task.add_done_callback(lambda t, k=key: self._on_done(k, t))
+
+        return await asyncio.shield(task)
+
+    def _on_done(self, key: str, task: asyncio.Task) -> None:
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        if not task.cancelled() and task.exception() is not None:
+            self.errors += 1
+
+    def in_flight(self) -> int:
+        """Number of keys with a running upstream call"""
+        return len(self._inflight)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        Получить статистику объединения запросов
+
+        Returns:
+            dict: calls, upstream calls (leaders), coalesced, in_flight
+        """
+        coalesce_rate = (self.coalesced / self.calls * 100) if self.calls > 0 else 0
+
+        return {
+            'calls': self.calls,
+            'upstream_calls': self.leaders,
+            'coalesced': self.coalesced,
+            'coalesce_rate': f"{coalesce_rate:.1f}%",
+            'errors': self.errors,
+            'in_flight': self.in_flight()
+        }
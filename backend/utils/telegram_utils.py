@@ -8,37 +8,6 @@ from datetime import datetime, timezone
 
 logger = logging.getLogger(__name__)
 
-# Button debouncing tracker (для предотвращения двойных кликов)
-button_click_tracker = {}
-BUTTON_DEBOUNCE_SECONDS = 1.0
-
-
-def is_button_click_allowed(user_id: int, button_data: str) -> bool:
-    """
-    Check if button click is allowed (debouncing)
-    Предотвращает множественные быстрые клики по кнопкам
-    
-    Args:
-        user_id: Telegram user ID
-        button_data: Data from callback button
-    
-    Returns:
-        True if click is allowed, False if too fast
-    """
-    current_time = datetime.now(timezone.utc).timestamp()
-    
-    if user_id not in button_click_tracker:
-        button_click_tracker[user_id] = {}
-    
-    last_click = button_click_tracker[user_id].get(button_data, 0)
-    
-    if current_time - last_click < BUTTON_DEBOUNCE_SECONDS:
-        logger.warning(f"Button click blocked for user {user_id}, button {button_data} - too fast")
-        return False
-    
-    button_click_tracker[user_id][button_data] = current_time
-    return True
-
 
 def generate_random_phone():
     """
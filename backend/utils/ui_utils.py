@@ -1413,10 +1413,53 @@ class DataConfirmationUI:
             [InlineKeyboardButton(_make_unique_text("✅ Всё верно, показать тарифы"), callback_data='confirm_data')],
             [InlineKeyboardButton(_make_unique_text("✏️ Редактировать данные"), callback_data='edit_data')],
             [InlineKeyboardButton(_make_unique_text("💾 Сохранить как шаблон"), callback_data='save_template')],
+            [InlineKeyboardButton(_make_unique_text("➕ Ещё посылка (пакетный заказ)"), callback_data='batch_add')],
             [InlineKeyboardButton(ButtonTexts.CANCEL, callback_data=CallbackData.CANCEL_ORDER)]
         ]
         return InlineKeyboardMarkup(keyboard)
     
+    @staticmethod
+    def format_batch_section(parcels: list) -> str:
+        """
+        Format parcels of a batch order (already added + current)
+        
+        Args:
+            parcels: Parcel dicts with to_* and parcel_* keys
+        
+        Returns:
+            Formatted batch section string
+        """
+        section = f"\n*Пакетный заказ: {len(parcels)} посылок*\n"
+        for n, parcel in enumerate(parcels, 1):
+            section += (
+                f"{n}. {parcel.get('to_name', '')}, {parcel.get('to_city', '')} "
+                f"{parcel.get('to_state', '')} {parcel.get('to_zip', '')} — "
+                f"{parcel.get('parcel_weight', parcel.get('weight', ''))} lb\n"
+            )
+        section += "\n━━━━━━━━━━━━━━━━━━━━━━\n"
+        return section
+    
+    @staticmethod
+    def build_batch_confirmation_keyboard() -> InlineKeyboardMarkup:
+        """Build keyboard for batch order confirmation screen"""
+        keyboard = [
+            [InlineKeyboardButton(_make_unique_text("✅ Показать тарифы для всех посылок"), callback_data='batch_checkout')],
+            [InlineKeyboardButton(_make_unique_text("➕ Ещё посылка"), callback_data='batch_add')],
+            [InlineKeyboardButton(_make_unique_text("✏️ Редактировать последнюю"), callback_data='edit_data')],
+            [InlineKeyboardButton(ButtonTexts.CANCEL, callback_data=CallbackData.CANCEL_ORDER)]
+        ]
+        return InlineKeyboardMarkup(keyboard)
+    
+    @staticmethod
+    def build_batch_add_keyboard() -> InlineKeyboardMarkup:
+        """Build keyboard asking who the next parcel goes to"""
+        keyboard = [
+            [InlineKeyboardButton(_make_unique_text("📥 Тот же получатель"), callback_data='batch_same_recipient')],
+            [InlineKeyboardButton(_make_unique_text("👤 Новый получатель"), callback_data='batch_new_recipient')],
+            [InlineKeyboardButton(_make_unique_text("◀️ Назад"), callback_data='back_to_confirmation')]
+        ]
+        return InlineKeyboardMarkup(keyboard)
+    
     @staticmethod
     def build_edit_menu_keyboard() -> InlineKeyboardMarkup:
         """Build keyboard for edit menu"""
@@ -1710,20 +1753,19 @@ async def ask_with_cancel_and_focus(
     if not placeholder or placeholder.strip() == "":
         placeholder = "Введите текст..."
     
-    bot_msg = await safe_telegram_call_func(
-        update.effective_message.reply_text(
-            text,
-            reply_markup=ForceReply(
-                input_field_placeholder=placeholder,
-                selective=True
-            )
-        )
+    # Новое сообщение или правка карточки заказа (utils/order_card.py);
+    # ID последнего сообщения сохраняется для UI-логики
+    from utils.order_card import order_card
+    await order_card.render(
+        update,
+        context,
+        text,
+        reply_markup=ForceReply(
+            input_field_placeholder=placeholder,
+            selective=True
+        ),
+        safe_call=safe_telegram_call_func
     )
-    
-    # Сохранить ID последнего сообщения для UI-логики
-    if bot_msg:
-        context.user_data['last_bot_message_id'] = bot_msg.message_id
-        context.user_data['last_bot_message_text'] = text
 
 
 async def ask_with_skip_cancel_and_focus(
@@ -1766,15 +1808,12 @@ async def ask_with_skip_cancel_and_focus(
         [InlineKeyboardButton("⏭️ Пропустить", callback_data=skip_callback)]
     ])
     
-    bot_msg = await safe_telegram_call_func(
-        update.effective_message.reply_text(
-            text,
-            reply_markup=skip_keyboard
-        )
+    from utils.order_card import order_card
+    await order_card.render(
+        update,
+        context,
+        text,
+        reply_markup=skip_keyboard,
+        safe_call=safe_telegram_call_func
     )
-    
-    # Сохранить ID последнего сообщения
-    if bot_msg:
-        context.user_data['last_bot_message_id'] = bot_msg.message_id
-        context.user_data['last_bot_message_text'] = text
 
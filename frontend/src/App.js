@@ -107,6 +107,7 @@ const Dashboard = () => {
   const [broadcastFileId, setBroadcastFileId] = useState('');
   const [uploadedImagePreview, setUploadedImagePreview] = useState('');
   const [sendingBroadcast, setSendingBroadcast] = useState(false);
+  const [audienceCounts, setAudienceCounts] = useState(null);
   const [uploadingImage, setUploadingImage] = useState(false);
   const [textareaRef, setTextareaRef] = useState(null);
   const [showPreview, setShowPreview] = useState(true);
@@ -127,6 +128,7 @@ const Dashboard = () => {
     loadData();
     loadMaintenanceStatus();
     loadApiMode();
+    loadAudienceCounts();
   }, []);
 
   const loadData = async () => {
@@ -155,6 +157,15 @@ const Dashboard = () => {
     }
   };
 
+  const loadAudienceCounts = async () => {
+    try {
+      const response = await axios.get(`${API}/broadcast/segments`);
+      setAudienceCounts(response.data.segments);
+    } catch (error) {
+      console.error('Error loading audience counts:', error);
+    }
+  };
+
   const loadExpenseStats = async () => {
     try {
       const params = {};
@@ -684,12 +695,21 @@ const Dashboard = () => {
       });
 
       if (response.data.success) {
-        const skipped = response.data.skipped_count || 0;
-        const failed = response.data.failed_count || 0;
+        // The broadcast runs in the background - poll its progress
+        const broadcastId = response.data.broadcast_id;
+        toast.info(`📢 Рассылка запущена: ${response.data.total_users} пользователей`);
+        
+        let progress = response.data;
+        while (!['done', 'cancelled'].includes(progress.status)) {
+          await new Promise(resolve => setTimeout(resolve, 2000));
+          progress = (await axios.get(`${API}/broadcast/${broadcastId}`)).data;
+          if (progress.status === 'paused') break;
+        }
         
-        let message = `✅ Рассылка отправлена: ${response.data.success_count} пользователям`;
-        if (skipped > 0) message += `. Пропущено: ${skipped} (заблокированные)`;
-        if (failed > 0) message += `. Ошибок: ${failed}`;
+        let message = `✅ Рассылка отправлена: ${progress.sent || 0} пользователям`;
+        if (progress.blocked > 0) message += `. Пропущено: ${progress.blocked} (заблокированные)`;
+        if (progress.failed > 0) message += `. Ошибок: ${progress.failed}`;
+        if (progress.status !== 'done') message += ` (${progress.status})`;
         
         toast.success(message);
         setBroadcastMessage(''); // Clear the form
@@ -2313,12 +2333,7 @@ const Dashboard = () => {
 
               <div className="flex items-center justify-between pt-4 border-t">
                 <div className="text-sm text-muted-foreground">
-                  Будет отправлено: <strong>{users.filter(u => !u.blocked).length}</strong> пользователям
-                  {users.filter(u => u.blocked).length > 0 && (
-                    <span className="ml-2 text-orange-600">
-                      (пропущено заблокированных: {users.filter(u => u.blocked).length})
-                    </span>
-                  )}
+                  Будет отправлено: <strong>{audienceCounts ? audienceCounts.all : '…'}</strong> пользователям
                 </div>
                 <div className="flex gap-2">
                   <Button